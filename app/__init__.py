@@ -108,6 +108,16 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = "login"
 
+    # 缓存服务请求钩子（释放请求中未回填的缓存回填租约）
+    from app.services.cache_service import init_cache_service
+
+    init_cache_service(app)
+
+    # 订单业绩预聚合（订单写入时增量维护分桶）
+    from app.services.order_rollup_service import register_order_rollup_listeners
+
+    register_order_rollup_listeners()
+
     # 注册Blueprint
     try:
         from app.routes.miniprogram import miniprogram_bp
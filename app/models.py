@@ -99,6 +99,7 @@ __all__ = [
     "HomepageActivityBanner",
     "User",
     "UserVisit",
+    "UserVisitRollup",  # 用户访问预聚合
     "OperationLog",
     "Order",
     "OrderImage",
@@ -123,6 +124,13 @@ __all__ = [
     "ShopOrder",  # 新增商城相关模型
     "SelectionOrder",  # 选片订单（关联产品馆）
     "PrintSizeConfig",  # 新增打印配置模型
+    "TaskQueueJob",  # 持久化任务队列
+    "ProviderGatewayJob",  # 服务商网关请求任务
+    "OrderRevenueRollup",  # 订单业绩预聚合
+    "OrderStatusRollup",  # 订单状态计数预聚合
+    "OrderSearchGram",  # 订单搜索n-gram索引
+    "OrderEvent",  # 订单事件（发件箱）
+    "OrderEventCursor",  # 订单事件消费进度
     "MockupTemplate",  # 样机套图模板
     "MockupTemplateProduct",  # 样机模板-产品绑定
     "_sanitize_style_code",
@@ -699,6 +707,23 @@ class UserVisit(db.Model):
     )
 
 
+class UserVisitRollup(db.Model):
+    """用户访问预聚合表（user_visit_buffer 维护，按天、用户分桶）"""
+
+    __tablename__ = "user_visit_rollups"
+
+    id = db.Column(db.Integer, primary_key=True)
+    visit_date = db.Column(db.Date, nullable=False, comment="访问日期（本地时间）")
+    # 唯一索引中NULL互不相等，未登录访问的用户ID用 '' 表示
+    user_id = db.Column(db.String(50), nullable=False, default="", comment="用户ID，''表示未登录")
+    visit_count = db.Column(db.Integer, nullable=False, default=0, comment="访问次数")
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint("visit_date", "user_id", name="uq_user_visit_rollup_bucket"),
+    )
+
+
 # ============================================================================
 # 订单相关模型
 # ============================================================================
@@ -818,6 +843,103 @@ class OrderImage(db.Model):
     )
 
 
+class OrderRevenueRollup(db.Model):
+    """订单业绩预聚合表（order_rollup_service 维护，按小时/按天分桶）"""
+
+    __tablename__ = "order_revenue_rollups"
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False, comment="分桶粒度：hour, day")
+    bucket_start = db.Column(db.DateTime, nullable=False, comment="分桶起始时间（本地时间）")
+    # 维度列不允许NULL（唯一索引中NULL互不相等），缺省值分别用 0 和 '' 表示
+    franchisee_id = db.Column(db.Integer, nullable=False, default=0, comment="加盟商ID，0表示无")
+    source_type = db.Column(db.String(20), nullable=False, default="", comment="数据来源类型")
+    order_mode = db.Column(db.String(20), nullable=False, default="", comment="订单模式")
+    order_count = db.Column(db.Integer, nullable=False, default=0, comment="完成订单数")
+    revenue = db.Column(db.Float, nullable=False, default=0.0, comment="完成订单金额合计")
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "granularity",
+            "bucket_start",
+            "franchisee_id",
+            "source_type",
+            "order_mode",
+            name="uq_order_revenue_rollup_bucket",
+        ),
+        db.Index(
+            "idx_order_revenue_rollup_franchisee", "granularity", "franchisee_id", "bucket_start"
+        ),
+    )
+
+
+class OrderStatusRollup(db.Model):
+    """订单状态计数预聚合表（order_rollup_service 维护，按加盟商和当前状态计数，不分时间）"""
+
+    __tablename__ = "order_status_rollups"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 维度列不允许NULL（唯一索引中NULL互不相等），缺省值分别用 0 和 '' 表示
+    franchisee_id = db.Column(db.Integer, nullable=False, default=0, comment="加盟商ID，0表示无")
+    status = db.Column(db.String(20), nullable=False, default="", comment="订单状态")
+    has_printer_error = db.Column(
+        db.Boolean, nullable=False, default=False, comment="是否有打印错误信息"
+    )
+    order_count = db.Column(db.Integer, nullable=False, default=0, comment="订单数")
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "franchisee_id", "status", "has_printer_error", name="uq_order_status_rollup_key"
+        ),
+    )
+
+
+class OrderSearchGram(db.Model):
+    """订单搜索n-gram索引表（order_search_service 维护；PostgreSQL 使用 pg_trgm 索引，不使用此表）"""
+
+    __tablename__ = "order_search_grams"
+
+    id = db.Column(db.Integer, primary_key=True)
+    gram = db.Column(db.String(20), nullable=False, comment="小写的n-gram")
+    field = db.Column(
+        db.String(20), nullable=False, comment="来源字段：order_number, customer_name, customer_phone"
+    )
+    order_id = db.Column(db.Integer, nullable=False, comment="订单ID（0为回填完成标记）")
+
+    __table_args__ = (
+        db.Index("idx_order_search_gram", "gram", "field", "order_id"),
+        db.Index("idx_order_search_gram_order", "order_id"),
+    )
+
+
+class OrderEvent(db.Model):
+    """订单事件发件箱（与订单修改在同一事务写入，order_event_service 的消费者异步处理副作用）"""
+
+    __tablename__ = "order_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=True, index=True, comment="订单ID")
+    order_number = db.Column(db.String(50), nullable=True, comment="订单号")
+    event_type = db.Column(db.String(50), nullable=False, comment="事件类型：order.created, order.status_changed")
+    payload = db.Column(db.Text, nullable=True, comment="事件数据（JSON）")
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+
+class OrderEventCursor(db.Model):
+    """订单事件消费进度（每个消费者一行）"""
+
+    __tablename__ = "order_event_cursors"
+
+    id = db.Column(db.Integer, primary_key=True)
+    consumer = db.Column(db.String(50), nullable=False, unique=True, comment="消费者名称")
+    last_event_id = db.Column(db.Integer, nullable=False, default=0, comment="已处理的最后一个事件ID")
+    attempts = db.Column(db.Integer, nullable=False, default=0, comment="下一个事件已失败的次数")
+    last_error = db.Column(db.Text, nullable=True, comment="最近一次处理失败的错误信息")
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 # ============================================================================
 # AI工作流相关模型
 # ============================================================================
@@ -1282,6 +1404,66 @@ class PollingConfig(db.Model):
         }
 
 
+class TaskQueueJob(db.Model):
+    """持久化任务队列（task_queue_service 的数据库后端）"""
+
+    __tablename__ = "task_queue_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(64), nullable=False, unique=True, comment="任务唯一ID")
+    task_type = db.Column(db.String(50), nullable=False, comment="任务类型：comfyui, api")
+    payload = db.Column(db.Text, comment="任务数据（JSON格式）")
+    priority = db.Column(db.Integer, default=0, comment="优先级（数字越大越先处理）")
+    # ready: 待处理, reserved: 处理中（可见性超时后重新变为可领取）, done: 已完成, dead: 超过重试次数
+    status = db.Column(db.String(20), default="ready", comment="状态")
+    attempts = db.Column(db.Integer, default=0, comment="已领取次数")
+    max_attempts = db.Column(db.Integer, default=3, comment="最大尝试次数")
+    available_at = db.Column(db.DateTime, default=datetime.now, comment="可被领取的时间")
+    reserved_until = db.Column(db.DateTime, comment="可见性超时时间")
+    last_error = db.Column(db.Text, comment="最后一次失败原因")
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.Index("idx_task_queue_job_status_priority", "status", "priority", "id"),
+        db.Index("idx_task_queue_job_reserved_until", "reserved_until"),
+    )
+
+
+class ProviderGatewayJob(db.Model):
+    """服务商网关请求任务（Web进程写入已构建好的HTTP请求，由 provider_gateway 进程异步发送并回写结果）"""
+
+    __tablename__ = "provider_gateway_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    ai_task_id = db.Column(db.Integer, comment="关联的AI任务ID")
+    client_name = db.Column(db.String(50), default="ai_provider", comment="HTTP客户端分组")
+    method = db.Column(db.String(10), default="POST")
+    url = db.Column(db.Text, nullable=False)
+    headers = db.Column(db.Text, comment="请求头（JSON格式）")
+    body = db.Column(db.LargeBinary, comment="已编码的请求体")
+    proxies = db.Column(db.Text, comment="代理设置（JSON格式，空表示使用环境变量）")
+    connect_timeout = db.Column(db.Float, default=10)
+    read_timeout = db.Column(db.Float, default=300)
+    retry_policy = db.Column(db.String(20), default="default", comment="重试策略")
+    # pending: 待发送, running: 发送中, done: 已收到响应, failed: 请求失败
+    status = db.Column(db.String(20), default="pending", comment="状态")
+    attempts = db.Column(db.Integer, default=0, comment="发送次数（含重试）")
+    claimed_by = db.Column(db.String(100), comment="领取的网关实例")
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.LargeBinary)
+    error_kind = db.Column(db.String(30), comment="失败类型：connect, timeout, disconnected, interrupted")
+    error_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("idx_provider_gateway_job_status", "status", "id"),
+        db.Index("idx_provider_gateway_job_ai_task", "ai_task_id"),
+    )
+
+
 # ============================================================================
 # 其他模型
 # ============================================================================
@@ -51,23 +51,20 @@ def get_revenue_detail():
         else:
             return jsonify({"success": False, "message": "无效的时间段"}), 400
 
-        # 使用数据库聚合函数计算总金额（优化：避免在内存中计算）
-        total_revenue = (
-            Order.query.filter(
-                func.date(Order.completed_at) >= start_date,
-                func.date(Order.completed_at) < end_date,
-                Order.status == "completed",
-            )
-            .with_entities(func.sum(Order.price))
-            .scalar()
-            or 0.0
-        )
+        # 总金额和订单数读取业绩预聚合分桶
+        from app.services.order_rollup_service import get_revenue_summary
 
-        # 查询订单列表（限制100条用于展示）
+        summary = get_revenue_summary(start_date, end_date)
+        total_revenue = summary["revenue"]
+        order_count = summary["order_count"]
+
+        # 查询订单列表（限制100条用于展示）；使用完成时间范围条件以命中 idx_order_completed_at
+        start_time = datetime.combine(start_date, datetime.min.time())
+        end_time = datetime.combine(end_date, datetime.min.time())
         orders = (
             Order.query.filter(
-                func.date(Order.completed_at) >= start_date,
-                func.date(Order.completed_at) < end_date,
+                Order.completed_at >= start_time,
+                Order.completed_at < end_time,
                 Order.status == "completed",
             )
             .order_by(Order.completed_at.desc())
@@ -75,13 +72,6 @@ def get_revenue_detail():
             .all()
         )
 
-        # 获取订单总数（用于统计）
-        order_count = Order.query.filter(
-            func.date(Order.completed_at) >= start_date,
-            func.date(Order.completed_at) < end_date,
-            Order.status == "completed",
-        ).count()
-
         orders_list = []
         for order in orders:
             orders_list.append(
@@ -108,6 +98,39 @@ def get_revenue_detail():
         return jsonify({"success": False, "message": f"获取业绩详情失败: {str(e)}"}), 500
 
 
+@admin_dashboard_api_bp.route("/api/admin/dashboard/stats", methods=["GET"])
+@login_required
+def get_dashboard_stats_api():
+    """获取仪表盘订单统计（订单数量、状态和业绩，可按加盟商筛选）"""
+    try:
+        if current_user.role not in ["admin", "operator"]:
+            return jsonify({"success": False, "message": "权限不足"}), 403
+
+        from app.services.dashboard_stats_service import get_dashboard_stats
+
+        franchisee_id = request.args.get("franchisee_id", type=int)
+        return jsonify({"success": True, "stats": get_dashboard_stats(franchisee_id)})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"获取仪表盘统计失败: {str(e)}"}), 500
+
+
+@admin_dashboard_api_bp.route("/api/admin/dashboard/image-processing-stats", methods=["GET"])
+@login_required
+def get_image_processing_stats_api():
+    """订单图片处理执行器统计（当前进程：队列深度、各加盟商排队数、等待时间、拒绝/转入任务队列数）"""
+    try:
+        if current_user.role not in ["admin", "operator"]:
+            return jsonify({"success": False, "message": "权限不足"}), 403
+
+        import os
+
+        from app.services.image_processing_executor import get_image_processing_stats
+
+        return jsonify({"success": True, "pid": os.getpid(), "stats": get_image_processing_stats()})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"获取图片处理统计失败: {str(e)}"}), 500
+
+
 @admin_dashboard_api_bp.route("/api/admin/dashboard/processing-orders", methods=["GET"])
 @login_required
 def get_processing_orders():
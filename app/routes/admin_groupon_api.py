@@ -19,6 +19,7 @@ from flask_login import current_user, login_required
 
 # 统一导入公共函数
 from app.utils.admin_helpers import get_models
+from app.utils.pagination import paginate_request
 
 # 创建蓝图
 admin_groupon_api_bp = Blueprint("admin_groupon_api", __name__, url_prefix="/api/admin/groupon")
@@ -260,10 +261,8 @@ def get_groupon_verify_list():
                 )
             )
 
-        # 分页查询
-        pagination = query.order_by(Coupon.create_time.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # 分页查询（带 cursor 参数时按游标翻页，不统计总数）
+        pagination = paginate_request(query, (Coupon.create_time, Coupon.id), page, per_page)
 
         coupons = pagination.items
 
@@ -301,6 +300,8 @@ def get_groupon_verify_list():
                     "pages": pagination.pages,
                     "has_next": pagination.has_next,
                     "has_prev": pagination.has_prev,
+                    "next_cursor": pagination.next_cursor,
+                    "prev_cursor": pagination.prev_cursor,
                 },
             }
         )
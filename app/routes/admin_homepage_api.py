@@ -119,9 +119,9 @@ def admin_create_banner():
 
         # 使轮播图缓存失效
         try:
-            from app.services.cache_service import cache_key, invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_banners")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("轮播图缓存已失效")
         except Exception as e:
             logger.warning(f"失效轮播图缓存失败: {e}")
@@ -186,9 +186,9 @@ def admin_update_banner(banner_id):
 
         # 使轮播图缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_banners")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("轮播图缓存已失效")
         except Exception as e:
             logger.warning(f"失效轮播图缓存失败: {e}")
@@ -219,9 +219,9 @@ def admin_delete_banner(banner_id):
 
         # 使轮播图缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_banners")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("轮播图缓存已失效")
         except Exception as e:
             logger.warning(f"失效轮播图缓存失败: {e}")
@@ -315,9 +315,9 @@ def admin_update_homepage_config():
 
         # 使首页配置缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_config")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("首页配置缓存已失效")
         except Exception as e:
             logger.warning(f"失效首页配置缓存失败: {e}")
@@ -458,9 +458,9 @@ def admin_create_category_nav():
 
         # 使首页配置缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_config")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("首页配置缓存已失效")
         except Exception as e:
             logger.warning(f"失效首页配置缓存失败: {e}")
@@ -515,9 +515,9 @@ def admin_update_category_nav(nav_id):
 
         # 使首页配置缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_config")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("首页配置缓存已失效")
         except Exception as e:
             logger.warning(f"失效首页配置缓存失败: {e}")
@@ -547,9 +547,9 @@ def admin_delete_category_nav(nav_id):
 
         # 使首页配置缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_config")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("首页配置缓存已失效")
         except Exception as e:
             logger.warning(f"失效首页配置缓存失败: {e}")
@@ -673,9 +673,9 @@ def admin_create_product_section():
 
         # 使首页配置缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_config")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("首页配置缓存已失效")
         except Exception as e:
             logger.warning(f"失效首页配置缓存失败: {e}")
@@ -745,9 +745,9 @@ def admin_update_product_section(section_id):
 
         # 使首页配置缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_config")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("首页配置缓存已失效")
         except Exception as e:
             logger.warning(f"失效首页配置缓存失败: {e}")
@@ -777,9 +777,9 @@ def admin_delete_product_section(section_id):
 
         # 使首页配置缓存失效
         try:
-            from app.services.cache_service import invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache("homepage_config")
+            invalidate_cache_tags(CACHE_TAGS["HOMEPAGE"])
             logger.info("首页配置缓存已失效")
         except Exception as e:
             logger.warning(f"失效首页配置缓存失败: {e}")
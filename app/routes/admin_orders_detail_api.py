@@ -764,6 +764,7 @@ def batch_update_order_status():
         Order = models["Order"]
         AITask = models["AITask"]
         db = models["db"]
+        from app.services.order_event_service import record_status_change
 
         # 查找所有状态为"AI任务处理中"的订单
         orders_to_check = Order.query.filter(
@@ -804,6 +805,7 @@ def batch_update_order_status():
             if len(valid_tasks) > 0 and len(completed_tasks) == len(valid_tasks):
                 old_status = order.status
                 order.status = "pending_selection"  # 待选片
+                record_status_change(order, old_status, source="admin_batch")
                 updated_count += 1
                 updated_orders.append(
                     {
@@ -865,14 +867,8 @@ def admin_add_order():
     if "test_server" in sys.modules:
         test_server_module = sys.modules["test_server"]
         app = test_server_module.app if hasattr(test_server_module, "app") else current_app
-        WECHAT_NOTIFICATION_AVAILABLE = getattr(
-            test_server_module, "WECHAT_NOTIFICATION_AVAILABLE", False
-        )
-        wechat_notify = getattr(test_server_module, "wechat_notify", None)
     else:
         app = current_app
-        WECHAT_NOTIFICATION_AVAILABLE = False
-        wechat_notify = None
 
     if request.method == "POST":
         try:
@@ -923,19 +919,17 @@ def admin_add_order():
                 )
                 db.session.add(order_image)
 
-            db.session.commit()
+            # ⭐ 微信通知由订单事件消费者异步发送（事件与订单同一事务提交）
+            from app.services.order_event_service import EVENT_ORDER_CREATED, record_order_event
 
-            # ⭐ 发送微信通知
-            if WECHAT_NOTIFICATION_AVAILABLE and wechat_notify:
-                try:
-                    wechat_notify(
-                        order_number=order.order_number,
-                        customer_name=customer_name,
-                        total_price=price,
-                        source="管理后台",
-                    )
-                except Exception as e:
-                    logger.info(f"微信通知失败: {e}")
+            record_order_event(
+                order,
+                EVENT_ORDER_CREATED,
+                customer_name=customer_name,
+                total_price=price,
+                source="管理后台",
+            )
+            db.session.commit()
 
             flash("订单创建成功！", "success")
             # 重定向到订单详情页
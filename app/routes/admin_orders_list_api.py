@@ -27,8 +27,14 @@ from flask_login import current_user, login_required
 from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 
+from app.services.order_search_service import (
+    order_search_condition,
+    order_search_rank,
+    search_orders,
+)
 from app.utils.admin_helpers import get_models
 from app.utils.decorators import admin_required
+from app.utils.pagination import count_rows, encode_cursor, keyset_order_by, keyset_paginate
 
 # 创建蓝图
 admin_orders_list_bp = Blueprint("admin_orders_list", __name__)
@@ -53,7 +59,8 @@ def admin_orders():
     status = request.args.get("status", "")
     order_mode = request.args.get("order_mode", "")
     search = request.args.get("search", "").strip()  # 订单搜索
-    page = request.args.get("page", 1, type=int)  # 分页参数
+    page = max(request.args.get("page", 1, type=int), 1)  # 分页参数（游标翻页时仅用于显示）
+    cursor = request.args.get("cursor", "")  # 上一页/下一页的游标
     per_page = 10  # 每页显示10条
 
     # 构建查询 - 过滤掉未支付订单（除非专门查unpaid状态）
@@ -77,15 +84,7 @@ def admin_orders():
 
     # 订单搜索（按订单号、客户姓名、客户电话搜索）
     if search:
-        from sqlalchemy import or_
-
-        query = query.filter(
-            or_(
-                Order.order_number.like(f"%{search}%"),
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
-            )
-        )
+        query = query.filter(order_search_condition(search))
 
     # 优化：先获取不重复的订单号列表（数据库层面分页）
     # 1. 构建基础查询（用于统计和获取订单号）
@@ -107,25 +106,16 @@ def admin_orders():
         base_query = base_query.filter(Order.order_mode == order_mode)
 
     if search:
-        from sqlalchemy import or_
+        base_query = base_query.filter(order_search_condition(search))
 
-        base_query = base_query.filter(
-            or_(
-                Order.order_number.like(f"%{search}%"),
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
-            )
-        )
-
-    # 2. 获取不重复的订单号总数
-    total_count = base_query.distinct().count()
+    # 2. 获取不重复的订单号总数（大表使用查询计划的估算值）
+    total_count, total_is_estimate = count_rows(base_query.distinct())
 
     # 3. 获取每个订单号的最早创建时间，用于排序
-    from sqlalchemy import text
-
-    order_numbers_subquery = db.session.query(
-        Order.order_number, func.min(Order.created_at).label("min_created_at")
-    ).group_by(Order.order_number)
+    min_created_at = func.min(Order.created_at).label("min_created_at")
+    order_numbers_subquery = db.session.query(Order.order_number, min_created_at).group_by(
+        Order.order_number
+    )
 
     # 应用相同的筛选条件到子查询
     if status == "unpaid":
@@ -145,20 +135,35 @@ def admin_orders():
         order_numbers_subquery = order_numbers_subquery.filter(Order.order_mode == order_mode)
 
     if search:
-        from sqlalchemy import or_
-
-        order_numbers_subquery = order_numbers_subquery.filter(
-            or_(
-                Order.order_number.like(f"%{search}%"),
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
+        order_numbers_subquery = order_numbers_subquery.filter(order_search_condition(search))
+
+    # 排序并分页：按 (最早创建时间, 订单号) 降序
+    # 上一页/下一页使用游标定位（与页码深度无关），跳页和搜索结果使用 OFFSET
+    order_keys = (min_created_at, Order.order_number)
+    next_cursor = prev_cursor = None
+    if cursor and not search:
+        keyset = keyset_paginate(order_numbers_subquery, order_keys, per_page, cursor, having=True)
+        paginated_order_numbers = keyset.items
+        has_next, has_prev = keyset.has_next, keyset.has_prev
+        next_cursor, prev_cursor = keyset.next_cursor, keyset.prev_cursor
+    else:
+        # 搜索时订单号完全匹配、前缀匹配的订单排在前面
+        if search:
+            order_numbers_subquery = order_numbers_subquery.order_by(
+                func.min(order_search_rank(search))
             )
-        )
-
-    # 排序并分页
-    order_numbers_subquery = order_numbers_subquery.order_by(text("min_created_at DESC"))
-    offset = (page - 1) * per_page
-    paginated_order_numbers = order_numbers_subquery.offset(offset).limit(per_page).all()
+        order_numbers_subquery = order_numbers_subquery.order_by(*keyset_order_by(order_keys))
+        offset = (page - 1) * per_page
+        # 多取一条判断是否有下一页（总数可能是估算值，只用于显示）
+        paginated_order_numbers = order_numbers_subquery.offset(offset).limit(per_page + 1).all()
+        has_next, has_prev = len(paginated_order_numbers) > per_page, page > 1
+        paginated_order_numbers = paginated_order_numbers[:per_page]
+        if paginated_order_numbers and not search:
+            first, last = paginated_order_numbers[0], paginated_order_numbers[-1]
+            if has_next:
+                next_cursor = encode_cursor([last.min_created_at, last.order_number], "next")
+            if has_prev:
+                prev_cursor = encode_cursor([first.min_created_at, first.order_number], "prev")
 
     # 4. 获取这些订单号对应的所有订单记录
     order_numbers = [row[0] for row in paginated_order_numbers]
@@ -235,8 +240,12 @@ def admin_orders():
 
         paginated_orders = orders
 
-    # 计算总页数
-    total_pages = (total_count + per_page - 1) // per_page if per_page > 0 else 1
+    # 计算总页数；总数为估算值时只用于显示，页码链接只到下一页（避免链接到空页或漏掉后续页）
+    if total_is_estimate:
+        total_pages = page + 1 if has_next else page
+    else:
+        total_pages = (total_count + per_page - 1) // per_page if per_page > 0 else 1
+        total_pages = max(total_pages, page + 1 if has_next else page)
 
     # 获取所有加盟商（门店）列表
     # 优化：虽然加盟商数量通常不多，但为了保持一致性，仍然支持分页
@@ -312,6 +321,11 @@ def admin_orders():
         current_page=page,
         total_pages=total_pages,
         total_count=total_count,
+        total_is_estimate=total_is_estimate,
+        has_next=has_next,
+        has_prev=has_prev,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
     )
 
 
@@ -350,15 +364,7 @@ def export_orders():
             query = query.filter(Order.order_mode == order_mode)
 
         if search:
-            from sqlalchemy import or_
-
-            query = query.filter(
-                or_(
-                    Order.order_number.like(f"%{search}%"),
-                    Order.customer_name.like(f"%{search}%"),
-                    Order.customer_phone.like(f"%{search}%"),
-                )
-            )
+            query = search_orders(search, query=query)
 
         # 获取总数（用于限制）
         total_count = query.count()
@@ -761,15 +767,7 @@ def export_orders_json():
             query = query.filter(Order.order_mode == order_mode)
 
         if search:
-            from sqlalchemy import or_
-
-            query = query.filter(
-                or_(
-                    Order.order_number.like(f"%{search}%"),
-                    Order.customer_name.like(f"%{search}%"),
-                    Order.customer_phone.like(f"%{search}%"),
-                )
-            )
+            query = search_orders(search, query=query)
 
         # 获取总数（用于限制）
         total_count = query.count()
@@ -207,9 +207,9 @@ def admin_create_category():
 
         # 使产品分类缓存失效
         try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache(CACHE_PREFIXES["PRODUCT_CATEGORIES"])
+            invalidate_cache_tags(CACHE_TAGS["PRODUCT_CATEGORIES"])
             logger.info("产品分类缓存已失效")
         except Exception as e:
             logger.warning(f"失效产品分类缓存失败: {e}")
@@ -352,9 +352,9 @@ def admin_update_category(category_id):
 
         # 使产品分类缓存失效
         try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache(CACHE_PREFIXES["PRODUCT_CATEGORIES"])
+            invalidate_cache_tags(CACHE_TAGS["PRODUCT_CATEGORIES"])
             logger.info("产品分类缓存已失效")
         except Exception as e:
             logger.warning(f"失效产品分类缓存失败: {e}")
@@ -404,9 +404,9 @@ def admin_delete_category(category_id):
 
         # 使产品分类缓存失效
         try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache(CACHE_PREFIXES["PRODUCT_CATEGORIES"])
+            invalidate_cache_tags(CACHE_TAGS["PRODUCT_CATEGORIES"])
             logger.info("产品分类缓存已失效")
         except Exception as e:
             logger.warning(f"失效产品分类缓存失败: {e}")
@@ -529,9 +529,9 @@ def admin_create_subcategory():
 
         # 使产品分类缓存失效
         try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache(CACHE_PREFIXES["PRODUCT_CATEGORIES"])
+            invalidate_cache_tags(CACHE_TAGS["PRODUCT_CATEGORIES"])
             logger.info("产品分类缓存已失效")
         except Exception as e:
             logger.warning(f"失效产品分类缓存失败: {e}")
@@ -645,9 +645,9 @@ def admin_update_subcategory(subcategory_id):
 
         # 使产品分类缓存失效
         try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache(CACHE_PREFIXES["PRODUCT_CATEGORIES"])
+            invalidate_cache_tags(CACHE_TAGS["PRODUCT_CATEGORIES"])
             logger.info("产品分类缓存已失效")
         except Exception as e:
             logger.warning(f"失效产品分类缓存失败: {e}")
@@ -697,9 +697,9 @@ def admin_delete_subcategory(subcategory_id):
 
         # 使产品分类缓存失效
         try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache
+            from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
 
-            invalidate_cache(CACHE_PREFIXES["PRODUCT_CATEGORIES"])
+            invalidate_cache_tags(CACHE_TAGS["PRODUCT_CATEGORIES"])
             logger.info("产品分类缓存已失效")
         except Exception as e:
             logger.warning(f"失效产品分类缓存失败: {e}")
@@ -32,6 +32,33 @@ from app.utils.decorators import admin_required
 admin_products_bp = Blueprint("admin_products", __name__)
 
 
+def _invalidate_product_caches(product_id=None, bindings_changed=False):
+    """
+    使产品相关的小程序缓存失效（按标签精确失效）
+
+    Args:
+        product_id: 产品ID（失效该产品绑定的风格列表缓存）
+        bindings_changed: 产品与风格分类的绑定或产品上下架/代码有变化时为True，
+                          同时失效风格列表中的绑定产品信息
+    """
+    try:
+        from app.services.cache_service import (
+            CACHE_TAGS,
+            invalidate_cache_tags,
+            product_cache_tag,
+        )
+
+        tags = [CACHE_TAGS["PRODUCT_CATALOG"]]
+        if product_id:
+            tags.append(product_cache_tag(product_id))
+        if bindings_changed:
+            tags.append(CACHE_TAGS["PRODUCT_BINDINGS"])
+        invalidate_cache_tags(*tags)
+        logger.info(f"产品缓存已失效: {tags}")
+    except Exception as e:
+        logger.warning(f"失效产品缓存失败: {e}")
+
+
 @admin_products_bp.route("/admin/products", methods=["GET"])
 @login_required
 @admin_required
@@ -524,6 +551,7 @@ def admin_sizes():
                             db.session.add(custom_field)
 
                     db.session.commit()
+                    _invalidate_product_caches(product.id, bindings_changed=True)
 
                     # 自动同步到冲印系统配置
                     try:
@@ -542,6 +570,7 @@ def admin_sizes():
             size_id = int(request.form.get("size_id"))
             try:
                 product_size = ProductSize.query.get_or_404(size_id)
+                size_product_id = product_size.product_id
 
                 orders_count = Order.query.filter_by(size=product_size.size_name).count()
 
@@ -553,6 +582,7 @@ def admin_sizes():
                     db.session.delete(product_size)
                     db.session.commit()
                     flash("尺寸删除成功", "success")
+                _invalidate_product_caches(size_product_id)
 
                 try:
                     from product_config_sync import auto_sync_product_config
@@ -572,6 +602,7 @@ def admin_sizes():
             logger.info(f"📝 开始编辑产品 - 产品ID: {product_id}")
             try:
                 product = Product.query.get_or_404(product_id)
+                original_code = product.code
 
                 # 更新产品基本信息
                 product.code = request.form.get("code")
@@ -1180,28 +1211,11 @@ def admin_sizes():
                 db.session.commit()
                 logger.info("✅ 数据库提交成功")
 
-                # 使产品列表缓存失效
-                try:
-                    from app.services.cache_service import (
-                        CACHE_PREFIXES,
-                        cache_key,
-                        delete_cache,
-                        invalidate_cache_pattern,
-                    )
-
-                    invalidate_cache_pattern(f"cache:{CACHE_PREFIXES['PRODUCTS']}:*")
-                    logger.info("产品列表缓存已失效")
-
-                    # 使该产品的风格缓存失效（小程序 /styles?productId=xxx 会缓存）
-                    for pid in (str(product_id), product.code or ""):
-                        if pid:
-                            key = cache_key(
-                                CACHE_PREFIXES["STYLE_CATEGORIES"], product_id=pid
-                            )
-                            delete_cache(key)
-                    logger.info("该产品风格缓存已失效")
-                except Exception as e:
-                    logger.warning(f"失效产品列表缓存失败: {e}")
+                # 使产品列表、该产品的风格缓存失效（小程序 /styles?productId=xxx 会缓存）
+                _invalidate_product_caches(
+                    product_id,
+                    bindings_changed=bool(to_delete or to_add) or product.code != original_code,
+                )
 
                 # 验证风格分类绑定保存结果（提交后）
                 saved_bindings = ProductStyleCategory.query.filter_by(product_id=product_id).all()
@@ -1280,6 +1294,7 @@ def admin_sizes():
                         product.image_url = None
 
                 db.session.commit()
+                _invalidate_product_caches(product_id)
                 flash("图片删除成功", "success")
             except Exception as e:
                 db.session.rollback()
@@ -1292,6 +1307,7 @@ def admin_sizes():
                 product = Product.query.get_or_404(product_id)
                 product.is_active = not product.is_active
                 db.session.commit()
+                _invalidate_product_caches(product_id, bindings_changed=True)
                 status_text = "上架" if product.is_active else "下架"
                 flash(f"产品已{status_text}", "success")
             except Exception as e:
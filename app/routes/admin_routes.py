@@ -99,85 +99,22 @@ def admin_dashboard():
         return redirect(url_for("auth.login"))
 
     db = models["db"]
-    Order = models["Order"]
     User = models["User"]
     FranchiseeAccount = models.get("FranchiseeAccount")
     AITask = models.get("AITask")
     MeituAPICallLog = models.get("MeituAPICallLog")
     AIConfig = models.get("AIConfig")
 
-    from datetime import datetime, timedelta
+    from datetime import datetime
 
-    from sqlalchemy import func, or_
+    from sqlalchemy import func
 
-    today = datetime.now().date()
-    yesterday = today - timedelta(days=1)
-    this_week_start = today - timedelta(days=today.weekday())
-    this_month_start = today.replace(day=1)
-
-    # 订单统计
-    total_orders = Order.query.filter(Order.status != "unpaid").count()
-    daily_orders = Order.query.filter(
-        func.date(Order.created_at) == today, Order.status != "unpaid"
-    ).count()
-    yesterday_orders = Order.query.filter(
-        func.date(Order.created_at) == yesterday, Order.status != "unpaid"
-    ).count()
-    week_orders = Order.query.filter(
-        func.date(Order.created_at) >= this_week_start, Order.status != "unpaid"
-    ).count()
-    month_orders = Order.query.filter(
-        func.date(Order.created_at) >= this_month_start, Order.status != "unpaid"
-    ).count()
-
-    # 业绩统计
-    daily_revenue = (
-        Order.query.filter(func.date(Order.completed_at) == today, Order.status == "completed")
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
-
-    yesterday_revenue = (
-        Order.query.filter(func.date(Order.completed_at) == yesterday, Order.status == "completed")
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
-
-    week_revenue = (
-        Order.query.filter(
-            func.date(Order.completed_at) >= this_week_start, Order.status == "completed"
-        )
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
-
-    month_revenue = (
-        Order.query.filter(
-            func.date(Order.completed_at) >= this_month_start, Order.status == "completed"
-        )
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
+    from app.services.dashboard_stats_service import get_dashboard_stats
 
-    total_revenue = (
-        Order.query.filter(Order.status == "completed")
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
+    today = datetime.now().date()
 
-    # 订单状态统计
-    pending_orders = Order.query.filter(Order.status.in_(["pending", "已支付"])).count()
-    processing_orders = Order.query.filter(Order.status == "processing").count()
-    completed_orders = Order.query.filter(Order.status == "completed").count()
-    # 异常订单：状态为failed或error，或者有printer错误信息的订单
-    error_orders = Order.query.filter(
-        or_(Order.status.in_(["failed", "error"]), Order.printer_error_message.isnot(None))
-    ).count()
+    # 订单数量、状态和业绩统计（条件聚合，短时缓存）
+    stats = get_dashboard_stats()
 
     # AI任务统计
     ai_task_stats = {}
@@ -226,20 +163,7 @@ def admin_dashboard():
 
     return render_template(
         "admin/dashboard.html",
-        total_orders=total_orders,
-        daily_orders=daily_orders,
-        yesterday_orders=yesterday_orders,
-        week_orders=week_orders,
-        month_orders=month_orders,
-        daily_revenue=float(daily_revenue),
-        yesterday_revenue=float(yesterday_revenue),
-        week_revenue=float(week_revenue),
-        month_revenue=float(month_revenue),
-        total_revenue=float(total_revenue),
-        pending_orders=pending_orders,
-        processing_orders=processing_orders,
-        completed_orders=completed_orders,
-        error_orders=error_orders,
+        **stats,
         ai_task_stats=ai_task_stats,
         meitu_stats=meitu_stats,
         brand_name=brand_name,
@@ -15,6 +15,7 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required
 from werkzeug.utils import secure_filename
 
+from app.routes.admin_styles_utils import _invalidate_style_catalog_cache
 from app.utils.admin_helpers import get_models, get_style_code_helpers
 
 # 创建蓝图（不设置url_prefix，因为会注册到主蓝图下）
@@ -180,13 +181,7 @@ def admin_create_category():
         db.session.commit()
 
         # 使风格分类缓存失效
-        try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache_pattern
-
-            invalidate_cache_pattern(f"cache:{CACHE_PREFIXES['STYLE_CATEGORIES']}:*")
-            logger.info("风格分类缓存已失效")
-        except Exception as e:
-            logger.warning(f"失效风格分类缓存失败: {e}")
+        _invalidate_style_catalog_cache()
 
         return jsonify(
             {
@@ -303,13 +298,7 @@ def admin_update_category(category_id):
         db.session.commit()
 
         # 使风格分类缓存失效
-        try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache_pattern
-
-            invalidate_cache_pattern(f"cache:{CACHE_PREFIXES['STYLE_CATEGORIES']}:*")
-            logger.info("风格分类缓存已失效")
-        except Exception as e:
-            logger.warning(f"失效风格分类缓存失败: {e}")
+        _invalidate_style_catalog_cache()
 
         return jsonify({"status": "success", "message": "分类更新成功"})
 
@@ -342,13 +331,7 @@ def admin_delete_category(category_id):
         db.session.commit()
 
         # 使风格分类缓存失效
-        try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache_pattern
-
-            invalidate_cache_pattern(f"cache:{CACHE_PREFIXES['STYLE_CATEGORIES']}:*")
-            logger.info("风格分类缓存已失效")
-        except Exception as e:
-            logger.warning(f"失效风格分类缓存失败: {e}")
+        _invalidate_style_catalog_cache()
 
         return jsonify({"status": "success", "message": "分类删除成功"})
 
@@ -461,13 +444,7 @@ def admin_create_subcategory():
         db.session.commit()
 
         # 使风格分类缓存失效
-        try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache_pattern
-
-            invalidate_cache_pattern(f"cache:{CACHE_PREFIXES['STYLE_CATEGORIES']}:*")
-            logger.info("风格分类缓存已失效")
-        except Exception as e:
-            logger.warning(f"失效风格分类缓存失败: {e}")
+        _invalidate_style_catalog_cache()
 
         return jsonify(
             {
@@ -527,13 +504,7 @@ def admin_update_subcategory(subcategory_id):
         db.session.commit()
 
         # 使风格分类缓存失效
-        try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache_pattern
-
-            invalidate_cache_pattern(f"cache:{CACHE_PREFIXES['STYLE_CATEGORIES']}:*")
-            logger.info("风格分类缓存已失效")
-        except Exception as e:
-            logger.warning(f"失效风格分类缓存失败: {e}")
+        _invalidate_style_catalog_cache()
 
         return jsonify({"status": "success", "message": "二级分类更新成功"})
 
@@ -568,13 +539,7 @@ def admin_delete_subcategory(subcategory_id):
         db.session.commit()
 
         # 使风格分类缓存失效
-        try:
-            from app.services.cache_service import CACHE_PREFIXES, invalidate_cache_pattern
-
-            invalidate_cache_pattern(f"cache:{CACHE_PREFIXES['STYLE_CATEGORIES']}:*")
-            logger.info("风格分类缓存已失效")
-        except Exception as e:
-            logger.warning(f"失效风格分类缓存失败: {e}")
+        _invalidate_style_catalog_cache()
 
         return jsonify({"status": "success", "message": "二级分类删除成功"})
 
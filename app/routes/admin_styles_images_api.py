@@ -15,6 +15,7 @@ from flask import Blueprint, jsonify, request
 from flask_login import login_required
 from werkzeug.utils import secure_filename
 
+from app.routes.admin_styles_utils import _invalidate_style_catalog_cache
 from app.utils.admin_helpers import get_models, get_style_code_helpers
 
 # 创建蓝图（不设置url_prefix，因为会注册到主蓝图下）
@@ -412,6 +413,7 @@ def admin_create_image():
 
         db.session.add(image)
         db.session.commit()
+        _invalidate_style_catalog_cache()
 
         return jsonify(
             {
@@ -544,6 +546,7 @@ def admin_update_image(image_id):
         image.code = final_code
 
         db.session.commit()
+        _invalidate_style_catalog_cache()
 
         return jsonify({"status": "success", "message": "图片更新成功"})
 
@@ -568,6 +571,7 @@ def admin_delete_image(image_id):
 
         db.session.delete(image)
         db.session.commit()
+        _invalidate_style_catalog_cache()
 
         return jsonify({"status": "success", "message": "图片删除成功"})
 
@@ -42,3 +42,14 @@ def _get_test_order_info(request):
         source_type = "admin_test"
 
     return order_number, customer_name, source_type
+
+
+def _invalidate_style_catalog_cache():
+    """使小程序风格/产品列表中的风格数据缓存失效（按标签精确失效）"""
+    try:
+        from app.services.cache_service import CACHE_TAGS, invalidate_cache_tags
+
+        invalidate_cache_tags(CACHE_TAGS["STYLE_CATALOG"])
+        logger.info("风格数据缓存已失效")
+    except Exception as e:
+        logger.warning(f"失效风格数据缓存失败: {e}")
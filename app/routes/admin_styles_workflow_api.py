@@ -1127,10 +1127,6 @@ def test_api_comfyui_template(image_id):
         # 调用API服务
         from app.services.ai_provider_service import create_api_task
 
-        # 使用真实订单ID和订单号
-        create_api_task._test_order_id = test_order.id
-        create_api_task._test_order_number = order_number
-
         success, task, error_message = create_api_task(
             style_image_id=image_id,
             prompt=prompt,
@@ -1144,6 +1140,8 @@ def test_api_comfyui_template(image_id):
             APITemplate=APITemplate,
             APIProviderConfig=APIProviderConfig,
             StyleImage=StyleImage,
+            order_id=test_order.id,  # 使用真实订单ID和订单号
+            order_number=order_number,
         )
 
         if not success:
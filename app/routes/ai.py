@@ -10,9 +10,11 @@ logger = logging.getLogger(__name__)
 import os
 import time
 
-import requests
 from flask import Blueprint
 
+from app.services.http_client import get_http_client
+from app.services.result_pipeline import guess_result_suffix
+
 # 创建主蓝图
 ai_bp = Blueprint("ai", __name__, url_prefix="/admin/ai")
 
@@ -62,7 +64,9 @@ def download_api_result_image(image_url, task_id, app_instance=None):
                 download_url = image_url
                 logger.info(f"📥 下载ComfyUI图片: {download_url}")
 
-            response = requests.get(download_url, timeout=60, proxies={"http": None, "https": None})
+            response = get_http_client("download").get(
+                download_url, timeout=60, proxies={"http": None, "https": None}
+            )
             if response.status_code == 200:
                 # 保存到final_works目录
                 final_folder = "final_works"
@@ -72,24 +76,8 @@ def download_api_result_image(image_url, task_id, app_instance=None):
                 timestamp = int(time.time())
                 task_id_str = str(task_id)[:8] if task_id else "unknown"
 
-                # 根据Content-Type确定文件扩展名
-                content_type = response.headers.get("Content-Type", "")
-                if "jpeg" in content_type.lower() or "jpg" in content_type.lower():
-                    suffix = ".jpg"
-                elif "png" in content_type.lower():
-                    suffix = ".png"
-                elif "webp" in content_type.lower():
-                    suffix = ".webp"
-                else:
-                    # 尝试从URL推断
-                    if image_url.lower().endswith(".jpg") or image_url.lower().endswith(".jpeg"):
-                        suffix = ".jpg"
-                    elif image_url.lower().endswith(".png"):
-                        suffix = ".png"
-                    elif image_url.lower().endswith(".webp"):
-                        suffix = ".webp"
-                    else:
-                        suffix = ".jpg"  # 默认JPG
+                # 根据Content-Type确定文件扩展名（其次从URL推断）
+                suffix = guess_result_suffix(response.headers.get("Content-Type", ""), image_url)
 
                 filename = f"final_{task_id_str}_{timestamp}{suffix}"
                 local_path = os.path.join(final_folder, filename)
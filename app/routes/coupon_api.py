@@ -13,6 +13,7 @@ from flask_login import login_required
 
 # 统一导入公共函数
 from app.utils.admin_helpers import get_models
+from app.utils.pagination import paginate_request
 
 # 创建蓝图
 coupon_api_bp = Blueprint("coupon_api", __name__, url_prefix="/api/coupons")
@@ -140,7 +141,7 @@ def get_coupons_list():
 
         status = request.args.get("status", "active")
         page = int(request.args.get("page", 1))
-        per_page = int(request.args.get("per_page", 10))
+        per_page = min(int(request.args.get("per_page", 10)), 100)
 
         query = Coupon.query
         # 如果请求所有状态，不过滤；否则只过滤status字段
@@ -148,7 +149,8 @@ def get_coupons_list():
         if status != "all":
             query = query.filter_by(status=status)
 
-        coupons = query.paginate(page=page, per_page=per_page, error_out=False)
+        # 按创建时间倒序；带 cursor 参数时按游标翻页（不统计总数）
+        coupons = paginate_request(query, (Coupon.create_time, Coupon.id), page, per_page)
 
         # 优化N+1查询：批量查询所有优惠券的已领取数量
         coupon_ids = [coupon.id for coupon in coupons.items]
@@ -211,6 +213,8 @@ def get_coupons_list():
                 "page": page,
                 "per_page": per_page,
                 "pages": coupons.pages,
+                "next_cursor": coupons.next_cursor,
+                "prev_cursor": coupons.prev_cursor,
             }
         )
 
@@ -483,6 +483,15 @@ def admin_franchisee_detail(account_id):
         order.franchisee_deduction for order in orders if order.franchisee_deduction
     )
 
+    # 今日/本月订单和业绩（与加盟商面板共用统计服务）
+    try:
+        from app.services.dashboard_stats_service import get_dashboard_stats
+
+        order_stats = get_dashboard_stats(account_id)
+    except Exception as e:
+        logger.info(f"获取加盟商订单统计失败: {e}")
+        order_stats = None
+
     return render_template(
         "admin/franchisee_detail.html",
         account=account,
@@ -494,6 +503,7 @@ def admin_franchisee_detail(account_id):
         total_orders=total_orders,
         total_order_amount=total_order_amount,
         total_deduction=total_deduction,
+        order_stats=order_stats,
     )
 
 
@@ -20,7 +20,9 @@ from sqlalchemy import desc, func, text
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 
-from app.routes.franchisee.common import get_models, get_wechat_notification
+from app.routes.franchisee.common import get_models
+from app.services.order_event_service import EVENT_ORDER_CREATED, record_order_event
+from app.services.order_search_service import order_search_condition, order_search_rank
 
 # 创建前端路由子蓝图
 bp = Blueprint("franchisee_frontend", __name__)
@@ -115,76 +117,13 @@ def dashboard():
         flash("账户不存在或已被禁用", "error")
         return redirect(url_for("franchisee.franchisee_frontend.franchisee_login"))
 
-    from sqlalchemy import func, or_
-
-    today = datetime.now().date()
-    yesterday = today - timedelta(days=1)
-    this_week_start = today - timedelta(days=today.weekday())
-    this_month_start = today.replace(day=1)
+    from app.services.dashboard_stats_service import get_dashboard_stats
 
     # 基础查询：只查询该加盟商的订单
     base_query = Order.query.filter(Order.franchisee_id == franchisee_id)
 
-    # 订单统计
-    total_orders = base_query.filter(Order.status != "unpaid").count()
-    daily_orders = base_query.filter(
-        func.date(Order.created_at) == today, Order.status != "unpaid"
-    ).count()
-    yesterday_orders = base_query.filter(
-        func.date(Order.created_at) == yesterday, Order.status != "unpaid"
-    ).count()
-    week_orders = base_query.filter(
-        func.date(Order.created_at) >= this_week_start, Order.status != "unpaid"
-    ).count()
-    month_orders = base_query.filter(
-        func.date(Order.created_at) >= this_month_start, Order.status != "unpaid"
-    ).count()
-
-    # 业绩统计（基于完成时间）
-    daily_revenue = (
-        base_query.filter(func.date(Order.completed_at) == today, Order.status == "completed")
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
-
-    yesterday_revenue = (
-        base_query.filter(func.date(Order.completed_at) == yesterday, Order.status == "completed")
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
-
-    week_revenue = (
-        base_query.filter(
-            func.date(Order.completed_at) >= this_week_start, Order.status == "completed"
-        )
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
-
-    month_revenue = (
-        base_query.filter(
-            func.date(Order.completed_at) >= this_month_start, Order.status == "completed"
-        )
-        .with_entities(func.sum(Order.price))
-        .scalar()
-        or 0.0
-    )
-
-    total_revenue = (
-        base_query.filter(Order.status == "completed").with_entities(func.sum(Order.price)).scalar()
-        or 0.0
-    )
-
-    # 订单状态统计
-    pending_orders = base_query.filter(Order.status.in_(["pending", "已支付"])).count()
-    processing_orders = base_query.filter(Order.status == "processing").count()
-    completed_orders = base_query.filter(Order.status == "completed").count()
-    error_orders = base_query.filter(
-        or_(Order.status.in_(["failed", "error"]), Order.printer_error_message.isnot(None))
-    ).count()
+    # 订单数量、状态和业绩统计（条件聚合，短时缓存）
+    stats = get_dashboard_stats(franchisee_id)
 
     # 最近30天的订单和充值记录
     thirty_days_ago = datetime.now() - timedelta(days=30)
@@ -216,22 +155,9 @@ def dashboard():
         account=account,
         recent_orders=recent_orders,
         recent_recharges=recent_recharges,
-        total_orders=total_orders,
-        daily_orders=daily_orders,
-        yesterday_orders=yesterday_orders,
-        week_orders=week_orders,
-        month_orders=month_orders,
         total_amount=total_amount,
         total_deduction=total_deduction,
-        daily_revenue=float(daily_revenue),
-        yesterday_revenue=float(yesterday_revenue),
-        week_revenue=float(week_revenue),
-        month_revenue=float(month_revenue),
-        total_revenue=float(total_revenue),
-        pending_orders=pending_orders,
-        processing_orders=processing_orders,
-        completed_orders=completed_orders,
-        error_orders=error_orders,
+        **stats,
     )
 
 
@@ -329,7 +255,7 @@ def franchisee_orders():
         flash("账户不存在或已被禁用", "error")
         return redirect(url_for("franchisee.franchisee_frontend.franchisee_login"))
 
-    from sqlalchemy import func, or_
+    from sqlalchemy import func
     from sqlalchemy.orm import joinedload
 
     # 获取筛选参数
@@ -356,13 +282,7 @@ def franchisee_orders():
 
     # 订单搜索（按订单号、客户姓名、客户电话搜索）
     if search:
-        query = query.filter(
-            or_(
-                Order.order_number.like(f"%{search}%"),
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
-            )
-        )
+        query = query.filter(order_search_condition(search))
 
     # 优化：使用数据库层面分页（类似管理后台订单列表的优化方式）
     from sqlalchemy import text
@@ -385,17 +305,16 @@ def franchisee_orders():
         order_numbers_subquery = order_numbers_subquery.filter(Order.order_mode == order_mode)
 
     if search:
-        order_numbers_subquery = order_numbers_subquery.filter(
-            or_(
-                Order.order_number.like(f"%{search}%"),
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
-            )
-        )
+        order_numbers_subquery = order_numbers_subquery.filter(order_search_condition(search))
 
     order_numbers_subquery = order_numbers_subquery.group_by(Order.order_number)
 
     # 排序并分页
+    # 搜索时订单号完全匹配、前缀匹配的订单排在前面
+    if search:
+        order_numbers_subquery = order_numbers_subquery.order_by(
+            func.min(order_search_rank(search))
+        )
     order_numbers_subquery = order_numbers_subquery.order_by(text("min_created_at DESC"))
     offset = (page - 1) * per_page
     paginated_order_numbers = order_numbers_subquery.offset(offset).limit(per_page).all()
@@ -465,8 +384,11 @@ def franchisee_orders():
             merged_order = MergedOrder(main_order, item_count, total_price, order_data["items"])
             orders.append(merged_order)
 
-        # 按创建时间排序
-        orders.sort(key=lambda x: x.created_at, reverse=True)
+        # 搜索时保持分页子查询的排序（匹配度优先），否则按创建时间排序
+        if search:
+            orders.sort(key=lambda x: order_numbers.index(x.order_number))
+        else:
+            orders.sort(key=lambda x: x.created_at, reverse=True)
         paginated_orders = orders
 
     # 3. 计算总数（不重复的订单号数量）
@@ -486,13 +408,7 @@ def franchisee_orders():
         total_count_query = total_count_query.filter(Order.order_mode == order_mode)
 
     if search:
-        total_count_query = total_count_query.filter(
-            or_(
-                Order.order_number.like(f"%{search}%"),
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
-            )
-        )
+        total_count_query = total_count_query.filter(order_search_condition(search))
 
     total_count = total_count_query.scalar() or 0
     total_pages = (total_count + per_page - 1) // per_page if per_page > 0 else 1
@@ -518,18 +434,10 @@ def franchisee_orders():
         or 0
     )
 
-    # 计算每日业绩总额（今天完成的订单总金额，使用数据库聚合函数，避免N+1查询）
-    daily_revenue = (
-        db.session.query(func.sum(Order.price))
-        .filter(
-            Order.franchisee_id == franchisee_id,
-            func.date(Order.completed_at) == today,
-            Order.status == "completed",
-        )
-        .scalar()
-        or 0.0
-    )
-    daily_revenue = float(daily_revenue)
+    # 计算每日业绩总额（今天完成的订单总金额，读取业绩预聚合分桶）
+    from app.services.order_rollup_service import get_revenue
+
+    daily_revenue = get_revenue(today, today + timedelta(days=1), franchisee_id=franchisee_id)
 
     # 计算待选片订单数（状态为pending_selection的订单，按订单号去重）
     pending_selection_order_numbers = (
@@ -827,15 +735,7 @@ def franchisee_users():
     # 支持筛选参数
     search = request.args.get("search", "").strip()
     if search:
-        from sqlalchemy import or_
-
-        query = query.filter(
-            or_(
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
-                Order.order_number.like(f"%{search}%"),
-            )
-        )
+        query = query.filter(order_search_condition(search))
 
     # 分页查询（按订单号去重）
     from sqlalchemy import func, text
@@ -845,17 +745,14 @@ def franchisee_users():
     ).filter(Order.franchisee_id == franchisee_id)
 
     if search:
-        from sqlalchemy import or_
-
-        order_numbers_subquery = order_numbers_subquery.filter(
-            or_(
-                Order.customer_name.like(f"%{search}%"),
-                Order.customer_phone.like(f"%{search}%"),
-                Order.order_number.like(f"%{search}%"),
-            )
-        )
+        order_numbers_subquery = order_numbers_subquery.filter(order_search_condition(search))
 
     order_numbers_subquery = order_numbers_subquery.group_by(Order.order_number)
+    # 搜索时订单号完全匹配、前缀匹配的订单排在前面
+    if search:
+        order_numbers_subquery = order_numbers_subquery.order_by(
+            func.min(order_search_rank(search))
+        )
     order_numbers_subquery = order_numbers_subquery.order_by(text("min_created_at DESC"))
     offset = (page - 1) * per_page
     paginated_order_numbers = order_numbers_subquery.offset(offset).limit(per_page).all()
@@ -1503,21 +1400,16 @@ def franchisee_order():
             )
             db.session.add(recharge_record)
 
+            # 微信通知由订单事件消费者异步发送
+            record_order_event(
+                order,
+                EVENT_ORDER_CREATED,
+                customer_name=customer_name,
+                total_price=price,
+                source="加盟商",
+            )
             db.session.commit()
 
-            wechat_notify, WECHAT_NOTIFICATION_AVAILABLE = get_wechat_notification()
-            if WECHAT_NOTIFICATION_AVAILABLE and wechat_notify:
-                try:
-                    wechat_notify(
-                        order_number=order_number,
-                        customer_name=customer_name,
-                        total_price=price,
-                        source="加盟商",
-                    )
-                    logger.info(f"✅ 加盟商订单微信通知已发送: {order_number}")
-                except Exception as e:
-                    logger.error("加盟商订单微信通知失败: {e}")
-
             flash(f"订单创建成功！订单号：{order_number}", "success")
             return redirect(url_for("franchisee.franchisee_frontend.dashboard"))
 
@@ -1625,25 +1517,16 @@ def franchisee_order_page(qr_code):
                     franchisee.used_quota += price
                     franchisee.remaining_quota -= price
 
+                    # 微信通知由订单事件消费者异步发送
+                    record_order_event(
+                        order,
+                        EVENT_ORDER_CREATED,
+                        customer_name=customer_name,
+                        total_price=price,
+                        source="加盟商",
+                    )
                     db.session.commit()
 
-                    wechat_notify, WECHAT_NOTIFICATION_AVAILABLE = get_wechat_notification()
-                    if WECHAT_NOTIFICATION_AVAILABLE and wechat_notify:
-                        try:
-                            wechat_notify(
-                                order_number=(
-                                    order.order_number
-                                    if hasattr(order, "order_number")
-                                    else f"加盟商{order.id}"
-                                ),
-                                customer_name=customer_name,
-                                total_price=price,
-                                source="加盟商",
-                            )
-                            logger.info(f"✅ 加盟商订单（二维码）微信通知已发送: {order.id}")
-                        except Exception as e:
-                            logger.error("加盟商订单微信通知失败: {e}")
-
                     flash(f"订单创建成功！订单金额：{price}元，已从加盟商账户扣除", "success")
                     return redirect(url_for("franchisee.franchisee_order_page", qr_code=qr_code))
                 else:
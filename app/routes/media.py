@@ -7,14 +7,14 @@
 import logging
 
 logger = logging.getLogger(__name__)
+import hashlib
 import os
 import sys
-import zipfile
-from io import BytesIO
 from urllib.parse import unquote
 
-from flask import Blueprint, current_app, jsonify, send_file, send_from_directory
+from flask import Blueprint, current_app, jsonify, request, send_from_directory
 from flask_login import login_required
+from werkzeug.security import safe_join
 
 # 统一导入公共函数
 from app.utils.admin_helpers import get_models
@@ -23,11 +23,21 @@ from app.utils.helpers import (
     generate_smart_filename,
     generate_smart_image_name,
 )
+from app.utils.image_derivatives import parse_derivative_params, send_derivative
+from app.utils.order_archive import ArchiveEntry, send_order_archive
 
 # 创建蓝图
 media_bp = Blueprint("media", __name__)
 
 
+def _derivative_response(filepath):
+    """请求带有派生图参数（w / q / fmt）时返回缩放/转码后的派生图响应，否则返回None"""
+    params = parse_derivative_params(request.args, request.headers.get("Accept", ""))
+    if params is None:
+        return None
+    return send_derivative(filepath, params)
+
+
 # ============================================================================
 # 下载路由（需要登录）
 # ============================================================================
@@ -116,6 +126,26 @@ def download_hd(filename):
         return f"下载失败: {str(e)}", 500
 
 
+def original_archive_entries(order, filenames, upload_folder):
+    """订单原图压缩包的条目：制作信息 + 原图（使用智能文件名）"""
+    production_info = generate_production_info(order)
+    # 制作信息含生成时间，按不含生成时间的内容计算缓存指纹，订单未变化时命中缓存
+    info_token = hashlib.sha256(
+        generate_production_info(order, include_generated_time=False).encode("utf-8")
+    ).hexdigest()
+    entries = [
+        ArchiveEntry("制作信息.txt", data=production_info.encode("utf-8"), cache_token=info_token)
+    ]
+    for index, fname in enumerate(filenames):
+        entries.append(
+            ArchiveEntry(
+                generate_smart_image_name(order, fname, index),
+                path=os.path.join(upload_folder, fname),
+            )
+        )
+    return entries
+
+
 @media_bp.route("/download/original/batch/<int:order_id>")
 @login_required
 def download_original_batch(order_id):
@@ -153,32 +183,13 @@ def download_original_batch(order_id):
         if not unique_files:
             return "订单没有图片", 404
 
-        # 生成制作信息
-        production_info = generate_production_info(order)
-
         # 生成智能文件名
         smart_filename = generate_smart_filename(order)
 
-        # 打包ZIP到内存
-        mem_file = BytesIO()
-        with zipfile.ZipFile(mem_file, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-            # 添加制作信息txt文件
-            zf.writestr("制作信息.txt", production_info.encode("utf-8"))
-
-            # 添加所有图片文件
-            for fname in unique_files:
-                file_path = os.path.join(current_app.config["UPLOAD_FOLDER"], fname)
-                if os.path.exists(file_path):
-                    # 使用智能文件名
-                    smart_image_name = generate_smart_image_name(
-                        order, fname, unique_files.index(fname)
-                    )
-                    zf.write(file_path, arcname=smart_image_name)
-
-        mem_file.seek(0)
-        download_name = f"{smart_filename}.zip"
-        return send_file(
-            mem_file, mimetype="application/zip", as_attachment=True, download_name=download_name
+        # 流式打包ZIP（图片不再重复压缩），完整下载后缓存到磁盘供再次下载
+        entries = original_archive_entries(order, unique_files, current_app.config["UPLOAD_FOLDER"])
+        return send_order_archive(
+            entries, cache_key=f"order_{order.id}", download_name=f"{smart_filename}.zip"
         )
     except Exception as e:
         logger.info(f"批量下载原图失败: {e}")
@@ -214,6 +225,9 @@ def public_media_hd(filename):
         hd_filepath = os.path.join(hd_folder, filename)
 
         if os.path.exists(hd_filepath):
+            derivative = _derivative_response(hd_filepath)
+            if derivative is not None:
+                return derivative
             response = send_from_directory(hd_folder, filename, as_attachment=False)
             # 如果是缩略图，设置较短的缓存时间（1小时）
             if filename.endswith("_thumb.jpg"):
@@ -233,6 +247,9 @@ def public_media_hd(filename):
         final_filepath = os.path.join(final_folder, filename)
 
         if os.path.exists(final_filepath):
+            derivative = _derivative_response(final_filepath)
+            if derivative is not None:
+                return derivative
             response = send_from_directory(final_folder, filename, as_attachment=False)
             # 如果是缩略图，设置较短的缓存时间（1小时）
             if filename.endswith("_thumb.jpg"):
@@ -328,17 +345,18 @@ def public_media_hd_original(filename):
 def public_mockup(filename):
     """样机套图生成结果访问（无需登录）"""
     try:
-        output_dir = current_app.config.get("MOCKUP_OUTPUT_FOLDER")
-        if not output_dir:
-            output_dir = os.path.join(current_app.root_path, "data", "mockup_output")
-        if not os.path.isabs(output_dir):
-            output_dir = os.path.join(current_app.root_path, output_dir)
+        from app.services.mockup_service import get_mockup_output_dir
+
+        output_dir = get_mockup_output_dir(current_app)
 
         filepath = os.path.join(output_dir, filename)
         if not os.path.exists(filepath):
             return jsonify({"error": "文件不存在", "filename": filename}), 404
 
-        return send_from_directory(output_dir, filename, as_attachment=False)
+        # 文件名由内容哈希生成，同名文件内容不会变化，可长期缓存
+        return send_from_directory(
+            output_dir, filename, as_attachment=False, max_age=365 * 24 * 3600
+        )
     except Exception as e:
         logger.exception("访问样机图片失败: %s", e)
         return jsonify({"error": str(e)}), 500
@@ -385,6 +403,10 @@ def media_original(filename):
             logger.error("路径遍历攻击尝试: %s", filepath)
             return jsonify({"error": "非法路径"}), 403
 
+        derivative = _derivative_response(filepath)
+        if derivative is not None:
+            return derivative
+
         file_size = os.path.getsize(filepath)
         logger.info(f"✅ 返回文件: {filepath}, 大小: {file_size} bytes")
         return send_from_directory(upload_folder, filename, as_attachment=False)
@@ -431,6 +453,11 @@ def media_final(filename):
     logger.info(f"文件是否存在: {os.path.exists(final_path)}")
     if os.path.exists(final_path):
         logger.info(f"文件大小: {os.path.getsize(final_path)} bytes")
+        safe_path = safe_join(current_app.config["FINAL_FOLDER"], filename)
+        if safe_path and os.path.isfile(safe_path):
+            derivative = _derivative_response(safe_path)
+            if derivative is not None:
+                return derivative
     return send_from_directory(current_app.config["FINAL_FOLDER"], filename, as_attachment=False)
 
 
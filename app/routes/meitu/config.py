@@ -419,6 +419,10 @@ def save_meitu_config():
                 db.session.add(config)
 
         db.session.commit()
+        # 配置通过原始SQL写入，ORM事件检测不到，需主动通知配置注册表
+        from app.services.config_registry import bump_config_version
+
+        bump_config_version()
 
         return jsonify({"status": "success", "message": "配置保存成功", "data": {"id": config.id}})
 
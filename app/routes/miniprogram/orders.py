@@ -7,7 +7,6 @@ import logging
 
 logger = logging.getLogger(__name__)
 import base64
-import threading
 from io import BytesIO
 
 import qrcode
@@ -82,6 +81,7 @@ def miniprogram_get_orders():
         from datetime import datetime
 
         from app.utils.helpers import parse_shipping_info as _parse_shipping_info
+        from app.utils.pagination import pagination_info, paginate_request
         from server_config import get_base_url, get_media_url
 
         openid = request.args.get("openid")
@@ -90,6 +90,8 @@ def miniprogram_get_orders():
 
         orders = []
         pagination = None  # 初始化分页对象
+        # 分页排序键；带 cursor 参数时按游标翻页，不再 OFFSET + count()
+        order_keys = (Order.created_at, Order.id)
 
         # 优先使用openid查询
         if openid:
@@ -117,10 +119,11 @@ def miniprogram_get_orders():
                 page = request.args.get("page", 1, type=int)
                 per_page = min(request.args.get("per_page", 20, type=int), 100)
 
-                pagination = (
-                    Order.query.filter(Order.openid == openid, Order.source_type == "miniprogram")
-                    .order_by(Order.created_at.desc())
-                    .paginate(page=page, per_page=per_page, error_out=False)
+                pagination = paginate_request(
+                    Order.query.filter(Order.openid == openid, Order.source_type == "miniprogram"),
+                    order_keys,
+                    page,
+                    per_page,
                 )
                 orders = pagination.items
 
@@ -143,12 +146,13 @@ def miniprogram_get_orders():
                 page = request.args.get("page", 1, type=int)
                 per_page = min(request.args.get("per_page", 20, type=int), 100)
 
-                pagination = (
+                pagination = paginate_request(
                     Order.query.filter(
                         Order.openid == user.open_id, Order.source_type == "miniprogram"
-                    )
-                    .order_by(Order.created_at.desc())
-                    .paginate(page=page, per_page=per_page, error_out=False)
+                    ),
+                    order_keys,
+                    page,
+                    per_page,
                 )
                 orders = pagination.items
             else:
@@ -162,12 +166,13 @@ def miniprogram_get_orders():
             page = request.args.get("page", 1, type=int)
             per_page = min(request.args.get("per_page", 20, type=int), 100)
 
-            pagination = (
+            pagination = paginate_request(
                 Order.query.filter(
                     Order.customer_phone == phone, Order.source_type == "miniprogram"
-                )
-                .order_by(Order.created_at.desc())
-                .paginate(page=page, per_page=per_page, error_out=False)
+                ),
+                order_keys,
+                page,
+                per_page,
             )
             orders = pagination.items
 
@@ -347,16 +352,8 @@ def miniprogram_get_orders():
 
         # 如果使用了分页，添加分页信息
         if pagination is not None:
-            response_data["pagination"] = {
-                "page": pagination.page,
-                "per_page": pagination.per_page,
-                "total": pagination.total,
-                "pages": pagination.pages,
-                "has_prev": pagination.has_prev,
-                "has_next": pagination.has_next,
-                "prev_page": pagination.prev_num if pagination.has_prev else None,
-                "next_page": pagination.next_num if pagination.has_next else None,
-            }
+            # 游标翻页时 total/pages 为空，使用 next_cursor / prev_cursor 继续翻页
+            response_data["pagination"] = pagination_info(pagination)
 
         return jsonify(response_data)
 
@@ -1004,43 +1001,21 @@ def android_upload_photos():
         # 根据订单类型判断是否进入自动化流程
         # 立即拍摄（shooting）：收到上传的原图就进入AI制作流程
         # 立即制作（making）：收到上传的图片也不进行任何处理
+        processing_queued = True
         if order.order_mode == "shooting":
             # 立即拍摄：进入自动化流程
             try:
-                from app.services.image_processing_service import process_order_images
-
-                # 获取风格分类ID（从订单中获取）
-                style_category_id = (
-                    order.style_category_id if hasattr(order, "style_category_id") else None
+                from app.services.image_processing_executor import (
+                    submit_order_image_processing,
                 )
-                style_image_id = order.style_image_id if hasattr(order, "style_image_id") else None
-
-                # 在后台线程中处理图片（需要应用上下文）
-                # 使用函数开头已获取的app实例（从test_server模块）
-                app_instance = app  # app已在函数开头从test_server获取
-
-                def process_images_async():
-                    try:
-                        # 使用从test_server获取的应用实例创建应用上下文
-                        with app_instance.app_context():
-                            process_order_images(
-                                order_id=order.id,
-                                order_number=order.order_number,
-                                style_category_id=style_category_id,
-                                style_image_id=style_image_id,
-                            )
-                    except Exception as e:
-                        logger.info(f"后台处理图片失败: {str(e)}")
-                        import traceback
 
-                        traceback.print_exc()
-
-                processing_thread = threading.Thread(target=process_images_async)
-                processing_thread.daemon = True
-                processing_thread.start()
-                logger.info("✅ 立即拍摄订单，已启动后台图片处理流程（美图API + AI工作流）")
+                # 提交到共享的有界执行器（按加盟商轮转处理，不再每次上传新起线程）
+                processing_queued = submit_order_image_processing(order)
+                if processing_queued:
+                    logger.info("✅ 立即拍摄订单，已提交后台图片处理流程（美图API + AI工作流）")
             except Exception as e:
-                logger.warning("启动图片处理流程失败: {str(e)}")
+                processing_queued = False
+                logger.warning(f"启动图片处理流程失败: {str(e)}")
                 # 不影响上传成功的返回
         elif order.order_mode == "making":
             # 立即制作：不进行任何自动化处理，等待人工处理
@@ -1049,30 +1024,16 @@ def android_upload_photos():
             # 未设置订单类型：默认进入自动化流程（兼容旧订单）
             logger.warning("订单类型未设置，默认进入自动化流程")
             try:
-                from app.services.image_processing_service import process_order_images
-
-                style_category_id = (
-                    order.style_category_id if hasattr(order, "style_category_id") else None
+                from app.services.image_processing_executor import (
+                    submit_order_image_processing,
                 )
-                style_image_id = order.style_image_id if hasattr(order, "style_image_id") else None
-
-                def process_images_async():
-                    try:
-                        process_order_images(
-                            order_id=order.id,
-                            order_number=order.order_number,
-                            style_category_id=style_category_id,
-                            style_image_id=style_image_id,
-                        )
-                    except Exception as e:
-                        logger.info(f"后台处理图片失败: {str(e)}")
 
-                processing_thread = threading.Thread(target=process_images_async)
-                processing_thread.daemon = True
-                processing_thread.start()
-                logger.info("✅ 已启动后台图片处理流程（美图API + AI工作流）")
+                processing_queued = submit_order_image_processing(order)
+                if processing_queued:
+                    logger.info("✅ 已提交后台图片处理流程（美图API + AI工作流）")
             except Exception as e:
-                logger.warning("启动图片处理流程失败: {str(e)}")
+                processing_queued = False
+                logger.warning(f"启动图片处理流程失败: {str(e)}")
 
         # 获取媒体URL
         from server_config import get_media_url
@@ -1093,6 +1054,22 @@ def android_upload_photos():
                 }
             )
 
+        if not processing_queued:
+            # 照片已保存，但图片处理未能排队（执行器和任务队列都已满/不可用）
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "照片已保存，图片处理队列繁忙，请稍后重试",
+                        "orderId": order.order_number,
+                        "uploadedFiles": uploaded_files_info,
+                        "status": order.status,
+                        "processingQueued": False,
+                    }
+                ),
+                503,
+            )
+
         return jsonify(
             {
                 "success": True,
@@ -1122,20 +1099,16 @@ def miniprogram_update_order_status(order_id):
     """小程序更新订单状态"""
     try:
         models = get_models()
-        helpers = get_helper_functions()
-        if not models or not helpers:
+        if not models:
             return jsonify({"status": "error", "message": "系统未初始化"}), 500
 
         db = models["db"]
         Order = models["Order"]
         Commission = models.get("Commission")
-        app = models.get("app")
-        send_order_completion_notification_auto = helpers.get(
-            "send_order_completion_notification_auto"
-        )
-        import os
         from datetime import datetime
 
+        from app.services.order_event_service import record_status_change
+
         data = request.get_json()
         if not data:
             return jsonify({"status": "error", "message": "缺少请求数据"}), 400
@@ -1152,6 +1125,7 @@ def miniprogram_update_order_status(order_id):
             return jsonify({"status": "error", "message": "订单类型不匹配"}), 400
 
         # 更新订单状态
+        old_status = order.status
         order.status = status
         if status == "delivered":
             order.completed_at = datetime.now()
@@ -1165,83 +1139,10 @@ def miniprogram_update_order_status(order_id):
             # 状态为completed时，设置完成时间
             order.completed_at = datetime.now()
 
+        # 订单完成通知（completed）、发送冲印系统（hd_ready）由订单事件消费者异步处理
+        record_status_change(order, old_status, source="miniprogram")
         db.session.commit()
 
-        # 如果状态更新为'completed'（已完成），自动发送订单完成通知
-        if status == "completed" and send_order_completion_notification_auto:
-            # 检查是否为加盟商订单且需要确版
-            if (
-                hasattr(order, "franchisee_id")
-                and order.franchisee_id
-                and hasattr(order, "need_confirmation")
-                and order.need_confirmation
-                and not getattr(order, "franchisee_confirmed", False)
-            ):
-                # 加盟商订单需要确版，不发送通知
-                pass
-            else:
-                # 普通订单或已确认的加盟商订单，正常流程
-                try:
-                    send_order_completion_notification_auto(order)
-                except Exception as e:
-                    logger.info(f"发送订单完成通知失败: {e}")
-
-        # 如果状态更新为'hd_ready'（高清放大），自动发送到冲印系统
-        if status == "hd_ready" and app:
-            try:
-                from printer_client import PrinterSystemClient
-                from printer_config import PRINTER_SYSTEM_AVAILABLE, PRINTER_SYSTEM_CONFIG
-
-                if PRINTER_SYSTEM_AVAILABLE and PRINTER_SYSTEM_CONFIG.get("enabled", False):
-                    # 检查是否有高清图片
-                    if hasattr(order, "hd_image") and order.hd_image:
-                        hd_image_path = os.path.join(
-                            app.config.get("HD_FOLDER", "hd_images"), order.hd_image
-                        )
-                        if os.path.exists(hd_image_path):
-                            # 发送到冲印系统（传入order对象用于状态跟踪）
-                            printer_client = PrinterSystemClient(PRINTER_SYSTEM_CONFIG)
-                            result = printer_client.send_order_to_printer(
-                                order, hd_image_path, order_obj=order
-                            )
-
-                            # 提交数据库更改（包括发送状态）
-                            db.session.commit()
-
-                            if result["success"]:
-                                logger.info(
-                                    f"订单 {order.order_number} 高清图片已成功发送到冲印系统"
-                                )
-                                # 发送成功后，更新状态为已发货
-                                order.status = "processing"
-                                db.session.commit()
-                            else:
-                                logger.info(
-                                    f"订单 {order.order_number} 高清图片发送到冲印系统失败: {result['message']}"
-                                )
-                        else:
-                            logger.info(
-                                f"订单 {order.order_number} 高清图片不存在: {hd_image_path}"
-                            )
-                            if hasattr(order, "printer_send_status"):
-                                order.printer_send_status = "sent_failed"
-                                order.printer_error_message = f"高清图片文件不存在: {hd_image_path}"
-                                db.session.commit()
-                    else:
-                        logger.info(f"订单 {order.order_number} 没有高清图片，跳过冲印系统发送")
-                        if hasattr(order, "printer_send_status"):
-                            order.printer_send_status = "sent_failed"
-                            order.printer_error_message = "订单没有高清图片"
-                            db.session.commit()
-            except ImportError:
-                logger.info("冲印系统模块未找到，跳过冲印系统发送")
-            except Exception as e:
-                logger.info(f"发送订单到冲印系统时发生错误: {str(e)}")
-                if hasattr(order, "printer_send_status"):
-                    order.printer_send_status = "sent_failed"
-                    order.printer_error_message = f"发送异常: {str(e)}"
-                    db.session.commit()
-
         # 状态文本映射
         status_text_map = {
             "unpaid": "待上传图片",
@@ -1524,55 +1425,21 @@ def update_order_images(order_id):
         # 根据订单类型判断是否进入自动化流程
         # 立即拍摄（shooting）：收到上传的原图就进入AI制作流程
         # 立即制作（making）：收到上传的图片也不进行任何处理
+        processing_queued = True
         if order.order_mode == "shooting":
             # 立即拍摄：进入自动化流程
             try:
-                from app.services.image_processing_service import process_order_images
-
-                # 获取风格分类ID（从订单中获取）
-                style_category_id = (
-                    order.style_category_id if hasattr(order, "style_category_id") else None
+                from app.services.image_processing_executor import (
+                    submit_order_image_processing,
                 )
-                style_image_id = order.style_image_id if hasattr(order, "style_image_id") else None
-
-                # 在后台线程中处理图片（需要应用上下文）
-                # 使用从models获取的app实例
-                app_instance = app if app else None
-                if not app_instance:
-                    # 如果models中没有app，尝试从test_server获取
-                    import sys
-
-                    if "test_server" in sys.modules:
-                        test_server_module = sys.modules["test_server"]
-                        if hasattr(test_server_module, "app"):
-                            app_instance = test_server_module.app
-
-                if app_instance:
-
-                    def process_images_async():
-                        try:
-                            # 使用应用实例创建应用上下文
-                            with app_instance.app_context():
-                                process_order_images(
-                                    order_id=order.id,
-                                    order_number=order.order_number,
-                                    style_category_id=style_category_id,
-                                    style_image_id=style_image_id,
-                                )
-                        except Exception as e:
-                            logger.info(f"后台处理图片失败: {str(e)}")
-                            import traceback
-
-                            traceback.print_exc()
-
-                    processing_thread = threading.Thread(target=process_images_async)
-                    processing_thread.daemon = True
-                    processing_thread.start()
-                    logger.info("✅ 立即拍摄订单，已启动后台图片处理流程（美图API + AI工作流）")
-                else:
-                    logger.warning("无法获取应用实例，跳过后台图片处理")
+
+                # 提交到共享的有界执行器（按加盟商轮转处理，不再每次上传新起线程）
+                processing_queued = submit_order_image_processing(order)
+                if processing_queued:
+                    logger.info("✅ 立即拍摄订单，已提交后台图片处理流程（美图API + AI工作流）")
             except Exception as e:
-                logger.warning("启动图片处理流程失败: {str(e)}")
+                processing_queued = False
+                logger.warning(f"启动图片处理流程失败: {str(e)}")
         elif order.order_mode == "making":
             # 立即制作：不进行任何自动化处理，等待人工处理
             logger.info("ℹ️ 立即制作订单，跳过自动化处理流程，等待人工处理")
@@ -1580,51 +1447,31 @@ def update_order_images(order_id):
             # 未设置订单类型：默认进入自动化流程（兼容旧订单）
             logger.warning("订单类型未设置，默认进入自动化流程")
             try:
-                from app.services.image_processing_service import process_order_images
-
-                style_category_id = (
-                    order.style_category_id if hasattr(order, "style_category_id") else None
+                from app.services.image_processing_executor import (
+                    submit_order_image_processing,
                 )
-                style_image_id = order.style_image_id if hasattr(order, "style_image_id") else None
-
-                # 在后台线程中处理图片（需要应用上下文）
-                # 使用从models获取的app实例
-                app_instance = app if app else None
-                if not app_instance:
-                    # 如果models中没有app，尝试从test_server获取
-                    import sys
-
-                    if "test_server" in sys.modules:
-                        test_server_module = sys.modules["test_server"]
-                        if hasattr(test_server_module, "app"):
-                            app_instance = test_server_module.app
-
-                if app_instance:
-
-                    def process_images_async():
-                        try:
-                            # 使用应用实例创建应用上下文
-                            with app_instance.app_context():
-                                process_order_images(
-                                    order_id=order.id,
-                                    order_number=order.order_number,
-                                    style_category_id=style_category_id,
-                                    style_image_id=style_image_id,
-                                )
-                        except Exception as e:
-                            logger.info(f"后台处理图片失败: {str(e)}")
-                            import traceback
-
-                            traceback.print_exc()
-
-                    processing_thread = threading.Thread(target=process_images_async)
-                    processing_thread.daemon = True
-                    processing_thread.start()
-                    logger.info("✅ 已启动后台图片处理流程（美图API + AI工作流）")
-                else:
-                    logger.warning("无法获取应用实例，跳过后台图片处理")
+
+                processing_queued = submit_order_image_processing(order)
+                if processing_queued:
+                    logger.info("✅ 已提交后台图片处理流程（美图API + AI工作流）")
             except Exception as e:
-                logger.warning("启动图片处理流程失败: {str(e)}")
+                processing_queued = False
+                logger.warning(f"启动图片处理流程失败: {str(e)}")
+
+        if not processing_queued:
+            # 图片已保存，但图片处理未能排队（执行器和任务队列都已满/不可用）
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": "订单图片已保存，图片处理队列繁忙，请稍后重试",
+                        "images": image_urls,
+                        "imageCount": len(processed_images),
+                        "processingQueued": False,
+                    }
+                ),
+                503,
+            )
 
         return jsonify(
             {
@@ -8,6 +8,7 @@ import logging
 logger = logging.getLogger(__name__)
 from flask import Blueprint, jsonify, request
 
+from app.services.order_search_service import search_orders
 from app.utils.admin_helpers import get_models
 
 # 创建子蓝图（不设置url_prefix，使用主蓝图的前缀）
@@ -49,7 +50,8 @@ def search_orders_for_selection():
             query = query.filter(Order.customer_phone == phone)
 
         if order_number:
-            query = query.filter(Order.order_number.like(f"%{order_number}%"))
+            # 订单号包含匹配（走搜索索引），完全匹配和前缀匹配排在前面
+            query = search_orders(order_number, query=query, fields=("order_number",))
 
         # 查询订单
         orders = query.order_by(Order.created_at.desc()).limit(50).all()  # 最多返回50条
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+服务商完成回调路由模块
+RunningHub / nano-banana / 美图 任务完成后回调此接口，替代频繁的状态轮询
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from flask import Blueprint, jsonify, request
+
+from app.services.provider_callbacks import handle_provider_callback
+
+# 创建蓝图
+provider_callbacks_bp = Blueprint("provider_callbacks", __name__, url_prefix="/api")
+
+
+@provider_callbacks_bp.route("/provider-callbacks/<provider>", methods=["POST"])
+def provider_callback(provider):
+    """
+    服务商任务完成回调
+    URL 由系统提交任务时生成（带 ref 与签名），重复回调、已结束任务的回调直接忽略
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if payload is None and request.form:
+            payload = request.form.to_dict()
+
+        status_code, result, message = handle_provider_callback(
+            provider, request.args.get("ref", ""), request.args.get("sig", ""), payload
+        )
+        return (
+            jsonify({"success": status_code == 200, "result": result, "message": message}),
+            status_code,
+        )
+    except Exception as e:
+        logger.error(f"处理服务商回调失败: {str(e)}")
+        import traceback
+
+        traceback.print_exc()
+        return jsonify({"success": False, "message": f"处理回调失败: {str(e)}"}), 500
@@ -8,11 +8,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 import json
-import sys
-import threading
 
 from flask import Blueprint, jsonify, request
 
+from app.services.user_visit_buffer import enqueue_visit
+from app.services.user_visit_buffer import get_user_visit_stats as query_user_visit_stats
+
 # 统一导入公共函数
 from app.utils.admin_helpers import get_models
 
@@ -86,106 +87,25 @@ def record_user_visit():
             return jsonify(response_data)
 
         # ⚡ 优化：先快速返回响应，避免超时
-        # 数据库操作在后台异步处理，不阻塞响应
-        logger.info("✅ [用户访问记录] 准备快速返回响应")
-
-        # 使用线程异步处理数据库操作
-        from flask import current_app
-
-        def save_visit_async():
-            # 在异步线程中需要创建应用上下文
-            try:
-                # 获取应用实例
-                if "test_server" in sys.modules:
-                    test_server_module = sys.modules["test_server"]
-                    app_instance = test_server_module.app
-                else:
-                    logger.warning("[用户访问记录] 异步保存：无法获取应用实例")
-                    return
-
-                # 在应用上下文中执行数据库操作
-                with app_instance.app_context():
-                    # 重新获取models，确保线程安全
-                    async_models = get_models()
-                    if not async_models:
-                        logger.warning("[用户访问记录] 异步保存：系统未初始化")
-                        return
-
-                    db = async_models["db"]
-                    UserVisit = async_models.get("UserVisit")
-
-                    if UserVisit:
-                        # 使用 ORM 快速插入
-                        new_visit = UserVisit(
-                            session_id=session_id,
-                            openid=openid if openid and openid != "anonymous" else None,
-                            user_id=user_id if user_id and user_id != "anonymous" else None,
-                            visit_type=visit_type,
-                            source="miniprogram",
-                            scene=scene,
-                            user_info=json.dumps(user_info) if user_info else None,
-                            is_authorized=bool(openid and openid != "anonymous"),
-                            is_registered=bool(user_id and user_id != "anonymous"),
-                            has_ordered=(visit_type == "order"),
-                            ip_address=ip_address,
-                            user_agent=user_agent,
-                            promotion_code=promotion_code,
-                            referrer_user_id=referrer_user_id,
-                        )
-                        db.session.add(new_visit)
-                        db.session.commit()
-                        logger.info(f"✅ [用户访问记录] 异步保存成功: visitId={new_visit.id}")
-                    else:
-                        # 使用原始 SQL（如果模型不存在）
-                        result = db.session.execute(
-                            db.text("""
-                                INSERT INTO user_visits
-                                (session_id, openid, user_id, promotion_code, referrer_user_id,
-                                 visit_time, visit_type, source, scene, user_info, is_authorized,
-                                 is_registered, has_ordered, ip_address, user_agent)
-                                VALUES (:session_id, :openid, :user_id, :promotion_code, :referrer_user_id,
-                                        CURRENT_TIMESTAMP, :visit_type, :source, :scene, :user_info, :is_authorized,
-                                        :is_registered, :has_ordered, :ip_address, :user_agent)
-                            """),
-                            {
-                                "session_id": session_id,
-                                "openid": openid if openid and openid != "anonymous" else None,
-                                "user_id": user_id if user_id and user_id != "anonymous" else None,
-                                "promotion_code": promotion_code,
-                                "referrer_user_id": referrer_user_id,
-                                "visit_type": visit_type,
-                                "source": "miniprogram",
-                                "scene": scene,
-                                "user_info": json.dumps(user_info) if user_info else None,
-                                "is_authorized": bool(openid and openid != "anonymous"),
-                                "is_registered": bool(user_id and user_id != "anonymous"),
-                                "has_ordered": (visit_type == "order"),
-                                "ip_address": ip_address,
-                                "user_agent": user_agent,
-                            },
-                        )
-                        db.session.commit()
-                        logger.info("✅ [用户访问记录] 异步保存成功（SQL方式）")
-            except Exception as e:
-                # 如果是重复记录错误（session_id 已存在），静默忽略
-                err_str = str(e)
-                err_lower = err_str.lower()
-                is_duplicate = (
-                    "unique" in err_lower
-                    or "duplicate" in err_lower
-                    or "重复键" in err_str
-                    or "唯一约束" in err_str
-                    or "uniqueviolation" in err_lower
-                )
-                if not is_duplicate:
-                    logger.warning(f"[用户访问记录] 异步保存失败: {e}")
-                    import traceback
-
-                    traceback.print_exc()
-
-        # 启动异步保存线程
-        thread = threading.Thread(target=save_visit_async, daemon=True)
-        thread.start()
+        # 访问记录放入进程内缓冲区，由后台线程批量写入数据库，不阻塞响应
+        enqueue_visit(
+            {
+                "session_id": session_id,
+                "openid": openid if openid and openid != "anonymous" else None,
+                "user_id": user_id if user_id and user_id != "anonymous" else None,
+                "visit_type": visit_type,
+                "source": "miniprogram",
+                "scene": scene,
+                "user_info": json.dumps(user_info) if user_info else None,
+                "is_authorized": bool(openid and openid != "anonymous"),
+                "is_registered": bool(user_id and user_id != "anonymous"),
+                "has_ordered": (visit_type == "order"),
+                "ip_address": ip_address,
+                "user_agent": user_agent,
+                "promotion_code": promotion_code,
+                "referrer_user_id": referrer_user_id,
+            }
+        )
 
         # 立即返回响应，不等待数据库操作完成
         logger.info("✅ [用户访问记录] 快速返回响应")
@@ -212,8 +132,6 @@ def record_user_visit():
 def get_user_visit_stats():
     """获取用户访问统计"""
     try:
-        from sqlalchemy import func
-
         start_date = request.args.get("startDate")
         end_date = request.args.get("endDate")
 
@@ -221,34 +139,10 @@ def get_user_visit_stats():
         if not models:
             return jsonify({"success": False, "message": "系统未初始化"}), 500
 
-        UserVisit = models["UserVisit"]
-        db = models["db"]
+        # 按天预聚合的分桶统计（带时分秒的时间范围直接查询访问表）
+        stats = query_user_visit_stats(start_date, end_date)
 
-        query = UserVisit.query
-
-        if start_date:
-            query = query.filter(UserVisit.visit_time >= start_date)
-        if end_date:
-            query = query.filter(UserVisit.visit_time <= end_date)
-
-        total_visits = query.count()
-        unique_users = (
-            query.with_entities(func.count(func.distinct(UserVisit.user_id))).scalar() or 0
-        )
-        unique_sessions = (
-            query.with_entities(func.count(func.distinct(UserVisit.session_id))).scalar() or 0
-        )
-
-        return jsonify(
-            {
-                "success": True,
-                "stats": {
-                    "totalVisits": total_visits,
-                    "uniqueUsers": unique_users,
-                    "uniqueSessions": unique_sessions,
-                },
-            }
-        )
+        return jsonify({"success": True, "stats": stats})
 
     except Exception as e:
         logger.info(f"获取访问统计失败: {str(e)}")
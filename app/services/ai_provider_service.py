@@ -8,33 +8,21 @@ import logging
 
 logger = logging.getLogger(__name__)
 import base64
+import contextlib
 import json
 import os
 import shutil
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from threading import Semaphore
 from urllib.parse import urlparse
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
-from app.utils.config_loader import get_int_config
-
-# 限流机制：限制API并发调用数（从数据库读取配置）
-# 全局信号量（会在首次使用时初始化）
-API_SEMAPHORE = None
-
-
-def _get_api_semaphore():
-    """获取或创建API信号量"""
-    global API_SEMAPHORE
-    if API_SEMAPHORE is None:
-        max_concurrency = get_int_config("api_max_concurrency", 5)
-        API_SEMAPHORE = Semaphore(max_concurrency)
-        logger.info(f"✅ API并发信号量已初始化: {max_concurrency}")
-    return API_SEMAPHORE
+from app.services.http_client import get_http_client
+from app.services.provider_callbacks import attach_ai_task_callback
+from app.services.upload_dedup import encode_inline_image, upload_once
 
 
 def call_api_with_config(
@@ -185,21 +173,10 @@ def call_api_with_config(
         if host and "t8star.cn" in host.lower():
             payload["async"] = "true"
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # VEO视频生成可能需要更长的超时时间（30-300秒）
-        response = session.post(draw_url, json=payload, headers=headers, timeout=(30, 300))
+        response = get_http_client("ai_provider").post(
+            draw_url, json=payload, headers=headers, timeout=(30, 300)
+        )
 
     elif api_config.api_type == "gemini-native":
         # 使用Google Gemini原生格式（JSON，图片base64编码）
@@ -243,7 +220,7 @@ def call_api_with_config(
                         or img_url.startswith("https://10.")
                     )
 
-                    img_data = None
+                    inline_image = None
                     if is_local_url:
                         # 本地URL：直接读取文件
                         try:
@@ -261,36 +238,17 @@ def call_api_with_config(
                                 local_file_path = path
 
                             if local_file_path and os.path.exists(local_file_path):
-                                with open(local_file_path, "rb") as f:
-                                    img_data = f.read()
+                                # 同一内容只编码一次（按SHA-256复用）
+                                inline_image = encode_inline_image(path=local_file_path)
                         except Exception as e:
                             logger.info(f"读取本地文件失败: {str(e)}，尝试HTTP下载")
                             is_local_url = False
 
-                    if not is_local_url or img_data is None:
-                        # 云端URL：使用HTTP下载
-                        proxies = {"http": None, "https": None}  # 禁用代理
-                        response_img = requests.get(img_url, proxies=proxies, timeout=30)
-                        if response_img.status_code == 200:
-                            img_data = response_img.content
-                        else:
-                            raise Exception(f"下载图片失败: HTTP {response_img.status_code}")
-
-                    # 转换为base64
-                    img_base64 = base64.b64encode(img_data).decode("utf-8")
-
-                    # 检测图片格式
-                    if img_data.startswith(b"\xff\xd8\xff"):
-                        mime_type = "image/jpeg"
-                    elif img_data.startswith(b"\x89PNG"):
-                        mime_type = "image/png"
-                    elif img_data.startswith(b"GIF"):
-                        mime_type = "image/gi"
-                    elif img_data.startswith(b"WEBP"):
-                        mime_type = "image/webp"
-                    else:
-                        mime_type = "image/jpeg"  # 默认
+                    if not is_local_url or inline_image is None:
+                        # 云端URL：通过共享下载连接池下载（禁用代理），短时间内同一URL不重复下载
+                        inline_image = encode_inline_image(url=img_url)
 
+                    mime_type, img_base64 = inline_image
                     parts.append({"inline_data": {"mime_type": mime_type, "data": img_base64}})
                 except Exception as e:
                     logger.info(f"处理图片失败: {str(e)}")
@@ -333,34 +291,16 @@ def call_api_with_config(
             logger.warning("[gemini-native] 警告: 没有图片URL，API调用可能失败")
 
         # 发送请求
-        session = requests.Session()
-
         # 关键修复：同步API（gemini-native）不应该重试，避免重复请求导致后端重复制作
         # 如果是同步API，禁用重试机制
         is_sync_api = api_config.is_sync_api if hasattr(api_config, "is_sync_api") else False
         if is_sync_api:
             # 同步API：不重试，避免连接断开后重复请求导致后端重复制作
             logger.warning("[同步API] 检测到同步API，禁用自动重试机制（避免重复请求）")
-            retry_strategy = Retry(
-                total=0,  # 不重试
-                backoff_factor=0,
-                status_forcelist=[],
-                allowed_methods=[],
-                raise_on_status=False,
-            )
+            retry_policy = "none"
         else:
             # 异步API：允许重试（仅对特定状态码）
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504],
-                allowed_methods=["POST"],
-                raise_on_status=False,
-            )
-
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
+            retry_policy = "default"
 
         # 代理设置：T8Star需要代理
         proxy_env_vars = ["HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy"]
@@ -461,8 +401,9 @@ def call_api_with_config(
         # 改进：更精确地判断错误类型，区分"连接建立前失败"和"连接建立后但响应超时"
         request_start_time = time.time()
         try:
-            response = session.post(
+            response = get_http_client("ai_provider").post(
                 draw_url,
+                retry=retry_policy,
                 json=payload,
                 headers=headers,
                 timeout=(connect_timeout, read_timeout),
@@ -664,7 +605,9 @@ def call_api_with_config(
                             else:
                                 # 云端URL：使用HTTP下载
                                 proxies = {"http": None, "https": None}  # 禁用代理
-                                img_response = requests.get(img_url, proxies=proxies, timeout=30)
+                                img_response = get_http_client("download").get(
+                                    img_url, proxies=proxies, timeout=30
+                                )
                                 img_response.raise_for_status()
                                 img_content = img_response.content
 
@@ -703,23 +646,10 @@ def call_api_with_config(
         if not files:
             raise Exception("所有图片下载失败，无法调用API")
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # 增加超时时间到300秒（5分钟）
         logger.info("⏳ 开始调用API，超时时间: 300秒（5分钟）")
         try:
-            response = session.post(
+            response = get_http_client("ai_provider").post(
                 draw_url, data=data, files=files, params=params, headers=headers, timeout=(10, 300)
             )
             logger.info(f"✅ nano-banana-edits API响应状态码: {response.status_code}")
@@ -776,23 +706,12 @@ def call_api_with_config(
         logger.info(f"请求参数: {json.dumps(request_data, ensure_ascii=False, indent=2)}")
         logger.info(f"API Key 长度: {len(api_config.api_key) if api_config.api_key else 0} 字符")
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # 超时设置：连接10秒，读取30秒（RunningHub 通常快速返回 taskId）
         logger.info("⏳ 开始调用 RunningHub ComfyUI 工作流 API，超时时间: 连接10秒, 读取30秒")
         try:
-            response = session.post(draw_url, json=request_data, headers=headers, timeout=(10, 30))
+            response = get_http_client("ai_provider").post(
+                draw_url, json=request_data, headers=headers, timeout=(10, 30)
+            )
             logger.info(f"✅ RunningHub ComfyUI 工作流 API响应状态码: {response.status_code}")
         except requests.exceptions.Timeout:
             logger.error("RunningHub ComfyUI 工作流 API调用超时")
@@ -901,23 +820,12 @@ def call_api_with_config(
         logger.info(f"请求参数: {json.dumps(payload, ensure_ascii=False)}")
         logger.info(f"图片数量: {len(image_urls_to_process)}")
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # 超时设置：连接10秒，读取30秒（RunningHub 通常快速返回 taskId）
         logger.info("⏳ 开始调用 RunningHub API，超时时间: 连接10秒, 读取30秒")
         try:
-            response = session.post(draw_url, json=payload, headers=headers, timeout=(10, 30))
+            response = get_http_client("ai_provider").post(
+                draw_url, json=payload, headers=headers, timeout=(10, 30)
+            )
             logger.info(f"✅ RunningHub API响应状态码: {response.status_code}")
         except requests.exceptions.Timeout:
             logger.error("RunningHub API调用超时")
@@ -993,8 +901,12 @@ def call_api_with_config(
                             # 必须上传到文件服务器（nano-banana API需要云端URL）
                             if api_config.file_upload_endpoint and host:
                                 upload_url = f"{host.rstrip('/')}{api_config.file_upload_endpoint}"
-                                logger.info(f"📤 开始上传图片到文件服务器: {upload_url}")
-                                try:
+
+                                # 同一内容已上传到该文件服务器时直接复用云端URL（重试、批量任务不重复上传）
+                                def _upload_to_file_server(
+                                    _digest, upload_url=upload_url, local_file_path=local_file_path
+                                ):
+                                    logger.info(f"📤 开始上传图片到文件服务器: {upload_url}")
                                     with open(local_file_path, "rb") as f:
                                         upload_files = {
                                             "file": (
@@ -1003,8 +915,9 @@ def call_api_with_config(
                                                 "image/jpeg",
                                             )
                                         }
-                                        upload_response = requests.post(
+                                        upload_response = get_http_client("ai_provider").post(
                                             upload_url,
+                                            retry="none",
                                             files=upload_files,
                                             headers={
                                                 "Authorization": f"Bearer {api_config.api_key}"
@@ -1026,9 +939,8 @@ def call_api_with_config(
                                                 or upload_result.get("file_url")
                                             )
                                             if cloud_url:
-                                                image_urls_for_request.append(cloud_url)
                                                 logger.info(f"✅ 图片已上传到服务器: {cloud_url}")
-                                                continue
+                                                return cloud_url
                                             else:
                                                 logger.warning(
                                                     "上传响应中未找到文件URL，响应内容: {json.dumps(upload_result, ensure_ascii=False)}"
@@ -1048,6 +960,15 @@ def call_api_with_config(
                                             raise Exception(
                                                 f"文件上传失败 (HTTP {upload_response.status_code})。请检查：\n1. 文件上传接口路径是否正确: {api_config.file_upload_endpoint}\n2. API Key是否正确\n3. 服务器是否支持文件上传\n错误详情: {error_text}"
                                             )
+
+                                try:
+                                    cloud_url = upload_once(
+                                        f"file_server:{upload_url}",
+                                        local_file_path,
+                                        _upload_to_file_server,
+                                    )
+                                    image_urls_for_request.append(cloud_url)
+                                    continue
                                 except requests.exceptions.RequestException as upload_error:
                                     error_msg = str(upload_error)
                                     logger.error("上传到文件服务器失败: {error_msg}")
@@ -1092,19 +1013,6 @@ def call_api_with_config(
         logger.info(f"请求参数: {json.dumps(request_data, ensure_ascii=False)}")
 
         try:
-            # 创建带重试机制的Session
-            session = requests.Session()
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504],
-                allowed_methods=["POST", "GET"],
-                raise_on_status=False,
-            )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount("http://", adapter)
-            session.mount("https://", adapter)
-
             # 代理设置：根据不同的服务商决定是否使用代理
             proxy_env_vars = ["HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy"]
             has_proxy = any(os.environ.get(var) for var in proxy_env_vars)
@@ -1166,7 +1074,7 @@ def call_api_with_config(
             logger.info(f"📤 发送请求到: {draw_url}")
             logger.info(f"📤 代理设置: {proxies}")
             logger.info(f"📤 超时设置: connect={connect_timeout}s, read={read_timeout}s")
-            response = session.post(
+            response = get_http_client("ai_provider").post(
                 draw_url,
                 json=request_data,
                 headers=headers,
@@ -1268,310 +1176,464 @@ def get_next_retry_api_config(current_api_config_id, retried_ids, db=None, APIPr
     return next_config
 
 
-def create_api_task(
-    style_image_id,
-    prompt,
-    image_size="1K",
-    aspect_ratio="auto",
-    uploaded_images=None,
-    upload_config=None,
-    api_config_id=None,
-    db=None,
-    AITask=None,
-    APITemplate=None,
-    APIProviderConfig=None,
-    StyleImage=None,
-    StyleCategory=None,
-):
+def _apply_sync_api_result(task, api_config, result, task_id):
     """
-    创建API调用任务
+    解析同步API的响应并更新任务（保存返回的图片、设置成功/失败状态，不提交事务）
 
     Args:
-        style_image_id: 风格图片ID
-        prompt: 提示词
-        image_size: 图片尺寸
-        aspect_ratio: 图片比例
-        uploaded_images: 上传的图片URL列表
-        api_config_id: API配置ID（可选，如果不提供则从模板配置获取）
-        db: 数据库实例
-        AITask: AITask模型类
-        APITemplate: APITemplate模型类
-        APIProviderConfig: APIProviderConfig模型类
-        StyleImage: StyleImage模型类
-        StyleCategory: StyleCategory模型类
-
-    Returns:
-        tuple: (success: bool, task: AITask, error_message: str)
+        task: AITask对象
+        api_config: APIProviderConfig对象
+        result: 响应JSON
+        task_id: 本地生成的任务ID（用于结果文件命名）
     """
-    try:
-        # 获取数据库模型
-        if not all([db, AITask, APITemplate, APIProviderConfig, StyleImage]):
-            import sys
+    # 同步API：直接返回结果，不需要轮询
+    result_image_url = None
+    image_data_base64 = None
+    mime_type = "image/png"
 
-            if "test_server" in sys.modules:
-                test_server_module = sys.modules["test_server"]
-                db = test_server_module.db
-                AITask = test_server_module.AITask
-                APITemplate = test_server_module.APITemplate
-                APIProviderConfig = test_server_module.APIProviderConfig
-                StyleImage = test_server_module.StyleImage
-                StyleCategory = test_server_module.StyleCategory
-
-        if not all([db, AITask, APITemplate, APIProviderConfig, StyleImage]):
-            return False, None, "数据库模型未初始化"
+    # 根据不同的API类型解析响应
+    if api_config.api_type == "gemini-native":
+        # Gemini API响应格式（参考bk-photo-v4的实现）
+        logger.info("📦 [同步API] 解析Gemini响应数据...")
+        logger.info(f"📦 [同步API] 响应数据结构: {json.dumps(result, ensure_ascii=False)[:500]}...")
+
+        # 关键修复：T8Star的响应格式可能是直接的parts数组，而不是candidates结构
+        parts_to_check = None
+
+        # 方式1：标准Gemini格式（candidates -> content -> parts）
+        if "candidates" in result and len(result["candidates"]) > 0:
+            candidate = result["candidates"][0]
+
+            # 检查 finishReason
+            finish_reason = candidate.get("finishReason", "")
+            logger.info(f"🔍 [同步API] Gemini finishReason: {finish_reason}")
+
+            if "content" in candidate and "parts" in candidate["content"]:
+                parts_to_check = candidate["content"]["parts"]
+
+        # 方式2：T8Star可能直接返回parts数组（根据用户提供的响应格式）
+        elif isinstance(result, list):
+            # 如果响应本身就是parts数组
+            parts_to_check = result
+            logger.info("🔍 [同步API] 检测到响应为parts数组格式（T8Star格式）")
+        elif "parts" in result:
+            # 如果响应有parts字段
+            parts_to_check = result["parts"]
+            logger.info("🔍 [同步API] 检测到响应包含parts字段")
+
+        if parts_to_check:
+            logger.info(f"🔍 [同步API] 检查 {len(parts_to_check)} 个parts，查找图片数据...")
+            for idx, part in enumerate(parts_to_check):
+                if not isinstance(part, dict):
+                    continue
 
-        # 获取风格图片
-        style_image = StyleImage.query.get(style_image_id)
-        if not style_image:
-            return False, None, "风格图片不存在"
+                logger.info(f"  part[{idx}] 键: {list(part.keys())}")
 
-        # 防重复提交检查（如果有关联订单，检查是否已有任务）
-        # 注意：API任务可能没有order_id，这里主要检查相同参数的重复提交
-        # 可以根据业务需求调整检查逻辑
+                # 检查inlineData字段（大写，标准格式）
+                if "inlineData" in part:
+                    inline_data = part["inlineData"]
+                    if isinstance(inline_data, dict) and "data" in inline_data:
+                        image_data_base64 = inline_data["data"]
+                        mime_type = inline_data.get("mimeType", "image/png")
+                        logger.info(
+                            f"✅ [同步API] 在part[{idx}]中找到图片数据（inlineData），MIME类型: {mime_type}, 数据长度: {len(image_data_base64) if image_data_base64 else 0}"
+                        )
+                        break
+                # 检查inline_data字段（小写，兼容格式）
+                elif "inline_data" in part:
+                    inline_data = part["inline_data"]
+                    if isinstance(inline_data, dict) and "data" in inline_data:
+                        image_data_base64 = inline_data["data"]
+                        mime_type = inline_data.get("mime_type", "image/png")
+                        logger.info(
+                            f"✅ [同步API] 在part[{idx}]中找到图片数据（inline_data），MIME类型: {mime_type}, 数据长度: {len(image_data_base64) if image_data_base64 else 0}"
+                        )
+                        break
+                # 检查text字段中是否有图片URL（markdown格式）
+                elif "text" in part:
+                    text = part.get("text", "")
+                    if text:
+                        import re
+
+                        # 提取markdown格式的图片URL: ![alt](url)
+                        markdown_pattern = r"!\[.*?\]\((https?://[^\s\)]+)\)"
+                        matches = re.findall(markdown_pattern, text)
+                        if matches:
+                            result_image_url = matches[0]
+                            logger.info(
+                                f"✅ [同步API] 从text字段中提取到图片URL: {result_image_url}"
+                            )
+                            break
+        else:
+            logger.warning("[同步API] 未找到candidates或parts结构，尝试其他格式...")
+            logger.info(f"   响应类型: {type(result)}")
+            logger.info(f"   响应键: {list(result.keys()) if isinstance(result, dict) else 'N/A'}")
+    elif api_config.api_type == "nano-banana-edits":
+        # nano-banana-edits API响应格式（OpenAI DALL-E格式）
+        logger.info("📦 [nano-banana-edits] 解析响应数据...")
+        logger.info(
+            f"📦 [nano-banana-edits] 响应数据结构: {json.dumps(result, ensure_ascii=False)[:500]}..."
+        )
 
-        # 获取API模板配置（图片级别 > 分类级别）
-        api_template = APITemplate.query.filter_by(
-            style_image_id=style_image_id, is_active=True
-        ).first()
-        if not api_template:
-            # 尝试从分类级别获取
-            api_template = APITemplate.query.filter_by(
-                style_category_id=style_image.category_id, style_image_id=None, is_active=True
-            ).first()
+        # 检查多种可能的响应格式
+        # 格式1: OpenAI DALL-E格式 {"created": 1234567890, "data": [{"url": "..."}]}
+        if "data" in result and isinstance(result["data"], list) and len(result["data"]) > 0:
+            result_image_url = result["data"][0].get("url")
+            logger.info(f"✅ [nano-banana-edits] 找到图片URL (格式1): {result_image_url}")
+        # 格式2: 直接返回URL字符串
+        elif isinstance(result, str) and (
+            result.startswith("http://") or result.startswith("https://")
+        ):
+            result_image_url = result
+            logger.info(f"✅ [nano-banana-edits] 找到图片URL (格式2): {result_image_url}")
+        # 格式3: {"url": "..."}
+        elif "url" in result:
+            result_image_url = result.get("url")
+            logger.info(f"✅ [nano-banana-edits] 找到图片URL (格式3): {result_image_url}")
+        # 格式4: {"image_url": "..."} 或 {"result_url": "..."}
+        elif "image_url" in result:
+            result_image_url = result.get("image_url")
+            logger.info(f"✅ [nano-banana-edits] 找到图片URL (格式4): {result_image_url}")
+        elif "result_url" in result:
+            result_image_url = result.get("result_url")
+            logger.info(f"✅ [nano-banana-edits] 找到图片URL (格式5): {result_image_url}")
+        # 格式5: {"data": {"url": "..."}}
+        elif "data" in result and isinstance(result["data"], dict):
+            result_image_url = result["data"].get("url") or result["data"].get("image_url")
+            logger.info(f"✅ [nano-banana-edits] 找到图片URL (格式6): {result_image_url}")
+        else:
+            logger.warning(
+                "[nano-banana-edits] 未找到图片URL，响应格式: {json.dumps(result, ensure_ascii=False)[:200]}"
+            )
+    elif api_config.api_type == "runninghub-rhart-edit":
+        # RunningHub API响应格式
+        # 响应格式：{"taskId": "...", "status": "QUEUED", "results": null, ...}
+        # RunningHub 是异步API，返回 taskId，需要轮询查询结果
+        # 这里不处理同步响应，因为 RunningHub 总是返回 taskId
+        logger.info("📦 [RunningHub] 解析响应数据...")
+        logger.info(
+            f"📦 [RunningHub] 响应数据结构: {json.dumps(result, ensure_ascii=False)[:500]}..."
+        )
+        # RunningHub 的响应会在异步处理部分处理（返回 taskId）
+        # 这里不需要提取图片URL，因为 RunningHub 是异步API
+    else:
+        # 其他同步API格式（如果有直接返回结果的）
+        # 尝试从响应中提取结果图片
+        if result.get("code") == 0 and "data" in result:
+            result_image_url = (
+                result["data"].get("image_url")
+                or result["data"].get("result_image")
+                or result["data"].get("url")
+            )
 
-        if not api_template:
-            return False, None, "未配置API调用模板"
+    # 如果找到base64图片数据，需要解码并上传到云端
+    if image_data_base64:
+        try:
+            logger.info("📤 [同步API] 开始处理base64图片数据...")
+            # 解码base64图片
+            image_data = base64.b64decode(image_data_base64)
+
+            # 保存到本地final_works目录（同步API直接返回结果，保存到本地即可）
+            # 关键修复：直接在项目目录创建文件，避免跨磁盘移动问题
+            final_folder = "final_works"
+            os.makedirs(final_folder, exist_ok=True)
+            timestamp = int(time.time())
+            suffix = ".jpg" if "jpeg" in mime_type.lower() else ".png"
+            # 使用task_id的前8位和完整task_id生成文件名（参考错误日志中的格式）
+            filename = f"final_{task_id[:8]}_{timestamp}{suffix}"
+            local_path = os.path.join(final_folder, filename)
+
+            # 直接写入到目标位置（避免跨磁盘移动）
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+            # 直接写入文件到目标位置
+            with open(local_path, "wb") as f:
+                f.write(image_data)
+
+            # 使用相对路径（用于存储到数据库）
+            result_image_url = os.path.join(final_folder, filename).replace("\\", "/")
+            logger.info(f"✅ [同步API] 图片已保存到本地: {local_path}")
+            logger.info(f"✅ [同步API] 图片路径（数据库）: {result_image_url}")
+        except Exception as e:
+            logger.error("[同步API] 处理base64图片失败: {str(e)}")
+            import traceback
 
-        # 获取API配置
-        if api_config_id:
-            api_config = APIProviderConfig.query.filter_by(id=api_config_id, is_active=True).first()
-        else:
-            # 从模板配置获取
-            if api_template.api_config_id:
-                api_config = APIProviderConfig.query.filter_by(
-                    id=api_template.api_config_id, is_active=True
-                ).first()
-            else:
-                # 使用默认配置
-                api_config = APIProviderConfig.query.filter_by(
-                    is_active=True, is_default=True
-                ).first()
-                if not api_config:
-                    api_config = APIProviderConfig.query.filter_by(is_active=True).first()
+            traceback.print_exc()
 
-        if not api_config:
-            return False, None, "未配置API服务商"
+    # 如果找到图片URL，更新任务状态
+    if result_image_url:
+        task.status = "success"
+        task.output_image_path = result_image_url
+        task.completed_at = datetime.now()
 
-        # 检查是否有批量提示词配置（优先级最高）
-        prompts_list = None
-        if api_template.prompts_json:
-            try:
-                # json 已在文件顶部导入，无需重复导入
-                prompts_list = (
-                    json.loads(api_template.prompts_json)
-                    if isinstance(api_template.prompts_json, str)
-                    else api_template.prompts_json
-                )
-                if prompts_list and isinstance(prompts_list, list) and len(prompts_list) > 0:
-                    # 过滤掉空字符串和None值
-                    prompts_list = [
-                        p.strip() if isinstance(p, str) else str(p) if p else ""
-                        for p in prompts_list
-                    ]
-                    prompts_list = [p for p in prompts_list if p and p.strip()]  # 移除空字符串
-
-                    if len(prompts_list) > 0:
-                        logger.info(f"📝 检测到批量提示词配置，共 {len(prompts_list)} 个有效提示词")
-                        # 如果用户提供了prompt，将其作为第一个提示词（如果用户有输入）
-                        if prompt and prompt.strip():
-                            prompts_list[0] = prompt.strip()
-                            logger.info(f"📝 使用用户输入的提示词替换第一个: {prompt[:50]}...")
-                    else:
-                        logger.warning("批量提示词配置中所有提示词都为空，忽略批量配置")
-                        prompts_list = None
-            except Exception as e:
-                logger.warning("解析批量提示词失败: {str(e)}")
-                prompts_list = None
+        # 更新processing_log中的result_image
+        api_info = json.loads(task.processing_log) if task.processing_log else {}
+        api_info["result_image"] = result_image_url
+        task.processing_log = json.dumps(api_info, ensure_ascii=False)
 
-        # 如果没有批量提示词，且用户也没有提供提示词，尝试使用默认提示词（向后兼容）
-        if not prompts_list and (not prompt or not prompt.strip()):
-            if api_template and api_template.default_prompt:
-                prompt = api_template.default_prompt.strip()
-                logger.info(f"📝 使用默认提示词: {prompt[:50]}...")
+        logger.info(f"✅ [同步API] 任务 {task.id} 已完成，图片URL: {result_image_url}")
+    else:
+        task.status = "failed"
+        task.error_message = "同步API响应中未找到结果图片"
+        logger.error("[同步API] 任务 {task.id} 失败：未找到结果图片")
+        # 保存完整响应以便调试
+        api_info = json.loads(task.processing_log) if task.processing_log else {}
+        api_info["full_response"] = result
+        task.processing_log = json.dumps(api_info, ensure_ascii=False)
 
-        # 如果配置了批量提示词，使用批量创建函数
-        if prompts_list and len(prompts_list) > 0:
-            logger.info(f"🔄 使用批量提示词创建任务，共 {len(prompts_list)} 个提示词")
-            # 获取order_id和order_number（如果设置了）
-            order_id = getattr(create_api_task, "_test_order_id", None)
-            order_number = getattr(create_api_task, "_test_order_number", None)
-
-            # 先确定最终的size和aspect_ratio（用于批量创建）
-            if api_config.api_type == "runninghub-comfyui-workflow":
-                final_size = None
-                final_aspect_ratio = None
-            else:
-                final_size = image_size or api_template.default_size or "1K"
-                final_aspect_ratio = aspect_ratio or api_template.default_aspect_ratio or "auto"
-
-            # 调用批量创建函数（需要在文件末尾定义）
-            # 注意：这里需要先定义函数，或者使用延迟导入
-            # 为了简化，我们在这里直接实现批量创建逻辑
-            created_tasks = []
-            errors = []
-
-            for idx, batch_prompt in enumerate(prompts_list):
-                # 验证提示词不为空
-                if not batch_prompt or not batch_prompt.strip():
-                    error_msg = f"提示词 {idx + 1} 为空，跳过"
-                    errors.append(error_msg)
-                    logger.warning("{error_msg}")
-                    continue
 
-                try:
-                    # 为每个提示词创建任务
-                    # 临时设置order_id和order_number
-                    original_order_id = getattr(create_api_task, "_test_order_id", None)
-                    original_order_number = getattr(create_api_task, "_test_order_number", None)
+def apply_gateway_response(task, job):
+    """
+    把服务商网关的请求结果写回AI任务（对应 create_api_task 中同步API发送后的处理，不提交事务）
 
-                    if order_id:
-                        create_api_task._test_order_id = order_id
-                        if order_number:
-                            create_api_task._test_order_number = order_number
+    Args:
+        task: AITask对象（processing状态）
+        job: ProviderGatewayJob对象（done / failed）
+    """
+    import sys
 
-                    # 递归调用create_api_task（但跳过批量提示词检查，避免无限循环）
-                    # 临时清空prompts_json，避免递归
-                    original_prompts_json = api_template.prompts_json
-                    api_template.prompts_json = None
+    from app.services.provider_gateway import REQUEST_MAY_BE_SENT_ERRORS
 
-                    try:
-                        success, task, error_message = create_api_task(
-                            style_image_id=style_image_id,
-                            prompt=batch_prompt.strip(),  # 确保去除首尾空格
-                            image_size=final_size if final_size else image_size,
-                            aspect_ratio=final_aspect_ratio if final_aspect_ratio else aspect_ratio,
-                            uploaded_images=uploaded_images,
-                            upload_config=upload_config,
-                            api_config_id=api_config_id or api_config.id,
-                            db=db,
-                            AITask=AITask,
-                            APITemplate=APITemplate,
-                            APIProviderConfig=APIProviderConfig,
-                            StyleImage=StyleImage,
-                            StyleCategory=StyleCategory,
-                        )
+    APIProviderConfig = sys.modules["test_server"].APIProviderConfig
+    api_info = json.loads(task.processing_log) if task.processing_log else {}
+    api_config = APIProviderConfig.query.get(api_info.get("api_config_id"))
+    task_id = api_info.get("task_id") or task.comfyui_prompt_id
 
-                        if success and task:
-                            created_tasks.append(task)
-                            logger.info(
-                                f"✅ 批量任务 {idx + 1}/{len(prompts_list)} 创建成功: task_id={task.id}, prompt={batch_prompt[:50]}..."
-                            )
-                        else:
-                            errors.append(
-                                f"提示词 {idx + 1} ({batch_prompt[:50]}...): {error_message}"
-                            )
-                            logger.error(
-                                "批量任务 {idx + 1}/{len(prompts_list)} 创建失败: {error_message}"
-                            )
-                    finally:
-                        # 恢复prompts_json
-                        api_template.prompts_json = original_prompts_json
-                        # 恢复order_id和order_number
-                        create_api_task._test_order_id = original_order_id
-                        create_api_task._test_order_number = original_order_number
+    if job.status == "failed":
+        if job.error_kind in REQUEST_MAY_BE_SENT_ERRORS:
+            # 请求可能已发送到后端：与同步发送时连接断开的处理一致，保持处理中状态且不重试
+            api_info["connection_closed_but_request_sent"] = True
+            api_info["should_not_retry"] = True
+            api_info["connection_error"] = (
+                f"连接被远程关闭，但请求可能已发送到后端，后端可能正在处理或已完成（{job.error_message}）"
+            )
+            task.processing_log = json.dumps(api_info, ensure_ascii=False)
+            logger.warning(
+                f"任务 {task.id} 网关请求未收到响应（{job.error_kind}），保持'处理中'状态"
+            )
+        else:
+            api_info["api_call_error"] = job.error_message
+            api_info["response_status"] = None
+            task.processing_log = json.dumps(api_info, ensure_ascii=False)
+            task.status = "failed"
+            task.error_message = f"同步API连接失败: {job.error_message}"
+        return
+
+    text = (job.response_body or b"").decode("utf-8", errors="replace")
+    api_info["response_data"] = text[:5000] if text else None
+    api_info["response_status"] = job.response_status
+    result = None
+    if job.response_status == 200 and text:
+        try:
+            result = json.loads(text)
+            api_info["original_response"] = result
+        except ValueError:
+            pass
+    task.processing_log = json.dumps(api_info, ensure_ascii=False)
+
+    if job.response_status != 200:
+        task.status = "failed"
+        task.error_message = f"HTTP {job.response_status}: {text[:500]}"
+    elif result is None or api_config is None:
+        task.status = "failed"
+        task.error_message = "同步API响应无法解析" if api_config else "API配置不存在"
+    else:
+        _apply_sync_api_result(task, api_config, result, task_id)
 
-                except Exception as e:
-                    error_msg = f"提示词 {idx + 1} ({batch_prompt[:50]}...): {str(e)}"
-                    errors.append(error_msg)
-                    logger.error("批量任务 {idx + 1}/{len(prompts_list)} 创建异常: {str(e)}")
-                    import traceback
 
-                    traceback.print_exc()
+def _resolve_api_task_config(
+    style_image_id, api_config_id, APITemplate, APIProviderConfig, StyleImage
+):
+    """
+    解析风格图片、API模板和服务商配置（批量任务只解析一次）
 
-            # 如果至少有一个任务创建成功，返回成功
-            if len(created_tasks) > 0:
-                error_message = f"成功创建 {len(created_tasks)}/{len(prompts_list)} 个任务" + (
-                    f"，失败: {', '.join(errors)}" if errors else ""
-                )
-                # 返回第一个任务（保持向后兼容）
-                return True, created_tasks[0], error_message if errors else None
-            else:
-                return False, None, f"所有任务创建失败: {', '.join(errors)}"
+    Returns:
+        tuple: (style_image, api_template, api_config, error_message)
+    """
+    # 获取风格图片
+    style_image = StyleImage.query.get(style_image_id)
+    if not style_image:
+        return None, None, None, "风格图片不存在"
+
+    # 防重复提交检查（如果有关联订单，检查是否已有任务）
+    # 注意：API任务可能没有order_id，这里主要检查相同参数的重复提交
+    # 可以根据业务需求调整检查逻辑
+
+    # 获取API模板配置（图片级别 > 分类级别）
+    api_template = APITemplate.query.filter_by(
+        style_image_id=style_image_id, is_active=True
+    ).first()
+    if not api_template:
+        # 尝试从分类级别获取
+        api_template = APITemplate.query.filter_by(
+            style_category_id=style_image.category_id, style_image_id=None, is_active=True
+        ).first()
 
-        # 验证提示词不为空（在非批量提示词的情况下）
-        # 注意：如果配置了批量提示词，这里不会执行（因为已经在上面处理了）
-        if not prompts_list and (not prompt or not prompt.strip()):
-            return False, None, "提示词不能为空，请配置批量提示词或提供提示词"
+    if not api_template:
+        return None, None, None, "未配置API调用模板"
 
-        # RunningHub ComfyUI 工作流：使用 request_body_template 构建请求体（不需要 model_name）
-        if api_config.api_type == "runninghub-comfyui-workflow":
-            # RunningHub ComfyUI 工作流不需要 model_name，跳过标准参数构建
-            model_name = None  # RunningHub ComfyUI 工作流不使用 model_name
-            final_prompt = prompt.strip() if prompt else ""
-            final_size = None  # RunningHub ComfyUI 工作流不使用 size
-            final_aspect_ratio = None  # RunningHub ComfyUI 工作流不使用 aspect_ratio
+    # 获取API配置
+    if api_config_id:
+        api_config = APIProviderConfig.query.filter_by(id=api_config_id, is_active=True).first()
+    else:
+        # 从模板配置获取
+        if api_template.api_config_id:
+            api_config = APIProviderConfig.query.filter_by(
+                id=api_template.api_config_id, is_active=True
+            ).first()
         else:
-            # 标准API：构建标准请求参数（参考bk-photo-v4：优先使用api_config.model_name）
-            # 注意：如果api_template.model_name为空，应该使用api_config.model_name
-            model_name = api_config.model_name or api_template.model_name or "nano-banana-pro"
-            logger.info(
-                f"📝 模型名称: api_config.model_name={api_config.model_name}, api_template.model_name={api_template.model_name}, 最终使用={model_name}"
+            # 使用默认配置
+            api_config = APIProviderConfig.query.filter_by(is_active=True, is_default=True).first()
+            if not api_config:
+                api_config = APIProviderConfig.query.filter_by(is_active=True).first()
+
+    if not api_config:
+        return None, None, None, "未配置API服务商"
+
+    return style_image, api_template, api_config, None
+
+
+def _template_batch_prompts(api_template, prompt):
+    """
+    模板中配置的批量提示词（用户输入的提示词替换第一个），未配置时返回None
+    """
+    # 检查是否有批量提示词配置（优先级最高）
+    prompts_list = None
+    if api_template.prompts_json:
+        try:
+            # json 已在文件顶部导入，无需重复导入
+            prompts_list = (
+                json.loads(api_template.prompts_json)
+                if isinstance(api_template.prompts_json, str)
+                else api_template.prompts_json
             )
-            final_prompt = prompt or api_template.default_prompt or ""
-            final_size = image_size or api_template.default_size or "1K"
-            final_aspect_ratio = aspect_ratio or api_template.default_aspect_ratio or "auto"
+            if prompts_list and isinstance(prompts_list, list) and len(prompts_list) > 0:
+                # 过滤掉空字符串和None值
+                prompts_list = [
+                    p.strip() if isinstance(p, str) else str(p) if p else "" for p in prompts_list
+                ]
+                prompts_list = [p for p in prompts_list if p and p.strip()]  # 移除空字符串
+
+                if len(prompts_list) > 0:
+                    logger.info(f"📝 检测到批量提示词配置，共 {len(prompts_list)} 个有效提示词")
+                    # 如果用户提供了prompt，将其作为第一个提示词（如果用户有输入）
+                    if prompt and prompt.strip():
+                        prompts_list[0] = prompt.strip()
+                        logger.info(f"📝 使用用户输入的提示词替换第一个: {prompt[:50]}...")
+                else:
+                    logger.warning("批量提示词配置中所有提示词都为空，忽略批量配置")
+                    prompts_list = None
+        except Exception as e:
+            logger.warning("解析批量提示词失败: {str(e)}")
+            prompts_list = None
 
-        # RunningHub ComfyUI 工作流：使用 request_body_template 构建请求体
-        if api_config.api_type == "runninghub-comfyui-workflow":
-            # 从 request_body_template 中获取工作流配置
-            request_body_template = None
-            if api_template.request_body_template:
-                try:
-                    request_body_template = (
-                        json.loads(api_template.request_body_template)
-                        if isinstance(api_template.request_body_template, str)
-                        else api_template.request_body_template
-                    )
-                except Exception:
-                    logger.warning(
-                        "解析 request_body_template 失败: {api_template.request_body_template}"
-                    )
+    return prompts_list
 
-            if not request_body_template or not request_body_template.get("workflow_id"):
-                return False, None, "RunningHub ComfyUI 工作流未配置 workflow_id"
 
-            workflow_id = request_body_template.get("workflow_id")
-            node_info_list_raw = request_body_template.get("nodeInfoList", [])
+def _build_api_request(api_config, api_template, prompt, image_size, aspect_ratio, uploaded_images):
+    """
+    构建单个提示词的服务商请求（不访问数据库、不发送请求）
+
+    Returns:
+        tuple: (api_request: dict, error_message: str)，api_request 包含 model_name、final_prompt、
+        final_size、final_aspect_ratio、request_data、draw_url
+    """
+    # RunningHub ComfyUI 工作流：使用 request_body_template 构建请求体（不需要 model_name）
+    if api_config.api_type == "runninghub-comfyui-workflow":
+        # RunningHub ComfyUI 工作流不需要 model_name，跳过标准参数构建
+        model_name = None  # RunningHub ComfyUI 工作流不使用 model_name
+        final_prompt = prompt.strip() if prompt else ""
+        final_size = None  # RunningHub ComfyUI 工作流不使用 size
+        final_aspect_ratio = None  # RunningHub ComfyUI 工作流不使用 aspect_ratio
+    else:
+        # 标准API：构建标准请求参数（参考bk-photo-v4：优先使用api_config.model_name）
+        # 注意：如果api_template.model_name为空，应该使用api_config.model_name
+        model_name = api_config.model_name or api_template.model_name or "nano-banana-pro"
+        logger.info(
+            f"📝 模型名称: api_config.model_name={api_config.model_name}, api_template.model_name={api_template.model_name}, 最终使用={model_name}"
+        )
+        final_prompt = prompt or api_template.default_prompt or ""
+        final_size = image_size or api_template.default_size or "1K"
+        final_aspect_ratio = aspect_ratio or api_template.default_aspect_ratio or "auto"
+
+    # RunningHub ComfyUI 工作流：使用 request_body_template 构建请求体
+    if api_config.api_type == "runninghub-comfyui-workflow":
+        # 从 request_body_template 中获取工作流配置
+        request_body_template = None
+        if api_template.request_body_template:
+            try:
+                request_body_template = (
+                    json.loads(api_template.request_body_template)
+                    if isinstance(api_template.request_body_template, str)
+                    else api_template.request_body_template
+                )
+            except Exception:
+                logger.warning(
+                    "解析 request_body_template 失败: {api_template.request_body_template}"
+                )
 
-            # 处理图片和提示词：将实际值替换占位符
-            image_urls_to_process = uploaded_images if uploaded_images else []
-            final_prompt = prompt or api_template.default_prompt or ""
+        if not request_body_template or not request_body_template.get("workflow_id"):
+            return None, "RunningHub ComfyUI 工作流未配置 workflow_id"
 
-            logger.info("📸 RunningHub ComfyUI 工作流：准备转换 nodeInfoList 格式")
-            logger.info(f"   - 工作流ID: {workflow_id}")
-            logger.info(f"   - 图片URL数量: {len(image_urls_to_process)}")
-            logger.info(f"   - 图片URL列表: {image_urls_to_process}")
-            logger.info(f"   - 提示词: {final_prompt}")
-            logger.info(
-                f"   - nodeInfoList 原始数据: {json.dumps(node_info_list_raw, ensure_ascii=False)}"
-            )
+        workflow_id = request_body_template.get("workflow_id")
+        node_info_list_raw = request_body_template.get("nodeInfoList", [])
 
-            # 根据 RunningHub API 文档，nodeInfoList 格式应该是：
-            # [{"nodeId": "x", "fieldName": "y", "fieldValue": "z"}]
-            # 而不是 {"nodeId": "x", "inputs": {"y": "z"}}
-            node_info_list = []
-            image_index = 0
+        # 处理图片和提示词：将实际值替换占位符
+        image_urls_to_process = uploaded_images if uploaded_images else []
+        final_prompt = prompt or api_template.default_prompt or ""
 
-            for node_info in node_info_list_raw:
-                node_id = node_info.get("nodeId")
-                if not node_id:
-                    continue
+        logger.info("📸 RunningHub ComfyUI 工作流：准备转换 nodeInfoList 格式")
+        logger.info(f"   - 工作流ID: {workflow_id}")
+        logger.info(f"   - 图片URL数量: {len(image_urls_to_process)}")
+        logger.info(f"   - 图片URL列表: {image_urls_to_process}")
+        logger.info(f"   - 提示词: {final_prompt}")
+        logger.info(
+            f"   - nodeInfoList 原始数据: {json.dumps(node_info_list_raw, ensure_ascii=False)}"
+        )
+
+        # 根据 RunningHub API 文档，nodeInfoList 格式应该是：
+        # [{"nodeId": "x", "fieldName": "y", "fieldValue": "z"}]
+        # 而不是 {"nodeId": "x", "inputs": {"y": "z"}}
+        node_info_list = []
+        image_index = 0
 
-                # 如果已经是正确的格式（fieldName/fieldValue），直接使用
-                if "fieldName" in node_info and "fieldValue" in node_info:
-                    field_name = node_info["fieldName"]
-                    field_value = node_info["fieldValue"]
+        for node_info in node_info_list_raw:
+            node_id = node_info.get("nodeId")
+            if not node_id:
+                continue
 
+            # 如果已经是正确的格式（fieldName/fieldValue），直接使用
+            if "fieldName" in node_info and "fieldValue" in node_info:
+                field_name = node_info["fieldName"]
+                field_value = node_info["fieldValue"]
+
+                # 替换占位符
+                if field_name in ["image", "imageUrls"]:
+                    if (
+                        field_value == "{{image_url}}"
+                        or field_value == ""
+                        or field_value == "{{ref_image_url}}"
+                    ) and image_index < len(image_urls_to_process):
+                        field_value = image_urls_to_process[image_index]
+                        logger.info(f"   ✅ 替换节点 {node_id} 的 {field_name}: {field_value}")
+                        image_index += 1
+                elif field_name == "text":
+                    if field_value == "{{prompt}}" and final_prompt:
+                        field_value = final_prompt
+                        logger.info(f"   ✅ 替换节点 {node_id} 的 {field_name}: {field_value}")
+
+                node_info_list.append(
+                    {
+                        "nodeId": str(node_id),
+                        "fieldName": field_name,
+                        "fieldValue": str(field_value) if field_value is not None else "",
+                    }
+                )
+            # 如果是旧格式（inputs 对象），转换为新格式
+            elif "inputs" in node_info:
+                inputs = node_info["inputs"]
+                for field_name, field_value in inputs.items():
                     # 替换占位符
                     if field_name in ["image", "imageUrls"]:
                         if (
@@ -1587,1016 +1649,1092 @@ def create_api_task(
                             field_value = final_prompt
                             logger.info(f"   ✅ 替换节点 {node_id} 的 {field_name}: {field_value}")
 
+                    # 如果 field_value 是列表或字典，转换为 JSON 字符串
+                    if isinstance(field_value, (list, dict)):
+                        field_value = json.dumps(field_value, ensure_ascii=False)
+                    else:
+                        field_value = str(field_value) if field_value is not None else ""
+
                     node_info_list.append(
                         {
                             "nodeId": str(node_id),
                             "fieldName": field_name,
-                            "fieldValue": str(field_value) if field_value is not None else "",
+                            "fieldValue": field_value,
                         }
                     )
-                # 如果是旧格式（inputs 对象），转换为新格式
-                elif "inputs" in node_info:
-                    inputs = node_info["inputs"]
-                    for field_name, field_value in inputs.items():
-                        # 替换占位符
-                        if field_name in ["image", "imageUrls"]:
-                            if (
-                                field_value == "{{image_url}}"
-                                or field_value == ""
-                                or field_value == "{{ref_image_url}}"
-                            ) and image_index < len(image_urls_to_process):
-                                field_value = image_urls_to_process[image_index]
-                                logger.info(
-                                    f"   ✅ 替换节点 {node_id} 的 {field_name}: {field_value}"
-                                )
-                                image_index += 1
-                        elif field_name == "text":
-                            if field_value == "{{prompt}}" and final_prompt:
-                                field_value = final_prompt
-                                logger.info(
-                                    f"   ✅ 替换节点 {node_id} 的 {field_name}: {field_value}"
-                                )
 
-                        # 如果 field_value 是列表或字典，转换为 JSON 字符串
-                        if isinstance(field_value, (list, dict)):
-                            field_value = json.dumps(field_value, ensure_ascii=False)
-                        else:
-                            field_value = str(field_value) if field_value is not None else ""
-
-                        node_info_list.append(
-                            {
-                                "nodeId": str(node_id),
-                                "fieldName": field_name,
-                                "fieldValue": field_value,
-                            }
-                        )
+        # 构建 RunningHub ComfyUI 工作流请求体
+        # 根据 RunningHub API 文档：https://www.runninghub.cn/runninghub-api-doc-cn/doc-7534195
+        # 使用 /task/openapi/create 端点，请求体包含 apiKey, workflowId, nodeInfoList
+        request_data = {
+            "apiKey": api_config.api_key,  # API Key 必须在请求体中
+            "workflowId": workflow_id,  # workflowId 在请求体中，不在 URL 路径中
+            "nodeInfoList": node_info_list,
+        }
 
-            # 构建 RunningHub ComfyUI 工作流请求体
-            # 根据 RunningHub API 文档：https://www.runninghub.cn/runninghub-api-doc-cn/doc-7534195
-            # 使用 /task/openapi/create 端点，请求体包含 apiKey, workflowId, nodeInfoList
-            request_data = {
-                "apiKey": api_config.api_key,  # API Key 必须在请求体中
-                "workflowId": workflow_id,  # workflowId 在请求体中，不在 URL 路径中
-                "nodeInfoList": node_info_list,
-            }
+        # 可选参数：如果配置中有，使用配置的值；否则使用默认值
+        if "addMetadata" in request_body_template:
+            request_data["addMetadata"] = request_body_template.get("addMetadata", False)
+        else:
+            request_data["addMetadata"] = False  # 默认值
 
-            # 可选参数：如果配置中有，使用配置的值；否则使用默认值
-            if "addMetadata" in request_body_template:
-                request_data["addMetadata"] = request_body_template.get("addMetadata", False)
-            else:
-                request_data["addMetadata"] = False  # 默认值
+        if "instanceType" in request_body_template:
+            request_data["instanceType"] = request_body_template.get("instanceType", "default")
+        else:
+            request_data["instanceType"] = "default"  # 默认值：24G显存
 
-            if "instanceType" in request_body_template:
-                request_data["instanceType"] = request_body_template.get("instanceType", "default")
-            else:
-                request_data["instanceType"] = "default"  # 默认值：24G显存
+        if "usePersonalQueue" in request_body_template:
+            request_data["usePersonalQueue"] = request_body_template.get("usePersonalQueue", False)
+        else:
+            request_data["usePersonalQueue"] = False  # 默认值
 
-            if "usePersonalQueue" in request_body_template:
-                request_data["usePersonalQueue"] = request_body_template.get(
-                    "usePersonalQueue", False
-                )
-            else:
-                request_data["usePersonalQueue"] = False  # 默认值
+        logger.info("📸 RunningHub ComfyUI 工作流：格式转换完成")
+        logger.info(
+            f"   - nodeInfoList 转换后数据: {json.dumps(node_info_list, ensure_ascii=False, indent=2)}"
+        )
+        logger.info(
+            f"📋 RunningHub ComfyUI 工作流请求数据: {json.dumps(request_data, ensure_ascii=False, indent=2)}"
+        )
+    elif api_config.api_type == "runninghub-rhart-edit":
+        # RunningHub 全能图片PRO-图生图 API：构建请求数据
+        # 注意：imageUrls 会在 call_api_with_config 中从 uploaded_images 参数添加
+        request_data = {
+            "model": model_name,
+            "prompt": final_prompt,
+            "aspectRatio": final_aspect_ratio,
+            "imageSize": final_size,
+            "webHook": "-1",  # 立即返回id，然后轮询获取结果
+            "shutProgress": False,
+        }
+        # 关键修复：在 request_data 中添加 imageUrls，用于任务详情显示
+        if uploaded_images:
+            request_data["imageUrls"] = uploaded_images
+            logger.info(f"📸 [RunningHub] 在 request_data 中添加 imageUrls: {uploaded_images}")
+    else:
+        # 标准API：构建标准请求数据
+        request_data = {
+            "model": model_name,
+            "prompt": final_prompt,
+            "aspectRatio": final_aspect_ratio,
+            "imageSize": final_size,
+            "webHook": "-1",  # 立即返回id，然后轮询获取结果
+            "shutProgress": False,
+        }
 
-            logger.info("📸 RunningHub ComfyUI 工作流：格式转换完成")
-            logger.info(
-                f"   - nodeInfoList 转换后数据: {json.dumps(node_info_list, ensure_ascii=False, indent=2)}"
-            )
-            logger.info(
-                f"📋 RunningHub ComfyUI 工作流请求数据: {json.dumps(request_data, ensure_ascii=False, indent=2)}"
-            )
-        elif api_config.api_type == "runninghub-rhart-edit":
-            # RunningHub 全能图片PRO-图生图 API：构建请求数据
-            # 注意：imageUrls 会在 call_api_with_config 中从 uploaded_images 参数添加
-            request_data = {
-                "model": model_name,
-                "prompt": final_prompt,
-                "aspectRatio": final_aspect_ratio,
-                "imageSize": final_size,
-                "webHook": "-1",  # 立即返回id，然后轮询获取结果
-                "shutProgress": False,
-            }
-            # 关键修复：在 request_data 中添加 imageUrls，用于任务详情显示
-            if uploaded_images:
-                request_data["imageUrls"] = uploaded_images
-                logger.info(f"📸 [RunningHub] 在 request_data 中添加 imageUrls: {uploaded_images}")
-        else:
-            # 标准API：构建标准请求数据
-            request_data = {
-                "model": model_name,
-                "prompt": final_prompt,
-                "aspectRatio": final_aspect_ratio,
-                "imageSize": final_size,
-                "webHook": "-1",  # 立即返回id，然后轮询获取结果
-                "shutProgress": False,
-            }
+    # 构建API URL
+    host = api_config.host_domestic or api_config.host_overseas
+    if not host:
+        return None, "API服务商未配置Host"
 
-        # 构建API URL
-        host = api_config.host_domestic or api_config.host_overseas
-        if not host:
-            return False, None, "API服务商未配置Host"
-
-        # 对于T8Star的gemini-native类型（同步API），需要根据模型名称动态构建endpoint
-        if api_config.api_type == "gemini-native":
-            is_t8star = host and "t8star.cn" in host.lower()
-            if is_t8star:
-                # T8Star的gemini-native应该使用 /v1/models/{model}:generateContent 格式
-                # 如果endpoint是 /v1/draw/nano-banana 或其他错误格式，需要修正
-                if api_config.draw_endpoint and (
-                    "/v1/draw/" in api_config.draw_endpoint
-                    or "/v1/images/" in api_config.draw_endpoint
-                ):
-                    # 错误的endpoint，需要根据model_name构建正确的endpoint
-                    model_endpoint = (
-                        model_name.replace("_", "-") if model_name else "gemini-3-pro-image-preview"
-                    )
-                    correct_endpoint = f"/v1/models/{model_endpoint}:generateContent"
-                    logger.warning(
-                        "检测到T8Star服务商的gemini-native API（同步API），但endpoint不正确，自动修正"
-                    )
-                    logger.info(f"   原endpoint: {api_config.draw_endpoint}")
-                    logger.info(f"   修正后endpoint: {correct_endpoint}")
-                    draw_url = host.rstrip("/") + correct_endpoint
-                elif api_config.draw_endpoint and ":generateContent" in api_config.draw_endpoint:
-                    # endpoint已经正确，直接使用
-                    draw_url = (
-                        api_config.draw_endpoint
-                        if api_config.draw_endpoint.startswith("http")
-                        else host.rstrip("/") + api_config.draw_endpoint
-                    )
-                else:
-                    # endpoint不完整，需要根据model_name构建
-                    model_endpoint = (
-                        model_name.replace("_", "-") if model_name else "gemini-3-pro-image-preview"
-                    )
-                    correct_endpoint = f"/v1/models/{model_endpoint}:generateContent"
-                    logger.warning(
-                        "T8Star gemini-native API endpoint不完整（同步API），自动构建: {correct_endpoint}"
-                    )
-                    draw_url = host.rstrip("/") + correct_endpoint
-            else:
-                # 非T8Star服务商，使用原有逻辑
+    # 对于T8Star的gemini-native类型（同步API），需要根据模型名称动态构建endpoint
+    if api_config.api_type == "gemini-native":
+        is_t8star = host and "t8star.cn" in host.lower()
+        if is_t8star:
+            # T8Star的gemini-native应该使用 /v1/models/{model}:generateContent 格式
+            # 如果endpoint是 /v1/draw/nano-banana 或其他错误格式，需要修正
+            if api_config.draw_endpoint and (
+                "/v1/draw/" in api_config.draw_endpoint or "/v1/images/" in api_config.draw_endpoint
+            ):
+                # 错误的endpoint，需要根据model_name构建正确的endpoint
+                model_endpoint = (
+                    model_name.replace("_", "-") if model_name else "gemini-3-pro-image-preview"
+                )
+                correct_endpoint = f"/v1/models/{model_endpoint}:generateContent"
+                logger.warning(
+                    "检测到T8Star服务商的gemini-native API（同步API），但endpoint不正确，自动修正"
+                )
+                logger.info(f"   原endpoint: {api_config.draw_endpoint}")
+                logger.info(f"   修正后endpoint: {correct_endpoint}")
+                draw_url = host.rstrip("/") + correct_endpoint
+            elif api_config.draw_endpoint and ":generateContent" in api_config.draw_endpoint:
+                # endpoint已经正确，直接使用
                 draw_url = (
                     api_config.draw_endpoint
                     if api_config.draw_endpoint.startswith("http")
                     else host.rstrip("/") + api_config.draw_endpoint
                 )
-        elif api_config.api_type == "nano-banana-edits":
-            # nano-banana-edits类型，使用/v1/images/edits端点
-            is_t8star = host and "t8star.cn" in host.lower()
-            if is_t8star:
-                # T8Star必须使用/v1/images/edits端点
-                correct_endpoint = "/v1/images/edits"
-                if api_config.draw_endpoint != correct_endpoint:
-                    logger.warning(
-                        "T8Star nano-banana-edits API endpoint不正确，自动修正为: {correct_endpoint}"
-                    )
-                draw_url = host.rstrip("/") + correct_endpoint
             else:
-                # 其他服务商，使用配置的endpoint
-                draw_url = f"{host.rstrip('/')}{api_config.draw_endpoint}"
-        elif api_config.api_type == "runninghub-comfyui-workflow":
-            # RunningHub ComfyUI 工作流 API
-            # 根据文档：https://www.runninghub.cn/runninghub-api-doc-cn/doc-7534195
-            # 使用 /task/openapi/create 端点，workflowId 在请求体中，不在 URL 路径中
-            draw_url = f"{host.rstrip('/')}/task/openapi/create"
+                # endpoint不完整，需要根据model_name构建
+                model_endpoint = (
+                    model_name.replace("_", "-") if model_name else "gemini-3-pro-image-preview"
+                )
+                correct_endpoint = f"/v1/models/{model_endpoint}:generateContent"
+                logger.warning(
+                    "T8Star gemini-native API endpoint不完整（同步API），自动构建: {correct_endpoint}"
+                )
+                draw_url = host.rstrip("/") + correct_endpoint
+        else:
+            # 非T8Star服务商，使用原有逻辑
+            draw_url = (
+                api_config.draw_endpoint
+                if api_config.draw_endpoint.startswith("http")
+                else host.rstrip("/") + api_config.draw_endpoint
+            )
+    elif api_config.api_type == "nano-banana-edits":
+        # nano-banana-edits类型，使用/v1/images/edits端点
+        is_t8star = host and "t8star.cn" in host.lower()
+        if is_t8star:
+            # T8Star必须使用/v1/images/edits端点
+            correct_endpoint = "/v1/images/edits"
+            if api_config.draw_endpoint != correct_endpoint:
+                logger.warning(
+                    "T8Star nano-banana-edits API endpoint不正确，自动修正为: {correct_endpoint}"
+                )
+            draw_url = host.rstrip("/") + correct_endpoint
         else:
-            # 其他API类型，直接使用配置的endpoint
+            # 其他服务商，使用配置的endpoint
             draw_url = f"{host.rstrip('/')}{api_config.draw_endpoint}"
-
-        # 输出详细的API配置信息（用于调试）
-        logger.info("📋 API配置信息:")
-        logger.info(f"   - 服务商: {api_config.name}")
-        logger.info(f"   - API类型: {api_config.api_type}")
-        logger.info(f"   - Host: {host}")
-        logger.info(f"   - Draw Endpoint: {api_config.draw_endpoint}")
-        logger.info(f"   - 模型名称: {model_name}")
-        logger.info(f"   - 完整URL: {draw_url}")
-
-        # 关键修复：先创建任务记录，即使API调用失败也要创建（这样用户才能在任务管理页面看到）
-        import uuid
-
-        task_id = str(uuid.uuid4())
-
-        # 对于测试任务，order_id 和 order_number 可以为测试值
-        # 检查是否有传入的 order_id（用于实际订单）或使用测试值
-        order_id = getattr(create_api_task, "_test_order_id", 0)  # 默认测试订单ID为0
-        order_number = getattr(create_api_task, "_test_order_number", f"TEST_{task_id[:8]}")
-
-        # 调用API（使用信号量限制并发数）
-        response = None
-        api_call_error = None
-        connection_closed_but_request_sent = False  # 标记连接断开但请求可能已发送
+    elif api_config.api_type == "runninghub-comfyui-workflow":
+        # RunningHub ComfyUI 工作流 API
+        # 根据文档：https://www.runninghub.cn/runninghub-api-doc-cn/doc-7534195
+        # 使用 /task/openapi/create 端点，workflowId 在请求体中，不在 URL 路径中
+        draw_url = f"{host.rstrip('/')}/task/openapi/create"
+    else:
+        # 其他API类型，直接使用配置的endpoint
+        draw_url = f"{host.rstrip('/')}{api_config.draw_endpoint}"
+
+    # 输出详细的API配置信息（用于调试）
+    logger.info("📋 API配置信息:")
+    logger.info(f"   - 服务商: {api_config.name}")
+    logger.info(f"   - API类型: {api_config.api_type}")
+    logger.info(f"   - Host: {host}")
+    logger.info(f"   - Draw Endpoint: {api_config.draw_endpoint}")
+    logger.info(f"   - 模型名称: {model_name}")
+    logger.info(f"   - 完整URL: {draw_url}")
+
+    # 关键修复：RunningHub ComfyUI 工作流需要传递 request_body_template
+    if (
+        api_config.api_type == "runninghub-comfyui-workflow"
+        and api_template
+        and api_template.request_body_template
+    ):
+        # 将 request_body_template 添加到 request_data 中，供模块化实现使用
         try:
-            semaphore = _get_api_semaphore()
-            semaphore.acquire()
-            try:
-                # 关键修复：RunningHub ComfyUI 工作流需要传递 request_body_template
-                if (
-                    api_config.api_type == "runninghub-comfyui-workflow"
-                    and api_template
-                    and api_template.request_body_template
-                ):
-                    # 将 request_body_template 添加到 request_data 中，供模块化实现使用
-                    try:
-                        request_body_template = (
-                            json.loads(api_template.request_body_template)
-                            if isinstance(api_template.request_body_template, str)
-                            else api_template.request_body_template
-                        )
-                        request_data["request_body_template"] = request_body_template
-                    except Exception as e:
-                        logger.warning("解析 request_body_template 失败: {str(e)}")
-
-                response = call_api_with_config(
-                    api_config=api_config,
-                    draw_url=draw_url,
-                    request_data=request_data,
-                    uploaded_image_urls=uploaded_images,
-                    upload_config=upload_config,  # 传递upload_config
-                    model_name=model_name,
-                    prompt=final_prompt,
-                    aspect_ratio=final_aspect_ratio,
-                    image_size=final_size,
-                    enhance_prompt=api_template.enhance_prompt if api_template else False,
-                )
-            finally:
-                semaphore.release()
+            request_body_template = (
+                json.loads(api_template.request_body_template)
+                if isinstance(api_template.request_body_template, str)
+                else api_template.request_body_template
+            )
+            request_data["request_body_template"] = request_body_template
         except Exception as e:
-            error_str = str(e)
-            # 检查是否是"连接断开但请求可能已发送"的特殊异常
-            if (
-                "ConnectionClosedButRequestSent" in str(type(e))
-                or "连接被远程关闭，但请求可能已发送" in error_str
-            ):
-                connection_closed_but_request_sent = True
-                logger.warning("连接断开但请求可能已发送，任务将保持'处理中'状态，等待结果")
-            else:
-                # 其他API调用失败，但也要创建任务记录（标记为失败状态）
-                api_call_error = error_str
-                logger.error("API调用失败，但会创建失败状态的任务记录: {api_call_error}")
-
-        # 关键修复：对于gemini-native类型，request_data可能不包含图片信息（因为图片在payload中）
-        # 需要从response对象中获取包含图片信息的request_data_for_log
-        request_params_for_log = (
-            request_data.copy() if isinstance(request_data, dict) else request_data
-        )
-
-        # 确保 request_params_for_log 包含所有图片URL（用于前端显示）
-        # 对于 nano-banana 类型，urls 字段在 call_api_with_config 中已添加到 request_data
-        # 但为了确保完整性，我们再次检查并添加
-        if api_config.api_type in ["nano-banana", "nano-banana-edits"] and uploaded_images:
-            if isinstance(request_params_for_log, dict):
-                # 确保 urls 字段存在且包含所有图片
-                if "urls" not in request_params_for_log or not request_params_for_log.get("urls"):
-                    request_params_for_log["urls"] = uploaded_images
-                else:
-                    # 如果已有 urls，确保包含所有图片（合并去重）
-                    existing_urls = request_params_for_log.get("urls", [])
-                    if not isinstance(existing_urls, list):
-                        existing_urls = [existing_urls] if existing_urls else []
-                    all_urls = list(
-                        dict.fromkeys(existing_urls + uploaded_images)
-                    )  # 保持顺序并去重
-                    request_params_for_log["urls"] = all_urls
-                logger.info(
-                    f"✅ [nano-banana] 确保 request_params 包含所有图片URL: {len(request_params_for_log.get('urls', []))} 张"
-                )
-
-        if response and hasattr(response, "request_data_for_log"):
-            request_params_for_log = response.request_data_for_log
-            logger.info("✅ [gemini-native] 使用包含图片信息的request_params（从response获取）")
-        elif api_config.api_type == "gemini-native" and uploaded_images:
-            # 如果response没有request_data_for_log，手动创建一个包含图片信息的request_data
-            request_params_for_log = {
-                "model": model_name,
-                "prompt": final_prompt,
-                "aspectRatio": final_aspect_ratio,
-                "imageSize": final_size,
-                "shutProgress": False,
-                "webHook": "-1",
-                "image_urls": uploaded_images,
-                "image_count": len(uploaded_images),
-                "image_format": "base64_encoded_in_payload",
-            }
-            logger.info("✅ [gemini-native] 手动创建包含图片信息的request_params")
-
-        # 将API相关信息存储在 processing_log 中（JSON格式）
-        api_info = {
-            "task_id": task_id,
-            "api_config_id": api_config.id,
-            "api_config_name": api_config.name,
-            "model_name": model_name,
-            "prompt": final_prompt,
-            "image_size": final_size,
-            "aspect_ratio": final_aspect_ratio,
-            "uploaded_images": uploaded_images,
-            "points_cost": api_template.points_cost or 0,
-            "request_params": request_params_for_log,  # 使用包含图片信息的request_params
-        }
+            logger.warning("解析 request_body_template 失败: {str(e)}")
+
+    # 本地任务ref（保存到 processing_log 的 task_id）；服务商支持回调时随请求提交签名回调URL
+    task_id = str(uuid.uuid4())
+    callback_url = attach_ai_task_callback(api_config.api_type, request_data, task_id)
+    if callback_url:
+        logger.info(f"📨 已注册服务商完成回调: {callback_url.split('?')[0]}")
+
+    return {
+        "task_id": task_id,
+        "callback_url": callback_url,
+        "model_name": model_name,
+        "final_prompt": final_prompt,
+        "final_size": final_size,
+        "final_aspect_ratio": final_aspect_ratio,
+        "request_data": request_data,
+        "draw_url": draw_url,
+    }, None
+
+
+def _send_api_request(
+    api_config, api_template, api_request, uploaded_images, upload_config, db=None
+):
+    """
+    发送服务商请求（占用 ai_provider 共享并发名额，可在工作线程中调用）
 
-        # 如果有响应，保存响应数据
-        if response:
-            api_info["response_data"] = response.text[:5000] if response.text else None
-            api_info["response_status"] = response.status_code
-            # 关键修复：对于同步API，保存完整的JSON响应（用于后续解析base64图片）
-            if response.status_code == 200 and response.text:
-                try:
-                    api_info["original_response"] = response.json()
-                except Exception:
-                    pass
-        elif api_call_error:
-            # API调用失败，保存错误信息
-            api_info["api_call_error"] = api_call_error
-            api_info["response_status"] = None
+    开启服务商网关时同步API只登记网关请求（需要在持有 db 会话的线程中调用）。
 
-        # 关键修复：同步API任务应该在创建时就确定状态，不应该使用pending状态
-        # 先判断是否为同步API，如果是同步API，初始状态应该是processing（等待响应），而不是pending
-        is_sync_api = api_config.is_sync_api if hasattr(api_config, "is_sync_api") else False
-
-        # 如果连接断开但请求可能已发送，保持处理中状态，不标记为失败
-        # 关键修复：对于同步API，如果连接断开，请求可能已发送，不应该重试（避免重复请求）
-        if connection_closed_but_request_sent:
-            initial_status = "processing"  # 保持处理中状态，等待结果
-            api_info["connection_closed_but_request_sent"] = True
-            api_info["should_not_retry"] = True  # 标记为不应重试（避免重复请求）
-            api_info["connection_error"] = (
-                "连接被远程关闭，但请求可能已发送到后端，后端可能正在处理或已完成"
-            )
-            logger.warning(
-                "任务 {task_id} 连接断开但请求可能已发送，保持'处理中'状态，标记为不应重试"
+    Returns:
+        tuple: (response, api_call_error, connection_closed_but_request_sent)
+    """
+    response = None
+    api_call_error = None
+    connection_closed_but_request_sent = False  # 标记连接断开但请求可能已发送
+    # 同步API一次请求可能持续数分钟：开启服务商网关时请求交给网关进程异步发送，不占用当前进程
+    gateway_context = contextlib.nullcontext()
+    if getattr(api_config, "is_sync_api", False):
+        from app.services.provider_gateway import defer_to_gateway, is_gateway_enabled
+
+        if is_gateway_enabled():
+            gateway_context = defer_to_gateway(db)
+    try:
+        # 并发上限由共享HTTP客户端统一控制（api_max_concurrency），内部请求不会重复占用名额
+        with get_http_client("ai_provider").slot(), gateway_context:
+            response = call_api_with_config(
+                api_config=api_config,
+                draw_url=api_request["draw_url"],
+                request_data=api_request["request_data"],
+                uploaded_image_urls=uploaded_images,
+                upload_config=upload_config,  # 传递upload_config
+                model_name=api_request["model_name"],
+                prompt=api_request["final_prompt"],
+                aspect_ratio=api_request["final_aspect_ratio"],
+                image_size=api_request["final_size"],
+                enhance_prompt=api_template.enhance_prompt if api_template else False,
             )
-        elif api_call_error:
-            initial_status = "failed"  # API调用失败，标记为失败状态
+    except Exception as e:
+        error_str = str(e)
+        # 检查是否是"连接断开但请求可能已发送"的特殊异常
+        if (
+            "ConnectionClosedButRequestSent" in str(type(e))
+            or "连接被远程关闭，但请求可能已发送" in error_str
+        ):
+            connection_closed_but_request_sent = True
+            logger.warning("连接断开但请求可能已发送，任务将保持'处理中'状态，等待结果")
         else:
-            initial_status = "processing" if is_sync_api else "pending"
+            # 其他API调用失败，但也要创建任务记录（标记为失败状态）
+            api_call_error = error_str
+            logger.error("API调用失败，但会创建失败状态的任务记录: {api_call_error}")
 
-        task = AITask(
-            order_id=order_id,  # 测试任务使用0
-            order_number=order_number,  # 测试任务使用TEST_前缀
-            style_image_id=style_image_id,
-            comfyui_prompt_id=task_id,  # 使用comfyui_prompt_id存储task_id（用于查询）
-            status=initial_status,  # 同步API使用processing，异步API使用pending，失败时使用failed
-            processing_log=json.dumps(api_info, ensure_ascii=False),  # 存储API信息
-            error_message=(
-                api_call_error if api_call_error else None
-            ),  # 保存错误信息（连接断开的情况不保存错误信息，保持处理中状态）
-        )
+    return response, api_call_error, connection_closed_but_request_sent
 
-        db.session.add(task)
-        db.session.flush()  # 确保task.id已生成
 
-        # 更新订单状态为"AI任务处理中"（如果order_id > 0，说明是真实订单）
-        if order_id and order_id > 0:
+def _new_api_task(
+    api_config,
+    api_template,
+    api_request,
+    task_id,
+    style_image_id,
+    uploaded_images,
+    response,
+    api_call_error,
+    connection_closed_but_request_sent,
+    order_id,
+    order_number,
+    AITask,
+):
+    """
+    根据发送结果构建任务记录（未加入会话），即使API调用失败也要创建（这样用户才能在任务管理页面看到）
+
+    Returns:
+        tuple: (task: AITask, gateway_job: ProviderGatewayJob 或 None)
+    """
+    model_name = api_request["model_name"]
+    final_prompt = api_request["final_prompt"]
+    final_size = api_request["final_size"]
+    final_aspect_ratio = api_request["final_aspect_ratio"]
+
+    gateway_job = getattr(response, "gateway_job", None)
+
+    # 关键修复：对于gemini-native类型，request_data可能不包含图片信息（因为图片在payload中）
+    # 需要从response对象中获取包含图片信息的request_data_for_log
+    request_data = api_request["request_data"]
+    request_params_for_log = request_data.copy() if isinstance(request_data, dict) else request_data
+
+    # 确保 request_params_for_log 包含所有图片URL（用于前端显示）
+    # 对于 nano-banana 类型，urls 字段在 call_api_with_config 中已添加到 request_data
+    # 但为了确保完整性，我们再次检查并添加
+    if api_config.api_type in ["nano-banana", "nano-banana-edits"] and uploaded_images:
+        if isinstance(request_params_for_log, dict):
+            # 确保 urls 字段存在且包含所有图片
+            if "urls" not in request_params_for_log or not request_params_for_log.get("urls"):
+                request_params_for_log["urls"] = uploaded_images
+            else:
+                # 如果已有 urls，确保包含所有图片（合并去重）
+                existing_urls = request_params_for_log.get("urls", [])
+                if not isinstance(existing_urls, list):
+                    existing_urls = [existing_urls] if existing_urls else []
+                all_urls = list(dict.fromkeys(existing_urls + uploaded_images))  # 保持顺序并去重
+                request_params_for_log["urls"] = all_urls
+            logger.info(
+                f"✅ [nano-banana] 确保 request_params 包含所有图片URL: {len(request_params_for_log.get('urls', []))} 张"
+            )
+
+    if response and hasattr(response, "request_data_for_log"):
+        request_params_for_log = response.request_data_for_log
+        logger.info("✅ [gemini-native] 使用包含图片信息的request_params（从response获取）")
+    elif api_config.api_type == "gemini-native" and uploaded_images:
+        # 如果response没有request_data_for_log，手动创建一个包含图片信息的request_data
+        request_params_for_log = {
+            "model": model_name,
+            "prompt": final_prompt,
+            "aspectRatio": final_aspect_ratio,
+            "imageSize": final_size,
+            "shutProgress": False,
+            "webHook": "-1",
+            "image_urls": uploaded_images,
+            "image_count": len(uploaded_images),
+            "image_format": "base64_encoded_in_payload",
+        }
+        logger.info("✅ [gemini-native] 手动创建包含图片信息的request_params")
+
+    # 将API相关信息存储在 processing_log 中（JSON格式）
+    api_info = {
+        "task_id": task_id,
+        "api_config_id": api_config.id,
+        "api_config_name": api_config.name,
+        "model_name": model_name,
+        "prompt": final_prompt,
+        "image_size": final_size,
+        "aspect_ratio": final_aspect_ratio,
+        "uploaded_images": uploaded_images,
+        "points_cost": api_template.points_cost or 0,
+        "request_params": request_params_for_log,  # 使用包含图片信息的request_params
+    }
+    if api_request.get("callback_url"):
+        # 已注册完成回调：轮询只作为回调超时后的兜底
+        api_info["callback_registered"] = True
+
+    # 如果有响应，保存响应数据
+    if gateway_job is not None:
+        api_info["gateway_job_id"] = gateway_job.id
+    elif response:
+        api_info["response_data"] = response.text[:5000] if response.text else None
+        api_info["response_status"] = response.status_code
+        # 关键修复：对于同步API，保存完整的JSON响应（用于后续解析base64图片）
+        if response.status_code == 200 and response.text:
             try:
-                import sys
-
-                if "test_server" in sys.modules:
-                    test_server_module = sys.modules["test_server"]
-                    Order = getattr(test_server_module, "Order", None)
-                    AITask = getattr(test_server_module, "AITask", None)
-                    if Order and AITask:
-                        order = Order.query.get(order_id)
-                        if order:
-                            # 如果订单状态是处理中或其他前置状态，更新为ai_processing
-                            if order.status in [
-                                "retouching",
-                                "shooting",
-                                "paid",
-                                "processing",
-                                "ai_processing",
-                            ]:
-                                if order.status != "ai_processing":
-                                    order.status = "ai_processing"  # AI任务处理中
-                                    logger.info(
-                                        f"✅ 订单 {order.order_number} 状态已更新为: ai_processing (从 {order.status} 更新)"
-                                    )
-                                else:
-                                    logger.info(
-                                        f"ℹ️ 订单 {order.order_number} 状态已经是: ai_processing"
-                                    )
-            except Exception as e:
-                logger.warning("更新订单状态失败: {str(e)}")
-                import traceback
+                api_info["original_response"] = response.json()
+            except Exception:
+                pass
+    elif api_call_error:
+        # API调用失败，保存错误信息
+        api_info["api_call_error"] = api_call_error
+        api_info["response_status"] = None
+
+    # 关键修复：同步API任务应该在创建时就确定状态，不应该使用pending状态
+    # 先判断是否为同步API，如果是同步API，初始状态应该是processing（等待响应），而不是pending
+    is_sync_api = api_config.is_sync_api if hasattr(api_config, "is_sync_api") else False
+
+    # 如果连接断开但请求可能已发送，保持处理中状态，不标记为失败
+    # 关键修复：对于同步API，如果连接断开，请求可能已发送，不应该重试（避免重复请求）
+    if connection_closed_but_request_sent:
+        initial_status = "processing"  # 保持处理中状态，等待结果
+        api_info["connection_closed_but_request_sent"] = True
+        api_info["should_not_retry"] = True  # 标记为不应重试（避免重复请求）
+        api_info["connection_error"] = (
+            "连接被远程关闭，但请求可能已发送到后端，后端可能正在处理或已完成"
+        )
+        logger.warning("任务 {task_id} 连接断开但请求可能已发送，保持'处理中'状态，标记为不应重试")
+    elif api_call_error:
+        initial_status = "failed"  # API调用失败，标记为失败状态
+    else:
+        initial_status = "processing" if is_sync_api else "pending"
+
+    task = AITask(
+        order_id=order_id,  # 测试任务使用0
+        order_number=order_number,  # 测试任务使用TEST_前缀
+        style_image_id=style_image_id,
+        comfyui_prompt_id=task_id,  # 使用comfyui_prompt_id存储task_id（用于查询）
+        status=initial_status,  # 同步API使用processing，异步API使用pending，失败时使用failed
+        processing_log=json.dumps(api_info, ensure_ascii=False),  # 存储API信息
+        error_message=(
+            api_call_error if api_call_error else None
+        ),  # 保存错误信息（连接断开的情况不保存错误信息，保持处理中状态）
+    )
 
-                traceback.print_exc()
+    return task, gateway_job
 
-        # 如果API调用失败（非连接断开），直接返回失败的任务
-        if api_call_error and not connection_closed_but_request_sent:
-            db.session.commit()  # 提交时包含订单状态更新
-            return True, task, None  # 返回True表示任务已创建（虽然是失败状态）
 
-        # 如果连接断开但请求可能已发送，也返回任务（保持处理中状态）
-        if connection_closed_but_request_sent:
-            db.session.commit()  # 提交时包含订单状态更新
-            return True, task, None  # 返回True表示任务已创建（保持处理中状态，等待结果）
+def _mark_order_ai_processing(order_id):
+    """更新订单状态为"AI任务处理中"（order_id > 0 说明是真实订单，不提交事务）"""
+    if order_id and order_id > 0:
+        try:
+            import sys
 
-        # 处理响应
-        if response.status_code == 200:
-            result = response.json()
+            if "test_server" in sys.modules:
+                test_server_module = sys.modules["test_server"]
+                Order = getattr(test_server_module, "Order", None)
+                AITask = getattr(test_server_module, "AITask", None)
+                if Order and AITask:
+                    order = Order.query.get(order_id)
+                    if order:
+                        # 如果订单状态是处理中或其他前置状态，更新为ai_processing
+                        if order.status in [
+                            "retouching",
+                            "shooting",
+                            "paid",
+                            "processing",
+                            "ai_processing",
+                        ]:
+                            if order.status != "ai_processing":
+                                order.status = "ai_processing"  # AI任务处理中
+                                logger.info(
+                                    f"✅ 订单 {order.order_number} 状态已更新为: ai_processing (从 {order.status} 更新)"
+                                )
+                            else:
+                                logger.info(
+                                    f"ℹ️ 订单 {order.order_number} 状态已经是: ai_processing"
+                                )
+        except Exception as e:
+            logger.warning("更新订单状态失败: {str(e)}")
+            import traceback
 
-            # 对于 RunningHub ComfyUI 工作流，打印完整响应以便调试
-            if api_config.api_type == "runninghub-comfyui-workflow":
-                logger.info(
-                    f"🔍 [RunningHub ComfyUI] 完整响应内容: {json.dumps(result, ensure_ascii=False, indent=2)}"
-                )
-                logger.info(f"🔍 [RunningHub ComfyUI] 响应字段: {list(result.keys())}")
-                # 检查所有可能包含 taskId 的字段
-                for key in result.keys():
-                    value = result.get(key)
-                    if isinstance(value, str) and value.strip().isdigit() and len(value) > 10:
-                        logger.info(
-                            f"🔍 [RunningHub ComfyUI] 发现可能的 taskId 在字段 '{key}': {value}"
-                        )
-                    elif isinstance(value, dict) and (
-                        "taskId" in value or "task_id" in value or "id" in value
-                    ):
-                        logger.info(
-                            f"🔍 [RunningHub ComfyUI] 发现可能的 taskId 在字段 '{key}' 中: {value.get('taskId') or value.get('task_id') or value.get('id')}"
-                        )
+            traceback.print_exc()
 
-            # 根据is_sync_api字段决定处理方式（is_sync_api已在上面定义）
-            if is_sync_api:
-                # 同步API：直接返回结果，不需要轮询
-                result_image_url = None
-                image_data_base64 = None
-                mime_type = "image/png"
-
-                # 根据不同的API类型解析响应
-                if api_config.api_type == "gemini-native":
-                    # Gemini API响应格式（参考bk-photo-v4的实现）
-                    logger.info("📦 [同步API] 解析Gemini响应数据...")
-                    logger.info(
-                        f"📦 [同步API] 响应数据结构: {json.dumps(result, ensure_ascii=False)[:500]}..."
-                    )
 
-                    # 关键修复：T8Star的响应格式可能是直接的parts数组，而不是candidates结构
-                    parts_to_check = None
+def _complete_api_task(
+    task,
+    task_id,
+    api_config,
+    response,
+    api_call_error,
+    connection_closed_but_request_sent,
+    gateway_job,
+):
+    """
+    根据服务商提交响应更新任务（任务需已flush获得ID，不提交事务）
 
-                    # 方式1：标准Gemini格式（candidates -> content -> parts）
-                    if "candidates" in result and len(result["candidates"]) > 0:
-                        candidate = result["candidates"][0]
+    Returns:
+        str: 任务被判定为创建失败时的错误信息，否则为None
+    """
+    # API调用失败（任务为失败状态），或连接断开但请求可能已发送（保持处理中状态，等待结果）
+    if api_call_error or connection_closed_but_request_sent:
+        return None
 
-                        # 检查 finishReason
-                        finish_reason = candidate.get("finishReason", "")
-                        logger.info(f"🔍 [同步API] Gemini finishReason: {finish_reason}")
+    # 请求已交给服务商网关：与任务一起提交，网关收到响应后更新任务（保持处理中状态）
+    if gateway_job is not None:
+        gateway_job.ai_task_id = task.id
+        logger.info(f"✅ 任务 {task.id} 已交给服务商网关发送（网关请求 {gateway_job.id}）")
+        return None
 
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            parts_to_check = candidate["content"]["parts"]
+    is_sync_api = getattr(api_config, "is_sync_api", False)
 
-                    # 方式2：T8Star可能直接返回parts数组（根据用户提供的响应格式）
-                    elif isinstance(result, list):
-                        # 如果响应本身就是parts数组
-                        parts_to_check = result
-                        logger.info("🔍 [同步API] 检测到响应为parts数组格式（T8Star格式）")
-                    elif "parts" in result:
-                        # 如果响应有parts字段
-                        parts_to_check = result["parts"]
-                        logger.info("🔍 [同步API] 检测到响应包含parts字段")
+    # 处理响应
+    if response.status_code == 200:
+        result = response.json()
 
-                    if parts_to_check:
-                        logger.info(
-                            f"🔍 [同步API] 检查 {len(parts_to_check)} 个parts，查找图片数据..."
-                        )
-                        for idx, part in enumerate(parts_to_check):
-                            if not isinstance(part, dict):
-                                continue
-
-                            logger.info(f"  part[{idx}] 键: {list(part.keys())}")
-
-                            # 检查inlineData字段（大写，标准格式）
-                            if "inlineData" in part:
-                                inline_data = part["inlineData"]
-                                if isinstance(inline_data, dict) and "data" in inline_data:
-                                    image_data_base64 = inline_data["data"]
-                                    mime_type = inline_data.get("mimeType", "image/png")
-                                    logger.info(
-                                        f"✅ [同步API] 在part[{idx}]中找到图片数据（inlineData），MIME类型: {mime_type}, 数据长度: {len(image_data_base64) if image_data_base64 else 0}"
-                                    )
-                                    break
-                            # 检查inline_data字段（小写，兼容格式）
-                            elif "inline_data" in part:
-                                inline_data = part["inline_data"]
-                                if isinstance(inline_data, dict) and "data" in inline_data:
-                                    image_data_base64 = inline_data["data"]
-                                    mime_type = inline_data.get("mime_type", "image/png")
-                                    logger.info(
-                                        f"✅ [同步API] 在part[{idx}]中找到图片数据（inline_data），MIME类型: {mime_type}, 数据长度: {len(image_data_base64) if image_data_base64 else 0}"
-                                    )
-                                    break
-                            # 检查text字段中是否有图片URL（markdown格式）
-                            elif "text" in part:
-                                text = part.get("text", "")
-                                if text:
-                                    import re
-
-                                    # 提取markdown格式的图片URL: ![alt](url)
-                                    markdown_pattern = r"!\[.*?\]\((https?://[^\s\)]+)\)"
-                                    matches = re.findall(markdown_pattern, text)
-                                    if matches:
-                                        result_image_url = matches[0]
-                                        logger.info(
-                                            f"✅ [同步API] 从text字段中提取到图片URL: {result_image_url}"
-                                        )
-                                        break
-                    else:
-                        logger.warning("[同步API] 未找到candidates或parts结构，尝试其他格式...")
-                        logger.info(f"   响应类型: {type(result)}")
-                        logger.info(
-                            f"   响应键: {list(result.keys()) if isinstance(result, dict) else 'N/A'}"
-                        )
-                elif api_config.api_type == "nano-banana-edits":
-                    # nano-banana-edits API响应格式（OpenAI DALL-E格式）
-                    logger.info("📦 [nano-banana-edits] 解析响应数据...")
+        # 对于 RunningHub ComfyUI 工作流，打印完整响应以便调试
+        if api_config.api_type == "runninghub-comfyui-workflow":
+            logger.info(
+                f"🔍 [RunningHub ComfyUI] 完整响应内容: {json.dumps(result, ensure_ascii=False, indent=2)}"
+            )
+            logger.info(f"🔍 [RunningHub ComfyUI] 响应字段: {list(result.keys())}")
+            # 检查所有可能包含 taskId 的字段
+            for key in result.keys():
+                value = result.get(key)
+                if isinstance(value, str) and value.strip().isdigit() and len(value) > 10:
                     logger.info(
-                        f"📦 [nano-banana-edits] 响应数据结构: {json.dumps(result, ensure_ascii=False)[:500]}..."
+                        f"🔍 [RunningHub ComfyUI] 发现可能的 taskId 在字段 '{key}': {value}"
                     )
-
-                    # 检查多种可能的响应格式
-                    # 格式1: OpenAI DALL-E格式 {"created": 1234567890, "data": [{"url": "..."}]}
-                    if (
-                        "data" in result
-                        and isinstance(result["data"], list)
-                        and len(result["data"]) > 0
-                    ):
-                        result_image_url = result["data"][0].get("url")
-                        logger.info(
-                            f"✅ [nano-banana-edits] 找到图片URL (格式1): {result_image_url}"
-                        )
-                    # 格式2: 直接返回URL字符串
-                    elif isinstance(result, str) and (
-                        result.startswith("http://") or result.startswith("https://")
-                    ):
-                        result_image_url = result
-                        logger.info(
-                            f"✅ [nano-banana-edits] 找到图片URL (格式2): {result_image_url}"
-                        )
-                    # 格式3: {"url": "..."}
-                    elif "url" in result:
-                        result_image_url = result.get("url")
-                        logger.info(
-                            f"✅ [nano-banana-edits] 找到图片URL (格式3): {result_image_url}"
-                        )
-                    # 格式4: {"image_url": "..."} 或 {"result_url": "..."}
-                    elif "image_url" in result:
-                        result_image_url = result.get("image_url")
-                        logger.info(
-                            f"✅ [nano-banana-edits] 找到图片URL (格式4): {result_image_url}"
-                        )
-                    elif "result_url" in result:
-                        result_image_url = result.get("result_url")
-                        logger.info(
-                            f"✅ [nano-banana-edits] 找到图片URL (格式5): {result_image_url}"
-                        )
-                    # 格式5: {"data": {"url": "..."}}
-                    elif "data" in result and isinstance(result["data"], dict):
-                        result_image_url = result["data"].get("url") or result["data"].get(
-                            "image_url"
-                        )
-                        logger.info(
-                            f"✅ [nano-banana-edits] 找到图片URL (格式6): {result_image_url}"
-                        )
-                    else:
-                        logger.warning(
-                            "[nano-banana-edits] 未找到图片URL，响应格式: {json.dumps(result, ensure_ascii=False)[:200]}"
-                        )
-                elif api_config.api_type == "runninghub-rhart-edit":
-                    # RunningHub API响应格式
-                    # 响应格式：{"taskId": "...", "status": "QUEUED", "results": null, ...}
-                    # RunningHub 是异步API，返回 taskId，需要轮询查询结果
-                    # 这里不处理同步响应，因为 RunningHub 总是返回 taskId
-                    logger.info("📦 [RunningHub] 解析响应数据...")
+                elif isinstance(value, dict) and (
+                    "taskId" in value or "task_id" in value or "id" in value
+                ):
                     logger.info(
-                        f"📦 [RunningHub] 响应数据结构: {json.dumps(result, ensure_ascii=False)[:500]}..."
+                        f"🔍 [RunningHub ComfyUI] 发现可能的 taskId 在字段 '{key}' 中: {value.get('taskId') or value.get('task_id') or value.get('id')}"
                     )
-                    # RunningHub 的响应会在异步处理部分处理（返回 taskId）
-                    # 这里不需要提取图片URL，因为 RunningHub 是异步API
-                else:
-                    # 其他同步API格式（如果有直接返回结果的）
-                    # 尝试从响应中提取结果图片
-                    if result.get("code") == 0 and "data" in result:
-                        result_image_url = (
-                            result["data"].get("image_url")
-                            or result["data"].get("result_image")
-                            or result["data"].get("url")
-                        )
 
-                # 如果找到base64图片数据，需要解码并上传到云端
-                if image_data_base64:
-                    try:
-                        logger.info("📤 [同步API] 开始处理base64图片数据...")
-                        # 解码base64图片
-                        image_data = base64.b64decode(image_data_base64)
-
-                        # 保存到本地final_works目录（同步API直接返回结果，保存到本地即可）
-                        # 关键修复：直接在项目目录创建文件，避免跨磁盘移动问题
-                        final_folder = "final_works"
-                        os.makedirs(final_folder, exist_ok=True)
-                        timestamp = int(time.time())
-                        suffix = ".jpg" if "jpeg" in mime_type.lower() else ".png"
-                        # 使用task_id的前8位和完整task_id生成文件名（参考错误日志中的格式）
-                        filename = f"final_{task_id[:8]}_{timestamp}{suffix}"
-                        local_path = os.path.join(final_folder, filename)
-
-                        # 直接写入到目标位置（避免跨磁盘移动）
-                        if os.path.exists(local_path):
-                            os.remove(local_path)
-
-                        # 直接写入文件到目标位置
-                        with open(local_path, "wb") as f:
-                            f.write(image_data)
-
-                        # 使用相对路径（用于存储到数据库）
-                        result_image_url = os.path.join(final_folder, filename).replace("\\", "/")
-                        logger.info(f"✅ [同步API] 图片已保存到本地: {local_path}")
-                        logger.info(f"✅ [同步API] 图片路径（数据库）: {result_image_url}")
-                    except Exception as e:
-                        logger.error("[同步API] 处理base64图片失败: {str(e)}")
-                        import traceback
-
-                        traceback.print_exc()
-
-                # 如果找到图片URL，更新任务状态
-                if result_image_url:
-                    task.status = "success"
-                    task.output_image_path = result_image_url
-                    task.completed_at = datetime.now()
-
-                    # 更新processing_log中的result_image
-                    api_info = json.loads(task.processing_log) if task.processing_log else {}
-                    api_info["result_image"] = result_image_url
-                    task.processing_log = json.dumps(api_info, ensure_ascii=False)
+        # 根据is_sync_api字段决定处理方式（is_sync_api已在上面定义）
+        if is_sync_api:
+            _apply_sync_api_result(task, api_config, result, task_id)
+        else:
+            # 异步API：返回task_id，需要轮询查询结果（参考bk-photo-v4）
+            # nano-banana等标准格式：{"code": 0, "data": {"id": "xxx"}}
+            api_task_id = None
+            if result.get("code") == 0 and "data" in result:
+                data = result.get("data")
+                if isinstance(data, dict):
+                    # 格式1: {"code": 0, "data": {"id": "xxx"}}
+                    api_task_id = data.get("id") or data.get("task_id")
+                elif isinstance(data, str):
+                    # 格式2: {"code": 0, "data": "task_id字符串"}
+                    api_task_id = data.strip() if data.strip() else None
+
+            # RunningHub 格式：{"taskId": "xxx", "status": "QUEUED", ...} 或 {"code": 0, "data": {"taskId": "xxx"}}
+            # 关键修复：对于 RunningHub API，优先提取 taskId（无论是否有错误码，RunningHub 都会返回 taskId）
+            if (
+                api_config.api_type == "runninghub-rhart-edit"
+                or api_config.api_type == "runninghub-comfyui-workflow"
+            ):
+                api_type_name = (
+                    "RunningHub ComfyUI"
+                    if api_config.api_type == "runninghub-comfyui-workflow"
+                    else "RunningHub"
+                )
 
-                    logger.info(f"✅ [同步API] 任务 {task.id} 已完成，图片URL: {result_image_url}")
-                else:
-                    task.status = "failed"
-                    task.error_message = "同步API响应中未找到结果图片"
-                    logger.error("[同步API] 任务 {task.id} 失败：未找到结果图片")
-                    # 保存完整响应以便调试
-                    api_info = json.loads(task.processing_log) if task.processing_log else {}
-                    api_info["full_response"] = result
-                    task.processing_log = json.dumps(api_info, ensure_ascii=False)
-            else:
-                # 异步API：返回task_id，需要轮询查询结果（参考bk-photo-v4）
-                # nano-banana等标准格式：{"code": 0, "data": {"id": "xxx"}}
-                api_task_id = None
-                if result.get("code") == 0 and "data" in result:
-                    data = result.get("data")
-                    if isinstance(data, dict):
-                        # 格式1: {"code": 0, "data": {"id": "xxx"}}
-                        api_task_id = data.get("id") or data.get("task_id")
-                    elif isinstance(data, str):
-                        # 格式2: {"code": 0, "data": "task_id字符串"}
-                        api_task_id = data.strip() if data.strip() else None
-
-                # RunningHub 格式：{"taskId": "xxx", "status": "QUEUED", ...} 或 {"code": 0, "data": {"taskId": "xxx"}}
-                # 关键修复：对于 RunningHub API，优先提取 taskId（无论是否有错误码，RunningHub 都会返回 taskId）
-                if (
-                    api_config.api_type == "runninghub-rhart-edit"
-                    or api_config.api_type == "runninghub-comfyui-workflow"
-                ):
-                    api_type_name = (
-                        "RunningHub ComfyUI"
-                        if api_config.api_type == "runninghub-comfyui-workflow"
-                        else "RunningHub"
-                    )
+                # 关键修复：优先从顶层提取 taskId（RunningHub 响应格式：{"taskId": "xxx", "status": "RUNNING", ...}）
+                # 即使有错误码（如 code: 433），RunningHub 也可能返回 taskId
+                if not api_task_id:
+                    api_task_id = result.get("taskId")
+                    if api_task_id:
+                        logger.info(f"✅ [{api_type_name}] 从响应顶层提取到 taskId: {api_task_id}")
 
-                    # 关键修复：优先从顶层提取 taskId（RunningHub 响应格式：{"taskId": "xxx", "status": "RUNNING", ...}）
-                    # 即使有错误码（如 code: 433），RunningHub 也可能返回 taskId
-                    if not api_task_id:
-                        api_task_id = result.get("taskId")
+                # 如果顶层没有，检查 data 字段
+                if not api_task_id and result.get("data"):
+                    if isinstance(result.get("data"), dict):
+                        api_task_id = result.get("data", {}).get("taskId")
                         if api_task_id:
                             logger.info(
-                                f"✅ [{api_type_name}] 从响应顶层提取到 taskId: {api_task_id}"
+                                f"✅ [{api_type_name}] 从 data 字段提取到 taskId: {api_task_id}"
                             )
-
-                    # 如果顶层没有，检查 data 字段
-                    if not api_task_id and result.get("data"):
-                        if isinstance(result.get("data"), dict):
-                            api_task_id = result.get("data", {}).get("taskId")
-                            if api_task_id:
-                                logger.info(
-                                    f"✅ [{api_type_name}] 从 data 字段提取到 taskId: {api_task_id}"
-                                )
-                        elif isinstance(result.get("data"), str):
-                            # data 可能是 taskId 字符串
-                            try:
-                                # 尝试解析为数字（taskId 通常是数字字符串）
-                                if result.get("data").strip().isdigit():
-                                    api_task_id = result.get("data").strip()
-                                    if api_task_id:
-                                        logger.info(
-                                            f"✅ [{api_type_name}] 从 data 字符串提取到 taskId: {api_task_id}"
-                                        )
-                            except Exception:
-                                pass
-
-                    # 如果还没找到，尝试从 msg 字段的 JSON 中提取（某些错误响应可能包含 taskId）
-                    if not api_task_id and result.get("msg"):
+                    elif isinstance(result.get("data"), str):
+                        # data 可能是 taskId 字符串
                         try:
-                            msg_json = (
-                                json.loads(result.get("msg"))
-                                if isinstance(result.get("msg"), str)
-                                else result.get("msg")
-                            )
-                            if isinstance(msg_json, dict):
-                                api_task_id = (
-                                    msg_json.get("taskId")
-                                    or msg_json.get("task_id")
-                                    or msg_json.get("id")
-                                )
+                            # 尝试解析为数字（taskId 通常是数字字符串）
+                            if result.get("data").strip().isdigit():
+                                api_task_id = result.get("data").strip()
                                 if api_task_id:
                                     logger.info(
-                                        f"✅ [{api_type_name}] 从 msg 字段提取到 taskId: {api_task_id}"
+                                        f"✅ [{api_type_name}] 从 data 字符串提取到 taskId: {api_task_id}"
                                     )
                         except Exception:
                             pass
 
-                # 如果上面没找到，尝试其他格式（非 RunningHub API）
-                if not api_task_id:
-                    # 格式3: {"task_id": "xxx"} 或 {"id": "xxx"}
-                    api_task_id = result.get("task_id") or result.get("id")
-
-                # 继续处理 RunningHub 的错误码（如果有）
-                if (
-                    api_config.api_type == "runninghub-rhart-edit"
-                    or api_config.api_type == "runninghub-comfyui-workflow"
-                ):
-                    # 检查是否有错误码（非0表示错误）
-                    if result.get("code") and result.get("code") != 0:
-                        error_code = result.get("code")
-                        error_msg = result.get("msg", "")
-
-                        logger.warning("[{api_type_name}] API返回错误码: {error_code}")
-                        if api_task_id:
-                            logger.warning(
-                                "[{api_type_name}] 但检测到 taskId: {api_task_id}，任务可能已创建，将继续处理"
+                # 如果还没找到，尝试从 msg 字段的 JSON 中提取（某些错误响应可能包含 taskId）
+                if not api_task_id and result.get("msg"):
+                    try:
+                        msg_json = (
+                            json.loads(result.get("msg"))
+                            if isinstance(result.get("msg"), str)
+                            else result.get("msg")
+                        )
+                        if isinstance(msg_json, dict):
+                            api_task_id = (
+                                msg_json.get("taskId")
+                                or msg_json.get("task_id")
+                                or msg_json.get("id")
                             )
-
-                        # 尝试解析错误信息（msg 可能是 JSON 字符串）
-                        error_details = {}
-                        if error_msg:
-                            try:
-                                error_details = (
-                                    json.loads(error_msg)
-                                    if isinstance(error_msg, str)
-                                    else error_msg
+                            if api_task_id:
+                                logger.info(
+                                    f"✅ [{api_type_name}] 从 msg 字段提取到 taskId: {api_task_id}"
                                 )
-                            except Exception:
-                                error_details = {"raw_message": error_msg}
-
-                        # 提取节点错误信息
-                        node_errors = error_details.get("node_errors", {})
-                        error_summary = []
-
-                        if node_errors:
-                            logger.warning("[{api_type_name}] 工作流节点验证警告:")
-                            for node_id, node_error in node_errors.items():
-                                errors = node_error.get("errors", [])
-                                node_name = node_error.get("node_name", "未知节点")
-                                for err in errors:
-                                    error_type = err.get("type", "")
-                                    error_message = err.get("message", "")
-                                    error_details_str = err.get("details", "")
-                                    input_name = err.get("extra_info", {}).get("input_name", "")
-                                    received_value = err.get("extra_info", {}).get(
-                                        "received_value", ""
-                                    )
+                    except Exception:
+                        pass
 
-                                    error_text = f"节点 {node_id} ({node_name})"
-                                    if input_name:
-                                        error_text += f" 字段 '{input_name}'"
-                                    if error_message:
-                                        error_text += f": {error_message}"
-                                    if error_details_str:
-                                        error_text += f" ({error_details_str})"
-                                    if received_value:
-                                        error_text += f" [当前值: {received_value}]"
-
-                                    error_summary.append(error_text)
-                                    logger.info(f"   - {error_text}")
-
-                        # 构建警告消息
-                        if error_summary:
-                            warning_message = "工作流验证警告（任务可能仍会执行）:\n" + "\n".join(
-                                f"  • {err}" for err in error_summary
-                            )
-                        else:
-                            warning_message = f"工作流验证警告 (错误码: {error_code})"
-                            if error_msg:
-                                warning_message += f": {error_msg[:200]}"
-
-                        # 保存警告信息到 processing_log，但不标记为失败
-                        api_info = json.loads(task.processing_log) if task.processing_log else {}
-                        api_info["warning_response"] = result
-                        api_info["warning_details"] = error_details
-                        api_info["warning_message"] = warning_message
-                        task.processing_log = json.dumps(api_info, ensure_ascii=False)
-
-                        # 如果有 taskId，继续处理；如果没有 taskId，检查是否可以从其他地方提取
-                        if not api_task_id:
-                            # 尝试从 errorMessages 或其他字段提取 taskId
-                            error_messages = result.get("errorMessages")
-                            if error_messages:
-                                if isinstance(error_messages, list) and len(error_messages) > 0:
-                                    # 尝试从错误消息中提取 taskId（如果包含）
-                                    for err_msg in error_messages:
-                                        if (
-                                            isinstance(err_msg, str)
-                                            and err_msg.strip().isdigit()
-                                            and len(err_msg.strip()) > 10
-                                        ):
-                                            api_task_id = err_msg.strip()
-                                            logger.info(
-                                                f"🔍 [{api_type_name}] 从 errorMessages 中提取到可能的 taskId: {api_task_id}"
-                                            )
-                                            break
-
-                            # 如果仍然没有 taskId，检查响应中的所有字段
-                            if not api_task_id:
-                                logger.info(f"🔍 [{api_type_name}] 尝试从响应中搜索 taskId...")
-                                for key, value in result.items():
-                                    if key.lower() in ["taskid", "task_id", "id"] and value:
-                                        if (
-                                            isinstance(value, str)
-                                            and value.strip().isdigit()
-                                            and len(value.strip()) > 10
-                                        ):
-                                            api_task_id = value.strip()
-                                            logger.info(
-                                                f"🔍 [{api_type_name}] 从字段 '{key}' 中找到可能的 taskId: {api_task_id}"
-                                            )
-                                            break
-                                        elif (
-                                            isinstance(value, (int, str))
-                                            and str(value).strip().isdigit()
-                                            and len(str(value).strip()) > 10
-                                        ):
-                                            api_task_id = str(value).strip()
-                                            logger.info(
-                                                f"🔍 [{api_type_name}] 从字段 '{key}' 中找到可能的 taskId: {api_task_id}"
-                                            )
-                                            break
+            # 如果上面没找到，尝试其他格式（非 RunningHub API）
+            if not api_task_id:
+                # 格式3: {"task_id": "xxx"} 或 {"id": "xxx"}
+                api_task_id = result.get("task_id") or result.get("id")
 
-                            # 如果仍然没有 taskId，标记为失败，但提示用户可以手动输入
-                            if not api_task_id:
-                                task.status = "failed"
-                                error_msg = warning_message.replace(
-                                    "警告（任务可能仍会执行）", "失败"
-                                )
-                                error_msg += "\n\n💡 提示：如果 RunningHub 后台已创建任务，可以在任务管理页面手动输入 taskId 进行查询。"
-                                task.error_message = error_msg
-                                logger.error(
-                                    "[{api_type_name}] 任务已标记为失败（无 taskId）: {warning_message[:200]}"
-                                )
-                                logger.info(
-                                    f"💡 [{api_type_name}] 提示：如果 RunningHub 后台已创建任务，请手动输入 taskId 进行查询"
-                                )
-                                return False, task, warning_message
-                            else:
-                                # 找到了 taskId，继续处理
-                                logger.info(
-                                    f"✅ [{api_type_name}] 从响应中提取到 taskId: {api_task_id}，任务将继续处理"
-                                )
-                        else:
-                            # 有 taskId，保存警告信息但继续处理
-                            logger.warning(
-                                "[{api_type_name}] 任务将继续处理（有 taskId），但存在验证警告"
-                            )
+            # 继续处理 RunningHub 的错误码（如果有）
+            if (
+                api_config.api_type == "runninghub-rhart-edit"
+                or api_config.api_type == "runninghub-comfyui-workflow"
+            ):
+                # 检查是否有错误码（非0表示错误）
+                if result.get("code") and result.get("code") != 0:
+                    error_code = result.get("code")
+                    error_msg = result.get("msg", "")
 
-                    # 成功响应或虽有警告但有 taskId：提取并处理 taskId
+                    logger.warning("[{api_type_name}] API返回错误码: {error_code}")
                     if api_task_id:
-                        logger.info(f"✅ [{api_type_name}] 找到 taskId: {api_task_id}")
-                        # RunningHub 的状态：QUEUED, RUNNING, SUCCESS, FAILED 等
-                        status = result.get("status", "")
-                        if not status and result.get("data"):
-                            status = result.get("data", {}).get("status", "")
-                        logger.info(f"📊 [{api_type_name}] 任务状态: {status}")
-                        # 如果状态是 FAILED，检查错误信息
-                        if status == "FAILED":
-                            error_code = result.get("errorCode", "")
-                            error_message = result.get("errorMessage", "")
-                            if error_code or error_message:
-                                logger.error(
-                                    "[{api_type_name}] 任务失败: {error_code} - {error_message}"
-                                )
+                        logger.warning(
+                            "[{api_type_name}] 但检测到 taskId: {api_task_id}，任务可能已创建，将继续处理"
+                        )
 
-                if api_task_id:
-                    task.status = "processing"
-                    # 保存API返回的task_id到comfyui_prompt_id字段（用于轮询查询，参考bk-photo-v4）
-                    task.comfyui_prompt_id = api_task_id
-                    # 同时保存到processing_log中
-                    api_info = json.loads(task.processing_log) if task.processing_log else {}
-                    api_info["api_task_id"] = api_task_id
-                    api_info["original_response"] = result
-                    task.processing_log = json.dumps(api_info, ensure_ascii=False)
-                    # 关键修复：保存API返回的task_id到notes字段（格式：T8_API_TASK_ID:xxx），用于轮询时优先提取（参考bk-photo-v4）
-                    if task.notes:
-                        task.notes = f"T8_API_TASK_ID:{api_task_id} | {task.notes}"
+                    # 尝试解析错误信息（msg 可能是 JSON 字符串）
+                    error_details = {}
+                    if error_msg:
+                        try:
+                            error_details = (
+                                json.loads(error_msg) if isinstance(error_msg, str) else error_msg
+                            )
+                        except Exception:
+                            error_details = {"raw_message": error_msg}
+
+                    # 提取节点错误信息
+                    node_errors = error_details.get("node_errors", {})
+                    error_summary = []
+
+                    if node_errors:
+                        logger.warning("[{api_type_name}] 工作流节点验证警告:")
+                        for node_id, node_error in node_errors.items():
+                            errors = node_error.get("errors", [])
+                            node_name = node_error.get("node_name", "未知节点")
+                            for err in errors:
+                                error_type = err.get("type", "")
+                                error_message = err.get("message", "")
+                                error_details_str = err.get("details", "")
+                                input_name = err.get("extra_info", {}).get("input_name", "")
+                                received_value = err.get("extra_info", {}).get("received_value", "")
+
+                                error_text = f"节点 {node_id} ({node_name})"
+                                if input_name:
+                                    error_text += f" 字段 '{input_name}'"
+                                if error_message:
+                                    error_text += f": {error_message}"
+                                if error_details_str:
+                                    error_text += f" ({error_details_str})"
+                                if received_value:
+                                    error_text += f" [当前值: {received_value}]"
+
+                                error_summary.append(error_text)
+                                logger.info(f"   - {error_text}")
+
+                    # 构建警告消息
+                    if error_summary:
+                        warning_message = "工作流验证警告（任务可能仍会执行）:\n" + "\n".join(
+                            f"  • {err}" for err in error_summary
+                        )
                     else:
-                        task.notes = f"T8_API_TASK_ID:{api_task_id}"
-                    # 同时保存完整响应到processing_log的result_data（用于轮询时提取，参考bk-photo-v4）
-                    # 注意：AITask模型没有result_data字段，所以保存到processing_log中
-                    api_info["result_data"] = result  # 保存完整响应对象（不是字符串）
+                        warning_message = f"工作流验证警告 (错误码: {error_code})"
+                        if error_msg:
+                            warning_message += f": {error_msg[:200]}"
+
+                    # 保存警告信息到 processing_log，但不标记为失败
+                    api_info = json.loads(task.processing_log) if task.processing_log else {}
+                    api_info["warning_response"] = result
+                    api_info["warning_details"] = error_details
+                    api_info["warning_message"] = warning_message
                     task.processing_log = json.dumps(api_info, ensure_ascii=False)
 
-                    # 从API响应中提取预计完成时间（如果API返回了该字段）
-                    if api_config.api_type in [
-                        "runninghub-rhart-edit",
-                        "runninghub-comfyui-workflow",
-                    ]:
-                        estimated_time_from_api = None
-
-                        # 检查响应中可能包含预计完成时间的字段
-                        for field_name in [
-                            "estimatedTime",
-                            "estimated_time",
-                            "eta",
-                            "ETA",
-                            "estimatedCompletionTime",
-                            "finishTime",
-                            "finish_time",
-                        ]:
-                            if field_name in result:
-                                estimated_time_from_api = result.get(field_name)
-                                break
-
-                        # 检查 data 字段中
-                        if not estimated_time_from_api and result.get("data"):
-                            data = result.get("data")
-                            if isinstance(data, dict):
-                                for field_name in [
-                                    "estimatedTime",
-                                    "estimated_time",
-                                    "eta",
-                                    "ETA",
-                                    "estimatedCompletionTime",
-                                    "finishTime",
-                                    "finish_time",
-                                ]:
-                                    if field_name in data:
-                                        estimated_time_from_api = data.get(field_name)
+                    # 如果有 taskId，继续处理；如果没有 taskId，检查是否可以从其他地方提取
+                    if not api_task_id:
+                        # 尝试从 errorMessages 或其他字段提取 taskId
+                        error_messages = result.get("errorMessages")
+                        if error_messages:
+                            if isinstance(error_messages, list) and len(error_messages) > 0:
+                                # 尝试从错误消息中提取 taskId（如果包含）
+                                for err_msg in error_messages:
+                                    if (
+                                        isinstance(err_msg, str)
+                                        and err_msg.strip().isdigit()
+                                        and len(err_msg.strip()) > 10
+                                    ):
+                                        api_task_id = err_msg.strip()
+                                        logger.info(
+                                            f"🔍 [{api_type_name}] 从 errorMessages 中提取到可能的 taskId: {api_task_id}"
+                                        )
                                         break
 
-                        # 如果API返回了预计完成时间，使用API的值
-                        if estimated_time_from_api:
-                            try:
-                                # 尝试解析为时间戳（秒或毫秒）
-                                if isinstance(estimated_time_from_api, (int, float)):
-                                    # 判断是秒还是毫秒（通常大于1000000000的是秒，否则可能是毫秒）
-                                    if estimated_time_from_api > 1000000000000:  # 毫秒
-                                        estimated_time_from_api = estimated_time_from_api / 1000
-                                    estimated_time = datetime.fromtimestamp(estimated_time_from_api)
-                                elif isinstance(estimated_time_from_api, str):
-                                    # 尝试解析ISO格式字符串
-                                    try:
-                                        estimated_time = datetime.fromisoformat(
-                                            estimated_time_from_api.replace("Z", "+00:00")
+                        # 如果仍然没有 taskId，检查响应中的所有字段
+                        if not api_task_id:
+                            logger.info(f"🔍 [{api_type_name}] 尝试从响应中搜索 taskId...")
+                            for key, value in result.items():
+                                if key.lower() in ["taskid", "task_id", "id"] and value:
+                                    if (
+                                        isinstance(value, str)
+                                        and value.strip().isdigit()
+                                        and len(value.strip()) > 10
+                                    ):
+                                        api_task_id = value.strip()
+                                        logger.info(
+                                            f"🔍 [{api_type_name}] 从字段 '{key}' 中找到可能的 taskId: {api_task_id}"
                                         )
-                                    except Exception:
-                                        # 尝试解析时间戳字符串
-                                        try:
-                                            timestamp = float(estimated_time_from_api)
-                                            if timestamp > 1000000000000:  # 毫秒
-                                                timestamp = timestamp / 1000
-                                            estimated_time = datetime.fromtimestamp(timestamp)
-                                        except Exception:
-                                            estimated_time = None
-                                else:
-                                    estimated_time = None
+                                        break
+                                    elif (
+                                        isinstance(value, (int, str))
+                                        and str(value).strip().isdigit()
+                                        and len(str(value).strip()) > 10
+                                    ):
+                                        api_task_id = str(value).strip()
+                                        logger.info(
+                                            f"🔍 [{api_type_name}] 从字段 '{key}' 中找到可能的 taskId: {api_task_id}"
+                                        )
+                                        break
 
-                                if estimated_time:
-                                    task.estimated_completion_time = estimated_time
-                                    logger.info(
-                                        f"📅 [创建任务] RunningHub 任务预计完成时间（来自API）: {estimated_time.strftime('%Y-%m-%d %H:%M:%S')}"
-                                    )
-                            except Exception as e:
-                                logger.warning("[创建任务] 解析API返回的预计完成时间失败: {str(e)}")
+                        # 如果仍然没有 taskId，标记为失败，但提示用户可以手动输入
+                        if not api_task_id:
+                            task.status = "failed"
+                            error_msg = warning_message.replace("警告（任务可能仍会执行）", "失败")
+                            error_msg += "\n\n💡 提示：如果 RunningHub 后台已创建任务，可以在任务管理页面手动输入 taskId 进行查询。"
+                            task.error_message = error_msg
+                            logger.error(
+                                "[{api_type_name}] 任务已标记为失败（无 taskId）: {warning_message[:200]}"
+                            )
+                            logger.info(
+                                f"💡 [{api_type_name}] 提示：如果 RunningHub 后台已创建任务，请手动输入 taskId 进行查询"
+                            )
+                            return warning_message
                         else:
-                            # 如果API没有返回预计完成时间，打印调试信息
+                            # 找到了 taskId，继续处理
                             logger.info(
-                                f"🔍 [创建任务] RunningHub API响应中未找到预计完成时间字段，响应字段: {list(result.keys())}"
+                                f"✅ [{api_type_name}] 从响应中提取到 taskId: {api_task_id}，任务将继续处理"
+                            )
+                    else:
+                        # 有 taskId，保存警告信息但继续处理
+                        logger.warning(
+                            "[{api_type_name}] 任务将继续处理（有 taskId），但存在验证警告"
+                        )
+
+                # 成功响应或虽有警告但有 taskId：提取并处理 taskId
+                if api_task_id:
+                    logger.info(f"✅ [{api_type_name}] 找到 taskId: {api_task_id}")
+                    # RunningHub 的状态：QUEUED, RUNNING, SUCCESS, FAILED 等
+                    status = result.get("status", "")
+                    if not status and result.get("data"):
+                        status = result.get("data", {}).get("status", "")
+                    logger.info(f"📊 [{api_type_name}] 任务状态: {status}")
+                    # 如果状态是 FAILED，检查错误信息
+                    if status == "FAILED":
+                        error_code = result.get("errorCode", "")
+                        error_message = result.get("errorMessage", "")
+                        if error_code or error_message:
+                            logger.error(
+                                "[{api_type_name}] 任务失败: {error_code} - {error_message}"
                             )
-                            if result.get("data") and isinstance(result.get("data"), dict):
+
+            if api_task_id:
+                task.status = "processing"
+                # 保存API返回的task_id到comfyui_prompt_id字段（用于轮询查询，参考bk-photo-v4）
+                task.comfyui_prompt_id = api_task_id
+                # 同时保存到processing_log中
+                api_info = json.loads(task.processing_log) if task.processing_log else {}
+                api_info["api_task_id"] = api_task_id
+                api_info["original_response"] = result
+                task.processing_log = json.dumps(api_info, ensure_ascii=False)
+                # 关键修复：保存API返回的task_id到notes字段（格式：T8_API_TASK_ID:xxx），用于轮询时优先提取（参考bk-photo-v4）
+                if task.notes:
+                    task.notes = f"T8_API_TASK_ID:{api_task_id} | {task.notes}"
+                else:
+                    task.notes = f"T8_API_TASK_ID:{api_task_id}"
+                # 同时保存完整响应到processing_log的result_data（用于轮询时提取，参考bk-photo-v4）
+                # 注意：AITask模型没有result_data字段，所以保存到processing_log中
+                api_info["result_data"] = result  # 保存完整响应对象（不是字符串）
+                task.processing_log = json.dumps(api_info, ensure_ascii=False)
+
+                # 从API响应中提取预计完成时间（如果API返回了该字段）
+                if api_config.api_type in [
+                    "runninghub-rhart-edit",
+                    "runninghub-comfyui-workflow",
+                ]:
+                    estimated_time_from_api = None
+
+                    # 检查响应中可能包含预计完成时间的字段
+                    for field_name in [
+                        "estimatedTime",
+                        "estimated_time",
+                        "eta",
+                        "ETA",
+                        "estimatedCompletionTime",
+                        "finishTime",
+                        "finish_time",
+                    ]:
+                        if field_name in result:
+                            estimated_time_from_api = result.get(field_name)
+                            break
+
+                    # 检查 data 字段中
+                    if not estimated_time_from_api and result.get("data"):
+                        data = result.get("data")
+                        if isinstance(data, dict):
+                            for field_name in [
+                                "estimatedTime",
+                                "estimated_time",
+                                "eta",
+                                "ETA",
+                                "estimatedCompletionTime",
+                                "finishTime",
+                                "finish_time",
+                            ]:
+                                if field_name in data:
+                                    estimated_time_from_api = data.get(field_name)
+                                    break
+
+                    # 如果API返回了预计完成时间，使用API的值
+                    if estimated_time_from_api:
+                        try:
+                            # 尝试解析为时间戳（秒或毫秒）
+                            if isinstance(estimated_time_from_api, (int, float)):
+                                # 判断是秒还是毫秒（通常大于1000000000的是秒，否则可能是毫秒）
+                                if estimated_time_from_api > 1000000000000:  # 毫秒
+                                    estimated_time_from_api = estimated_time_from_api / 1000
+                                estimated_time = datetime.fromtimestamp(estimated_time_from_api)
+                            elif isinstance(estimated_time_from_api, str):
+                                # 尝试解析ISO格式字符串
+                                try:
+                                    estimated_time = datetime.fromisoformat(
+                                        estimated_time_from_api.replace("Z", "+00:00")
+                                    )
+                                except Exception:
+                                    # 尝试解析时间戳字符串
+                                    try:
+                                        timestamp = float(estimated_time_from_api)
+                                        if timestamp > 1000000000000:  # 毫秒
+                                            timestamp = timestamp / 1000
+                                        estimated_time = datetime.fromtimestamp(timestamp)
+                                    except Exception:
+                                        estimated_time = None
+                            else:
+                                estimated_time = None
+
+                            if estimated_time:
+                                task.estimated_completion_time = estimated_time
                                 logger.info(
-                                    f"🔍 [创建任务] data字段中的键: {list(result.get('data').keys())}"
+                                    f"📅 [创建任务] RunningHub 任务预计完成时间（来自API）: {estimated_time.strftime('%Y-%m-%d %H:%M:%S')}"
                                 )
+                        except Exception as e:
+                            logger.warning("[创建任务] 解析API返回的预计完成时间失败: {str(e)}")
+                    else:
+                        # 如果API没有返回预计完成时间，打印调试信息
+                        logger.info(
+                            f"🔍 [创建任务] RunningHub API响应中未找到预计完成时间字段，响应字段: {list(result.keys())}"
+                        )
+                        if result.get("data") and isinstance(result.get("data"), dict):
+                            logger.info(
+                                f"🔍 [创建任务] data字段中的键: {list(result.get('data').keys())}"
+                            )
 
-                    logger.info(
-                        f"✅ 已保存API返回的task_id: {api_task_id} 到 comfyui_prompt_id、notes 和 processing_log"
-                    )
-                else:
-                    task.status = "failed"
-                    task.error_message = f"异步API响应中未找到任务ID，响应: {json.dumps(result, ensure_ascii=False)[:500]}"
-                    logger.error(
-                        "异步API响应中未找到任务ID，完整响应: {json.dumps(result, ensure_ascii=False)}"
-                    )
-        else:
+                logger.info(
+                    f"✅ 已保存API返回的task_id: {api_task_id} 到 comfyui_prompt_id、notes 和 processing_log"
+                )
+            else:
+                task.status = "failed"
+                task.error_message = f"异步API响应中未找到任务ID，响应: {json.dumps(result, ensure_ascii=False)[:500]}"
+                logger.error(
+                    "异步API响应中未找到任务ID，完整响应: {json.dumps(result, ensure_ascii=False)}"
+                )
+    else:
+        task.status = "failed"
+        task.error_message = f"HTTP {response.status_code}: {response.text[:500]}"
+
+    return None
+
+
+def _submit_api_tasks(
+    style_image_id,
+    prompts,
+    image_size,
+    aspect_ratio,
+    uploaded_images,
+    upload_config,
+    api_template,
+    api_config,
+    order_id,
+    order_number,
+    db,
+    AITask,
+):
+    """
+    批量提交引擎：共用已解析的模板与服务商配置，并发发送各提示词的请求，任务记录一次写入、一次提交
+
+    - 并发数不超过 ai_provider 共享客户端的并发上限（api_max_concurrency）
+    - 上传图片/base64编码按内容去重，各提示词共用同一份（见 upload_dedup）
+    - 开启服务商网关的同步API只登记网关请求，在当前线程依次登记
+
+    Returns:
+        tuple: (created_tasks: list[AITask], errors: list[str])
+    """
+    from flask import current_app, has_app_context
+
+    from app.services.provider_gateway import is_gateway_enabled
+
+    errors = []
+    submissions = []  # (序号, 提示词, api_request)
+    for idx, prompt in enumerate(prompts):
+        if not prompt or not prompt.strip():
+            errors.append(f"提示词 {idx + 1} 为空，跳过")
+            continue
+        api_request, error_message = _build_api_request(
+            api_config, api_template, prompt.strip(), image_size, aspect_ratio, uploaded_images
+        )
+        if error_message:
+            errors.append(f"提示词 {idx + 1} ({prompt[:50]}...): {error_message}")
+            continue
+        submissions.append((idx, prompt, api_request))
+
+    if not submissions:
+        return [], errors
+
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def send_in_app_context(api_request):
+        with app.app_context() if app is not None else contextlib.nullcontext():
+            return _send_api_request(
+                api_config, api_template, api_request, uploaded_images, upload_config
+            )
+
+    client = get_http_client("ai_provider")
+    workers = min(len(submissions), client.max_concurrency or len(submissions))
+    if (getattr(api_config, "is_sync_api", False) and is_gateway_enabled()) or workers <= 1:
+        results = [
+            _send_api_request(
+                api_config, api_template, api_request, uploaded_images, upload_config, db=db
+            )
+            for _, _, api_request in submissions
+        ]
+    else:
+        logger.info(f"🚀 批量提交 {len(submissions)} 个提示词（并发 {workers}）")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-batch") as executor:
+            results = list(executor.map(send_in_app_context, [item[2] for item in submissions]))
+
+    records = []
+    for (idx, prompt, api_request), result in zip(submissions, results):
+        response, api_call_error, connection_closed = result
+        task_id = api_request["task_id"]
+        task, gateway_job = _new_api_task(
+            api_config,
+            api_template,
+            api_request,
+            task_id,
+            style_image_id,
+            uploaded_images,
+            response,
+            api_call_error,
+            connection_closed,
+            order_id=order_id or 0,
+            order_number=order_number or f"TEST_{task_id[:8]}",
+            AITask=AITask,
+        )
+        records.append((idx, prompt, task, task_id, result, gateway_job))
+
+    # 一次写入所有任务记录
+    db.session.add_all([record[2] for record in records])
+    db.session.flush()
+
+    _mark_order_ai_processing(order_id)
+
+    created_tasks = []
+    for idx, prompt, task, task_id, result, gateway_job in records:
+        try:
+            error_message = _complete_api_task(task, task_id, api_config, *result, gateway_job)
+        except Exception as e:
+            logger.error(f"批量任务 {idx + 1}/{len(prompts)} 处理响应异常: {str(e)}")
             task.status = "failed"
-            task.error_message = f"HTTP {response.status_code}: {response.text[:500]}"
+            task.error_message = f"处理响应失败: {str(e)}"
+            error_message = str(e)
+        if error_message:
+            errors.append(f"提示词 {idx + 1} ({prompt[:50]}...): {error_message}")
+            logger.error(f"批量任务 {idx + 1}/{len(prompts)} 创建失败: {error_message}")
+        else:
+            created_tasks.append(task)
+            logger.info(
+                f"✅ 批量任务 {idx + 1}/{len(prompts)} 创建成功: task_id={task.id}, prompt={prompt[:50]}..."
+            )
 
-        db.session.commit()
+    db.session.commit()
+    return created_tasks, errors
 
+
+def create_api_task(
+    style_image_id,
+    prompt,
+    image_size="1K",
+    aspect_ratio="auto",
+    uploaded_images=None,
+    upload_config=None,
+    api_config_id=None,
+    db=None,
+    AITask=None,
+    APITemplate=None,
+    APIProviderConfig=None,
+    StyleImage=None,
+    order_id=None,
+    order_number=None,
+):
+    """
+    创建API调用任务
+
+    Args:
+        style_image_id: 风格图片ID
+        prompt: 提示词
+        image_size: 图片尺寸
+        aspect_ratio: 图片比例
+        uploaded_images: 上传的图片URL列表
+        api_config_id: API配置ID（可选，如果不提供则从模板配置获取）
+        db: 数据库实例
+        AITask: AITask模型类
+        APITemplate: APITemplate模型类
+        APIProviderConfig: APIProviderConfig模型类
+        StyleImage: StyleImage模型类
+        order_id: 关联订单ID（可选，默认0表示测试任务）
+        order_number: 关联订单号（可选，默认 TEST_ 前缀）
+
+    Returns:
+        tuple: (success: bool, task: AITask, error_message: str)
+    """
+    try:
+        # 获取数据库模型
+        if not all([db, AITask, APITemplate, APIProviderConfig, StyleImage]):
+            import sys
+
+            if "test_server" in sys.modules:
+                test_server_module = sys.modules["test_server"]
+                db = test_server_module.db
+                AITask = test_server_module.AITask
+                APITemplate = test_server_module.APITemplate
+                APIProviderConfig = test_server_module.APIProviderConfig
+                StyleImage = test_server_module.StyleImage
+
+        if not all([db, AITask, APITemplate, APIProviderConfig, StyleImage]):
+            return False, None, "数据库模型未初始化"
+
+        style_image, api_template, api_config, error_message = _resolve_api_task_config(
+            style_image_id, api_config_id, APITemplate, APIProviderConfig, StyleImage
+        )
+        if error_message:
+            return False, None, error_message
+
+        # 检查是否有批量提示词配置（优先级最高）
+        prompts_list = _template_batch_prompts(api_template, prompt)
+
+        # 如果没有批量提示词，且用户也没有提供提示词，尝试使用默认提示词（向后兼容）
+        if not prompts_list and (not prompt or not prompt.strip()):
+            if api_template and api_template.default_prompt:
+                prompt = api_template.default_prompt.strip()
+                logger.info(f"📝 使用默认提示词: {prompt[:50]}...")
+
+        # 如果配置了批量提示词：共用已解析的配置并发提交
+        if prompts_list:
+            logger.info(f"🔄 使用批量提示词创建任务，共 {len(prompts_list)} 个提示词")
+            created_tasks, errors = _submit_api_tasks(
+                style_image_id=style_image_id,
+                prompts=prompts_list,
+                image_size=image_size,
+                aspect_ratio=aspect_ratio,
+                uploaded_images=uploaded_images,
+                upload_config=upload_config,
+                api_template=api_template,
+                api_config=api_config,
+                order_id=order_id,
+                order_number=order_number,
+                db=db,
+                AITask=AITask,
+            )
+
+            # 如果至少有一个任务创建成功，返回成功
+            if len(created_tasks) > 0:
+                error_message = f"成功创建 {len(created_tasks)}/{len(prompts_list)} 个任务" + (
+                    f"，失败: {', '.join(errors)}" if errors else ""
+                )
+                # 返回第一个任务（保持向后兼容）
+                return True, created_tasks[0], error_message if errors else None
+            else:
+                return False, None, f"所有任务创建失败: {', '.join(errors)}"
+
+        # 验证提示词不为空（在非批量提示词的情况下）
+        if not prompt or not prompt.strip():
+            return False, None, "提示词不能为空，请配置批量提示词或提供提示词"
+
+        api_request, error_message = _build_api_request(
+            api_config, api_template, prompt, image_size, aspect_ratio, uploaded_images
+        )
+        if error_message:
+            return False, None, error_message
+
+        # 关键修复：先创建任务记录，即使API调用失败也要创建（这样用户才能在任务管理页面看到）
+        task_id = api_request["task_id"]
+
+        response, api_call_error, connection_closed_but_request_sent = _send_api_request(
+            api_config, api_template, api_request, uploaded_images, upload_config, db=db
+        )
+
+        # 对于测试任务，order_id 和 order_number 使用测试值
+        task, gateway_job = _new_api_task(
+            api_config,
+            api_template,
+            api_request,
+            task_id,
+            style_image_id,
+            uploaded_images,
+            response,
+            api_call_error,
+            connection_closed_but_request_sent,
+            order_id=order_id or 0,
+            order_number=order_number or f"TEST_{task_id[:8]}",
+            AITask=AITask,
+        )
+
+        db.session.add(task)
+        db.session.flush()  # 确保task.id已生成
+
+        # 更新订单状态为"AI任务处理中"（如果order_id > 0，说明是真实订单）
+        _mark_order_ai_processing(order_id)
+
+        error_message = _complete_api_task(
+            task,
+            task_id,
+            api_config,
+            response,
+            api_call_error,
+            connection_closed_but_request_sent,
+            gateway_job,
+        )
+        db.session.commit()  # 提交时包含订单状态更新
+
+        if error_message:
+            return False, task, error_message
         return True, task, None
 
     except Exception as e:
@@ -2659,51 +2797,42 @@ def create_api_tasks_batch(
         if len(valid_prompts) == 0:
             return False, [], "没有有效的提示词"
 
-        # 如果设置了order_id，为所有任务设置相同的order_id和order_number
-        if order_id:
-            create_api_task._test_order_id = order_id
-            if order_number:
-                create_api_task._test_order_number = order_number
+        # 获取数据库模型
+        if not all([db, AITask, APITemplate, APIProviderConfig, StyleImage]):
+            import sys
 
-        # 批量创建任务
-        created_tasks = []
-        errors = []
+            if "test_server" in sys.modules:
+                test_server_module = sys.modules["test_server"]
+                db = test_server_module.db
+                AITask = test_server_module.AITask
+                APITemplate = test_server_module.APITemplate
+                APIProviderConfig = test_server_module.APIProviderConfig
+                StyleImage = test_server_module.StyleImage
 
-        for idx, prompt in enumerate(valid_prompts):
-            try:
-                success, task, error_message = create_api_task(
-                    style_image_id=style_image_id,
-                    prompt=prompt,
-                    image_size=image_size,
-                    aspect_ratio=aspect_ratio,
-                    uploaded_images=uploaded_images,
-                    upload_config=upload_config,
-                    api_config_id=api_config_id,
-                    db=db,
-                    AITask=AITask,
-                    APITemplate=APITemplate,
-                    APIProviderConfig=APIProviderConfig,
-                    StyleImage=StyleImage,
-                    StyleCategory=StyleCategory,
-                )
+        if not all([db, AITask, APITemplate, APIProviderConfig, StyleImage]):
+            return False, [], "数据库模型未初始化"
 
-                if success and task:
-                    created_tasks.append(task)
-                    logger.info(
-                        f"✅ 批量任务 {idx + 1}/{len(valid_prompts)} 创建成功: task_id={task.id}, prompt={prompt[:50]}..."
-                    )
-                else:
-                    errors.append(f"提示词 {idx + 1} ({prompt[:50]}...): {error_message}")
-                    logger.error(
-                        "批量任务 {idx + 1}/{len(valid_prompts)} 创建失败: {error_message}"
-                    )
-            except Exception as e:
-                error_msg = f"提示词 {idx + 1} ({prompt[:50]}...): {str(e)}"
-                errors.append(error_msg)
-                logger.error("批量任务 {idx + 1}/{len(valid_prompts)} 创建异常: {str(e)}")
-                import traceback
+        # 模板和服务商配置只解析一次，所有提示词共用
+        style_image, api_template, api_config, error_message = _resolve_api_task_config(
+            style_image_id, api_config_id, APITemplate, APIProviderConfig, StyleImage
+        )
+        if error_message:
+            return False, [], error_message
 
-                traceback.print_exc()
+        created_tasks, errors = _submit_api_tasks(
+            style_image_id=style_image_id,
+            prompts=valid_prompts,
+            image_size=image_size,
+            aspect_ratio=aspect_ratio,
+            uploaded_images=uploaded_images,
+            upload_config=upload_config,
+            api_template=api_template,
+            api_config=api_config,
+            order_id=order_id,
+            order_number=order_number,
+            db=db,
+            AITask=AITask,
+        )
 
         # 如果至少有一个任务创建成功，返回成功
         if len(created_tasks) > 0:
@@ -2718,4 +2847,6 @@ def create_api_tasks_batch(
         import traceback
 
         traceback.print_exc()
+        if db:
+            db.session.rollback()
         return False, [], f"批量创建任务失败: {str(e)}"
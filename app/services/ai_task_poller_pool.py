@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+AI任务并发轮询引擎
+- 每个服务商类型一个有界线程池，并按服务商限速，避免单个慢服务商拖慢其他任务
+- 使用到期时间堆调度：每个任务在 wait_before_polling / polling_interval_with_tasks 到期时才查询，
+  不再每轮全量扫描
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 各服务商的并发与限速配置
+# max_workers: 线程池大小（同时进行的状态查询数）
+# rate: 每秒最多发起的状态查询数
+PROVIDER_POOL_LIMITS = {
+    "runninghub": {"max_workers": 8, "rate": 5.0},
+    "gemini": {"max_workers": 6, "rate": 5.0},
+    "nano-banana": {"max_workers": 6, "rate": 5.0},
+    "veo": {"max_workers": 4, "rate": 2.0},
+    "comfyui": {"max_workers": 4, "rate": 10.0},
+    "meitu": {"max_workers": 2, "rate": 2.0},
+    "default": {"max_workers": 4, "rate": 5.0},
+}
+
+# 轮询任务出错后的重试等待时间（秒）
+ERROR_RETRY_DELAY = 30
+
+
+def resolve_provider_key(api_type: Optional[str], is_local_comfyui_task: bool = False) -> str:
+    """
+    根据API类型确定任务所属的服务商线程池
+
+    Args:
+        api_type: APIProviderConfig.api_type
+        is_local_comfyui_task: 是否本地ComfyUI任务
+
+    Returns:
+        str: PROVIDER_POOL_LIMITS 中的键
+    """
+    if is_local_comfyui_task:
+        return "comfyui"
+    if not api_type:
+        return "default"
+    api_type = api_type.lower()
+    if api_type.startswith("runninghub"):
+        return "runninghub"
+    if api_type.startswith("gemini"):
+        return "gemini"
+    if api_type.startswith("nano-banana"):
+        return "nano-banana"
+    if api_type.startswith("veo"):
+        return "veo"
+    return "default"
+
+
+class RateLimiter:
+    """令牌桶限速器（线程安全）"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = max(float(rate), 0.001)
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """获取一个令牌，令牌不足时阻塞等待；超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class DueTaskHeap:
+    """
+    按到期时间排序的任务堆（线程安全）
+    同一个任务只保留最近一次调度，旧的堆元素惰性删除
+    """
+
+    _REMOVED = object()
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def push(self, task_id, due_at: float, provider_key: str):
+        """加入或重新调度任务"""
+        with self._lock:
+            old_entry = self._entries.pop(task_id, None)
+            if old_entry is not None:
+                old_entry[2] = self._REMOVED
+            entry = [due_at, next(self._counter), task_id, provider_key]
+            self._entries[task_id] = entry
+            heapq.heappush(self._heap, entry)
+
+    def discard(self, task_id):
+        """移除任务（不存在时忽略）"""
+        with self._lock:
+            entry = self._entries.pop(task_id, None)
+            if entry is not None:
+                entry[2] = self._REMOVED
+
+    def pop_due(self, now: float) -> List[Tuple[object, str]]:
+        """弹出所有已到期的任务，返回 [(task_id, provider_key), ...]"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, task_id, provider_key = heapq.heappop(self._heap)
+                if task_id is self._REMOVED:
+                    continue
+                del self._entries[task_id]
+                due.append((task_id, provider_key))
+        return due
+
+    def next_due_at(self) -> Optional[float]:
+        """最近一个任务的到期时间，堆为空时返回None"""
+        with self._lock:
+            while self._heap and self._heap[0][2] is self._REMOVED:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def __contains__(self, task_id) -> bool:
+        with self._lock:
+            return task_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class ProviderPollerPool:
+    """按服务商划分的有界轮询线程池，每个线程池带独立的限速器"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict]] = None):
+        self.limits = limits or PROVIDER_POOL_LIMITS
+        self._executors = {}
+        self._limiters = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider_key: str):
+        with self._lock:
+            if provider_key not in self._executors:
+                limit = self.limits.get(provider_key) or self.limits["default"]
+                self._executors[provider_key] = ThreadPoolExecutor(
+                    max_workers=limit["max_workers"],
+                    thread_name_prefix=f"AIPoller-{provider_key}",
+                )
+                self._limiters[provider_key] = RateLimiter(limit["rate"])
+                self._stats[provider_key] = {
+                    "submitted": 0,
+                    "completed": 0,
+                    "failed": 0,
+                    "in_flight": 0,
+                }
+            return self._executors[provider_key], self._limiters[provider_key]
+
+    def submit(self, provider_key: str, fn: Callable, *args):
+        """提交一次状态查询到对应服务商的线程池（执行前先获取限速令牌）"""
+        executor, limiter = self._get(provider_key)
+        stats = self._stats[provider_key]
+
+        def run():
+            limiter.acquire()
+            try:
+                result = fn(*args)
+                with self._lock:
+                    stats["completed"] += 1
+                return result
+            except Exception:
+                with self._lock:
+                    stats["failed"] += 1
+                raise
+            finally:
+                with self._lock:
+                    stats["in_flight"] -= 1
+
+        with self._lock:
+            stats["submitted"] += 1
+            stats["in_flight"] += 1
+        return executor.submit(run)
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {key: dict(value) for key, value in self._stats.items()}
+
+
+class AITaskPollerEngine:
+    """
+    AI任务轮询引擎
+
+    Args:
+        discover_func: 发现待轮询任务，返回 [(task_id, provider_key, due_at), ...]
+        poll_func: 轮询单个任务，返回距下次轮询的秒数，任务结束时返回None
+        settings_func: 返回轮询配置（polling_interval / polling_interval_with_tasks）
+        sweep_jobs: 需要周期执行的整批轮询 {名称: 函数}，在同名线程池中执行且不会重叠
+        limits: 服务商线程池配置，默认 PROVIDER_POOL_LIMITS
+    """
+
+    def __init__(
+        self,
+        discover_func: Callable[[], List[Tuple[object, str, float]]],
+        poll_func: Callable[[object], Optional[float]],
+        settings_func: Optional[Callable[[], Dict]] = None,
+        sweep_jobs: Optional[Dict[str, Callable]] = None,
+        limits: Optional[Dict[str, Dict]] = None,
+    ):
+        self.discover_func = discover_func
+        self.poll_func = poll_func
+        self.settings_func = settings_func
+        self.sweep_jobs = sweep_jobs or {}
+        self.pool = ProviderPollerPool(limits)
+        self.heap = DueTaskHeap()
+
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self._sweeps_running = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self._discovery_interval = 5
+        self._next_discovery_at = 0.0
+        self._next_sweep_at = 0.0
+        self._stats = {"discovered": 0, "polled": 0, "rescheduled": 0, "errors": 0}
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="AIPollerScheduler")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        self.pool.shutdown(wait=False)
+
+    def schedule(self, task_id, provider_key: str, due_at: Optional[float] = None):
+        """手动调度任务（例如任务提交后立即加入轮询）"""
+        self.heap.push(task_id, due_at if due_at is not None else time.time(), provider_key)
+        self._wakeup.set()
+
+    def _refresh_settings(self):
+        if not self.settings_func:
+            return
+        try:
+            settings = self.settings_func() or {}
+            self._discovery_interval = settings.get("polling_interval_with_tasks") or 5
+        except Exception as e:
+            logger.warning(f"[轮询引擎] 读取轮询配置失败: {str(e)}")
+
+    def _discover(self):
+        try:
+            discovered = self.discover_func() or []
+        except Exception as e:
+            logger.error(f"[轮询引擎] 发现待轮询任务失败: {str(e)}")
+            return
+
+        added = 0
+        for task_id, provider_key, due_at in discovered:
+            with self._in_flight_lock:
+                if task_id in self._in_flight:
+                    continue
+            if task_id in self.heap:
+                continue
+            self.heap.push(task_id, due_at, provider_key)
+            added += 1
+
+        if added:
+            self._stats["discovered"] += added
+            logger.info(f"🔍 [轮询引擎] 新发现 {added} 个待轮询任务（待调度: {len(self.heap)}）")
+
+    def _poll_task(self, task_id, provider_key: str):
+        stat_key = "polled"
+        try:
+            next_delay = self.poll_func(task_id)
+        except Exception as e:
+            stat_key = "errors"
+            next_delay = ERROR_RETRY_DELAY
+            logger.warning(f"[轮询引擎] 轮询任务 {task_id} 出错: {str(e)}")
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(task_id)
+
+        with self._in_flight_lock:
+            self._stats[stat_key] += 1
+            if next_delay is not None:
+                self._stats["rescheduled"] += 1
+
+        if next_delay is not None and self._running:
+            self.heap.push(task_id, time.time() + next_delay, provider_key)
+            self._wakeup.set()
+
+    def _run_sweep(self, name: str, func: Callable):
+        try:
+            func()
+        except Exception as e:
+            logger.warning(f"[轮询引擎] 执行 {name} 轮询失败: {str(e)}")
+        finally:
+            with self._in_flight_lock:
+                self._sweeps_running.discard(name)
+
+    def _dispatch_due(self, now: float):
+        for task_id, provider_key in self.heap.pop_due(now):
+            with self._in_flight_lock:
+                if task_id in self._in_flight:
+                    continue
+                self._in_flight.add(task_id)
+            self.pool.submit(provider_key, self._poll_task, task_id, provider_key)
+
+    def _dispatch_sweeps(self):
+        for name, func in self.sweep_jobs.items():
+            with self._in_flight_lock:
+                if name in self._sweeps_running:
+                    continue
+                self._sweeps_running.add(name)
+            self.pool.submit(name, self._run_sweep, name, func)
+
+    def _run(self):
+        logger.info("🚀 [轮询引擎] 调度线程已启动")
+        while self._running:
+            try:
+                self._wakeup.clear()
+                now = time.time()
+                if now >= self._next_discovery_at:
+                    self._refresh_settings()
+                    self._discover()
+                    self._next_discovery_at = now + self._discovery_interval
+                if now >= self._next_sweep_at:
+                    self._dispatch_sweeps()
+                    self._next_sweep_at = now + self._discovery_interval
+
+                self._dispatch_due(now)
+
+                # 睡眠到下一个到期时间（最多到下一次任务发现）
+                wake_at = min(self._next_discovery_at, self._next_sweep_at)
+                next_due_at = self.heap.next_due_at()
+                if next_due_at is not None:
+                    wake_at = min(wake_at, next_due_at)
+                self._wakeup.wait(max(0.05, wake_at - time.time()))
+            except Exception as e:
+                logger.error(f"[轮询引擎] 调度异常: {str(e)}")
+                time.sleep(5)
+        logger.info("🛑 [轮询引擎] 调度线程已停止")
+
+    def get_stats(self) -> Dict:
+        with self._in_flight_lock:
+            in_flight = len(self._in_flight)
+        return {
+            **self._stats,
+            "is_running": self._running,
+            "scheduled": len(self.heap),
+            "in_flight": in_flight,
+            "providers": self.pool.get_stats(),
+        }
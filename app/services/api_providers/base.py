@@ -12,6 +12,8 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 
+from app.services.http_client import get_http_client
+
 
 class BaseAPIProvider(ABC):
     """API服务商基础抽象类"""
@@ -105,7 +107,7 @@ class BaseAPIProvider(ABC):
             Response对象
         """
         headers = self.build_request_headers()
-        response = requests.post(
+        response = get_http_client("ai_provider").post(
             draw_url, json=request_data, headers=headers, timeout=timeout, proxies=proxies
         )
         return response
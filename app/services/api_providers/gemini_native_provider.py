@@ -7,7 +7,6 @@ gemini-native 服务商实现
 import logging
 
 logger = logging.getLogger(__name__)
-import base64
 import json
 import os
 import time
@@ -15,8 +14,9 @@ from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from app.services.http_client import get_http_client
+from app.services.upload_dedup import encode_inline_image
 
 from .base import BaseAPIProvider
 
@@ -81,7 +81,7 @@ class GeminiNativeProvider(BaseAPIProvider):
                         or img_url.startswith("https://10.")
                     )
 
-                    img_data = None
+                    inline_image = None
                     if is_local_url:
                         # 本地URL：直接读取文件
                         try:
@@ -99,36 +99,17 @@ class GeminiNativeProvider(BaseAPIProvider):
                                 local_file_path = path
 
                             if local_file_path and os.path.exists(local_file_path):
-                                with open(local_file_path, "rb") as f:
-                                    img_data = f.read()
+                                # 同一内容只编码一次（按SHA-256复用）
+                                inline_image = encode_inline_image(path=local_file_path)
                         except Exception as e:
                             logger.info(f"读取本地文件失败: {str(e)}，尝试HTTP下载")
                             is_local_url = False
 
-                    if not is_local_url or img_data is None:
-                        # 云端URL：使用HTTP下载
-                        proxies = {"http": None, "https": None}  # 禁用代理
-                        response_img = requests.get(img_url, proxies=proxies, timeout=30)
-                        if response_img.status_code == 200:
-                            img_data = response_img.content
-                        else:
-                            raise Exception(f"下载图片失败: HTTP {response_img.status_code}")
-
-                    # 转换为base64
-                    img_base64 = base64.b64encode(img_data).decode("utf-8")
-
-                    # 检测图片格式
-                    if img_data.startswith(b"\xff\xd8\xff"):
-                        mime_type = "image/jpeg"
-                    elif img_data.startswith(b"\x89PNG"):
-                        mime_type = "image/png"
-                    elif img_data.startswith(b"GIF"):
-                        mime_type = "image/gi"
-                    elif img_data.startswith(b"WEBP"):
-                        mime_type = "image/webp"
-                    else:
-                        mime_type = "image/jpeg"  # 默认
+                    if not is_local_url or inline_image is None:
+                        # 云端URL：通过共享下载连接池下载（禁用代理），短时间内同一URL不重复下载
+                        inline_image = encode_inline_image(url=img_url)
 
+                    mime_type, img_base64 = inline_image
                     parts.append({"inline_data": {"mime_type": mime_type, "data": img_base64}})
                 except Exception as e:
                     logger.info(f"处理图片失败: {str(e)}")
@@ -185,32 +166,13 @@ class GeminiNativeProvider(BaseAPIProvider):
 
         headers = self.build_request_headers()
 
-        # 创建Session
-        session = requests.Session()
-
         # 关键修复：同步API不应该重试，避免重复请求导致后端重复制作
         if self.is_sync_api:
             logger.warning("[同步API] 检测到同步API，禁用自动重试机制（避免重复请求）")
-            retry_strategy = Retry(
-                total=0,  # 不重试
-                backoff_factor=0,
-                status_forcelist=[],
-                allowed_methods=[],
-                raise_on_status=False,
-            )
+            retry_policy = "none"
         else:
             # 异步API：允许重试（仅对特定状态码）
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504],
-                allowed_methods=["POST"],
-                raise_on_status=False,
-            )
-
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
+            retry_policy = "default"
 
         # 代理设置
         if proxies is None:
@@ -240,8 +202,9 @@ class GeminiNativeProvider(BaseAPIProvider):
         # 关键修复：同步API如果连接断开，不应该重试（避免重复请求导致后端重复制作）
         request_start_time = time.time()
         try:
-            response = session.post(
+            response = get_http_client("ai_provider").post(
                 draw_url,
+                retry=retry_policy,
                 json=request_data,
                 headers=headers,
                 timeout=(connect_timeout, read_timeout),
@@ -13,8 +13,8 @@ from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from app.services.http_client import get_http_client
 
 from .base import BaseAPIProvider
 
@@ -124,7 +124,9 @@ class NanoBananaEditsProvider(BaseAPIProvider):
                 else:
                     # 云端URL：使用HTTP下载
                     proxies = {"http": None, "https": None}  # 禁用代理
-                    img_response = requests.get(img_url, proxies=proxies, timeout=30)
+                    img_response = get_http_client("download").get(
+                        img_url, proxies=proxies, timeout=30
+                    )
                     img_response.raise_for_status()
                     img_content = img_response.content
 
@@ -172,19 +174,6 @@ class NanoBananaEditsProvider(BaseAPIProvider):
 
         headers = self.build_request_headers()
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # 代理设置
         if proxies is None:
             proxies = self.get_proxy_settings()
@@ -195,7 +184,7 @@ class NanoBananaEditsProvider(BaseAPIProvider):
         logger.info(f"上传文件数量: {len(files)}")
 
         # 使用 multipart/form-data 格式发送请求
-        response = session.post(
+        response = get_http_client("ai_provider").post(
             draw_url,
             data=data,
             files=files,
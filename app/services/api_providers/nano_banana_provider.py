@@ -11,8 +11,9 @@ import os
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from app.services.http_client import get_http_client
+from app.services.upload_dedup import upload_once
 
 from .base import BaseAPIProvider
 
@@ -115,40 +116,44 @@ class NanoBananaProvider(BaseAPIProvider):
             if not os.path.exists(local_file_path):
                 raise Exception(f"本地文件不存在: {local_file_path}")
 
-            # 上传到文件服务器
+            # 上传到文件服务器（同一内容已上传过时直接复用云端URL）
             upload_url = f"{self.host.rstrip('/')}{self.api_config.file_upload_endpoint}"
-            logger.info(f"📤 开始上传图片到文件服务器: {upload_url}")
-
-            with open(local_file_path, "rb") as f:
-                upload_files = {"file": (os.path.basename(local_file_path), f, "image/jpeg")}
-                upload_response = requests.post(
-                    upload_url,
-                    files=upload_files,
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                    timeout=30,
-                )
 
-                if upload_response.status_code == 200:
-                    upload_result = upload_response.json()
-                    cloud_url = (
-                        upload_result.get("url")
-                        or upload_result.get("data", {}).get("url")
-                        or upload_result.get("file_url")
+            def _upload(_digest):
+                logger.info(f"📤 开始上传图片到文件服务器: {upload_url}")
+                with open(local_file_path, "rb") as f:
+                    upload_files = {"file": (os.path.basename(local_file_path), f, "image/jpeg")}
+                    upload_response = get_http_client("ai_provider").post(
+                        upload_url,
+                        retry="none",
+                        files=upload_files,
+                        headers={"Authorization": f"Bearer {self.api_key}"},
+                        timeout=30,
                     )
-                    if cloud_url:
-                        logger.info(f"✅ 图片已上传到服务器: {cloud_url}")
-                        return cloud_url
+
+                    if upload_response.status_code == 200:
+                        upload_result = upload_response.json()
+                        cloud_url = (
+                            upload_result.get("url")
+                            or upload_result.get("data", {}).get("url")
+                            or upload_result.get("file_url")
+                        )
+                        if cloud_url:
+                            logger.info(f"✅ 图片已上传到服务器: {cloud_url}")
+                            return cloud_url
+                        else:
+                            raise Exception("文件上传成功但响应中未包含文件URL")
                     else:
-                        raise Exception("文件上传成功但响应中未包含文件URL")
-                else:
-                    error_text = (
-                        upload_response.text[:500]
-                        if hasattr(upload_response, "text")
-                        else str(upload_response.content[:500])
-                    )
-                    raise Exception(
-                        f"文件上传失败 (HTTP {upload_response.status_code}): {error_text}"
-                    )
+                        error_text = (
+                            upload_response.text[:500]
+                            if hasattr(upload_response, "text")
+                            else str(upload_response.content[:500])
+                        )
+                        raise Exception(
+                            f"文件上传失败 (HTTP {upload_response.status_code}): {error_text}"
+                        )
+
+            return upload_once(f"file_server:{upload_url}", local_file_path, _upload)
         except Exception as e:
             logger.error("上传本地图片失败: {str(e)}")
             raise
@@ -165,19 +170,6 @@ class NanoBananaProvider(BaseAPIProvider):
         """
         headers = self.build_request_headers()
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # 代理设置
         if proxies is None:
             proxies = self.get_proxy_settings()
@@ -190,7 +182,7 @@ class NanoBananaProvider(BaseAPIProvider):
         logger.info(f"📤 发送请求到: {draw_url}")
         logger.info(f"📤 请求参数: {json.dumps(request_data, ensure_ascii=False)}")
 
-        response = session.post(
+        response = get_http_client("ai_provider").post(
             draw_url,
             json=request_data,
             headers=headers,
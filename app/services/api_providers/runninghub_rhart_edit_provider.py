@@ -11,8 +11,8 @@ import json
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from app.services.http_client import get_http_client
 
 from .base import BaseAPIProvider
 
@@ -70,6 +70,11 @@ class RunningHubRhartEditProvider(BaseAPIProvider):
             "imageUrls": image_urls_to_process,  # 图片URL数组
         }
 
+        # 注册了完成回调时传给 RunningHub（webHook 为 -1 表示不回调，只轮询）
+        webhook = kwargs.get("webHook")
+        if webhook and webhook != "-1":
+            payload["webhookUrl"] = webhook
+
         logger.info(f"📸 [RunningHub] 请求包含 {len(image_urls_to_process)} 张图片")
 
         return payload
@@ -86,19 +91,6 @@ class RunningHubRhartEditProvider(BaseAPIProvider):
         """
         headers = self.build_request_headers()
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # 代理设置
         if proxies is None:
             proxies = self.get_proxy_settings()
@@ -108,7 +100,7 @@ class RunningHubRhartEditProvider(BaseAPIProvider):
         logger.info(f"📤 请求参数: {json.dumps(request_data, ensure_ascii=False)}")
         logger.info(f"📤 图片数量: {len(request_data.get('imageUrls', []))}")
 
-        response = session.post(
+        response = get_http_client("ai_provider").post(
             draw_url, json=request_data, headers=headers, timeout=(10, 30), proxies=proxies
         )
 
@@ -11,8 +11,8 @@ import json
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from app.services.http_client import get_http_client
 
 from .base import BaseAPIProvider
 
@@ -103,19 +103,6 @@ class VeoVideoProvider(BaseAPIProvider):
         """
         headers = self.build_request_headers()
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["POST", "GET"],
-            raise_on_status=False,
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-
         # 代理设置
         if proxies is None:
             proxies = self.get_proxy_settings()
@@ -125,7 +112,7 @@ class VeoVideoProvider(BaseAPIProvider):
         logger.info(f"📤 请求参数: {json.dumps(request_data, ensure_ascii=False)}")
         logger.info("📤 超时设置: 连接30秒, 读取300秒（视频生成需要较长时间）")
 
-        response = session.post(
+        response = get_http_client("ai_provider").post(
             draw_url,
             json=request_data,
             headers=headers,
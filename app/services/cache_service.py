@@ -1,45 +1,292 @@
 # -*- coding: utf-8 -*-
 """
 缓存服务模块
-支持Redis缓存，提升系统性能
+两级缓存：进程内LRU（L1，短TTL）+ Redis（L2），提升系统性能
+
+- L1 命中不访问Redis；按标签或单个键失效时递增Redis中的失效版本号，其他进程在
+  TAG_SYNC_INTERVAL 秒内丢弃对应的L1条目（按模式删除只能等L1过期，最多 L1_MAX_TTL 秒）
+- 缓存未命中时按缓存键加回填租约（进程内 + Redis锁），同一个键只有一个请求回源，
+  其他请求等待回填结果，避免缓存击穿
+- Redis断开后按指数退避自动重连，期间仅使用L1
 """
 
+import fnmatch
 import hashlib
 import json
 import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import timedelta
 from functools import wraps
 from typing import Any, Callable, Optional
 
 logger = logging.getLogger(__name__)
 
+# L1缓存配置
+L1_MAX_ENTRIES = 1024  # 最大条目数（LRU淘汰）
+L1_MAX_TTL = 30  # 条目最长存活时间（秒）
+
+# 缓存击穿保护配置
+FILL_LEASE_TTL = 10  # 回填租约最长持有时间（秒）
+FILL_WAIT_TIMEOUT = 3  # 等待其他请求回填的最长时间（秒）
+FILL_POLL_INTERVAL = 0.05  # 等待其他进程回填时轮询Redis的间隔（秒）
+
+# 标签失效配置
+TAG_SET_PREFIX = "cache:tag:"  # Redis集合：标签 -> 缓存键
+TAG_VERSIONS_KEY = "cache:tag_versions"  # Redis哈希：标签 -> 失效版本号
+TAG_SYNC_INTERVAL = 1  # 各进程同步其他进程标签失效的间隔（秒）
+KEY_TAG_PREFIX = "key:"  # 单个键失效在标签版本哈希中的字段前缀
+_TAG_HEADER = "#tags:"  # 带标签的缓存值前缀（JSON不会以#开头）
+
+# Redis重连退避配置
+REDIS_RETRY_BASE = 1  # 首次重连等待（秒）
+REDIS_RETRY_MAX = 60  # 最长重连等待（秒）
+
+_MISSING = object()
+
+# 释放回填锁：只删除自己持有的锁（租约过期后可能已被其他进程获取）
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 # Redis客户端（延迟导入）
 _redis_client = None
+_redis_lib_missing = False  # 未安装redis库时不再尝试
+_redis_failures = 0  # 连续连接失败次数
+_redis_retry_at = 0.0  # 下次允许重连的时间（time.monotonic）
+_redis_connect_lock = threading.Lock()
+_redis_state_lock = threading.Lock()
+
+# 统计计数器（当前进程）
+_stats_lock = threading.Lock()
+_stats = {
+    "l1_hits": 0,
+    "l2_hits": 0,
+    "misses": 0,
+    "sets": 0,
+    "errors": 0,
+    "fill_waits": 0,
+    "fill_wait_hits": 0,
+    "redis_reconnects": 0,
+    "redis_get_count": 0,
+    "redis_get_seconds": 0.0,
+    "get_count": 0,
+    "get_seconds": 0.0,
+}
+
+
+def _incr_stat(name: str, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+class _LocalCache:
+    """进程内LRU缓存，保存序列化后的JSON字符串（避免调用方修改返回值污染缓存）"""
+
+    def __init__(self, max_entries: int = L1_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, serialized, tags)
+        self._tag_keys = {}  # tag -> set(key)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] <= now:
+                self._remove(key)
+                return _MISSING
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    def set(self, key: str, serialized: str, timeout: int, tags=()):
+        ttl = min(timeout, L1_MAX_TTL) if timeout else L1_MAX_TTL
+        tags = tuple(tags or ())
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, serialized, tags)
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def delete_tags(self, tags) -> int:
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tag_keys.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def delete_pattern(self, pattern: str) -> int:
+        with self._lock:
+            keys = [key for key in self._data if fnmatch.fnmatchcase(key, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tag_keys.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local_cache = _LocalCache()
+
+
+class _FillLeases:
+    """
+    缓存回填租约（single-flight）
+    进程内用Event让同一个键的并发请求等待；跨进程用Redis SET NX锁（值为本次租约的令牌）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leases = {}  # key -> (event, expires_at, token)
+
+    def acquire(self, key: str, client) -> Optional[threading.Event]:
+        """
+        尝试获取回填租约
+
+        Returns:
+            None 表示获取成功（调用方负责回源并回填）；
+            否则返回正在回填的Event（进程内其他线程持有租约）
+        """
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[1] > now:
+                return lease[0]
+            token = uuid.uuid4().hex
+            self._leases[key] = (threading.Event(), now + FILL_LEASE_TTL, token)
+
+        if client is not None:
+            try:
+                if not client.set(f"lock:{key}", token, nx=True, px=int(FILL_LEASE_TTL * 1000)):
+                    # 其他进程正在回填：释放进程内租约，返回一个不会被设置的Event表示需要等待
+                    self.release(key, client=None)
+                    return _REMOTE_FILL
+            except Exception:
+                pass
+        return None
+
+    def release(self, key: str, client=None):
+        with self._lock:
+            lease = self._leases.pop(key, None)
+        if lease is not None:
+            lease[0].set()
+            if client is not None:
+                try:
+                    client.eval(_RELEASE_LEASE_SCRIPT, 1, f"lock:{key}", lease[2])
+                except Exception:
+                    pass
+
+
+# 其他进程持有回填租约的标记
+_REMOTE_FILL = threading.Event()
+
+_fill_leases = _FillLeases()
+
+
+def _redis_config():
+    """读取Redis连接配置：优先应用配置，无应用上下文时使用环境变量"""
+    from flask import current_app, has_app_context
+
+    if has_app_context():
+        config = current_app.config
+        return (
+            config.get("REDIS_HOST", "localhost"),
+            config.get("REDIS_PORT", 6379),
+            config.get("REDIS_DB", 0),
+            config.get("REDIS_PASSWORD", None),
+        )
+    return (
+        os.environ.get("REDIS_HOST", "localhost"),
+        int(os.environ.get("REDIS_PORT", 6379)),
+        int(os.environ.get("REDIS_DB", 0)),
+        os.environ.get("REDIS_PASSWORD") or None,
+    )
+
+
+def _mark_redis_down(error: Exception):
+    """Redis不可用：丢弃客户端，按指数退避安排下次重连"""
+    global _redis_client, _redis_failures, _redis_retry_at
+
+    with _redis_state_lock:
+        if _redis_failures == 0:
+            logger.warning(f"⚠️  Redis连接失败: {error}，暂时仅使用进程内缓存（不影响主功能）")
+        _redis_client = None
+        _redis_failures += 1
+        delay = min(REDIS_RETRY_BASE * (2 ** (_redis_failures - 1)), REDIS_RETRY_MAX)
+        _redis_retry_at = time.monotonic() + delay
+
+
+def _is_connection_error(error: Exception) -> bool:
+    try:
+        import redis
+
+        return isinstance(error, (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError))
+    except ImportError:
+        return False
 
 
 def get_redis_client():
-    """获取Redis客户端（单例模式）"""
-    global _redis_client
+    """获取Redis客户端（单例模式，断开后按退避间隔自动重连）"""
+    global _redis_client, _redis_lib_missing, _redis_failures
 
     if _redis_client is not None:
         return _redis_client
 
-    # 如果已经尝试连接失败，直接返回None（避免重复尝试）
-    if _redis_client is False:
+    if _redis_lib_missing or time.monotonic() < _redis_retry_at:
         return None
 
     try:
         import redis
-        from flask import current_app
+    except ImportError:
+        logger.warning("⚠️  Redis未安装，将仅使用进程内缓存。请安装: pip install redis")
+        _redis_lib_missing = True
+        return None
+
+    # 其他线程正在连接时不阻塞等待，本次按不可用处理
+    if not _redis_connect_lock.acquire(blocking=False):
+        return None
+
+    try:
+        if _redis_client is not None:
+            return _redis_client
 
         # 从配置获取Redis连接信息
-        redis_host = current_app.config.get("REDIS_HOST", "localhost")
-        redis_port = current_app.config.get("REDIS_PORT", 6379)
-        redis_db = current_app.config.get("REDIS_DB", 0)
-        redis_password = current_app.config.get("REDIS_PASSWORD", None)
+        redis_host, redis_port, redis_db, redis_password = _redis_config()
 
         # 创建Redis连接（缩短超时时间，避免阻塞）
-        _redis_client = redis.Redis(
+        client = redis.Redis(
             host=redis_host,
             port=redis_port,
             db=redis_db,
@@ -50,33 +297,34 @@ def get_redis_client():
         )
 
         # 测试连接（快速失败）
-        _redis_client.ping()
-        logger.info(f"✅ Redis连接成功: {redis_host}:{redis_port}")
-
+        client.ping()
+        if _redis_failures:
+            _incr_stat("redis_reconnects")
+            logger.info(f"✅ Redis已重新连接: {redis_host}:{redis_port}")
+        else:
+            logger.info(f"✅ Redis连接成功: {redis_host}:{redis_port}")
+        _redis_failures = 0
+        _redis_client = client
         return _redis_client
 
-    except ImportError:
-        logger.warning("⚠️  Redis未安装，缓存功能将不可用。请安装: pip install redis")
-        _redis_client = False  # 标记为已尝试，避免重复尝试
-        return None
     except Exception as e:
-        # 只在第一次失败时记录警告，避免日志刷屏
-        if _redis_client is None:
-            logger.warning(f"⚠️  Redis连接失败: {e}，缓存功能将不可用（不影响主功能）")
-        _redis_client = False  # 标记为已尝试，避免重复尝试
+        _mark_redis_down(e)
         return None
+    finally:
+        _redis_connect_lock.release()
+
+
+def _handle_redis_error(action: str, key: str, error: Exception):
+    _incr_stat("errors")
+    if _is_connection_error(error):
+        _mark_redis_down(error)
+    else:
+        logger.debug(f"{action}失败 {key}: {error}")
 
 
 def is_cache_available():
-    """检查缓存是否可用"""
-    client = get_redis_client()
-    if client is None:
-        return False
-    try:
-        client.ping()
-        return True
-    except Exception:
-        return False
+    """检查Redis缓存是否可用（连接断开后在退避期内返回False）"""
+    return get_redis_client() is not None
 
 
 def cache_key(prefix: str, *args, **kwargs) -> str:
@@ -118,77 +366,309 @@ def cache_key(prefix: str, *args, **kwargs) -> str:
     return f"cache:{key}"
 
 
+def _deserialize(value: str) -> Any:
+    # 尝试解析JSON
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        # 如果不是JSON，直接返回字符串
+        return value
+
+
+def _serialize(value: Any) -> str:
+    if isinstance(value, (str, int, float, bool, type(None))):
+        # 简单类型直接存储
+        return json.dumps(value, ensure_ascii=False)
+    # 复杂对象序列化为JSON
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _pack_tags(serialized: str, tags) -> str:
+    if not tags:
+        return serialized
+    return f"{_TAG_HEADER}{','.join(tags)}\n{serialized}"
+
+
+def _unpack_tags(value: str):
+    """拆分Redis中的缓存值，返回 (标签元组, 序列化值)"""
+    if isinstance(value, str) and value.startswith(_TAG_HEADER):
+        header, _, serialized = value.partition("\n")
+        return tuple(tag for tag in header[len(_TAG_HEADER) :].split(",") if tag), serialized
+    return (), value
+
+
+# 标签失效监听器（如目录快照服务），参数为失效的标签列表
+_tag_invalidation_listeners = []
+
+
+def add_tag_invalidation_listener(callback: Callable):
+    """注册标签失效监听器，invalidate_cache_tags 执行后调用 callback(tags)"""
+    if callback not in _tag_invalidation_listeners:
+        _tag_invalidation_listeners.append(callback)
+    return callback
+
+
+def _notify_tag_invalidation(tags):
+    for callback in _tag_invalidation_listeners:
+        try:
+            callback(tags)
+        except Exception as e:
+            logger.warning(f"⚠️  缓存标签失效回调执行失败: {e}")
+
+
+# 已知的标签版本（用于感知其他进程的标签失效）
+_tag_versions = {}
+_tag_versions_synced_at = None
+_tag_versions_lock = threading.Lock()
+
+
+def _sync_tag_versions(client):
+    """
+    同步其他进程的标签失效：每 TAG_SYNC_INTERVAL 秒读取一次标签版本，
+    版本变化的标签对应的L1条目立即删除
+    """
+    global _tag_versions_synced_at
+
+    now = time.monotonic()
+    if _tag_versions_synced_at is not None and now - _tag_versions_synced_at < TAG_SYNC_INTERVAL:
+        return
+    if not _tag_versions_lock.acquire(blocking=False):
+        return
+    try:
+        versions = client.hgetall(TAG_VERSIONS_KEY) or {}
+        if _tag_versions_synced_at is None:
+            # 首次同步：L1中可能已有本进程在Redis断开期间写入的条目，全部丢弃
+            _local_cache.clear()
+        else:
+            changed = [
+                tag for tag, version in versions.items() if _tag_versions.get(tag) != version
+            ]
+            changed += [tag for tag in _tag_versions if tag not in versions]
+            if changed:
+                _local_cache.delete_tags(changed)
+                for tag in changed:
+                    if tag.startswith(KEY_TAG_PREFIX):
+                        _local_cache.delete(tag[len(KEY_TAG_PREFIX) :])
+        _tag_versions.clear()
+        _tag_versions.update(versions)
+        _tag_versions_synced_at = now
+    except Exception as e:
+        _handle_redis_error("同步缓存标签", TAG_VERSIONS_KEY, e)
+    finally:
+        _tag_versions_lock.release()
+
+
+def _lookup(key: str, client) -> Any:
+    """依次查询L1和Redis，返回序列化值或_MISSING"""
+    if client is not None:
+        _sync_tag_versions(client)
+
+    value = _local_cache.get(key)
+    if value is not _MISSING:
+        _incr_stat("l1_hits")
+        return value
+
+    if client is None:
+        return _MISSING
+
+    start = time.perf_counter()
+    try:
+        value = client.get(key)
+    except Exception as e:
+        _handle_redis_error("获取缓存", key, e)
+        return _MISSING
+    finally:
+        with _stats_lock:
+            _stats["redis_get_count"] += 1
+            _stats["redis_get_seconds"] += time.perf_counter() - start
+
+    if value is None:
+        return _MISSING
+
+    _incr_stat("l2_hits")
+    tags, value = _unpack_tags(value)
+    _local_cache.set(key, value, L1_MAX_TTL, tags)
+    return value
+
+
+def _wait_for_fill(key: str, waiting: threading.Event) -> Any:
+    """等待其他请求回填缓存，超时返回_MISSING（调用方自行回源）"""
+    _incr_stat("fill_waits")
+    deadline = time.monotonic() + FILL_WAIT_TIMEOUT
+
+    if waiting is not _REMOTE_FILL:
+        waiting.wait(FILL_WAIT_TIMEOUT)
+        value = _lookup(key, get_redis_client())
+    else:
+        value = _MISSING
+        while time.monotonic() < deadline:
+            time.sleep(FILL_POLL_INTERVAL)
+            value = _lookup(key, get_redis_client())
+            if value is not _MISSING:
+                break
+
+    if value is not _MISSING:
+        _incr_stat("fill_wait_hits")
+    return value
+
+
+def _in_request() -> bool:
+    from flask import has_request_context
+
+    return has_request_context()
+
+
+def _request_leases() -> set:
+    """当前请求持有的回填租约（请求结束时释放未回填的部分）"""
+    from flask import g
+
+    return g.setdefault("_cache_fill_leases", set())
+
+
 def get_cache(key: str) -> Optional[Any]:
     """
     从缓存获取数据
 
+    在请求上下文中未命中时，本请求获得该键的回填租约（应随后调用set_cache回填，
+    未回填的租约在请求结束时释放）；同一键的其他并发请求等待回填结果。
+
     Args:
         key: 缓存键
 
     Returns:
         缓存的数据，如果不存在或出错返回None
     """
-    if not is_cache_available():
-        return None
-
+    start = time.perf_counter()
     try:
         client = get_redis_client()
-        value = client.get(key)
+        value = _lookup(key, client)
 
-        if value is None:
-            return None
+        if value is _MISSING and _in_request() and key not in _request_leases():
+            waiting = _fill_leases.acquire(key, client)
+            if waiting is None:
+                _request_leases().add(key)
+            else:
+                value = _wait_for_fill(key, waiting)
 
-        # 尝试解析JSON
-        try:
-            return json.loads(value)
-        except (json.JSONDecodeError, TypeError):
-            # 如果不是JSON，直接返回字符串
-            return value
+        if value is _MISSING:
+            _incr_stat("misses")
+            return None
+        return _deserialize(value)
 
     except Exception as e:
         # 只在debug模式下记录，避免日志刷屏
         logger.debug(f"获取缓存失败 {key}: {e}")
         return None
+    finally:
+        with _stats_lock:
+            _stats["get_count"] += 1
+            _stats["get_seconds"] += time.perf_counter() - start
 
 
-def set_cache(key: str, value: Any, timeout: int = 3600) -> bool:
+def set_cache(key: str, value: Any, timeout: int = 3600, tags=None) -> bool:
     """
-    设置缓存
+    设置缓存（同时写入L1和Redis，并释放该键的回填租约）
 
     Args:
         key: 缓存键
         value: 要缓存的数据
         timeout: 过期时间（秒），默认1小时
+        tags: 缓存标签列表（如 CACHE_TAGS['STYLE_CATALOG']、product_cache_tag(1)），
+              invalidate_cache_tags 按标签精确失效
 
     Returns:
         是否设置成功
     """
-    if not is_cache_available():
+    client = get_redis_client()
+    try:
+        serialized = _serialize(value)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"⚠️  设置缓存失败 {key}: {e}")
+        _fill_leases.release(key, client)
         return False
 
-    try:
-        client = get_redis_client()
+    tags = tuple(dict.fromkeys(tags or ()))
+    _local_cache.set(key, serialized, timeout, tags)
+    _incr_stat("sets")
 
-        # 序列化为JSON
-        if isinstance(value, (str, int, float, bool, type(None))):
-            # 简单类型直接存储
-            serialized = json.dumps(value, ensure_ascii=False)
-        else:
-            # 复杂对象序列化为JSON
-            serialized = json.dumps(value, ensure_ascii=False, default=str)
-
-        # 设置缓存
-        client.setex(key, timeout, serialized)
+    try:
+        if client is None:
+            return True
+        # 设置缓存，并登记到各标签的键集合
+        pipe = client.pipeline(transaction=False)
+        pipe.setex(key, timeout, _pack_tags(serialized, tags))
+        for tag in tags:
+            pipe.sadd(f"{TAG_SET_PREFIX}{tag}", key)
+        pipe.execute()
         return True
 
     except Exception as e:
+        _handle_redis_error("设置缓存", key, e)
         logger.warning(f"⚠️  设置缓存失败 {key}: {e}")
-        return False
+        return True
+    finally:
+        if _in_request():
+            _request_leases().discard(key)
+        _fill_leases.release(key, client)
+
+
+def get_or_set(key: str, loader: Callable[[], Any], timeout: int = 3600, tags=None) -> Any:
+    """
+    读取缓存，未命中时调用loader回源并回填；同一键并发未命中时只有一个调用方回源
+
+    Args:
+        key: 缓存键
+        loader: 回源函数
+        timeout: 过期时间（秒）
+        tags: 缓存标签列表
+
+    Returns:
+        缓存的数据或loader的返回值
+    """
+    client = get_redis_client()
+    value = _lookup(key, client)
+    if value is not _MISSING:
+        return _deserialize(value)
+
+    waiting = _fill_leases.acquire(key, client)
+    if waiting is not None:
+        value = _wait_for_fill(key, waiting)
+        if value is not _MISSING:
+            return _deserialize(value)
+        # 等待超时，自行回源（不回填，避免覆盖持有租约者的结果）
+        _incr_stat("misses")
+        return loader()
+
+    _incr_stat("misses")
+    try:
+        result = loader()
+        if result is not None:
+            set_cache(key, result, timeout, tags)
+        return result
+    finally:
+        _fill_leases.release(key, client)
+
+
+def release_cache_fill_leases(exception=None):
+    """释放当前请求持有但未回填的回填租约（注册为teardown_request）"""
+    from flask import g
+
+    leases = g.pop("_cache_fill_leases", None)
+    if not leases:
+        return
+    client = get_redis_client()
+    for key in leases:
+        _fill_leases.release(key, client)
+
+
+def init_cache_service(app):
+    """在Flask应用上注册缓存服务的请求钩子"""
+    app.teardown_request(release_cache_fill_leases)
 
 
 def delete_cache(key: str) -> bool:
     """
-    删除缓存
+    删除缓存，并通过标签版本通知其他进程丢弃该键的L1条目
 
     Args:
         key: 缓存键
@@ -196,21 +676,33 @@ def delete_cache(key: str) -> bool:
     Returns:
         是否删除成功
     """
-    if not is_cache_available():
+    _local_cache.delete(key)
+
+    client = get_redis_client()
+    if client is None:
         return False
 
+    key_tag = f"{KEY_TAG_PREFIX}{key}"
     try:
-        client = get_redis_client()
-        client.delete(key)
+        pipe = client.pipeline(transaction=False)
+        pipe.delete(key)
+        pipe.hincrby(TAG_VERSIONS_KEY, key_tag, 1)
+        version = pipe.execute()[-1]
+        # 本进程已直接删除L1条目，记录新版本避免同步时重复处理
+        with _tag_versions_lock:
+            _tag_versions[key_tag] = str(version)
         return True
     except Exception as e:
+        _handle_redis_error("删除缓存", key, e)
         logger.warning(f"⚠️  删除缓存失败 {key}: {e}")
         return False
 
 
 def delete_cache_pattern(pattern: str) -> int:
     """
-    按模式删除缓存
+    按模式删除缓存（使用SCAN分批删除，不阻塞Redis）
+
+    能确定影响范围时优先使用 invalidate_cache_tags
 
     Args:
         pattern: 缓存键模式（支持通配符，如 cache:product:*）
@@ -218,17 +710,82 @@ def delete_cache_pattern(pattern: str) -> int:
     Returns:
         删除的缓存数量
     """
-    if not is_cache_available():
+    local_count = _local_cache.delete_pattern(pattern)
+
+    client = get_redis_client()
+    if client is None:
+        return local_count
+
+    try:
+        deleted = 0
+        batch = []
+        for key in client.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += client.delete(*batch)
+                batch = []
+        if batch:
+            deleted += client.delete(*batch)
+        return deleted
+    except Exception as e:
+        _handle_redis_error("按模式删除缓存", pattern, e)
+        logger.warning(f"⚠️  按模式删除缓存失败 {pattern}: {e}")
+        return 0
+
+
+def invalidate_cache_tags(*tags: str) -> int:
+    """
+    按标签使缓存失效：只删除登记在这些标签下的缓存键（O(受影响键数)），
+    并递增标签版本号，其他进程在 TAG_SYNC_INTERVAL 秒内丢弃对应的L1条目
+
+    Args:
+        *tags: 缓存标签
+
+    Returns:
+        删除的Redis缓存数量
+
+    Usage:
+        invalidate_cache_tags(CACHE_TAGS['PRODUCT_CATALOG'], product_cache_tag(product.id))
+    """
+    tags = [tag for tag in dict.fromkeys(tags) if tag]
+    if not tags:
+        return 0
+
+    local_count = _local_cache.delete_tags(tags)
+    _notify_tag_invalidation(tags)
+
+    client = get_redis_client()
+    if client is None:
+        logger.debug(f"🗑️  已失效 {local_count} 个本地缓存: tags={tags}")
         return 0
 
     try:
-        client = get_redis_client()
-        keys = client.keys(pattern)
+        pipe = client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.smembers(f"{TAG_SET_PREFIX}{tag}")
+        keys = set()
+        for members in pipe.execute():
+            keys.update(members or ())
+
+        pipe = client.pipeline(transaction=False)
         if keys:
-            return client.delete(*keys)
-        return 0
+            pipe.delete(*keys)
+        pipe.delete(*[f"{TAG_SET_PREFIX}{tag}" for tag in tags])
+        for tag in tags:
+            pipe.hincrby(TAG_VERSIONS_KEY, tag, 1)
+        results = pipe.execute()
+        deleted = results[0] if keys else 0
+
+        # 本进程已直接删除L1条目，记录新版本避免同步时重复处理
+        with _tag_versions_lock:
+            for tag, version in zip(tags, results[-len(tags) :]):
+                _tag_versions[tag] = str(version)
+
+        logger.debug(f"🗑️  已按标签删除 {deleted} 个缓存: tags={tags}")
+        return deleted
     except Exception as e:
-        logger.warning(f"⚠️  按模式删除缓存失败 {pattern}: {e}")
+        _handle_redis_error("按标签删除缓存", ",".join(tags), e)
+        logger.warning(f"⚠️  按标签删除缓存失败 {tags}: {e}")
         return 0
 
 
@@ -253,20 +810,8 @@ def cached(timeout: int = 3600, key_prefix: str = None):
             prefix = key_prefix or f"{func.__module__}.{func.__name__}"
             cache_key_str = cache_key(prefix, *args, **kwargs)
 
-            # 尝试从缓存获取
-            cached_value = get_cache(cache_key_str)
-            if cached_value is not None:
-                logger.debug(f"✅ 缓存命中: {cache_key_str}")
-                return cached_value
-
-            # 缓存未命中，执行函数
-            logger.debug(f"❌ 缓存未命中: {cache_key_str}")
-            result = func(*args, **kwargs)
-
-            # 将结果存入缓存
-            set_cache(cache_key_str, result, timeout)
-
-            return result
+            # 从缓存获取，未命中时执行函数并回填（同一键并发未命中只执行一次）
+            return get_or_set(cache_key_str, lambda: func(*args, **kwargs), timeout)
 
         return wrapper
 
@@ -316,19 +861,63 @@ CACHE_PREFIXES = {
     "STATISTICS": "statistics",
 }
 
+# 常用缓存标签（按数据来源划分，后台修改对应数据时按标签失效）
+CACHE_TAGS = {
+    "STYLE_CATALOG": "style_catalog",  # 风格分类/子分类/风格图片
+    "PRODUCT_CATALOG": "product_catalog",  # 产品及其尺寸、图片等
+    "PRODUCT_BINDINGS": "product_bindings",  # 产品与风格分类的绑定关系
+    "PRODUCT_CATEGORIES": "product_categories",  # 产品一级/二级分类
+    "HOMEPAGE": "homepage",  # 首页轮播图/导航/产品区块
+}
+
+
+def product_cache_tag(product_id) -> str:
+    """单个产品相关缓存的标签（如该产品绑定的风格分类列表）"""
+    return f"product:{product_id}"
+
 
 def get_cache_stats() -> dict:
     """
     获取缓存统计信息
 
     Returns:
-        缓存统计信息字典
+        缓存统计信息字典（含当前进程的L1/L2命中率和延迟）
     """
-    if not is_cache_available():
-        return {"available": False, "message": "Redis未安装或不可用"}
+    with _stats_lock:
+        counters = dict(_stats)
+
+    lookups = counters["l1_hits"] + counters["l2_hits"] + counters["misses"]
+    local_stats = {
+        "l1_entries": len(_local_cache),
+        "l1_max_entries": _local_cache.max_entries,
+        "l1_hits": counters["l1_hits"],
+        "l2_hits": counters["l2_hits"],
+        "misses": counters["misses"],
+        "hit_rate": (
+            round((counters["l1_hits"] + counters["l2_hits"]) / lookups, 4) if lookups else None
+        ),
+        "sets": counters["sets"],
+        "errors": counters["errors"],
+        "fill_waits": counters["fill_waits"],
+        "fill_wait_hits": counters["fill_wait_hits"],
+        "redis_reconnects": counters["redis_reconnects"],
+        "avg_get_ms": (
+            round(counters["get_seconds"] * 1000 / counters["get_count"], 3)
+            if counters["get_count"]
+            else None
+        ),
+        "avg_redis_get_ms": (
+            round(counters["redis_get_seconds"] * 1000 / counters["redis_get_count"], 3)
+            if counters["redis_get_count"]
+            else None
+        ),
+    }
+
+    client = get_redis_client()
+    if client is None:
+        return {"available": False, "message": "Redis未安装或不可用", **local_stats}
 
     try:
-        client = get_redis_client()
         info = client.info()
 
         return {
@@ -337,6 +926,8 @@ def get_cache_stats() -> dict:
             "connected_clients": info.get("connected_clients", 0),
             "total_keys": client.dbsize(),
             "keyspace": info.get("db0", {}),
+            **local_stats,
         }
     except Exception as e:
-        return {"available": False, "error": str(e)}
+        _handle_redis_error("获取缓存统计", "info", e)
+        return {"available": False, "error": str(e), **local_stats}
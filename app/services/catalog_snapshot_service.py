@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+小程序目录快照服务
+把已发布的风格/产品/首页/产品分类数据一次性构建为带版本号的快照：
+每个接口参数组合对应快照中的一个切片，切片预先序列化为JSON并预先gzip压缩，
+接口直接返回切片字节并支持 ETag / 304，小程序打开时的目录请求不访问数据库。
+
+- 后台修改目录数据（缓存标签失效）时快照作废，延迟合并后在后台线程重建
+- 快照发布到Redis（catalog:snapshot:<版本>），各进程每秒检查一次当前版本并按需加载；
+  Redis不可用时每个进程在本地构建，最长使用 LOCAL_SNAPSHOT_MAX_AGE 秒
+- 快照不可用时接口回退到原有的缓存 + 数据库查询
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY_PREFIX = "catalog:snapshot"
+VERSION_KEY = f"{SNAPSHOT_KEY_PREFIX}:version"  # 当前已发布的快照版本
+GENERATION_KEY = f"{SNAPSHOT_KEY_PREFIX}:generation"  # 失效代数，每次作废快照时递增
+BUILD_LOCK_KEY = f"{SNAPSHOT_KEY_PREFIX}:build_lock"
+META_FIELD = "__meta__"
+
+SNAPSHOT_REDIS_TTL = 86400  # Redis中快照数据保留时间（秒）
+BUILD_LOCK_TTL = 120  # 构建锁最长持有时间（秒）
+VERSION_CHECK_INTERVAL = 1  # 检查其他进程发布新快照的间隔（秒）
+SNAPSHOT_REFRESH_INTERVAL = 3600  # 快照超过此时长后在后台重建（秒）
+LOCAL_SNAPSHOT_MAX_AGE = 30  # 无Redis时本地快照的最长使用时间（秒）
+REBUILD_DELAY = 0.5  # 作废后延迟重建，合并一次发布中的多次失效（秒）
+READ_REBUILD_INTERVAL = 5  # 读取时发现无快照触发重建的最小间隔（秒）
+GZIP_MIN_SIZE = 500  # 小于此大小的切片不返回gzip
+
+# 触发快照重建的缓存标签
+CATALOG_TAGS = (
+    "style_catalog",
+    "product_catalog",
+    "product_bindings",
+    "product_categories",
+    "homepage",
+)
+
+# 仅当失效代数未变化时才发布快照（避免构建期间发生的修改被旧快照覆盖）
+_PUBLISH_SCRIPT = """
+if (redis.call('get', KEYS[1]) or '0') == ARGV[1] then
+    redis.call('set', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class CatalogSlice:
+    """快照切片：一个接口参数组合的响应体"""
+
+    __slots__ = ("body", "gzip_body", "etag")
+
+    def __init__(self, body: bytes, version: int):
+        self.body = body
+        self.gzip_body = gzip.compress(body, 6) if len(body) >= GZIP_MIN_SIZE else None
+        self.etag = f"c{version}-{hashlib.sha1(body).hexdigest()[:16]}"
+
+
+class CatalogSnapshot:
+    """一个版本的目录快照"""
+
+    def __init__(self, version: int, texts: Dict[str, str], meta: Dict):
+        self.version = version
+        self.built_at = meta.get("built_at") or time.time()
+        self.loaded_at = time.monotonic()
+        # 产品参数（code或ID字符串）-> 产品ID，与 /styles 接口先按code、再按ID查找的规则一致
+        self.product_aliases = meta.get("product_aliases") or {}
+        self.slices = {
+            key: CatalogSlice(text.encode("utf-8"), version) for key, text in texts.items()
+        }
+
+    def get_slice(self, name: str, **params) -> Optional[CatalogSlice]:
+        if name == "styles":
+            product_id = params.get("product_id")
+            if product_id:
+                pid = self.product_aliases.get(str(product_id))
+                if pid is None:
+                    return None
+                return self.slices.get(f"styles:product:{pid}")
+            return self.slices.get("styles")
+        if name == "products":
+            return self.slices.get(
+                products_slice_key(params.get("category_id"), params.get("subcategory_id"))
+            )
+        return self.slices.get(name)
+
+
+def products_slice_key(category_id=None, subcategory_id=None) -> str:
+    return f"products:{category_id or ''}:{subcategory_id or ''}"
+
+
+# 当前进程的快照状态
+_snapshot: Optional[CatalogSnapshot] = None
+_version_checked_at = 0.0
+_state_lock = threading.Lock()
+_local_generation = 0  # 无Redis时的本地失效代数
+_rebuild_timer: Optional[threading.Timer] = None
+_rebuild_lock = threading.Lock()
+_building = threading.Lock()
+_read_rebuild_at = 0.0
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _get_redis():
+    from app.services.cache_service import get_redis_client
+
+    return get_redis_client()
+
+
+def _app_context():
+    return sys.modules["test_server"].app.app_context()
+
+
+def build_catalog_texts() -> Dict[str, str]:
+    """
+    构建目录快照的全部切片（需在应用上下文中调用）
+
+    Returns:
+        {切片键: JSON文本}，另含 META_FIELD 元数据
+    """
+    from app.routes.miniprogram.catalog import (
+        build_banners_data,
+        build_homepage_config_data,
+        build_product_categories_data,
+        build_products_data,
+        build_styles_data,
+    )
+    from app.routes.miniprogram.common import get_helper_functions, get_models
+
+    models = get_models()
+    helpers = get_helper_functions()
+    if not models or not helpers:
+        raise RuntimeError("系统未初始化")
+
+    Product = models["Product"]
+    ProductCategory = models.get("ProductCategory")
+    ProductSubcategory = models.get("ProductSubcategory")
+
+    texts = {}
+
+    # 风格：全部风格 + 每个上架产品绑定的风格
+    texts["styles"] = _dumps(build_styles_data(models, helpers)[0])
+    products = Product.query.filter_by(is_active=True).all()
+    product_aliases = {str(p.id): p.id for p in products}
+    product_aliases.update({p.code: p.id for p in products if p.code})
+    for product in products:
+        data, _ = build_styles_data(models, helpers, product.code or str(product.id))
+        texts[f"styles:product:{product.id}"] = _dumps(data)
+
+    # 产品：全部产品 + 按一级/二级分类筛选
+    product_filters = {(None, None)}
+    if ProductCategory:
+        for category in ProductCategory.query.filter_by(is_active=True).all():
+            product_filters.add((str(category.id), None))
+    if ProductSubcategory:
+        for subcategory in ProductSubcategory.query.filter_by(is_active=True).all():
+            product_filters.add((None, str(subcategory.id)))
+            product_filters.add((str(subcategory.category_id), str(subcategory.id)))
+    for category_id, subcategory_id in product_filters:
+        data = build_products_data(models, helpers, category_id, subcategory_id)
+        texts[products_slice_key(category_id, subcategory_id)] = _dumps(data)
+
+    texts["banners"] = _dumps(build_banners_data(models, helpers))
+    texts["homepage_config"] = _dumps(build_homepage_config_data(models, helpers))
+    texts["product_categories"] = _dumps(build_product_categories_data(models, helpers))
+
+    texts[META_FIELD] = _dumps({"built_at": time.time(), "product_aliases": product_aliases})
+    return texts
+
+
+def _install(version: int, texts: Dict[str, str]) -> CatalogSnapshot:
+    global _snapshot
+    texts = dict(texts)
+    meta = json.loads(texts.pop(META_FIELD, "{}"))
+    snapshot = CatalogSnapshot(version, texts, meta)
+    with _state_lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def rebuild_catalog_snapshot() -> Optional[int]:
+    """
+    构建并发布目录快照（需在应用上下文中调用）
+
+    Returns:
+        发布的快照版本号；构建期间快照再次作废或其他进程正在构建时返回None
+    """
+    if not _building.acquire(blocking=False):
+        return None
+    client = _get_redis()
+    locked = False
+    try:
+        if client is not None:
+            try:
+                if not client.set(BUILD_LOCK_KEY, "1", nx=True, ex=BUILD_LOCK_TTL):
+                    logger.debug("其他进程正在构建目录快照")
+                    return None
+                locked = True
+                generation = client.get(GENERATION_KEY) or "0"
+            except Exception as e:
+                logger.warning(f"⚠️  目录快照使用Redis失败，改为本地构建: {e}")
+                client = None
+        if client is None:
+            generation = str(_local_generation)
+
+        start = time.perf_counter()
+        texts = build_catalog_texts()
+        elapsed = time.perf_counter() - start
+        version = int(time.time() * 1000)
+
+        if client is not None:
+            data_key = f"{SNAPSHOT_KEY_PREFIX}:{version}"
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(data_key, mapping=texts)
+            pipe.expire(data_key, SNAPSHOT_REDIS_TTL)
+            pipe.execute()
+            published = client.eval(
+                _PUBLISH_SCRIPT, 2, GENERATION_KEY, VERSION_KEY, generation, version
+            )
+        else:
+            published = str(_local_generation) == generation
+
+        if not published:
+            logger.info("目录快照构建期间数据已变更，重新构建")
+            schedule_catalog_rebuild()
+            return None
+
+        snapshot = _install(version, texts)
+        logger.info(
+            f"✅ 目录快照已发布: 版本={version}, 切片数={len(snapshot.slices)}, 耗时={elapsed:.2f}秒"
+        )
+        return version
+    finally:
+        if locked:
+            try:
+                client.delete(BUILD_LOCK_KEY)
+            except Exception:
+                pass
+        _building.release()
+
+
+def _rebuild_in_background():
+    global _rebuild_timer
+    with _rebuild_lock:
+        _rebuild_timer = None
+    try:
+        with _app_context():
+            rebuild_catalog_snapshot()
+    except Exception as e:
+        logger.error(f"构建目录快照失败: {e}")
+
+
+def schedule_catalog_rebuild(delay: float = REBUILD_DELAY):
+    """在后台线程中重建目录快照（已有待执行的重建时合并）"""
+    global _rebuild_timer
+    if "test_server" not in sys.modules:
+        return
+    with _rebuild_lock:
+        if _rebuild_timer is not None:
+            return
+        timer = threading.Timer(delay, _rebuild_in_background)
+        timer.daemon = True
+        timer.name = "CatalogSnapshotBuilder"
+        _rebuild_timer = timer
+    timer.start()
+
+
+def invalidate_catalog_snapshot():
+    """作废当前目录快照（所有进程），并安排重建"""
+    global _snapshot, _local_generation
+
+    with _state_lock:
+        _snapshot = None
+        _local_generation += 1
+
+    client = _get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.incr(GENERATION_KEY)
+            pipe.delete(VERSION_KEY)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️  作废Redis目录快照失败: {e}")
+
+    schedule_catalog_rebuild()
+
+
+def _on_cache_tags_invalidated(tags):
+    if any(tag in CATALOG_TAGS for tag in tags):
+        invalidate_catalog_snapshot()
+
+
+def get_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    """获取当前进程可用的目录快照（必要时从Redis加载其他进程发布的新版本）"""
+    global _snapshot, _version_checked_at
+
+    now = time.monotonic()
+    snapshot = _snapshot
+    client = _get_redis()
+
+    if client is None:
+        if snapshot is not None and now - snapshot.loaded_at > LOCAL_SNAPSHOT_MAX_AGE:
+            with _state_lock:
+                _snapshot = snapshot = None
+    elif snapshot is None or now - _version_checked_at >= VERSION_CHECK_INTERVAL:
+        _version_checked_at = now
+        try:
+            version = client.get(VERSION_KEY)
+            if version is None:
+                with _state_lock:
+                    _snapshot = snapshot = None
+            elif snapshot is None or snapshot.version != int(version):
+                texts = client.hgetall(f"{SNAPSHOT_KEY_PREFIX}:{version}")
+                snapshot = _install(int(version), texts) if texts else None
+        except Exception as e:
+            logger.debug(f"检查目录快照版本失败: {e}")
+
+    if snapshot is None or time.time() - snapshot.built_at > SNAPSHOT_REFRESH_INTERVAL:
+        _schedule_rebuild_from_read(now)
+    return snapshot
+
+
+def _schedule_rebuild_from_read(now: float):
+    """读取时发现快照缺失或过旧，按最小间隔触发重建（避免每个请求都触发）"""
+    global _read_rebuild_at
+    if now < _read_rebuild_at:
+        return
+    _read_rebuild_at = now + READ_REBUILD_INTERVAL
+    schedule_catalog_rebuild(delay=0)
+
+
+def get_catalog_response(name: str, **params) -> Optional[Response]:
+    """
+    从目录快照返回接口响应（支持 If-None-Match / gzip）
+
+    Args:
+        name: styles / products / banners / homepage_config / product_categories
+        **params: 接口参数（product_id / category_id / subcategory_id）
+
+    Returns:
+        Response；快照不可用或快照中没有对应切片时返回None（调用方回退到数据库查询）
+    """
+    try:
+        snapshot = get_catalog_snapshot()
+        if snapshot is None:
+            return None
+        catalog_slice = snapshot.get_slice(name, **params)
+        if catalog_slice is None:
+            return None
+    except Exception as e:
+        logger.warning(f"⚠️  读取目录快照失败: {e}")
+        return None
+
+    if request.if_none_match.contains(catalog_slice.etag):
+        response = Response(status=304)
+    elif catalog_slice.gzip_body is not None and "gzip" in request.accept_encodings:
+        response = Response(catalog_slice.gzip_body, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(catalog_slice.body, mimetype="application/json")
+
+    response.set_etag(catalog_slice.etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["X-Catalog-Version"] = str(snapshot.version)
+    return response
+
+
+def get_catalog_snapshot_stats() -> dict:
+    """当前进程的目录快照状态"""
+    snapshot = _snapshot
+    if snapshot is None:
+        return {"available": False}
+    return {
+        "available": True,
+        "version": snapshot.version,
+        "built_at": snapshot.built_at,
+        "slices": len(snapshot.slices),
+        "bytes": sum(len(s.body) for s in snapshot.slices.values()),
+        "gzip_bytes": sum(len(s.gzip_body or s.body) for s in snapshot.slices.values()),
+    }
+
+
+def _register():
+    from app.services.cache_service import add_tag_invalidation_listener
+
+    add_tag_invalidation_listener(_on_cache_tags_invalidated)
+
+
+_register()
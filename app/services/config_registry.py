@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+配置注册表
+把 AIConfig / PollingConfig / MeituAPIConfig / APIProviderConfig 全部行一次性加载为不可变快照，
+热路径读取配置不再访问数据库（原 get_config_value 等每次调用都查询一次 AIConfig）。
+
+- 版本号：任一配置行通过ORM提交修改后递增（会话 after_commit 事件），
+  版本号保存在Redis（config:registry:version），各进程每秒最多检查一次，版本变化时重新加载
+- Redis不可用时本进程的修改立即生效，其他进程的快照最长使用 LOCAL_SNAPSHOT_MAX_AGE 秒
+- 快照中的配置行是与会话无关的副本，只读使用；需要修改配置时仍查询数据库
+- 加载失败时返回 None，调用方回退到直接查询数据库
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "config:registry:version"
+VERSION_CHECK_INTERVAL = 1  # 检查其他进程修改配置的间隔（秒）
+LOCAL_SNAPSHOT_MAX_AGE = 30  # 无Redis时快照的最长使用时间（秒）
+LOAD_RETRY_INTERVAL = 5  # 加载失败后的重试间隔（秒）
+
+# 快照包含的配置模型
+CONFIG_MODELS = ("AIConfig", "PollingConfig", "MeituAPIConfig", "APIProviderConfig")
+
+
+class ConfigSnapshot:
+    """一个版本的配置快照（只读）"""
+
+    def __init__(self, version: int, rows: dict):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        # 配置键 -> 配置值（行存在但值为空时为 '' 或 None）
+        self.ai_configs = MappingProxyType(
+            {row.config_key: row.config_value for row in rows.get("AIConfig", ())}
+        )
+        # 任务类型 -> PollingConfig
+        self.polling_configs = MappingProxyType(
+            {row.task_type: row for row in rows.get("PollingConfig", ())}
+        )
+        # 按ID排序的 MeituAPIConfig
+        self.meitu_configs = tuple(sorted(rows.get("MeituAPIConfig", ()), key=lambda r: r.id))
+        # ID -> APIProviderConfig
+        self.api_provider_configs = MappingProxyType(
+            {row.id: row for row in rows.get("APIProviderConfig", ())}
+        )
+
+    def get(self, config_key: str, default=None):
+        """AIConfig 配置值（行不存在时返回 default）"""
+        return self.ai_configs.get(config_key, default)
+
+    def get_polling_config(self, task_type: str, active_only: bool = True):
+        config = self.polling_configs.get(task_type)
+        if config is None or (active_only and not config.is_active):
+            return None
+        return config
+
+    def get_active_meitu_config(self):
+        """第一个启用的美图API配置"""
+        return next((config for config in self.meitu_configs if config.is_active), None)
+
+    def get_api_provider_config(self, config_id):
+        try:
+            return self.api_provider_configs.get(int(config_id))
+        except (TypeError, ValueError):
+            return None
+
+
+_snapshot: Optional[ConfigSnapshot] = None
+_version_checked_at = 0.0
+_load_failed_at = None
+_load_lock = threading.Lock()
+_listeners_registered = False
+
+
+def _get_redis():
+    try:
+        from app.services.cache_service import get_redis_client
+
+        return get_redis_client()
+    except Exception:
+        return None
+
+
+def _app_context():
+    import contextlib
+
+    from flask import has_app_context
+
+    if not has_app_context() and "test_server" in sys.modules:
+        test_server_module = sys.modules["test_server"]
+        if hasattr(test_server_module, "app"):
+            return test_server_module.app.app_context()
+    return contextlib.nullcontext()
+
+
+def _get_model(name):
+    test_server_module = sys.modules.get("test_server")
+    return getattr(test_server_module, name, None) if test_server_module else None
+
+
+def _load_rows() -> dict:
+    """读取所有配置行，复制为与会话无关的对象"""
+    test_server_module = sys.modules["test_server"]
+    db = test_server_module.db
+    rows = {}
+    with _app_context():
+        for name in CONFIG_MODELS:
+            model = _get_model(name)
+            if model is None:
+                continue
+            result = db.session.execute(model.__table__.select())
+            rows[name] = [model(**dict(row._mapping)) for row in result]
+    return rows
+
+
+def _read_version(client) -> int:
+    if client is None:
+        return 0
+    try:
+        return int(client.get(VERSION_KEY) or 0)
+    except Exception as e:
+        logger.debug(f"读取配置版本失败: {e}")
+        return 0
+
+
+def _load(client) -> Optional[ConfigSnapshot]:
+    global _snapshot, _load_failed_at
+
+    with _load_lock:
+        # 等锁期间其他线程可能已加载
+        current = _snapshot
+        version = _read_version(client)
+        if current is not None and current.version == version and client is not None:
+            return current
+        try:
+            # 先读版本再读数据：加载期间发生的修改会使版本号变化，下次检查时再次加载
+            snapshot = ConfigSnapshot(version, _load_rows())
+        except Exception as e:
+            _load_failed_at = time.monotonic()
+            logger.warning(f"⚠️  加载配置快照失败，回退到直接查询数据库: {e}")
+            return None
+        _snapshot = snapshot
+        _load_failed_at = None
+        logger.debug(f"配置快照已加载: 版本={version}, 配置项={len(snapshot.ai_configs)}")
+        return snapshot
+
+
+def get_config_snapshot() -> Optional[ConfigSnapshot]:
+    """获取当前配置快照（必要时重新加载）；不可用时返回 None"""
+    global _version_checked_at
+
+    if "test_server" not in sys.modules:
+        return None
+
+    now = time.monotonic()
+    snapshot = _snapshot
+    if snapshot is None:
+        if _load_failed_at is not None and now - _load_failed_at < LOAD_RETRY_INTERVAL:
+            return None
+        return _load(_get_redis())
+
+    client = _get_redis()
+    if client is None:
+        if now - snapshot.loaded_at > LOCAL_SNAPSHOT_MAX_AGE:
+            return _load(None) or snapshot
+        return snapshot
+
+    if now - _version_checked_at >= VERSION_CHECK_INTERVAL:
+        _version_checked_at = now
+        if _read_version(client) != snapshot.version:
+            return _load(client) or snapshot
+    return snapshot
+
+
+def get_active_meitu_config():
+    """启用的美图API配置（只读；快照不可用时查询数据库）"""
+    snapshot = get_config_snapshot()
+    if snapshot is not None:
+        return snapshot.get_active_meitu_config()
+    MeituAPIConfig = _get_model("MeituAPIConfig")
+    return MeituAPIConfig.query.filter_by(is_active=True).first() if MeituAPIConfig else None
+
+
+def get_polling_config(task_type: str):
+    """启用的轮询配置（只读；快照不可用时查询数据库）"""
+    snapshot = get_config_snapshot()
+    if snapshot is not None:
+        return snapshot.get_polling_config(task_type)
+    PollingConfig = _get_model("PollingConfig")
+    if PollingConfig is None:
+        return None
+    return PollingConfig.query.filter_by(task_type=task_type, is_active=True).first()
+
+
+def bump_config_version():
+    """配置已修改：作废本进程快照，并通知其他进程重新加载"""
+    global _snapshot
+
+    _snapshot = None
+    client = _get_redis()
+    if client is None:
+        return
+    try:
+        client.incr(VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"⚠️  更新配置版本失败: {e}")
+
+
+def get_config_registry_stats() -> dict:
+    snapshot = _snapshot
+    if snapshot is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "version": snapshot.version,
+        "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1),
+        "ai_configs": len(snapshot.ai_configs),
+        "polling_configs": len(snapshot.polling_configs),
+        "meitu_configs": len(snapshot.meitu_configs),
+        "api_provider_configs": len(snapshot.api_provider_configs),
+    }
+
+
+# ============================================================================
+# 修改检测
+# ============================================================================
+
+
+def _config_classes():
+    return tuple(model for model in map(_get_model, CONFIG_MODELS) if model is not None)
+
+
+def _after_flush(session, flush_context):
+    classes = _config_classes()
+    if not classes:
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, classes):
+            session.info["config_registry_changed"] = True
+            return
+
+
+def _after_commit(session):
+    if session.info.pop("config_registry_changed", False):
+        bump_config_version()
+
+
+def _after_rollback(session):
+    session.info.pop("config_registry_changed", None)
+
+
+def register_config_registry_listeners():
+    """注册配置修改检测的会话事件（可重复调用）"""
+    global _listeners_registered
+
+    if _listeners_registered:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    event.listen(Session, "after_flush", _after_flush)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_rollback", _after_rollback)
+    _listeners_registered = True
+
+
+def _reset_after_fork():
+    global _snapshot, _load_lock
+    _snapshot = None
+    _load_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
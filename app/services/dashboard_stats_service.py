@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+仪表盘统计服务
+管理后台仪表盘和加盟商面板的订单统计（原每次打开页面对订单表执行约15次 count()/sum()，
+其中按天统计使用 func.date(created_at) == ...，无法命中索引）
+
+- 今日/昨日/本周/本月订单数量：一次条件聚合（SUM(CASE ...)）查询得出，
+  只扫描最早统计区间起点之后的订单（created_at 范围条件，可命中索引）
+- 累计订单数和各状态数量：读取订单状态计数（order_rollup_service.get_order_status_counts），
+  状态计数尚未重算完成时查询订单表
+- 业绩金额：一次条件聚合读取订单业绩分桶（order_rollup_service.get_revenue_buckets）
+- 结果按加盟商缓存 DASHBOARD_STATS_TTL 秒（cache_service，Redis不可用时为进程内缓存）
+
+统计口径与原页面一致：
+- 订单数量不含未支付（unpaid）订单，按创建时间归属
+- 待处理：pending / 已支付；异常：failed / error 或有打印错误信息
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 统计结果缓存时间（秒）
+STATS_TTL = int(os.environ.get("DASHBOARD_STATS_TTL", "10"))
+
+PENDING_STATUSES = ("pending", "已支付")
+ERROR_STATUSES = ("failed", "error")
+
+
+def _periods(today) -> Dict:
+    """统计区间：名称 -> (start, end)，为空表示不限"""
+    tomorrow = today + timedelta(days=1)
+    yesterday = today - timedelta(days=1)
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    return {
+        "daily": (today, tomorrow),
+        "yesterday": (yesterday, today),
+        "week": (week_start, None),
+        "month": (month_start, None),
+    }
+
+
+def _to_datetime(value):
+    return datetime.combine(value, datetime.min.time()) if value is not None else None
+
+
+def _count_columns(columns: Dict, franchisee_id: Optional[int], *filters) -> Dict:
+    from app.models import Order, db
+
+    query = db.session.query(*columns.values()).filter(*filters)
+    if franchisee_id is not None:
+        query = query.filter(Order.franchisee_id == franchisee_id)
+    row = query.one()
+    return {name: int(value or 0) for name, value in zip(columns, row)}
+
+
+def _period_counts(franchisee_id: Optional[int], periods: Dict) -> Dict:
+    """一次查询统计各时间区间的订单数量（只扫描最早区间起点之后的订单）"""
+    from sqlalchemy import and_, case, func
+
+    from app.models import Order
+
+    columns = {}
+    for name, (start, end) in periods.items():
+        conditions = [Order.created_at >= _to_datetime(start)]
+        if end is not None:
+            conditions.append(Order.created_at < _to_datetime(end))
+        columns[f"{name}_orders"] = func.sum(case((and_(*conditions), 1), else_=0))
+
+    earliest = min(_to_datetime(start) for start, _ in periods.values())
+    return _count_columns(
+        columns, franchisee_id, Order.created_at >= earliest, Order.status != "unpaid"
+    )
+
+
+def _status_counts(franchisee_id: Optional[int]) -> Dict:
+    """累计订单数和各状态订单数（优先读取订单状态计数）"""
+    from app.services.order_rollup_service import get_order_status_counts
+
+    counts = get_order_status_counts(franchisee_id)
+    if counts is None:
+        return _query_status_counts(franchisee_id)
+
+    def total(match):
+        return sum(count for key, count in counts.items() if match(*key))
+
+    return {
+        # 与 SQL 的 status != 'unpaid' 一致：状态为空的订单不计入
+        "total_orders": total(lambda status, _: status not in ("", "unpaid")),
+        "pending_orders": total(lambda status, _: status in PENDING_STATUSES),
+        "processing_orders": total(lambda status, _: status == "processing"),
+        "completed_orders": total(lambda status, _: status == "completed"),
+        "error_orders": total(lambda status, error: status in ERROR_STATUSES or error),
+    }
+
+
+def _query_status_counts(franchisee_id: Optional[int]) -> Dict:
+    """状态计数尚未重算完成时直接统计订单表"""
+    from sqlalchemy import case, func, or_
+
+    from app.models import Order
+
+    def count_if(condition):
+        return func.sum(case((condition, 1), else_=0))
+
+    columns = {
+        "total_orders": count_if(Order.status != "unpaid"),
+        "pending_orders": count_if(Order.status.in_(PENDING_STATUSES)),
+        "processing_orders": count_if(Order.status == "processing"),
+        "completed_orders": count_if(Order.status == "completed"),
+        "error_orders": count_if(
+            or_(Order.status.in_(ERROR_STATUSES), Order.printer_error_message.isnot(None))
+        ),
+    }
+    return _count_columns(columns, franchisee_id)
+
+
+def _order_counts(franchisee_id: Optional[int], periods: Dict) -> Dict:
+    """各时间区间、累计和各状态的订单数量"""
+    counts = _status_counts(franchisee_id)
+    counts.update(_period_counts(franchisee_id, periods))
+    return counts
+
+
+def _revenues(franchisee_id: Optional[int], periods: Dict) -> Dict:
+    from app.services.order_rollup_service import get_revenue_buckets
+
+    tomorrow = periods["daily"][1]
+    # 业绩按完成时间统计，本周/本月截止到今天结束
+    ranges = {
+        name: (start, end if end is not None else tomorrow)
+        for name, (start, end) in periods.items()
+    }
+    ranges["total"] = (None, None)
+    revenues = get_revenue_buckets(ranges, franchisee_id=franchisee_id)
+    return {f"{name}_revenue": value for name, value in revenues.items()}
+
+
+def compute_dashboard_stats(franchisee_id: Optional[int] = None, today=None) -> Dict:
+    """
+    计算仪表盘订单统计（不使用缓存）
+
+    Args:
+        franchisee_id: 只统计该加盟商的订单，为空表示全部
+        today: 统计基准日期（默认今天）
+
+    Returns:
+        {total_orders, daily_orders, yesterday_orders, week_orders, month_orders,
+         pending_orders, processing_orders, completed_orders, error_orders,
+         daily_revenue, yesterday_revenue, week_revenue, month_revenue, total_revenue}
+    """
+    today = today or datetime.now().date()
+    periods = _periods(today)
+    stats = _order_counts(franchisee_id, periods)
+    stats.update(_revenues(franchisee_id, periods))
+    return stats
+
+
+def get_dashboard_stats(franchisee_id: Optional[int] = None, use_cache: bool = True) -> Dict:
+    """
+    获取仪表盘订单统计，按加盟商缓存 STATS_TTL 秒
+
+    Args:
+        franchisee_id: 只统计该加盟商的订单，为空表示全部
+        use_cache: 是否使用缓存
+    """
+    today = datetime.now().date()
+    if not use_cache or STATS_TTL <= 0:
+        return compute_dashboard_stats(franchisee_id, today)
+
+    from app.services.cache_service import CACHE_PREFIXES, cache_key, get_or_set
+
+    key = cache_key(
+        CACHE_PREFIXES["DASHBOARD"],
+        "order_stats",
+        franchisee_id if franchisee_id is not None else "all",
+        today.isoformat(),
+    )
+    return get_or_set(key, lambda: compute_dashboard_stats(franchisee_id, today), STATS_TTL)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+进程级共享HTTP连接池
+
+各云端API服务商（nano-banana、gemini、RunningHub、VEO等）、美图API、ComfyUI 原先每次调用都
+新建 requests.Session 或直接使用 requests.post，每次都要重新建立TCP/TLS连接。
+这里按客户端名称（服务商分组）维护长期存在的 Session：
+
+- 每个 Session 内部按主机维护连接池（keep-alive 复用），单个主机的连接数有上限
+- 每个客户端可配置并发上限（替代原 API_SEMAPHORE / ComfyUI 信号量），同一线程内嵌套调用不会重复占用
+- 统一的重试与退避策略
+- 统计连接复用率与请求延迟分位数（get_http_client_stats）
+"""
+
+import http.cookiejar
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# 单个主机的最大连接数（超过时等待空闲连接）
+DEFAULT_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "32"))
+# 每个客户端缓存连接池的主机数
+DEFAULT_POOL_HOSTS = int(os.environ.get("HTTP_POOL_HOSTS", "16"))
+# 延迟统计保留的最近样本数
+LATENCY_SAMPLES = 1000
+# 超过该耗时的请求记录告警日志
+SLOW_REQUEST_SECONDS = 60
+
+# 各客户端的配置：并发上限配置项（数据库配置名, 默认值）、重试策略
+CLIENT_PROFILES = {
+    # 云端AI服务商（提交任务）：429/5xx/读取失败时服务商可能已创建任务，重试会重复提交（重复计费），
+    # 仅重试连接失败
+    "ai_provider": {"concurrency_config": ("api_max_concurrency", 5), "retry": "connect"},
+    # 本地/内网 ComfyUI：提交不重试（避免重复提交工作流），仅重试连接失败
+    "comfyui": {"concurrency_config": ("comfyui_max_concurrency", 10), "retry": "connect"},
+    # 美图API：提交任务只重试连接失败
+    "meitu": {"concurrency_config": None, "retry": "connect"},
+    # 图片下载（服务商结果图、用户上传图）
+    "download": {"concurrency_config": None, "retry": "default"},
+}
+
+
+def _build_retry(policy):
+    """重试策略：default 对429/5xx和连接失败退避重试；connect 仅重试连接失败；none 不重试"""
+    if policy == "none":
+        return Retry(total=0, raise_on_status=False)
+    if policy == "connect":
+        return Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.5)
+    return Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST", "GET"],
+        raise_on_status=False,
+    )
+
+
+class PooledHttpClient:
+    """一个服务商分组的共享 Session + 并发上限 + 统计"""
+
+    def __init__(self, name, max_concurrency=None, retry="default"):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.default_retry = retry
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counters = {"requests": 0, "errors": 0, "limit_waits": 0, "limit_wait_seconds": 0.0}
+        self._status_counts = {}
+        # 每种重试策略一个Session（重试策略绑定在连接适配器上），共享并发上限与统计
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def session(self, retry=None):
+        retry = retry or self.default_retry
+        session = self._sessions.get(retry)
+        if session is None:
+            with self._sessions_lock:
+                session = self._sessions.get(retry)
+                if session is None:
+                    session = self._sessions[retry] = self._build_session(retry)
+        return session
+
+    def _build_session(self, retry):
+        session = requests.Session()
+        # 共享Session不保存Cookie，避免不同调用之间互相影响
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(
+            pool_connections=DEFAULT_POOL_HOSTS,
+            pool_maxsize=max(DEFAULT_POOL_MAXSIZE, self.max_concurrency or 0),
+            pool_block=True,
+            max_retries=_build_retry(retry),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个并发名额（没有并发上限时不限制）
+
+        同一线程内嵌套调用（如外层已占用名额，内部再调用 request）只占用一次。
+        """
+        depth = getattr(self._local, "depth", 0)
+        if self._semaphore is None or depth > 0:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        if not self._semaphore.acquire(blocking=False):
+            wait_start = time.monotonic()
+            self._semaphore.acquire()
+            with self._stats_lock:
+                self._counters["limit_waits"] += 1
+                self._counters["limit_wait_seconds"] += time.monotonic() - wait_start
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            self._semaphore.release()
+
+    def request(self, method, url, retry=None, **kwargs):
+        """
+        发送请求（参数同 requests.Session.request）
+
+        :param retry: 重试策略（default / connect / none），默认使用客户端配置
+        """
+        handler = _intercepted_handler(self.name)
+        if handler is not None:
+            return handler(self, method, url, retry or self.default_retry, kwargs)
+
+        session = self.session(retry)
+        with self.slot():
+            start = time.monotonic()
+            try:
+                response = session.request(method, url, **kwargs)
+            except Exception:
+                self._record(time.monotonic() - start, None)
+                raise
+            elapsed = time.monotonic() - start
+            self._record(elapsed, response.status_code)
+            if elapsed > SLOW_REQUEST_SECONDS:
+                logger.warning(f"⚠️ HTTP请求较慢 [{self.name}] {method} {url} 耗时 {elapsed:.1f}s")
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def _record(self, elapsed, status_code):
+        with self._stats_lock:
+            self._counters["requests"] += 1
+            if status_code is None:
+                self._counters["errors"] += 1
+            else:
+                self._status_counts[status_code] = self._status_counts.get(status_code, 0) + 1
+            self._latencies.append(elapsed)
+
+    def _pool_counters(self):
+        """统计当前各主机连接池新建连接数 / 请求数"""
+        connections = 0
+        requests_sent = 0
+        hosts = 0
+        seen = set()
+        adapters = [
+            adapter
+            for session in list(self._sessions.values())
+            for adapter in session.adapters.values()
+        ]
+        for adapter in adapters:
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                hosts += 1
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+        return hosts, connections, requests_sent
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self._counters)
+            status_counts = dict(self._status_counts)
+            samples = sorted(self._latencies)
+        hosts, connections, requests_sent = self._pool_counters()
+
+        def percentile(p):
+            if not samples:
+                return None
+            index = min(int(round(p / 100 * (len(samples) - 1))), len(samples) - 1)
+            return round(samples[index] * 1000, 1)
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "requests": counters["requests"],
+            "errors": counters["errors"],
+            "status_counts": status_counts,
+            "limit_waits": counters["limit_waits"],
+            "limit_wait_seconds": round(counters["limit_wait_seconds"], 3),
+            "pooled_hosts": hosts,
+            "new_connections": connections,
+            "pool_requests": requests_sent,
+            # 连接复用率：1 - 新建连接数 / 发出的请求数（含重试）
+            "connection_reuse_rate": (
+                round(1 - connections / requests_sent, 4) if requests_sent else None
+            ),
+            "latency_ms": {"p50": percentile(50), "p90": percentile(90), "p99": percentile(99)},
+        }
+
+    def close(self):
+        for session in list(self._sessions.values()):
+            session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_interceptors = threading.local()
+
+
+def _intercepted_handler(client_name):
+    stack = getattr(_interceptors, "stack", None)
+    if not stack:
+        return None
+    handler, client_names = stack[-1]
+    if client_names is None or client_name in client_names:
+        return handler
+    return None
+
+
+@contextmanager
+def intercept_requests(handler, client_names=None):
+    """
+    在当前线程内接管共享客户端的请求（如交给服务商网关异步发送）
+
+    :param handler: handler(client, method, url, retry, kwargs)，返回值作为响应对象
+    :param client_names: 只接管这些分组（None 表示全部）
+    """
+    stack = getattr(_interceptors, "stack", None)
+    if stack is None:
+        stack = _interceptors.stack = []
+    stack.append((handler, set(client_names) if client_names else None))
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def _resolve_max_concurrency(profile):
+    config = profile.get("concurrency_config")
+    if not config:
+        return None
+    config_key, default = config
+    try:
+        from app.utils.config_loader import get_int_config
+
+        return max(get_int_config(config_key, default), 1)
+    except Exception as e:
+        logger.warning(f"读取并发配置 {config_key} 失败，使用默认值 {default}: {e}")
+        return default
+
+
+def get_http_client(name):
+    """
+    获取（必要时创建）指定分组的共享HTTP客户端
+
+    :param name: 客户端分组名（见 CLIENT_PROFILES，未知分组使用默认重试、无并发上限）
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    profile = CLIENT_PROFILES.get(name, {})
+    max_concurrency = _resolve_max_concurrency(profile)
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = PooledHttpClient(
+                name, max_concurrency=max_concurrency, retry=profile.get("retry", "default")
+            )
+            _clients[name] = client
+            logger.info(
+                f"✅ HTTP连接池已初始化: {name}"
+                + (f"（并发上限 {max_concurrency}）" if max_concurrency else "")
+            )
+    return client
+
+
+def get_http_client_stats():
+    """各HTTP客户端的连接复用率、延迟分位数等统计（当前进程）"""
+    return {name: client.stats() for name, client in list(_clients.items())}
+
+
+def reset_http_clients():
+    """丢弃所有共享连接（进程fork后子进程不能复用父进程的socket）"""
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_http_clients)
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+订单图片处理执行器
+
+上传原图后需要执行完整的 process_order_images（美图API + AI工作流），原先每次上传都新起一个线程，
+多台自拍机同时上传时每个 gunicorn worker 里会同时跑几十个重量级线程。
+这里改为进程内共享的有界执行器：
+
+- 固定数量的工作线程（IMAGE_PROCESSING_WORKERS）
+- 按加盟商分队列，工作线程在有待处理任务的加盟商之间轮转取任务，
+  单个加盟商的批量上传不会让其他门店的订单一直排队
+- 排队总数和单个加盟商的排队数都有上限，超出时转入持久化任务队列（task_queue_service，
+  由Leader进程的队列工作线程稍后处理）；任务队列也不可用时返回False，由接口告知客户端
+- 同一订单已在排队时不重复排队（排到时会处理订单当时的全部图片）
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# 工作线程数（每个进程）
+MAX_WORKERS = int(os.environ.get("IMAGE_PROCESSING_WORKERS", "4"))
+# 排队任务总数上限
+MAX_QUEUE_SIZE = int(os.environ.get("IMAGE_PROCESSING_MAX_QUEUE", "200"))
+# 单个加盟商的排队任务数上限
+MAX_QUEUE_PER_FRANCHISEE = int(os.environ.get("IMAGE_PROCESSING_MAX_PER_FRANCHISEE", "50"))
+
+
+class ImageProcessingJob:
+    """一次订单图片处理"""
+
+    def __init__(self, order_id, order_number, style_category_id=None, style_image_id=None):
+        self.order_id = order_id
+        self.order_number = order_number
+        self.style_category_id = style_category_id
+        self.style_image_id = style_image_id
+        self.submitted_at = time.monotonic()
+
+
+def _app_context():
+    import contextlib
+
+    if "test_server" in sys.modules and hasattr(sys.modules["test_server"], "app"):
+        return sys.modules["test_server"].app.app_context()
+    return contextlib.nullcontext()
+
+
+def _run_job(job):
+    from app.services.image_processing_service import process_order_images
+
+    with _app_context():
+        return process_order_images(
+            order_id=job.order_id,
+            order_number=job.order_number,
+            style_category_id=job.style_category_id,
+            style_image_id=job.style_image_id,
+        )
+
+
+class FairImageExecutor:
+    """按加盟商轮转取任务的有界线程池"""
+
+    def __init__(self, max_workers=None, max_queue_size=None, max_per_franchisee=None, runner=None):
+        self.max_workers = max(max_workers or MAX_WORKERS, 1)
+        self.max_queue_size = max_queue_size or MAX_QUEUE_SIZE
+        self.max_per_franchisee = max_per_franchisee or MAX_QUEUE_PER_FRANCHISEE
+        self._runner = runner or _run_job
+        # 加盟商ID -> 排队任务；顺序即轮转顺序
+        self._queues = OrderedDict()
+        self._queued_orders = set()
+        self._running = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "deferred": 0,
+            "duplicates": 0,
+        }
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def _start(self):
+        if self._threads:
+            return
+        for index in range(self.max_workers):
+            thread = threading.Thread(
+                target=self._worker, daemon=True, name=f"image-processing-{index}"
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job, franchisee_id=None):
+        """
+        提交订单图片处理任务
+
+        Returns:
+            bool: 是否已排队（订单已在排队中也返回True；队列已满返回False）
+        """
+        key = franchisee_id or 0
+        with self._cond:
+            if job.order_id in self._queued_orders:
+                self._counters["duplicates"] += 1
+                return True
+            pending = self._queues.get(key)
+            queued = sum(len(jobs) for jobs in self._queues.values())
+            if queued >= self.max_queue_size or (
+                pending is not None and len(pending) >= self.max_per_franchisee
+            ):
+                self._counters["rejected"] += 1
+                logger.warning(
+                    f"[图片处理] 队列已满，拒绝订单 {job.order_number}"
+                    f"（排队 {queued}，加盟商 {key} 排队 {len(pending or ())}）"
+                )
+                return False
+            if pending is None:
+                pending = self._queues[key] = deque()
+            pending.append(job)
+            self._queued_orders.add(job.order_id)
+            self._counters["submitted"] += 1
+            self._start()
+            self._cond.notify()
+        return True
+
+    def note_deferred(self):
+        """被拒绝的任务已转入持久化任务队列"""
+        with self._cond:
+            self._counters["deferred"] += 1
+
+    def _take(self):
+        """从轮转顺序中第一个加盟商取一个任务，该加盟商移到队尾"""
+        with self._cond:
+            while not self._queues:
+                self._cond.wait()
+            key, pending = next(iter(self._queues.items()))
+            job = pending.popleft()
+            if pending:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._queued_orders.discard(job.order_id)
+            self._running[job.order_id] = key
+            wait = time.monotonic() - job.submitted_at
+            self._wait_seconds += wait
+            self._max_wait_seconds = max(self._max_wait_seconds, wait)
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._take()
+            ok = False
+            try:
+                result = self._runner(job)
+                ok = not (isinstance(result, tuple) and result and result[0] is False)
+                if not ok:
+                    logger.info(f"[图片处理] 订单 {job.order_number} 未完成处理: {result[1]}")
+            except Exception as e:
+                logger.info(f"后台处理图片失败: {str(e)}")
+                import traceback
+
+                traceback.print_exc()
+            finally:
+                with self._cond:
+                    self._running.pop(job.order_id, None)
+                    self._counters["completed" if ok else "failed"] += 1
+
+    def get_stats(self):
+        with self._cond:
+            depth_by_franchisee = {key: len(jobs) for key, jobs in self._queues.items()}
+            started = self._counters["submitted"] - sum(depth_by_franchisee.values())
+            return {
+                **self._counters,
+                "workers": self.max_workers,
+                "running": len(self._running),
+                "queue_depth": sum(depth_by_franchisee.values()),
+                "queue_size": self.max_queue_size,
+                "queue_depth_by_franchisee": depth_by_franchisee,
+                "avg_wait_seconds": round(self._wait_seconds / started, 3) if started else 0.0,
+                "max_wait_seconds": round(self._max_wait_seconds, 3),
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_image_processing_executor():
+    """获取（必要时创建）进程内的订单图片处理执行器"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = FairImageExecutor()
+    return _executor
+
+
+def _defer_job(job):
+    """执行器队列已满：转入持久化任务队列（task_type = image_processing）"""
+    from app.services.task_queue_service import PRIORITY_NORMAL, submit_task
+
+    return submit_task(
+        "image_processing",
+        {
+            "order_id": job.order_id,
+            "order_number": job.order_number,
+            "style_category_id": job.style_category_id,
+            "style_image_id": job.style_image_id,
+        },
+        priority=PRIORITY_NORMAL,
+    )
+
+
+def run_deferred_image_processing(task_data):
+    """
+    处理从任务队列领取的订单图片处理任务（task_queue_service 工作线程调用）
+
+    :return: 是否处理成功
+    """
+    job = ImageProcessingJob(
+        task_data.get("order_id"),
+        task_data.get("order_number"),
+        style_category_id=task_data.get("style_category_id"),
+        style_image_id=task_data.get("style_image_id"),
+    )
+    result = _run_job(job)
+    return not (isinstance(result, tuple) and result and result[0] is False)
+
+
+def submit_order_image_processing(order):
+    """
+    把订单提交到图片处理执行器（美图API + AI工作流），立即返回
+
+    执行器队列已满时转入持久化任务队列稍后处理。
+
+    :param order: Order 实例（需已提交，读取ID、订单号、风格和加盟商）
+    :return: 是否已排队（执行器或任务队列）；False 表示处理未能排队，需告知客户端
+    """
+    job = ImageProcessingJob(
+        order.id,
+        order.order_number,
+        style_category_id=getattr(order, "style_category_id", None),
+        style_image_id=getattr(order, "style_image_id", None),
+    )
+    executor = get_image_processing_executor()
+    if executor.submit(job, franchisee_id=getattr(order, "franchisee_id", None)):
+        return True
+    try:
+        if _defer_job(job):
+            executor.note_deferred()
+            logger.info(f"[图片处理] 订单 {job.order_number} 已转入任务队列稍后处理")
+            return True
+    except Exception as e:
+        logger.warning(f"[图片处理] 订单 {job.order_number} 转入任务队列失败: {str(e)}")
+    return False
+
+
+def get_image_processing_stats():
+    """订单图片处理执行器统计（当前进程）"""
+    if _executor is None:
+        return {"started": False}
+    return get_image_processing_executor().get_stats()
+
+
+def _reset_after_fork():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
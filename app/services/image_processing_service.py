@@ -35,7 +35,6 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
         db = test_server_module.db
         Order = test_server_module.Order
         OrderImage = test_server_module.OrderImage
-        MeituAPIConfig = test_server_module.MeituAPIConfig
         MeituAPIPreset = test_server_module.MeituAPIPreset
         MeituAPICallLog = test_server_module.MeituAPICallLog
         StyleImage = (
@@ -93,7 +92,9 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
         original_image_path = main_image_info["path"]
 
         # 检查美图API是否在流程中启用
-        meitu_config = MeituAPIConfig.query.filter_by(is_active=True).first()
+        from app.services.config_registry import get_active_meitu_config
+
+        meitu_config = get_active_meitu_config()
         use_meitu = False
         retouched_image_path = None
 
@@ -134,7 +135,8 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
 
                     import requests
 
-                    from app.services.meitu_api_service import call_meitu_api, download_result_image
+                    from app.services.meitu_api_service import call_meitu_api
+                    from app.services.provider_callbacks import build_callback_url
 
                     logger.info(f"📞 调用美图API，预设ID: {preset_id}")
                     start_time = time.time()
@@ -144,6 +146,11 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
                     poll_interval = 3  # 每3秒轮询一次
                     max_poll_attempts = total_timeout // poll_interval  # 最多轮询次数
 
+                    # 未单独配置回调地址时使用本系统的签名回调（启用了服务商回调时）
+                    repost_url = meitu_config.repost_url or build_callback_url(
+                        "meitu", order.order_number
+                    )
+
                     # 调用美图API（异步接口，返回msg_id）
                     success, result_path, error_msg, call_log = call_meitu_api(
                         image_path=original_image_path,
@@ -152,7 +159,7 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
                         api_secret=meitu_config.api_secret,
                         api_base_url=meitu_config.api_base_url,
                         api_endpoint=meitu_config.api_endpoint,
-                        repost_url=meitu_config.repost_url,
+                        repost_url=repost_url,
                         db=db,
                         MeituAPICallLog=MeituAPICallLog,
                         order_id=order.id,
@@ -206,18 +213,15 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
                                 # 查询结果（通过查询call_log的状态）
                                 db.session.refresh(call_log)
 
-                                if call_log.status == "success" and call_log.result_image_url:
-                                    # 成功获取结果
-                                    result_image_url = call_log.result_image_url
+                                # 结果图由回调/美图轮询提交给结果图流水线下载（只下载一次），
+                                # 这里等待流水线记录本地路径
+                                if call_log.status == "success" and call_log.result_image_path:
+                                    result_image_path = call_log.result_image_path
                                     logger.info(
-                                        f"✅ 美图API处理完成，结果图片URL: {result_image_url}"
+                                        f"✅ 美图API处理完成，结果图片: {result_image_path}"
                                     )
 
-                                    # 下载结果图片
-                                    result_image_path = download_result_image(
-                                        result_image_url, order.order_number
-                                    )
-                                    if result_image_path and os.path.exists(result_image_path):
+                                    if os.path.exists(result_image_path):
                                         retouched_image_path = result_image_path
                                         result_found = True
 
@@ -250,7 +254,7 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
                                         )
                                         break
                                     else:
-                                        logger.warning("下载美图结果图片失败，跳过美图处理")
+                                        logger.warning("美图结果图片文件不存在，跳过美图处理")
                                         use_meitu = False
                                         # 下载失败，更新状态为ai_processing
                                         if (
@@ -388,35 +392,21 @@ def process_order_images(order_id, order_number=None, style_category_id=None, st
 
         # 调用AI工作流服务（使用任务队列）
         try:
-            from app.services.task_queue_service import submit_task
+            from app.services.task_queue_service import get_order_priority, submit_task
 
-            # 提交任务到队列
+            # 提交任务到队列（任务数据需可持久化，模型类由create_ai_task自行获取）
             task_data = {
                 "order_id": order.id,
                 "style_category_id": style_category_id,
                 "style_image_id": style_image_id,
-                "kwargs": {
-                    "db": db,
-                    "Order": Order,
-                    "AITask": (
-                        test_server_module.AITask if hasattr(test_server_module, "AITask") else None
-                    ),
-                    "StyleCategory": (
-                        test_server_module.StyleCategory
-                        if hasattr(test_server_module, "StyleCategory")
-                        else None
-                    ),
-                    "StyleImage": (
-                        test_server_module.StyleImage
-                        if hasattr(test_server_module, "StyleImage")
-                        else None
-                    ),
-                    "OrderImage": OrderImage,
-                },
             }
 
-            # 提交到队列（如果队列未启动，回退到直接调用）
-            queue_submitted = submit_task("comfyui", task_data)
+            # 提交到队列（门店订单优先于测试任务；如果队列不可用，回退到直接调用）
+            queue_submitted = submit_task(
+                "comfyui",
+                task_data,
+                priority=get_order_priority(getattr(order, "source_type", None)),
+            )
 
             if queue_submitted:
                 logger.info(
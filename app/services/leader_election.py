@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+后台服务Leader选举
+gunicorn多worker部署时，保证只有一个进程运行任务队列工作线程、AI任务轮询服务和业绩预聚合对账
+
+- 本机：文件锁（进程退出时由操作系统自动释放）保证同一台机器只有一个进程当选
+- 跨机器：Redis租约锁（SET NX PX + 续约）；只有未配置Redis（未设置 REDIS_HOST）时
+  才退化为仅使用文件锁，已配置但连不上Redis时不当选、续约失败时退位，避免多台机器同时当选
+- 连接Redis失败后每 REDIS_RETRY_INTERVAL 秒重试一次，启动时Redis未就绪的进程之后仍会使用Redis
+- 当选进程被 max_requests 回收或异常退出后，其他进程在下一次竞选周期自动接管
+"""
+
+import atexit
+import contextlib
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # Linux / macOS
+    msvcrt = None
+
+# 连接Redis失败后的重试间隔（秒）
+REDIS_RETRY_INTERVAL = 30
+
+# 续约：仅当锁仍属于自己时延长过期时间
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# 释放：仅当锁仍属于自己时删除
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _create_redis_client():
+    """创建Leader选举使用的Redis客户端（不依赖应用上下文），失败返回None"""
+    try:
+        import redis
+
+        client = redis.Redis(
+            host=os.environ.get("REDIS_HOST", "localhost"),
+            port=int(os.environ.get("REDIS_PORT", 6379)),
+            db=int(os.environ.get("REDIS_DB", 0)),
+            password=os.environ.get("REDIS_PASSWORD") or None,
+            decode_responses=True,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+        )
+        client.ping()
+        return client
+    except ImportError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️  Leader选举无法连接Redis: {e}")
+        return None
+
+
+def _redis_configured() -> bool:
+    """是否配置了Redis（设置了 REDIS_HOST 且已安装 redis 包）"""
+    import importlib.util
+
+    return bool(os.environ.get("REDIS_HOST")) and importlib.util.find_spec("redis") is not None
+
+
+class LeaderElection:
+    """
+    基于租约的Leader选举
+
+    Args:
+        name: 选举名称（同名选举互斥）
+        ttl: 租约时长（秒），当选进程失联超过此时长后其他进程可接管
+        renew_interval: 续约/竞选间隔（秒），应明显小于ttl
+        lock_dir: 本机文件锁所在目录
+    """
+
+    def __init__(
+        self,
+        name: str = "background_services",
+        ttl: int = 30,
+        renew_interval: int = 10,
+        lock_dir: str = "logs",
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.lock_path = os.path.join(lock_dir, f"{name}.lock")
+        self.redis_key = f"leader:{name}"
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._redis = None
+        self._redis_checked_at = None
+        self._redis_seen = False  # 曾经连接成功过
+        self._has_redis_lease = False
+        self._redis_lock = threading.Lock()
+        self._lock_file = None
+        self._is_leader = False
+        self._on_elected: List[Callable] = []
+        self._on_revoked: List[Callable] = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def _get_redis(self):
+        """获取Redis客户端；未连接成功时每 REDIS_RETRY_INTERVAL 秒重试一次"""
+        with self._redis_lock:
+            if self._redis is None:
+                now = time.monotonic()
+                if (
+                    self._redis_checked_at is None
+                    or now - self._redis_checked_at >= REDIS_RETRY_INTERVAL
+                ):
+                    self._redis_checked_at = now
+                    self._redis = _create_redis_client()
+                    if self._redis is not None:
+                        self._redis_seen = True
+            return self._redis
+
+    def _redis_required(self) -> bool:
+        """已配置（或曾连接成功过）Redis时，必须持有Redis租约才能当选"""
+        return self._redis_seen or _redis_configured()
+
+    def _acquire_file_lock(self) -> bool:
+        """获取本机文件锁（非阻塞）"""
+        if self._lock_file is not None:
+            return True
+        if fcntl is None and msvcrt is None:
+            return True
+
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        lock_file = open(self.lock_path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(self.token)
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def _release_file_lock(self):
+        if self._lock_file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._lock_file.seek(0)
+                msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        finally:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_redis_lease(self) -> bool:
+        """获取Redis租约；只有未配置Redis时才视为成功（仅依赖文件锁），Redis出错时不当选"""
+        client = self._get_redis()
+        if client is None:
+            self._has_redis_lease = False
+            return not self._redis_required()
+        try:
+            acquired = bool(client.set(self.redis_key, self.token, nx=True, px=self.ttl * 1000))
+            # Redis短暂故障后租约可能仍属于自己
+            if not acquired and client.get(self.redis_key) == self.token:
+                acquired = self._renew_lease(client)
+        except Exception as e:
+            logger.warning(f"⚠️  [Leader选举] Redis获取租约失败: {e}")
+            acquired = False
+        self._has_redis_lease = acquired
+        return acquired
+
+    def _renew_lease(self, client) -> bool:
+        return bool(client.eval(_RENEW_SCRIPT, 1, self.redis_key, self.token, self.ttl * 1000))
+
+    def _renew_redis_lease(self) -> bool:
+        """续约；Redis出错时返回False（无法确认租约仍属于自己）"""
+        client = self._get_redis()
+        if client is None:
+            return not self._redis_required()
+        if not self._has_redis_lease:
+            # 仅凭文件锁当选后Redis恢复可用：需要再取得Redis租约
+            return self._acquire_redis_lease()
+        try:
+            return self._renew_lease(client)
+        except Exception as e:
+            logger.warning(f"⚠️  [Leader选举] Redis续约失败: {e}")
+            return False
+
+    def _release_redis_lease(self):
+        self._has_redis_lease = False
+        client = self._redis
+        if client is None:
+            return
+        try:
+            client.eval(_RELEASE_SCRIPT, 1, self.redis_key, self.token)
+        except Exception:
+            pass
+
+    def try_acquire(self) -> bool:
+        """尝试当选：先获取本机文件锁，再获取跨机器的Redis租约"""
+        if not self._acquire_file_lock():
+            return False
+        if not self._acquire_redis_lease():
+            self._release_file_lock()
+            return False
+        return True
+
+    def renew(self) -> bool:
+        """续约，返回是否仍是Leader"""
+        return self._renew_redis_lease()
+
+    def release(self):
+        """主动放弃Leader身份（进程退出时调用，便于其他进程立即接管）"""
+        was_leader = self._is_leader
+        self._is_leader = False
+        self._release_redis_lease()
+        self._release_file_lock()
+        if was_leader:
+            self._fire(self._on_revoked)
+            logger.info(f"👋 [Leader选举] 进程 {os.getpid()} 已释放 {self.name} Leader身份")
+
+    def on_elected(self, callback: Callable):
+        self._on_elected.append(callback)
+        return callback
+
+    def on_revoked(self, callback: Callable):
+        self._on_revoked.append(callback)
+        return callback
+
+    def _fire(self, callbacks: List[Callable]):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(
+                    f"[Leader选举] 回调 {getattr(callback, '__name__', callback)} 执行失败: {e}"
+                )
+
+    def _tick(self):
+        if self._is_leader:
+            if not self.renew():
+                logger.warning(f"⚠️  [Leader选举] 进程 {os.getpid()} 租约已被接管，停止后台服务")
+                self._is_leader = False
+                self._release_file_lock()
+                self._fire(self._on_revoked)
+        elif self.try_acquire():
+            self._is_leader = True
+            logger.info(f"👑 [Leader选举] 进程 {os.getpid()} 当选 {self.name} Leader")
+            self._fire(self._on_elected)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f"[Leader选举] 竞选异常: {e}")
+            self._stop_event.wait(self.renew_interval)
+
+    def start(self):
+        """启动后台竞选线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name=f"LeaderElection-{self.name}"
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """停止竞选并释放Leader身份"""
+        self._stop_event.set()
+        self.release()
+
+
+# 全局选举实例（每个进程一个）
+_background_election: Optional[LeaderElection] = None
+
+
+def _app_context():
+    """任务队列初始化需要读取数据库配置，优先在test_server应用上下文中执行"""
+    if "test_server" in sys.modules and hasattr(sys.modules["test_server"], "app"):
+        return sys.modules["test_server"].app.app_context()
+    return contextlib.nullcontext()
+
+
+def _start_background_services():
+    try:
+        from app.services.task_queue_service import start_task_queue
+
+        with _app_context():
+            start_task_queue()
+    except Exception as e:
+        logger.warning(f"启动任务队列服务失败: {str(e)}")
+
+    try:
+        from app.services.ai_task_polling_service import init_ai_task_polling_service
+
+        init_ai_task_polling_service()
+    except Exception as e:
+        logger.warning(f"启动AI任务状态轮询服务失败: {str(e)}")
+
+    try:
+        from app.services.order_rollup_service import start_order_rollup_worker
+
+        start_order_rollup_worker()
+    except Exception as e:
+        logger.warning(f"启动业绩预聚合对账服务失败: {str(e)}")
+
+    try:
+        from app.services.user_visit_buffer import start_user_visit_rollup_worker
+
+        start_user_visit_rollup_worker()
+    except Exception as e:
+        logger.warning(f"启动访问预聚合对账服务失败: {str(e)}")
+
+    try:
+        from app.services.order_search_service import start_order_search_index_worker
+
+        start_order_search_index_worker()
+    except Exception as e:
+        logger.warning(f"启动订单搜索索引服务失败: {str(e)}")
+
+    try:
+        from app.services.order_event_service import start_order_event_runner
+
+        start_order_event_runner()
+    except Exception as e:
+        logger.warning(f"启动订单事件消费服务失败: {str(e)}")
+
+    try:
+        from app.services.result_pipeline import start_result_sweeper
+
+        start_result_sweeper()
+    except Exception as e:
+        logger.warning(f"启动远程结果图补偿服务失败: {str(e)}")
+
+    try:
+        from app.services.provider_gateway import start_gateway_job_purger
+
+        start_gateway_job_purger()
+    except Exception as e:
+        logger.warning(f"启动服务商网关请求清理服务失败: {str(e)}")
+
+
+def _stop_background_services():
+    try:
+        from app.services.provider_gateway import stop_gateway_job_purger
+
+        stop_gateway_job_purger()
+    except Exception as e:
+        logger.warning(f"停止服务商网关请求清理服务失败: {str(e)}")
+
+    try:
+        from app.services.result_pipeline import stop_result_sweeper
+
+        stop_result_sweeper()
+    except Exception as e:
+        logger.warning(f"停止远程结果图补偿服务失败: {str(e)}")
+
+    try:
+        from app.services.order_event_service import stop_order_event_runner
+
+        stop_order_event_runner()
+    except Exception as e:
+        logger.warning(f"停止订单事件消费服务失败: {str(e)}")
+
+    try:
+        from app.services.user_visit_buffer import stop_user_visit_rollup_worker
+
+        stop_user_visit_rollup_worker()
+    except Exception as e:
+        logger.warning(f"停止访问预聚合对账服务失败: {str(e)}")
+
+    try:
+        from app.services.order_rollup_service import stop_order_rollup_worker
+
+        stop_order_rollup_worker()
+    except Exception as e:
+        logger.warning(f"停止业绩预聚合对账服务失败: {str(e)}")
+
+    try:
+        from app.services.ai_task_polling_service import stop_ai_task_polling_service
+
+        stop_ai_task_polling_service()
+    except Exception as e:
+        logger.warning(f"停止AI任务状态轮询服务失败: {str(e)}")
+
+    try:
+        from app.services.task_queue_service import stop_task_queue
+
+        stop_task_queue(wait=False)
+    except Exception as e:
+        logger.warning(f"停止任务队列服务失败: {str(e)}")
+
+
+def start_background_services_election(ttl: int = 30, renew_interval: int = 10) -> LeaderElection:
+    """
+    参与后台服务Leader竞选，当选进程启动任务队列和AI任务轮询服务
+
+    在每个gunicorn worker（post_fork）或单进程启动脚本中调用；
+    失去Leader身份时自动停止这些服务。
+    """
+    global _background_election
+
+    if _background_election is not None:
+        return _background_election
+
+    election = LeaderElection("background_services", ttl=ttl, renew_interval=renew_interval)
+    election.on_elected(_start_background_services)
+    election.on_revoked(_stop_background_services)
+    election.start()
+    _background_election = election
+    logger.info(f"🗳️  进程 {os.getpid()} 已加入后台服务Leader竞选")
+    return election
+
+
+def release_background_services_leadership():
+    """释放后台服务Leader身份（gunicorn worker退出时调用）"""
+    global _background_election
+    if _background_election is not None:
+        _background_election.stop()
+        _background_election = None
+
+
+def is_background_services_leader() -> bool:
+    """当前进程是否为后台服务Leader"""
+    return _background_election is not None and _background_election.is_leader
@@ -16,11 +16,16 @@ from urllib.parse import urlencode
 
 import requests
 
+from app.services.http_client import get_http_client
+from app.services.upload_dedup import upload_once
+
 
 def upload_image_to_oss(image_path, order_number=None):
     """
     将本地图片上传到OSS获取公网URL（用于测试环境）
 
+    同一内容的图片只上传一次：按文件SHA-256复用已上传的URL（重试、多个任务共用）
+
     Args:
         image_path: 本地图片路径
         order_number: 订单号（用于生成OSS路径）
@@ -28,6 +33,22 @@ def upload_image_to_oss(image_path, order_number=None):
     Returns:
         tuple: (success: bool, public_url: str, error_message: str)
     """
+    errors = []
+
+    def _upload(_digest):
+        success, public_url, error_msg = _upload_image_to_oss_direct(image_path, order_number)
+        if not success:
+            errors.append(error_msg)
+        return public_url if success else None
+
+    public_url = upload_once('oss', image_path, _upload)
+    if public_url:
+        return True, public_url, None
+    return False, None, errors[0] if errors else 'OSS上传失败'
+
+
+def _upload_image_to_oss_direct(image_path, order_number=None):
+    """上传本地图片到OSS（不查询去重索引）"""
     try:
         # 尝试导入OSS配置
         try:
@@ -215,7 +236,7 @@ def call_meitu_api(image_path, preset_id, api_key, api_secret, api_base_url='htt
 
         # 5. 发送JSON请求
         try:
-            response = requests.post(
+            response = get_http_client('meitu').post(
                 request_url,
                 json=request_data,  # 使用json参数发送JSON数据
                 headers={'Content-Type': 'application/json'},
@@ -344,7 +365,7 @@ def download_result_image(image_url, order_number=None):
         str: 本地保存的图片路径
     """
     try:
-        response = requests.get(image_url, timeout=60, proxies={'http': None, 'https': None})
+        response = get_http_client('download').get(image_url, timeout=60, proxies={'http': None, 'https': None})
         if response.status_code == 200:
             # 保存到uploads/meitu_results目录
             uploads_dir = 'uploads'
@@ -389,10 +410,16 @@ def get_meitu_config(db=None, MeituAPIConfig=None):
             if hasattr(test_server_module, 'MeituAPIConfig'):
                 MeituAPIConfig = test_server_module.MeituAPIConfig
 
-    if not db or not MeituAPIConfig:
+    from app.services.config_registry import get_config_snapshot
+
+    snapshot = get_config_snapshot()
+    if snapshot is not None:
+        config = snapshot.get_active_meitu_config()
+    elif db and MeituAPIConfig:
+        config = MeituAPIConfig.query.filter_by(is_active=True).first()
+    else:
         return None
 
-    config = MeituAPIConfig.query.filter_by(is_active=True).first()
     if config:
         return {
             'app_id': config.app_id,
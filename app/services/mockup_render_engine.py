@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+样机套图渲染引擎
+
+- 模板缓存：每个渲染进程缓存解析后的 PSD（按 路径 + 修改时间 + 大小 + 智能对象图层名 区分），
+  并预合成智能对象下方/上方的图层；渲染时只重新合成智能对象所在区域
+- 无法安全拆分上下图层的模板（混合模式、蒙版、图层样式、调整图层等）退回整图合成
+- 进程池：渲染在独立进程中执行，不占用请求线程的 GIL；同一输出文件的并发请求合并为一次渲染
+- 内容寻址：输出文件名由 (模板内容, 智能对象图层名, 原图内容, 输出格式) 的哈希决定，
+  相同输入直接复用已生成的文件
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+try:
+    from psd_tools import PSDImage
+    from psd_tools.api.layers import SmartObjectLayer
+    from psd_tools.constants import BlendMode, ChannelID
+
+    PSD_TOOLS_AVAILABLE = True
+except ImportError:
+    PSD_TOOLS_AVAILABLE = False
+    PSDImage = None
+    SmartObjectLayer = None
+    BlendMode = None
+    ChannelID = None
+
+# 渲染算法变更时递增，使旧的内容寻址输出失效
+ENGINE_VERSION = 1
+
+RENDER_WORKERS = int(os.environ.get("MOCKUP_RENDER_WORKERS", "2"))
+RENDER_TIMEOUT = int(os.environ.get("MOCKUP_RENDER_TIMEOUT", "120"))
+TEMPLATE_CACHE_SIZE = int(os.environ.get("MOCKUP_TEMPLATE_CACHE_SIZE", "4"))
+
+# 可以参与快速合成的图层类型（调整图层等会影响下方所有像素，不能拆分）
+_SIMPLE_LAYER_KINDS = ("pixel", "shape", "type", "smartobject")
+
+_template_cache = OrderedDict()
+_template_lock = threading.Lock()
+
+_digest_cache = OrderedDict()
+_digest_lock = threading.Lock()
+_DIGEST_CACHE_SIZE = 256
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+# ============================================================================
+# 模板解析与缓存
+# ============================================================================
+
+
+def _is_normal_blend(layer, allow_pass_through=False):
+    allowed = [BlendMode.NORMAL]
+    if allow_pass_through:
+        allowed.append(BlendMode.PASS_THROUGH)
+    return layer.blend_mode in allowed
+
+
+def _fast_path_blocker(layers, smart_index):
+    """检查模板能否拆分为 下方 + 智能对象 + 上方 三部分合成，不能时返回原因"""
+    smart = layers[smart_index]
+    if not _is_normal_blend(smart) or smart.has_mask() or smart.has_effects():
+        return "智能对象图层使用了混合模式、蒙版或图层样式"
+    if smart.clipping or getattr(smart, "clip_layers", None):
+        return "智能对象图层存在剪贴蒙版"
+
+    parent = smart.parent
+    while parent is not None and parent.kind != "psdimage":
+        if (
+            not _is_normal_blend(parent, allow_pass_through=True)
+            or parent.opacity != 255
+            or parent.has_mask()
+            or parent.has_effects()
+        ):
+            return f"智能对象所在图层组 {parent.name} 使用了混合模式、不透明度、蒙版或图层样式"
+        parent = parent.parent
+
+    for layer in layers[smart_index + 1 :]:
+        if not layer.is_visible():
+            continue
+        if layer.is_group():
+            if not _is_normal_blend(layer, allow_pass_through=True):
+                return f"上方图层组 {layer.name} 使用了混合模式"
+            continue
+        if layer.kind not in _SIMPLE_LAYER_KINDS:
+            return f"上方存在调整/填充图层 {layer.name}"
+        if not _is_normal_blend(layer) or layer.has_effects():
+            return f"上方图层 {layer.name} 使用了混合模式或图层样式"
+    return None
+
+
+def _layer_filter(layer_ids):
+    def _filter(layer):
+        return layer.is_visible() and (layer.is_group() or id(layer) in layer_ids)
+
+    return _filter
+
+
+def _find_smart_layer(psd, smart_layer_name):
+    for layer in psd.descendants():
+        if isinstance(layer, SmartObjectLayer) and layer.name == smart_layer_name:
+            return layer
+    raise ValueError(f"未找到智能对象图层：{smart_layer_name}")
+
+
+class ParsedTemplate:
+    """解析后的样机模板（只读，可在同一进程内多次渲染复用）"""
+
+    def __init__(self, psd_path, smart_layer_name):
+        with open(psd_path, "rb") as f:
+            self.psd_bytes = f.read()
+        self.smart_layer_name = smart_layer_name
+
+        psd = PSDImage.open(io.BytesIO(self.psd_bytes))
+        layers = list(psd.descendants())
+        smart = _find_smart_layer(psd, smart_layer_name)
+        smart_index = next(i for i, layer in enumerate(layers) if layer is smart)
+
+        self.canvas_size = psd.size
+        self.fit_size = smart.size
+        self.layer_box = (smart.left, smart.top, smart.width, smart.height)
+        self.opacity = smart.opacity
+
+        self.fast_path_blocker = _fast_path_blocker(layers, smart_index)
+        self.static_image = None
+        if self.fast_path_blocker:
+            logger.info(f"样机模板 {psd_path} 使用整图合成: {self.fast_path_blocker}")
+            return
+
+        below_ids = {id(layer) for layer in layers[:smart_index] if not layer.is_group()}
+        above_ids = {id(layer) for layer in layers[smart_index + 1 :] if not layer.is_group()}
+        below = psd.composite(force=True, layer_filter=_layer_filter(below_ids)).convert("RGBA")
+        above = psd.composite(force=True, layer_filter=_layer_filter(above_ids)).convert("RGBA")
+
+        # 智能对象区域与画布的交集，渲染时只重新合成该区域
+        left, top, width, height = self.layer_box
+        canvas_w, canvas_h = self.canvas_size
+        self.region = (
+            max(left, 0),
+            max(top, 0),
+            min(left + width, canvas_w),
+            min(top + height, canvas_h),
+        )
+        self.static_image = Image.alpha_composite(below, above)
+        self.below_region = below.crop(self.region)
+        self.above_region = above.crop(self.region)
+
+    def open_psd(self):
+        """重新解析出可修改的 PSD 对象（整图合成 / 输出 PSD 时使用）"""
+        return PSDImage.open(io.BytesIO(self.psd_bytes))
+
+
+def get_parsed_template(psd_path, smart_layer_name):
+    """获取（必要时解析并缓存）模板，PSD 文件被替换后自动重新解析"""
+    stat = os.stat(psd_path)
+    key = (os.path.abspath(psd_path), stat.st_mtime_ns, stat.st_size, smart_layer_name)
+
+    with _template_lock:
+        template = _template_cache.get(key)
+        if template is not None:
+            _template_cache.move_to_end(key)
+            return template
+
+    template = ParsedTemplate(psd_path, smart_layer_name)
+    with _template_lock:
+        _template_cache[key] = template
+        _template_cache.move_to_end(key)
+        while len(_template_cache) > max(TEMPLATE_CACHE_SIZE, 1):
+            _template_cache.popitem(last=False)
+    return template
+
+
+# ============================================================================
+# 渲染
+# ============================================================================
+
+
+def _fit_image(image_path, fit_size, layer_size):
+    """等比例缩放 + 中心裁剪，适配智能对象尺寸（无拉伸）"""
+    new_img = Image.open(image_path).convert("RGB")
+    so_w, so_h = fit_size
+    scale = max(so_w / new_img.width, so_h / new_img.height)
+    new_w = int(new_img.width * scale)
+    new_h = int(new_img.height * scale)
+    scaled = new_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    crop_left = (scaled.width - so_w) // 2
+    crop_top = (scaled.height - so_h) // 2
+    crop_img = scaled.crop((crop_left, crop_top, crop_left + so_w, crop_top + so_h))
+    if crop_img.size != tuple(layer_size):
+        crop_img = crop_img.resize(tuple(layer_size), Image.Resampling.LANCZOS)
+    return crop_img
+
+
+def _flatten(image):
+    """RGBA 合成结果铺白底，转换为可保存为 JPG 的 RGB 图片"""
+    if image.mode == "RGB":
+        return image
+    image = image.convert("RGBA")
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def _render_fast(template, image_path):
+    left, top, width, height = template.layer_box
+    photo = _fit_image(image_path, template.fit_size, (width, height)).convert("RGBA")
+    if template.opacity != 255:
+        photo.putalpha(template.opacity)
+
+    x0, y0, x1, y1 = template.region
+    patch = template.below_region.copy()
+    patch.alpha_composite(photo.crop((x0 - left, y0 - top, x1 - left, y1 - top)))
+    patch.alpha_composite(template.above_region)
+
+    result = template.static_image.copy()
+    result.paste(patch, (x0, y0))
+    return result
+
+
+def _replace_smart_layer_pixels(psd, template, image_path):
+    """把智能对象图层的像素替换为用户图片（整图合成 / 输出 PSD 时使用）"""
+    layer = _find_smart_layer(psd, template.smart_layer_name)
+    w, h = layer.width, layer.height
+    rgb = _fit_image(image_path, template.fit_size, (w, h))
+
+    channels = {
+        ChannelID.TRANSPARENCY_MASK: b"\xff" * (w * h),
+        ChannelID.CHANNEL_0: rgb.getchannel("R").tobytes(),
+        ChannelID.CHANNEL_1: rgb.getchannel("G").tobytes(),
+        ChannelID.CHANNEL_2: rgb.getchannel("B").tobytes(),
+    }
+    for ci, cd in zip(layer._record.channel_info, layer._channels):
+        if ci.id in channels:
+            cd.set_data(channels[ci.id], w, h, psd.depth, psd.version)
+
+    # psd-tools 新版本改为公开方法 mark_updated
+    mark_updated = getattr(psd, "mark_updated", None) or getattr(psd, "_mark_updated")
+    mark_updated()
+
+
+def render_to_file(psd_path, smart_layer_name, image_path, output_path, output_format="jpg"):
+    """
+    在当前进程内渲染样机图并写入 output_path（先写临时文件再原子替换）
+
+    :return: True 成功
+    """
+    if not PSD_TOOLS_AVAILABLE:
+        raise RuntimeError("psd-tools 未安装，请执行: pip install psd-tools")
+
+    template = get_parsed_template(psd_path, smart_layer_name)
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if output_format == "psd":
+            psd = template.open_psd()
+            _replace_smart_layer_pixels(psd, template, image_path)
+            psd.save(tmp_path)
+        else:
+            if template.fast_path_blocker is None:
+                result = _render_fast(template, image_path)
+            else:
+                psd = template.open_psd()
+                _replace_smart_layer_pixels(psd, template, image_path)
+                result = psd.composite(force=True)
+            _flatten(result).save(tmp_path, format="JPEG", quality=95, optimize=True)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    return True
+
+
+# ============================================================================
+# 内容寻址输出
+# ============================================================================
+
+
+def file_digest(path):
+    """文件内容的 SHA-256（按 路径 + 修改时间 + 大小 缓存，避免重复读取大文件）"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+        if digest is not None:
+            _digest_cache.move_to_end(key)
+            return digest
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        _digest_cache[key] = digest
+        while len(_digest_cache) > _DIGEST_CACHE_SIZE:
+            _digest_cache.popitem(last=False)
+    return digest
+
+
+def output_filename(psd_path, smart_layer_name, image_path, output_format="jpg"):
+    """根据输入内容生成输出文件名：相同 (模板, 原图, 格式) 得到相同文件名"""
+    ext = "psd" if output_format == "psd" else "jpg"
+    source = ":".join(
+        [
+            str(ENGINE_VERSION),
+            file_digest(psd_path),
+            smart_layer_name,
+            file_digest(image_path),
+            ext,
+        ]
+    )
+    return f"mockup_{hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]}.{ext}"
+
+
+# ============================================================================
+# 进程池
+# ============================================================================
+
+
+def _create_executor():
+    from app.utils.process_pool import create_process_pool
+
+    # render_to_file 在 forkserver 工作进程中执行（不从多线程的Web进程直接 fork）
+    return create_process_pool(max(RENDER_WORKERS, 1), "MockupRender")
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = _create_executor()
+        return _executor
+
+
+def _reset_executor(broken):
+    """丢弃已损坏的进程池（工作进程被杀死等），下次提交时重建"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    try:
+        broken.shutdown(wait=False)
+    except Exception:
+        pass
+
+
+def _discard_broken_executor():
+    executor = _executor
+    if executor is not None and getattr(executor, "_broken", False):
+        _reset_executor(executor)
+
+
+def _submit_render(psd_path, smart_layer_name, image_path, output_path, output_format):
+    executor = _get_executor()
+    try:
+        return executor.submit(
+            render_to_file, psd_path, smart_layer_name, image_path, output_path, output_format
+        )
+    except (BrokenProcessPool, RuntimeError) as e:
+        logger.warning(f"⚠️  样机渲染进程池不可用，重建进程池: {e}")
+        _reset_executor(executor)
+        return _get_executor().submit(
+            render_to_file, psd_path, smart_layer_name, image_path, output_path, output_format
+        )
+
+
+def render_mockup(psd_path, smart_layer_name, image_path, output_path, output_format="jpg"):
+    """
+    渲染样机图到 output_path（output_path 应由 output_filename 生成）
+
+    输出文件已存在时直接返回；否则提交到进程池渲染，同一输出文件的并发请求共享一次渲染。
+
+    :return: True 成功；失败时抛出异常
+    """
+    if os.path.exists(output_path):
+        return True
+
+    with _inflight_lock:
+        future = _inflight.get(output_path)
+        if future is None:
+            future = _submit_render(
+                psd_path, smart_layer_name, image_path, output_path, output_format
+            )
+            _inflight[output_path] = future
+
+    try:
+        return future.result(timeout=RENDER_TIMEOUT)
+    except BrokenProcessPool:
+        _discard_broken_executor()
+        raise RuntimeError("样机渲染进程异常退出")
+    finally:
+        if future.done():
+            with _inflight_lock:
+                if _inflight.get(output_path) is future:
+                    del _inflight[output_path]
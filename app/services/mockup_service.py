@@ -2,34 +2,28 @@
 """
 样机套图服务
 基于 psd-tools 实现 PSD 智能对象替换，生成样机效果图
+渲染由 mockup_render_engine 完成（模板缓存 + 进程池 + 内容寻址输出）
 """
 
 import logging
 import os
-import uuid
 from urllib.parse import unquote
 
-from PIL import Image
+from app.services.mockup_render_engine import (
+    PSD_TOOLS_AVAILABLE,
+    PSDImage,
+    SmartObjectLayer,
+    output_filename,
+    render_mockup,
+    render_to_file,
+)
 
 logger = logging.getLogger(__name__)
 
-# 延迟导入 psd-tools（可选依赖）
-try:
-    from psd_tools import PSDImage
-    from psd_tools.api.layers import SmartObjectLayer
-    from psd_tools.constants import ChannelID
-
-    PSD_TOOLS_AVAILABLE = True
-except ImportError:
-    PSD_TOOLS_AVAILABLE = False
-    PSDImage = None
-    SmartObjectLayer = None
-    ChannelID = None
-
 
 def replace_psd_smart_object(psd_path, smart_layer_name, new_image_path, output_path, output_format="jpg"):
     """
-    替换 PSD 智能对象内容，生成套图
+    替换 PSD 智能对象内容，生成套图（在当前进程内渲染，模板解析结果会被缓存）
 
     :param psd_path: PSD 文件路径
     :param smart_layer_name: 智能对象图层名
@@ -38,60 +32,7 @@ def replace_psd_smart_object(psd_path, smart_layer_name, new_image_path, output_
     :param output_format: "psd" 保留图层，"jpg" 扁平图片
     :return: True 成功
     """
-    if not PSD_TOOLS_AVAILABLE:
-        raise RuntimeError("psd-tools 未安装，请执行: pip install psd-tools")
-
-    psd = PSDImage.open(psd_path)
-    target_smart_layer = None
-
-    for layer in psd.descendants():
-        if isinstance(layer, SmartObjectLayer) and layer.name == smart_layer_name:
-            target_smart_layer = layer
-            break
-
-    if not target_smart_layer:
-        raise ValueError(f"未找到智能对象图层：{smart_layer_name}")
-
-    # 处理用户原图：等比例缩放 + 中心裁剪，适配智能对象尺寸（无拉伸）
-    new_img = Image.open(new_image_path).convert("RGB")
-    so_w, so_h = target_smart_layer.size
-    scale = max(so_w / new_img.width, so_h / new_img.height)
-    new_w = int(new_img.width * scale)
-    new_h = int(new_img.height * scale)
-    scaled = new_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-    crop_left = (scaled.width - so_w) // 2
-    crop_top = (scaled.height - so_h) // 2
-    crop_img = scaled.crop((crop_left, crop_top, crop_left + so_w, crop_top + so_h))
-
-    w, h = target_smart_layer.width, target_smart_layer.height
-    crop_img = crop_img.resize((w, h), Image.Resampling.LANCZOS)
-    rgb = crop_img.convert("RGB")
-
-    r_data = rgb.getchannel("R").tobytes()
-    g_data = rgb.getchannel("G").tobytes()
-    b_data = rgb.getchannel("B").tobytes()
-    alpha_data = b"\xff" * (w * h)
-
-    depth = psd.depth
-    version = psd.version
-    for ci, cd in zip(target_smart_layer._record.channel_info, target_smart_layer._channels):
-        if ci.id == ChannelID.TRANSPARENCY_MASK:
-            cd.set_data(alpha_data, w, h, depth, version)
-        elif ci.id == ChannelID.CHANNEL_0:
-            cd.set_data(r_data, w, h, depth, version)
-        elif ci.id == ChannelID.CHANNEL_1:
-            cd.set_data(g_data, w, h, depth, version)
-        elif ci.id == ChannelID.CHANNEL_2:
-            cd.set_data(b_data, w, h, depth, version)
-
-    psd._mark_updated()
-
-    if output_format == "psd":
-        psd.save(output_path)
-    else:
-        final_img = psd.composite()
-        final_img.save(output_path, quality=95, optimize=True)
-    return True
+    return render_to_file(psd_path, smart_layer_name, new_image_path, output_path, output_format)
 
 
 def resolve_image_path_from_url(image_url, app):
@@ -162,6 +103,41 @@ def resolve_psd_path(psd_path, app):
     return psd_path if os.path.exists(psd_path) else None
 
 
+def get_mockup_output_dir(app):
+    """样机输出目录：MOCKUP_OUTPUT_FOLDER 或 data/mockup_output"""
+    output_dir = app.config.get("MOCKUP_OUTPUT_FOLDER")
+    if not output_dir:
+        output_dir = os.path.join(app.root_path, "data", "mockup_output")
+    if not os.path.isabs(output_dir):
+        output_dir = os.path.join(app.root_path, output_dir)
+    return output_dir
+
+
+def _render_mockup_output(template, psd_path, image_path, app, output_format="jpg"):
+    """
+    渲染样机图到内容寻址的输出文件（相同模板 + 原图 + 格式直接复用已生成的文件）
+
+    :return: (success, result_dict)
+    """
+    smart_layer_name = template.smart_layer_name or "photogo"
+    output_dir = get_mockup_output_dir(app)
+    os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        filename = output_filename(psd_path, smart_layer_name, image_path, output_format)
+        output_path = os.path.join(output_dir, filename)
+        render_mockup(psd_path, smart_layer_name, image_path, output_path, output_format)
+        # 生成可访问的 URL
+        return True, {
+            "preview_url": f"/public/mockup/{filename}",
+            "filepath": output_path,
+            "filename": filename,
+        }
+    except Exception as e:
+        logger.exception("样机生成失败: %s", e)
+        return False, {"error": str(e)}
+
+
 def generate_mockup(template, image_url, app, output_format="jpg"):
     """
     生成样机套图
@@ -183,37 +159,7 @@ def generate_mockup(template, image_url, app, output_format="jpg"):
     if not psd_path or not os.path.exists(psd_path):
         return False, {"error": "PSD 模板文件不存在"}
 
-    # 输出目录：data/mockup_output 或 MOCKUP_OUTPUT_FOLDER
-    output_dir = app.config.get("MOCKUP_OUTPUT_FOLDER")
-    if not output_dir:
-        output_dir = os.path.join(app.root_path, "data", "mockup_output")
-    if not os.path.isabs(output_dir):
-        output_dir = os.path.join(app.root_path, output_dir)
-
-    os.makedirs(output_dir, exist_ok=True)
-
-    ext = "psd" if output_format == "psd" else "jpg"
-    filename = f"mockup_{uuid.uuid4().hex[:12]}.{ext}"
-    output_path = os.path.join(output_dir, filename)
-
-    try:
-        replace_psd_smart_object(
-            psd_path,
-            template.smart_layer_name or "photogo",
-            image_path,
-            output_path,
-            output_format=output_format,
-        )
-        # 生成可访问的 URL
-        preview_url = f"/public/mockup/{filename}"
-        return True, {
-            "preview_url": preview_url,
-            "filepath": output_path,
-            "filename": filename,
-        }
-    except Exception as e:
-        logger.exception("样机生成失败: %s", e)
-        return False, {"error": str(e)}
+    return _render_mockup_output(template, psd_path, image_path, app, output_format)
 
 
 def generate_mockup_from_path(template, image_path, app, output_format="jpg"):
@@ -236,34 +182,7 @@ def generate_mockup_from_path(template, image_path, app, output_format="jpg"):
     if not psd_path or not os.path.exists(psd_path):
         return False, {"error": "PSD 模板文件不存在"}
 
-    output_dir = app.config.get("MOCKUP_OUTPUT_FOLDER")
-    if not output_dir:
-        output_dir = os.path.join(app.root_path, "data", "mockup_output")
-    if not os.path.isabs(output_dir):
-        output_dir = os.path.join(app.root_path, output_dir)
-
-    os.makedirs(output_dir, exist_ok=True)
-
-    ext = "psd" if output_format == "psd" else "jpg"
-    filename = f"mockup_{uuid.uuid4().hex[:12]}.{ext}"
-    output_path = os.path.join(output_dir, filename)
-
-    try:
-        replace_psd_smart_object(
-            psd_path,
-            template.smart_layer_name or "photogo",
-            image_path,
-            output_path,
-            output_format=output_format,
-        )
-        return True, {
-            "preview_url": f"/public/mockup/{filename}",
-            "filepath": output_path,
-            "filename": filename,
-        }
-    except Exception as e:
-        logger.exception("样机生成失败: %s", e)
-        return False, {"error": str(e)}
+    return _render_mockup_output(template, psd_path, image_path, app, output_format)
 
 
 def scan_psd_templates(directory):
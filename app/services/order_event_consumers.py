@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+订单事件的默认消费者（由 order_event_service 的消费线程调用）
+
+- wechat_new_order：新订单微信通知（原在创建订单的请求内发送；发送失败时重试）
+- order_completion_notification：订单完成后发送订单完成通知（原在小程序状态更新请求内发送）
+- printer_dispatch：订单进入高清放大（hd_ready）后发送到冲印系统（原在小程序状态更新请求内发送）
+"""
+
+import logging
+import os
+import sys
+
+from app.services.order_event_service import (
+    EVENT_ORDER_CREATED,
+    EVENT_STATUS_CHANGED,
+    register_order_event_consumer,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _get_order(event):
+    from app.models import Order
+
+    return Order.query.get(event["order_id"]) if event["order_id"] else None
+
+
+def notify_new_order(event):
+    """新订单微信通知"""
+    try:
+        from wechat_notification import get_wechat_notification
+    except ImportError:
+        return
+    wechat = get_wechat_notification()
+    if not wechat.enabled:
+        return
+    payload = event["payload"]
+    # 发送失败时抛出异常，由消费线程按退避重试
+    if not wechat.send_order_notification(
+        event["order_number"],
+        payload.get("customer_name"),
+        payload.get("total_price"),
+        payload.get("source") or "小程序",
+    ):
+        raise RuntimeError(f"订单微信通知发送失败: {event['order_number']}")
+    logger.info(f"✅ 订单微信通知已发送: {event['order_number']}")
+
+
+def notify_order_completed(event):
+    """订单完成通知（需确版且未确认的加盟商订单不发送）"""
+    if event["payload"].get("new_status") != "completed":
+        return
+    send_notification = getattr(
+        sys.modules.get("test_server"), "send_order_completion_notification_auto", None
+    )
+    order = _get_order(event)
+    if not send_notification or order is None:
+        return
+    if (
+        getattr(order, "franchisee_id", None)
+        and getattr(order, "need_confirmation", False)
+        and not getattr(order, "franchisee_confirmed", False)
+    ):
+        return
+    send_notification(order)
+
+
+def send_order_to_printer(order, app=None):
+    """
+    把订单高清图片发送到冲印系统，发送成功后订单状态改为 processing；
+    失败时记录到订单的 printer_send_status / printer_error_message
+    """
+    from app.models import db
+
+    if app is None:
+        app = getattr(sys.modules.get("test_server"), "app", None)
+    try:
+        from printer_client import PrinterSystemClient
+        from printer_config import PRINTER_SYSTEM_AVAILABLE, PRINTER_SYSTEM_CONFIG
+
+        if not (PRINTER_SYSTEM_AVAILABLE and PRINTER_SYSTEM_CONFIG.get("enabled", False)):
+            return
+        # 检查是否有高清图片
+        if not (hasattr(order, "hd_image") and order.hd_image):
+            logger.info(f"订单 {order.order_number} 没有高清图片，跳过冲印系统发送")
+            if hasattr(order, "printer_send_status"):
+                order.printer_send_status = "sent_failed"
+                order.printer_error_message = "订单没有高清图片"
+                db.session.commit()
+            return
+
+        hd_folder = app.config.get("HD_FOLDER", "hd_images") if app else "hd_images"
+        hd_image_path = os.path.join(hd_folder, order.hd_image)
+        if not os.path.exists(hd_image_path):
+            logger.info(f"订单 {order.order_number} 高清图片不存在: {hd_image_path}")
+            if hasattr(order, "printer_send_status"):
+                order.printer_send_status = "sent_failed"
+                order.printer_error_message = f"高清图片文件不存在: {hd_image_path}"
+                db.session.commit()
+            return
+
+        # 发送到冲印系统（传入order对象用于状态跟踪）
+        printer_client = PrinterSystemClient(PRINTER_SYSTEM_CONFIG)
+        result = printer_client.send_order_to_printer(order, hd_image_path, order_obj=order)
+        # 提交数据库更改（包括发送状态）
+        db.session.commit()
+
+        if result["success"]:
+            logger.info(f"订单 {order.order_number} 高清图片已成功发送到冲印系统")
+            # 发送成功后，更新状态为已发货
+            order.status = "processing"
+            db.session.commit()
+        else:
+            logger.info(
+                f"订单 {order.order_number} 高清图片发送到冲印系统失败: {result['message']}"
+            )
+    except ImportError:
+        logger.info("冲印系统模块未找到，跳过冲印系统发送")
+    except Exception as e:
+        logger.info(f"发送订单到冲印系统时发生错误: {str(e)}")
+        db.session.rollback()
+        if hasattr(order, "printer_send_status"):
+            order.printer_send_status = "sent_failed"
+            order.printer_error_message = f"发送异常: {str(e)}"
+            db.session.commit()
+
+
+def dispatch_to_printer(event):
+    """订单进入高清放大后发送到冲印系统（订单状态已被后续修改时跳过）"""
+    if event["payload"].get("new_status") != "hd_ready":
+        return
+    order = _get_order(event)
+    if order is None or order.status != "hd_ready":
+        return
+    send_order_to_printer(order)
+
+
+def register_default_order_event_consumers():
+    """注册默认消费者（可重复调用）"""
+    register_order_event_consumer("wechat_new_order", notify_new_order, [EVENT_ORDER_CREATED])
+    register_order_event_consumer(
+        "order_completion_notification", notify_order_completed, [EVENT_STATUS_CHANGED]
+    )
+    register_order_event_consumer("printer_dispatch", dispatch_to_printer, [EVENT_STATUS_CHANGED])
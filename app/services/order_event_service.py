@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+订单事件发件箱（transactional outbox）
+
+订单状态变化后的副作用（微信通知、订单完成通知、发送冲印系统等）原先在请求内同步执行，
+外部服务慢或失败时直接拖慢/影响状态更新请求。这里改为：
+
+- 写入：修改订单时调用 record_order_event()，事件行加入当前会话，随订单修改在同一事务提交；
+  请求只需等待数据库提交
+- 消费：后台服务Leader进程中的消费线程按事件ID顺序读取事件，分发给已注册的消费者；
+  每个消费者在 order_event_cursors 中保存自己的消费进度，互不影响
+- 批量：每轮每个消费者最多读取 ORDER_EVENT_BATCH 个事件
+- 重试：处理失败时停在该事件，按指数退避重试；连续失败 ORDER_EVENT_MAX_ATTEMPTS 次后记录错误并跳过
+- 事件ID空洞：并发事务可能晚于更大的ID提交，遇到空洞时等待 GAP_TIMEOUT 秒再越过
+  （超时仍未出现视为事务已回滚）
+- 新注册的消费者：还没有任何消费进度时（首次部署）从第一个事件开始，请求进程在Leader
+  首次运行前写入的事件不会丢失；已有其他消费者时从其中最慢的进度开始，不会重放更早的历史事件
+- 所有消费者都已处理且超过保留期的事件定期清理
+
+处理语义为至少一次：消费者需容忍重复处理（进程在处理完成、保存进度前退出时会重复）。
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_ORDER_CREATED = "order.created"
+EVENT_STATUS_CHANGED = "order.status_changed"
+
+# 无新事件时的轮询间隔（毫秒）
+POLL_INTERVAL = int(os.environ.get("ORDER_EVENT_POLL_MS", "500")) / 1000
+# 每轮每个消费者最多处理的事件数
+BATCH_SIZE = int(os.environ.get("ORDER_EVENT_BATCH", "100"))
+# 同一事件最多处理次数（超出后跳过）
+MAX_ATTEMPTS = int(os.environ.get("ORDER_EVENT_MAX_ATTEMPTS", "5"))
+RETRY_BASE = 2  # 首次重试等待（秒）
+RETRY_MAX = 300  # 最长重试等待（秒）
+# 事件ID空洞的最长等待时间（秒）
+GAP_TIMEOUT = 10
+# 已消费事件的保留时间和清理间隔
+RETENTION = timedelta(days=7)
+PURGE_INTERVAL = 3600
+
+
+class OrderEventConsumer:
+    """订单事件消费者"""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Dict], None],
+        event_types: Optional[Iterable[str]] = None,
+        batch_size: Optional[int] = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.event_types = frozenset(event_types) if event_types else None
+        self.batch_size = batch_size or BATCH_SIZE
+        # 运行状态（仅消费线程访问）
+        self.retry_at = 0.0
+        self.gap_seen_at = None
+        self.counters = {"processed": 0, "failed": 0, "skipped": 0}
+
+    def accepts(self, event_type: str) -> bool:
+        return self.event_types is None or event_type in self.event_types
+
+
+_consumers: Dict[str, OrderEventConsumer] = {}
+_consumers_lock = threading.Lock()
+
+_worker_thread: Optional[threading.Thread] = None
+_worker_stop = threading.Event()
+_wakeup = threading.Event()
+
+
+def register_order_event_consumer(
+    name: str,
+    handler: Callable[[Dict], None],
+    event_types: Optional[Iterable[str]] = None,
+    batch_size: Optional[int] = None,
+) -> OrderEventConsumer:
+    """
+    注册订单事件消费者（同名重复注册时替换处理函数）
+
+    Args:
+        name: 消费者名称（消费进度按名称保存，改名等同于新消费者）
+        handler: 处理函数，参数为事件字典
+            {id, order_id, order_number, event_type, payload, created_at}；抛出异常表示处理失败
+        event_types: 只处理这些类型的事件，为空表示全部
+        batch_size: 每轮最多处理的事件数
+    """
+    consumer = OrderEventConsumer(name, handler, event_types, batch_size)
+    with _consumers_lock:
+        existing = _consumers.get(name)
+        if existing is not None:
+            # 保留运行状态（重试等待、计数）
+            consumer.retry_at = existing.retry_at
+            consumer.gap_seen_at = existing.gap_seen_at
+            consumer.counters = existing.counters
+        _consumers[name] = consumer
+    return consumer
+
+
+# ============================================================================
+# 写入
+# ============================================================================
+
+
+def record_order_event(order, event_type: str, **payload):
+    """
+    记录订单事件：加入当前会话，随调用方的 commit 与订单修改一起提交（本函数不提交）
+
+    Args:
+        order: Order 实例（新建订单会先 flush 以获得ID）
+        event_type: 事件类型（EVENT_*）
+        **payload: 事件数据（需可JSON序列化）
+    """
+    from app.models import OrderEvent, db
+
+    if order.id is None:
+        db.session.flush()
+    event = OrderEvent(
+        order_id=order.id,
+        order_number=order.order_number,
+        event_type=event_type,
+        payload=json.dumps(payload, ensure_ascii=False, default=str),
+    )
+    db.session.add(event)
+    return event
+
+
+def record_status_change(order, old_status, source: Optional[str] = None):
+    """记录订单状态变化事件（状态未变化时不记录）"""
+    if old_status == order.status:
+        return None
+    return record_order_event(
+        order, EVENT_STATUS_CHANGED, old_status=old_status, new_status=order.status, source=source
+    )
+
+
+# ============================================================================
+# 消费
+# ============================================================================
+
+
+def _to_dict(event) -> Dict:
+    try:
+        payload = json.loads(event.payload) if event.payload else {}
+    except (TypeError, ValueError):
+        payload = {}
+    return {
+        "id": event.id,
+        "order_id": event.order_id,
+        "order_number": event.order_number,
+        "event_type": event.event_type,
+        "payload": payload,
+        "created_at": event.created_at,
+    }
+
+
+def _get_cursor(name: str):
+    """读取消费进度，不存在时从已有消费者中最慢的进度开始（没有任何消费者时从头开始）"""
+    from sqlalchemy import func
+
+    from app.models import OrderEventCursor, db
+
+    cursor = OrderEventCursor.query.filter_by(consumer=name).first()
+    if cursor is None:
+        start = db.session.query(func.min(OrderEventCursor.last_event_id)).scalar() or 0
+        cursor = OrderEventCursor(consumer=name, last_event_id=start, attempts=0)
+        db.session.add(cursor)
+        db.session.commit()
+        logger.info(f"📮 [订单事件] 新消费者 {name} 从事件 {start} 之后开始消费")
+    return cursor
+
+
+def _visible_events(consumer: OrderEventConsumer, last_event_id: int) -> list:
+    """
+    读取可以处理的事件：从 last_event_id 之后连续的ID开始，
+    遇到空洞时等待 GAP_TIMEOUT 秒（可能是尚未提交的并发事务）
+    """
+    from app.models import OrderEvent
+
+    events = (
+        OrderEvent.query.filter(OrderEvent.id > last_event_id)
+        .order_by(OrderEvent.id.asc())
+        .limit(consumer.batch_size)
+        .all()
+    )
+    visible = []
+    expected = last_event_id + 1
+    for event in events:
+        if event.id != expected:
+            now = time.monotonic()
+            if consumer.gap_seen_at is None:
+                consumer.gap_seen_at = now
+            if now - consumer.gap_seen_at < GAP_TIMEOUT:
+                break
+            logger.debug(f"[订单事件] 越过事件ID空洞 {expected}..{event.id - 1}")
+        consumer.gap_seen_at = None
+        visible.append(event)
+        expected = event.id + 1
+    return visible
+
+
+def _run_consumer(consumer: OrderEventConsumer) -> int:
+    """处理一批事件，返回处理的事件数"""
+    from app.models import db
+
+    if time.monotonic() < consumer.retry_at:
+        return 0
+
+    cursor = _get_cursor(consumer.name)
+    # 先转为字典：处理函数和保存进度时的提交会使ORM对象过期
+    events = [_to_dict(event) for event in _visible_events(consumer, cursor.last_event_id)]
+    processed = 0
+    for event in events:
+        if not consumer.accepts(event["event_type"]):
+            cursor.last_event_id = event["id"]
+            continue
+        try:
+            consumer.handler(event)
+        except Exception as e:
+            db.session.rollback()
+            cursor.attempts = (cursor.attempts or 0) + 1
+            cursor.last_error = str(e)[:1000]
+            consumer.counters["failed"] += 1
+            if cursor.attempts < MAX_ATTEMPTS:
+                delay = min(RETRY_BASE * 2 ** (cursor.attempts - 1), RETRY_MAX)
+                consumer.retry_at = time.monotonic() + delay
+                logger.warning(
+                    f"⚠️  [订单事件] {consumer.name} 处理事件 {event['id']} 失败"
+                    f"（第{cursor.attempts}次，{delay}秒后重试）: {e}"
+                )
+                db.session.commit()
+                return processed
+            logger.error(
+                f"❌ [订单事件] {consumer.name} 处理事件 {event['id']} 连续失败"
+                f" {cursor.attempts} 次，跳过: {e}"
+            )
+            consumer.counters["skipped"] += 1
+        else:
+            consumer.counters["processed"] += 1
+            processed += 1
+        cursor.attempts = 0
+        cursor.last_event_id = event["id"]
+        # 处理后立即保存进度，减少进程退出时的重复处理
+        db.session.commit()
+    db.session.commit()
+    return processed
+
+
+def purge_order_events(retention: timedelta = RETENTION) -> int:
+    """清理所有消费者都已处理且超过保留期的事件"""
+    from sqlalchemy import func
+
+    from app.models import OrderEvent, OrderEventCursor, db
+
+    with _consumers_lock:
+        names = list(_consumers)
+    if not names:
+        return 0
+    consumed = (
+        db.session.query(func.min(OrderEventCursor.last_event_id))
+        .filter(OrderEventCursor.consumer.in_(names))
+        .scalar()
+    )
+    if not consumed:
+        return 0
+    deleted = OrderEvent.query.filter(
+        OrderEvent.id <= consumed, OrderEvent.created_at < datetime.now() - retention
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def _app_context():
+    import contextlib
+
+    if "test_server" in sys.modules and hasattr(sys.modules["test_server"], "app"):
+        return sys.modules["test_server"].app.app_context()
+    return contextlib.nullcontext()
+
+
+def run_order_event_consumers_once() -> int:
+    """所有消费者各处理一批事件（需在应用上下文中调用），返回处理的事件数"""
+    from app.models import db
+
+    with _consumers_lock:
+        consumers = list(_consumers.values())
+    processed = 0
+    for consumer in consumers:
+        try:
+            processed += _run_consumer(consumer)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"⚠️  [订单事件] 消费者 {consumer.name} 运行失败: {e}")
+    return processed
+
+
+def _worker_loop():
+    last_purge = time.monotonic()
+    while not _worker_stop.is_set():
+        processed = 0
+        try:
+            with _app_context():
+                processed = run_order_event_consumers_once()
+                if time.monotonic() - last_purge >= PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    purged = purge_order_events()
+                    if purged:
+                        logger.info(f"🧹 [订单事件] 已清理 {purged} 个已消费事件")
+        except Exception as e:
+            logger.warning(f"⚠️  [订单事件] 消费线程异常: {e}")
+        if not processed:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+
+
+def start_order_event_runner():
+    """启动订单事件消费线程（仅在后台服务Leader进程中运行）"""
+    global _worker_thread
+
+    from app.services.order_event_consumers import register_default_order_event_consumers
+
+    register_default_order_event_consumers()
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+    _worker_stop.clear()
+    _worker_thread = threading.Thread(target=_worker_loop, daemon=True, name="OrderEventRunner")
+    _worker_thread.start()
+    logger.info(f"📮 [订单事件] 消费线程已启动，消费者: {', '.join(_consumers)}")
+
+
+def stop_order_event_runner():
+    global _worker_thread
+
+    _worker_stop.set()
+    _wakeup.set()
+    _worker_thread = None
+
+
+def get_order_event_stats() -> Dict:
+    """各消费者的消费进度、积压和失败情况"""
+    from sqlalchemy import func
+
+    from app.models import OrderEvent, OrderEventCursor, db
+
+    latest = db.session.query(func.max(OrderEvent.id)).scalar() or 0
+    cursors = {cursor.consumer: cursor for cursor in OrderEventCursor.query.all()}
+    with _consumers_lock:
+        consumers = list(_consumers.values())
+    stats = {"latest_event_id": latest, "running": _worker_thread is not None, "consumers": {}}
+    for consumer in consumers:
+        cursor = cursors.get(consumer.name)
+        last_event_id = cursor.last_event_id if cursor else latest
+        stats["consumers"][consumer.name] = {
+            **consumer.counters,
+            "last_event_id": last_event_id,
+            "lag": latest - last_event_id,
+            "attempts": cursor.attempts if cursor else 0,
+            "last_error": cursor.last_error if cursor else None,
+        }
+    return stats
@@ -0,0 +1,722 @@
+# -*- coding: utf-8 -*-
+"""
+订单业绩预聚合服务
+按小时/按天、加盟商、数据来源、订单模式维护已完成订单的数量和金额，
+仪表盘类统计直接读取分桶，不再对订单表做 func.date(...) 全表聚合
+
+- 增量：Order 的 ORM 插入/更新/删除时，在同一事务内对受影响分桶做加减
+- 补偿：批量 UPDATE（query.update）等绕过ORM事件的修改由后台对账任务修正，
+  对账任务定期按订单表重算最近时间窗口的分桶；全量回填尚未完成时先做一次全量回填
+- 全量回填全部提交后写入完成标记行（granularity = READY_GRANULARITY），
+  没有完成标记时统计直接查询订单表（增量写入的分桶不代表历史数据已回填）
+- 统计口径与原仪表盘一致：status == 'completed'，按 completed_at 归属时间，金额为 price
+
+订单状态计数（OrderStatusRollup）：按加盟商、当前状态、是否有打印错误计数，供仪表盘的累计订单数和
+各状态订单数使用。同样由ORM事件增量维护；对账任务每次整体重算（一次 GROUP BY），
+重算结果与完成标记行（status = STATUS_READY_MARKER）在同一事务提交，没有标记行时统计直接查询订单表。
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY_HOUR = "hour"
+GRANULARITY_DAY = "day"
+GRANULARITIES = (GRANULARITY_HOUR, GRANULARITY_DAY)
+
+# 全量回填完成标记行（不参与统计查询）
+READY_GRANULARITY = "ready"
+READY_BUCKET_START = datetime(1970, 1, 1)
+
+# 状态计数的完成标记行（不参与统计查询）
+STATUS_READY_MARKER = "__ready__"
+
+# 影响统计结果的订单字段
+_TRACKED_ATTRIBUTES = (
+    "status",
+    "completed_at",
+    "price",
+    "franchisee_id",
+    "source_type",
+    "order_mode",
+    "printer_error_message",
+)
+
+# 对账任务：间隔和重算窗口
+RECONCILE_INTERVAL = 600
+RECONCILE_WINDOW = timedelta(days=2)
+# 全量回填时每批处理的时间跨度
+BACKFILL_CHUNK = timedelta(days=7)
+
+_listeners_registered = False
+_rollup_ready = False
+_status_rollup_ready = False
+
+_worker_thread: Optional[threading.Thread] = None
+_worker_stop = threading.Event()
+
+
+def _get_models():
+    from app.models import Order, OrderRevenueRollup
+
+    return Order, OrderRevenueRollup
+
+
+def _bucket_start(value: datetime, granularity: str) -> datetime:
+    if granularity == GRANULARITY_DAY:
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _dimensions(franchisee_id, source_type, order_mode) -> Tuple[int, str, str]:
+    return (franchisee_id or 0, source_type or "", order_mode or "")
+
+
+def _contribution(values: Dict) -> Optional[Tuple[datetime, Tuple[int, str, str], float]]:
+    """订单对分桶的贡献：(完成时间, 维度, 金额)，不计入统计时返回None"""
+    if values.get("status") != "completed" or not values.get("completed_at"):
+        return None
+    dims = _dimensions(
+        values.get("franchisee_id"), values.get("source_type"), values.get("order_mode")
+    )
+    return values["completed_at"], dims, float(values.get("price") or 0)
+
+
+def _status_key(values: Dict) -> Tuple[int, str, bool]:
+    """订单在状态计数中的键：(加盟商ID, 状态, 是否有打印错误)"""
+    return (
+        values.get("franchisee_id") or 0,
+        values.get("status") or "",
+        values.get("printer_error_message") is not None,
+    )
+
+
+def _add_delta(deltas, contribution, sign: int):
+    if contribution is None:
+        return
+    completed_at, dims, amount = contribution
+    for granularity in GRANULARITIES:
+        key = (granularity, _bucket_start(completed_at, granularity)) + dims
+        deltas[key][0] += sign
+        deltas[key][1] += sign * amount
+
+
+def _current_values(target) -> Dict:
+    return {name: getattr(target, name, None) for name in _TRACKED_ATTRIBUTES}
+
+
+def _previous_values(target) -> Dict:
+    """从属性历史中取出本次flush之前的值"""
+    from sqlalchemy import inspect as sa_inspect
+
+    state = sa_inspect(target)
+    values = {}
+    for name in _TRACKED_ATTRIBUTES:
+        history = state.attrs[name].history
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            values[name] = getattr(target, name, None)
+    return values
+
+
+def _upsert_bucket(connection, rollup_table, key, count_delta: int, revenue_delta: float):
+    """对单个分桶累加增量（PostgreSQL/SQLite 使用 ON CONFLICT，其他数据库先UPDATE后INSERT）"""
+    granularity, bucket_start, franchisee_id, source_type, order_mode = key
+    row = {
+        "granularity": granularity,
+        "bucket_start": bucket_start,
+        "franchisee_id": franchisee_id,
+        "source_type": source_type,
+        "order_mode": order_mode,
+        "order_count": count_delta,
+        "revenue": revenue_delta,
+        "updated_at": datetime.now(),
+    }
+    dialect = connection.dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(rollup_table).values(**row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                "granularity",
+                "bucket_start",
+                "franchisee_id",
+                "source_type",
+                "order_mode",
+            ],
+            set_={
+                "order_count": rollup_table.c.order_count + count_delta,
+                "revenue": rollup_table.c.revenue + revenue_delta,
+                "updated_at": row["updated_at"],
+            },
+        )
+        connection.execute(stmt)
+        return
+
+    result = connection.execute(
+        rollup_table.update()
+        .where(
+            rollup_table.c.granularity == granularity,
+            rollup_table.c.bucket_start == bucket_start,
+            rollup_table.c.franchisee_id == franchisee_id,
+            rollup_table.c.source_type == source_type,
+            rollup_table.c.order_mode == order_mode,
+        )
+        .values(
+            order_count=rollup_table.c.order_count + count_delta,
+            revenue=rollup_table.c.revenue + revenue_delta,
+            updated_at=row["updated_at"],
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(rollup_table.insert().values(**row))
+
+
+def _upsert_status_count(connection, status_table, key, count_delta: int):
+    """对单个状态计数累加增量（同 _upsert_bucket）"""
+    franchisee_id, status, has_printer_error = key
+    row = {
+        "franchisee_id": franchisee_id,
+        "status": status,
+        "has_printer_error": has_printer_error,
+        "order_count": count_delta,
+        "updated_at": datetime.now(),
+    }
+    dialect = connection.dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(status_table).values(**row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["franchisee_id", "status", "has_printer_error"],
+            set_={
+                "order_count": status_table.c.order_count + count_delta,
+                "updated_at": row["updated_at"],
+            },
+        )
+        connection.execute(stmt)
+        return
+
+    result = connection.execute(
+        status_table.update()
+        .where(
+            status_table.c.franchisee_id == franchisee_id,
+            status_table.c.status == status,
+            status_table.c.has_printer_error == has_printer_error,
+        )
+        .values(
+            order_count=status_table.c.order_count + count_delta,
+            updated_at=row["updated_at"],
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(status_table.insert().values(**row))
+
+
+def _apply_deltas(connection, deltas, status_deltas=None):
+    status_deltas = {key: delta for key, delta in (status_deltas or {}).items() if delta}
+    if not deltas and not status_deltas:
+        return
+    from app.models import OrderStatusRollup
+
+    _, OrderRevenueRollup = _get_models()
+    rollup_table = OrderRevenueRollup.__table__
+    try:
+        # 使用保存点：分桶更新失败不影响订单本身的写入，由对账任务补偿
+        with connection.begin_nested():
+            for key, (count_delta, revenue_delta) in deltas.items():
+                if count_delta == 0 and abs(revenue_delta) < 1e-9:
+                    continue
+                _upsert_bucket(connection, rollup_table, key, count_delta, revenue_delta)
+            for key, count_delta in status_deltas.items():
+                _upsert_status_count(connection, OrderStatusRollup.__table__, key, count_delta)
+    except Exception as e:
+        logger.warning(f"⚠️  [业绩预聚合] 增量更新分桶失败，等待对账任务修正: {e}")
+
+
+def _on_order_insert(mapper, connection, target):
+    current = _current_values(target)
+    deltas = defaultdict(lambda: [0, 0.0])
+    _add_delta(deltas, _contribution(current), 1)
+    _apply_deltas(connection, deltas, {_status_key(current): 1})
+
+
+def _on_order_update(mapper, connection, target):
+    previous = _previous_values(target)
+    current = _current_values(target)
+    if previous == current:
+        return
+    deltas = defaultdict(lambda: [0, 0.0])
+    _add_delta(deltas, _contribution(previous), -1)
+    _add_delta(deltas, _contribution(current), 1)
+    status_deltas = defaultdict(int)
+    status_deltas[_status_key(previous)] -= 1
+    status_deltas[_status_key(current)] += 1
+    _apply_deltas(connection, deltas, status_deltas)
+
+
+def _on_order_delete(mapper, connection, target):
+    previous = _previous_values(target)
+    deltas = defaultdict(lambda: [0, 0.0])
+    _add_delta(deltas, _contribution(previous), -1)
+    _apply_deltas(connection, deltas, {_status_key(previous): -1})
+
+
+def _noop_set_listener(target, value, oldvalue, initiator):
+    pass
+
+
+def register_order_rollup_listeners():
+    """注册订单写入时增量维护分桶的ORM事件（可重复调用）"""
+    global _listeners_registered
+
+    if _listeners_registered:
+        return
+    from sqlalchemy import event
+
+    Order, _ = _get_models()
+
+    # active_history：未加载的字段被直接赋值时也先取出旧值，保证能正确扣减原分桶
+    for name in _TRACKED_ATTRIBUTES:
+        event.listen(getattr(Order, name), "set", _noop_set_listener, active_history=True)
+    event.listen(Order, "after_insert", _on_order_insert)
+    event.listen(Order, "after_update", _on_order_update)
+    event.listen(Order, "after_delete", _on_order_delete)
+    _listeners_registered = True
+
+
+# ============================================================================
+# 重算（对账 / 全量回填）
+# ============================================================================
+
+
+def rebuild_order_rollups(start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    """
+    按订单表重算 [start, end) 范围内的分桶（需在应用上下文中调用）
+
+    start/end 会对齐到整天；都为空时全量重建。返回参与统计的订单数。
+    """
+    from app.models import db
+
+    Order, OrderRevenueRollup = _get_models()
+
+    if start is None:
+        first = (
+            db.session.query(Order.completed_at)
+            .filter(Order.status == "completed", Order.completed_at.isnot(None))
+            .order_by(Order.completed_at.asc())
+            .first()
+        )
+        start = first[0] if first else datetime.now()
+    if end is None:
+        end = datetime.now() + timedelta(days=1)
+    start = _bucket_start(start, GRANULARITY_DAY)
+    end = _bucket_start(end + timedelta(days=1) - timedelta(microseconds=1), GRANULARITY_DAY)
+
+    total = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + BACKFILL_CHUNK, end)
+        total += _rebuild_range(db, Order, OrderRevenueRollup, chunk_start, chunk_end)
+        chunk_start = chunk_end
+    return total
+
+
+def _rebuild_range(db, Order, OrderRevenueRollup, start: datetime, end: datetime) -> int:
+    deltas = defaultdict(lambda: [0, 0.0])
+    rows = (
+        db.session.query(
+            Order.completed_at,
+            Order.price,
+            Order.franchisee_id,
+            Order.source_type,
+            Order.order_mode,
+        )
+        .filter(
+            Order.status == "completed",
+            Order.completed_at >= start,
+            Order.completed_at < end,
+        )
+        .yield_per(2000)
+    )
+    count = 0
+    for completed_at, price, franchisee_id, source_type, order_mode in rows:
+        dims = _dimensions(franchisee_id, source_type, order_mode)
+        _add_delta(deltas, (completed_at, dims, float(price or 0)), 1)
+        count += 1
+
+    try:
+        OrderRevenueRollup.query.filter(
+            OrderRevenueRollup.granularity.in_(GRANULARITIES),
+            OrderRevenueRollup.bucket_start >= start,
+            OrderRevenueRollup.bucket_start < end,
+        ).delete(synchronize_session=False)
+        now = datetime.now()
+        db.session.bulk_insert_mappings(
+            OrderRevenueRollup,
+            [
+                {
+                    "granularity": key[0],
+                    "bucket_start": key[1],
+                    "franchisee_id": key[2],
+                    "source_type": key[3],
+                    "order_mode": key[4],
+                    "order_count": order_count,
+                    "revenue": revenue,
+                    "updated_at": now,
+                }
+                for key, (order_count, revenue) in deltas.items()
+            ],
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return count
+
+
+def _has_ready_marker() -> bool:
+    _, OrderRevenueRollup = _get_models()
+    return (
+        OrderRevenueRollup.query.filter_by(
+            granularity=READY_GRANULARITY, bucket_start=READY_BUCKET_START
+        ).first()
+        is not None
+    )
+
+
+def _mark_rollup_ready():
+    """全量回填提交后写入完成标记"""
+    from app.models import db
+
+    _, OrderRevenueRollup = _get_models()
+    if _has_ready_marker():
+        return
+    db.session.add(
+        OrderRevenueRollup(
+            granularity=READY_GRANULARITY,
+            bucket_start=READY_BUCKET_START,
+            franchisee_id=0,
+            source_type="",
+            order_mode="",
+            order_count=0,
+            revenue=0.0,
+        )
+    )
+    db.session.commit()
+
+
+def rebuild_status_rollups() -> int:
+    """
+    按订单表整体重算状态计数（需在应用上下文中调用），返回订单数
+
+    重算结果与完成标记行在同一事务中替换原有数据
+    """
+    from sqlalchemy import func
+
+    from app.models import OrderStatusRollup, db
+
+    Order, _ = _get_models()
+    has_printer_error = Order.printer_error_message.isnot(None)
+    rows = (
+        db.session.query(Order.franchisee_id, Order.status, has_printer_error, func.count(Order.id))
+        .group_by(Order.franchisee_id, Order.status, has_printer_error)
+        .all()
+    )
+    counts = defaultdict(int)
+    for franchisee_id, status, printer_error, order_count in rows:
+        key = _status_key(
+            {
+                "franchisee_id": franchisee_id,
+                "status": status,
+                "printer_error_message": "" if printer_error else None,
+            }
+        )
+        counts[key] += order_count
+    # 完成标记行
+    counts[(0, STATUS_READY_MARKER, False)] = 0
+
+    try:
+        OrderStatusRollup.query.delete(synchronize_session=False)
+        now = datetime.now()
+        db.session.bulk_insert_mappings(
+            OrderStatusRollup,
+            [
+                {
+                    "franchisee_id": franchisee_id,
+                    "status": status,
+                    "has_printer_error": printer_error,
+                    "order_count": order_count,
+                    "updated_at": now,
+                }
+                for (franchisee_id, status, printer_error), order_count in counts.items()
+            ],
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return sum(counts.values())
+
+
+def reconcile_recent_rollups(window: timedelta = RECONCILE_WINDOW) -> int:
+    """重算最近时间窗口的分桶和全部状态计数；全量回填未完成（含中断）时先做全量回填"""
+    global _rollup_ready, _status_rollup_ready
+
+    if not _has_ready_marker():
+        logger.info("📊 [业绩预聚合] 尚未完成全量回填，开始全量回填")
+        count = rebuild_order_rollups()
+        _mark_rollup_ready()
+        logger.info(f"✅ [业绩预聚合] 全量回填完成，共 {count} 个完成订单")
+    else:
+        count = rebuild_order_rollups(datetime.now() - window, None)
+    _rollup_ready = True
+
+    rebuild_status_rollups()
+    _status_rollup_ready = True
+    return count
+
+
+def _app_context():
+    import contextlib
+    import sys
+
+    if "test_server" in sys.modules and hasattr(sys.modules["test_server"], "app"):
+        return sys.modules["test_server"].app.app_context()
+    return contextlib.nullcontext()
+
+
+def _worker_loop():
+    while not _worker_stop.is_set():
+        try:
+            with _app_context():
+                reconcile_recent_rollups()
+        except Exception as e:
+            logger.error(f"[业绩预聚合] 对账失败: {e}")
+        _worker_stop.wait(RECONCILE_INTERVAL)
+
+
+def start_order_rollup_worker():
+    """启动后台对账线程（仅在后台服务Leader进程中运行）"""
+    global _worker_thread
+
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+    _worker_stop.clear()
+    _worker_thread = threading.Thread(target=_worker_loop, daemon=True, name="OrderRollupWorker")
+    _worker_thread.start()
+    logger.info("📊 [业绩预聚合] 对账线程已启动")
+
+
+def stop_order_rollup_worker():
+    global _worker_thread
+
+    _worker_stop.set()
+    _worker_thread = None
+
+
+# ============================================================================
+# 查询
+# ============================================================================
+
+
+def _is_rollup_ready() -> bool:
+    """分桶是否可用：全量回填已完成（存在完成标记）"""
+    global _rollup_ready
+
+    if not _rollup_ready and _has_ready_marker():
+        _rollup_ready = True
+    return _rollup_ready
+
+
+def get_order_status_counts(franchisee_id: Optional[int] = None) -> Optional[Dict]:
+    """
+    各状态的订单数（当前状态）
+
+    Returns:
+        {(状态, 是否有打印错误): 订单数}，状态为空时为 ''；状态计数尚未重算完成时返回None
+    """
+    global _status_rollup_ready
+
+    from sqlalchemy import func
+
+    from app.models import OrderStatusRollup, db
+
+    if not _status_rollup_ready:
+        marker = OrderStatusRollup.query.filter_by(
+            franchisee_id=0, status=STATUS_READY_MARKER
+        ).first()
+        if marker is None:
+            return None
+        _status_rollup_ready = True
+
+    query = db.session.query(
+        OrderStatusRollup.status,
+        OrderStatusRollup.has_printer_error,
+        func.sum(OrderStatusRollup.order_count),
+    ).filter(OrderStatusRollup.status != STATUS_READY_MARKER)
+    if franchisee_id is not None:
+        query = query.filter(OrderStatusRollup.franchisee_id == franchisee_id)
+    rows = query.group_by(OrderStatusRollup.status, OrderStatusRollup.has_printer_error).all()
+    return {(status, bool(printer_error)): int(count or 0) for status, printer_error, count in rows}
+
+
+def _to_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+
+def get_revenue_summary(
+    start=None,
+    end=None,
+    franchisee_id: Optional[int] = None,
+    source_type: Optional[str] = None,
+    order_mode: Optional[str] = None,
+) -> Dict:
+    """
+    统计 [start, end) 内完成订单的数量和金额
+
+    Args:
+        start/end: date 或 datetime，为空表示不限；整天边界读取按天分桶，
+            否则按小时分桶（边界向外对齐到整点）
+        franchisee_id/source_type/order_mode: 维度过滤，为空表示不限
+
+    Returns:
+        {"order_count": int, "revenue": float}
+    """
+    from sqlalchemy import func
+
+    from app.models import db
+
+    Order, OrderRevenueRollup = _get_models()
+    start = _to_datetime(start)
+    end = _to_datetime(end)
+
+    if not _is_rollup_ready():
+        # 分桶尚未回填完成：直接查订单表（使用可命中索引的范围条件）
+        query = db.session.query(func.count(Order.id), func.sum(Order.price)).filter(
+            Order.status == "completed", Order.completed_at.isnot(None)
+        )
+        if start is not None:
+            query = query.filter(Order.completed_at >= start)
+        if end is not None:
+            query = query.filter(Order.completed_at < end)
+        if franchisee_id is not None:
+            query = query.filter(Order.franchisee_id == franchisee_id)
+        if source_type is not None:
+            query = query.filter(Order.source_type == source_type)
+        if order_mode is not None:
+            query = query.filter(Order.order_mode == order_mode)
+        order_count, revenue = query.one()
+        return {"order_count": int(order_count or 0), "revenue": float(revenue or 0.0)}
+
+    day_aligned = all(
+        value is None or value == _bucket_start(value, GRANULARITY_DAY) for value in (start, end)
+    )
+    granularity = GRANULARITY_DAY if day_aligned else GRANULARITY_HOUR
+
+    query = db.session.query(
+        func.sum(OrderRevenueRollup.order_count), func.sum(OrderRevenueRollup.revenue)
+    ).filter(OrderRevenueRollup.granularity == granularity)
+    if start is not None:
+        query = query.filter(OrderRevenueRollup.bucket_start >= _bucket_start(start, granularity))
+    if end is not None:
+        query = query.filter(OrderRevenueRollup.bucket_start < end)
+    if franchisee_id is not None:
+        query = query.filter(OrderRevenueRollup.franchisee_id == franchisee_id)
+    if source_type is not None:
+        query = query.filter(OrderRevenueRollup.source_type == source_type)
+    if order_mode is not None:
+        query = query.filter(OrderRevenueRollup.order_mode == order_mode)
+    order_count, revenue = query.one()
+    return {"order_count": int(order_count or 0), "revenue": float(revenue or 0.0)}
+
+
+def get_revenue(start=None, end=None, franchisee_id: Optional[int] = None) -> float:
+    """统计 [start, end) 内完成订单的金额"""
+    return get_revenue_summary(start, end, franchisee_id=franchisee_id)["revenue"]
+
+
+def get_revenue_buckets(ranges: Dict[str, Tuple], franchisee_id: Optional[int] = None) -> Dict:
+    """
+    一次查询统计多个 [start, end) 区间的完成订单金额（条件聚合）
+
+    Args:
+        ranges: 名称 -> (start, end)，start/end 为空表示不限
+        franchisee_id: 为空表示全部加盟商
+
+    Returns:
+        名称 -> 金额
+    """
+    from sqlalchemy import and_, case, func
+
+    from app.models import db
+
+    Order, OrderRevenueRollup = _get_models()
+    ranges = {
+        name: (_to_datetime(start), _to_datetime(end)) for name, (start, end) in ranges.items()
+    }
+    if not ranges:
+        return {}
+
+    granularity = None
+    if _is_rollup_ready():
+        bounds = [value for pair in ranges.values() for value in pair if value is not None]
+        granularity = (
+            GRANULARITY_DAY
+            if all(value == _bucket_start(value, GRANULARITY_DAY) for value in bounds)
+            else GRANULARITY_HOUR
+        )
+        time_column = OrderRevenueRollup.bucket_start
+        value_column = OrderRevenueRollup.revenue
+        filters = [OrderRevenueRollup.granularity == granularity]
+        if franchisee_id is not None:
+            filters.append(OrderRevenueRollup.franchisee_id == franchisee_id)
+    else:
+        # 分桶尚未回填完成：直接查订单表
+        time_column = Order.completed_at
+        value_column = Order.price
+        filters = [Order.status == "completed", Order.completed_at.isnot(None)]
+        if franchisee_id is not None:
+            filters.append(Order.franchisee_id == franchisee_id)
+
+    def align(value):
+        # 分桶起点向下对齐，使包含 start 的分桶计入
+        return _bucket_start(value, granularity) if granularity else value
+
+    columns = []
+    for start, end in ranges.values():
+        conditions = []
+        if start is not None:
+            conditions.append(time_column >= align(start))
+        if end is not None:
+            conditions.append(time_column < end)
+        amount = case((and_(*conditions), value_column), else_=0) if conditions else value_column
+        columns.append(func.sum(amount))
+
+    # 所有区间都有起点时只扫描最早起点之后的数据
+    starts = [start for start, _ in ranges.values()]
+    if all(start is not None for start in starts):
+        filters.append(time_column >= align(min(starts)))
+
+    row = db.session.query(*columns).filter(*filters).one()
+    return {name: float(value or 0.0) for name, value in zip(ranges, row)}
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+订单搜索服务
+按订单号、客户姓名、客户电话做包含匹配（原各路由直接 LIKE '%关键词%'，无法使用B树索引，每次搜索都全表扫描）
+
+- PostgreSQL：三个字段上建 pg_trgm GIN 索引，LIKE '%关键词%' 直接命中索引
+- 其他数据库（SQLite 等）：维护 order_search_grams n-gram 索引表，先按 n-gram 取候选订单，
+  再对候选订单做 LIKE 校验，结果与原 LIKE 完全一致
+- 不足3个字符的关键词无法使用 n-gram，退化为原 LIKE 查询
+- 排序：订单号完全匹配 > 任一字段前缀匹配 > 包含匹配
+
+n-gram 表在订单 ORM 插入/更新/删除时同步维护；首次启用时由后台线程全量回填，回填完成前使用 LIKE 查询。
+"""
+
+import logging
+import threading
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ("order_number", "customer_name", "customer_phone")
+GRAM_SIZE = 3
+# 回填时每批处理的订单数
+BACKFILL_BATCH = 2000
+# 回填完成标记（order_id=0 的行）
+READY_FIELD = "_ready"
+
+# PostgreSQL pg_trgm 索引：索引名 -> 字段
+TRGM_INDEXES = {
+    "idx_order_order_number_trgm": "order_number",
+    "idx_order_customer_name_trgm": "customer_name",
+    "idx_order_customer_phone_trgm": "customer_phone",
+}
+
+_listeners_registered = False
+_index_ready = False
+_worker_thread: Optional[threading.Thread] = None
+
+
+def _get_models():
+    from app.models import Order, OrderSearchGram
+
+    return Order, OrderSearchGram
+
+
+def _dialect_name() -> str:
+    from app.models import db
+
+    return db.engine.dialect.name
+
+
+def make_grams(value) -> set:
+    """字符串的小写 n-gram 集合（长度不足时为空）"""
+    if not value:
+        return set()
+    text = str(value).lower()
+    return {text[i : i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# ============================================================================
+# 查询
+# ============================================================================
+
+
+def _like_conditions(Order, term: str, fields: Iterable[str], prefix: bool = False):
+    pattern = f"{_escape_like(term)}%" if prefix else f"%{_escape_like(term)}%"
+    return [getattr(Order, field).like(pattern, escape="\\") for field in fields]
+
+
+def _is_index_ready() -> bool:
+    """n-gram 表是否已回填完成"""
+    global _index_ready
+
+    if _index_ready:
+        return True
+    _, OrderSearchGram = _get_models()
+    if OrderSearchGram.query.filter_by(order_id=0, field=READY_FIELD).first() is not None:
+        _index_ready = True
+    return _index_ready
+
+
+def order_search_condition(term: str, fields: Iterable[str] = SEARCH_FIELDS):
+    """
+    订单搜索过滤条件：任一字段包含关键词
+
+    可直接用于 filter()，包括按订单号分组的统计/分页子查询
+    """
+    from sqlalchemy import func, or_, select
+
+    Order, OrderSearchGram = _get_models()
+    term = (term or "").strip()
+    fields = tuple(fields)
+    condition = or_(*_like_conditions(Order, term, fields))
+
+    grams = make_grams(term)
+    if not grams or _dialect_name() == "postgresql" or not _is_index_ready():
+        return condition
+
+    candidates = (
+        select(OrderSearchGram.order_id)
+        .where(OrderSearchGram.gram.in_(sorted(grams)), OrderSearchGram.field.in_(fields))
+        .group_by(OrderSearchGram.order_id, OrderSearchGram.field)
+        .having(func.count(func.distinct(OrderSearchGram.gram)) == len(grams))
+    )
+    return Order.id.in_(candidates) & condition
+
+
+def order_search_rank(term: str, fields: Iterable[str] = SEARCH_FIELDS):
+    """
+    搜索结果排序表达式（越小越靠前）：0 订单号完全匹配，1 前缀匹配，2 包含匹配
+
+    按订单号分组的查询中使用 func.min(order_search_rank(...))
+    """
+    from sqlalchemy import case, or_
+
+    Order, _ = _get_models()
+    term = (term or "").strip()
+    fields = tuple(fields)
+    whens = []
+    if "order_number" in fields:
+        whens.append((Order.order_number == term, 0))
+    whens.append((or_(*_like_conditions(Order, term, fields, prefix=True)), 1))
+    return case(*whens, else_=2)
+
+
+def search_orders(
+    term: str,
+    franchisee_id: Optional[int] = None,
+    query=None,
+    fields: Iterable[str] = SEARCH_FIELDS,
+    limit: Optional[int] = None,
+):
+    """
+    搜索订单（订单号 / 客户姓名 / 客户电话 包含关键词），完全匹配和前缀匹配排在前面
+
+    Args:
+        term: 关键词
+        franchisee_id: 只搜索该加盟商的订单
+        query: 在该查询上追加条件（默认 Order.query）；调用方可继续追加排序作为次级排序
+        fields: 参与匹配的字段
+        limit: 最多返回条数
+
+    Returns:
+        追加了搜索条件和排序的查询
+    """
+    Order, _ = _get_models()
+    if query is None:
+        query = Order.query
+    if franchisee_id is not None:
+        query = query.filter(Order.franchisee_id == franchisee_id)
+    query = query.filter(order_search_condition(term, fields)).order_by(
+        order_search_rank(term, fields)
+    )
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+# ============================================================================
+# n-gram 索引维护
+# ============================================================================
+
+
+def _gram_rows(order_id, values) -> list:
+    return [
+        {"gram": gram, "field": field, "order_id": order_id}
+        for field in SEARCH_FIELDS
+        for gram in make_grams(values.get(field))
+    ]
+
+
+def _replace_grams(connection, target, delete: bool, insert: bool):
+    if connection.dialect.name == "postgresql":
+        return
+    _, OrderSearchGram = _get_models()
+    table = OrderSearchGram.__table__
+    try:
+        # 使用保存点：索引维护失败不影响订单本身的写入
+        with connection.begin_nested():
+            if delete:
+                connection.execute(table.delete().where(table.c.order_id == target.id))
+            if insert:
+                rows = _gram_rows(
+                    target.id, {field: getattr(target, field, None) for field in SEARCH_FIELDS}
+                )
+                if rows:
+                    connection.execute(table.insert(), rows)
+    except Exception as e:
+        logger.warning(f"⚠️  [订单搜索] 更新订单 {target.id} 的n-gram索引失败: {e}")
+
+
+def _on_order_insert(mapper, connection, target):
+    _replace_grams(connection, target, delete=False, insert=True)
+
+
+def _on_order_update(mapper, connection, target):
+    from sqlalchemy import inspect as sa_inspect
+
+    state = sa_inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in SEARCH_FIELDS):
+        _replace_grams(connection, target, delete=True, insert=True)
+
+
+def _on_order_delete(mapper, connection, target):
+    _replace_grams(connection, target, delete=True, insert=False)
+
+
+def register_order_search_listeners():
+    """注册订单写入时维护n-gram索引的ORM事件（可重复调用；PostgreSQL 下事件直接跳过）"""
+    global _listeners_registered
+
+    if _listeners_registered:
+        return
+    from sqlalchemy import event
+
+    Order, _ = _get_models()
+    event.listen(Order, "after_insert", _on_order_insert)
+    event.listen(Order, "after_update", _on_order_update)
+    event.listen(Order, "after_delete", _on_order_delete)
+    _listeners_registered = True
+
+
+def rebuild_order_search_index() -> int:
+    """按订单表全量重建n-gram索引（需在应用上下文中调用），返回处理的订单数"""
+    global _index_ready
+
+    from app.models import db
+
+    Order, OrderSearchGram = _get_models()
+    table = OrderSearchGram.__table__
+
+    db.session.execute(table.delete())
+    db.session.commit()
+    _index_ready = False
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(
+                Order.id, Order.order_number, Order.customer_name, Order.customer_phone
+            )
+            .filter(Order.id > last_id)
+            .order_by(Order.id.asc())
+            .limit(BACKFILL_BATCH)
+            .all()
+        )
+        if not rows:
+            break
+        grams = []
+        for order_id, order_number, customer_name, customer_phone in rows:
+            grams.extend(
+                _gram_rows(
+                    order_id,
+                    {
+                        "order_number": order_number,
+                        "customer_name": customer_name,
+                        "customer_phone": customer_phone,
+                    },
+                )
+            )
+        if grams:
+            db.session.execute(table.insert(), grams)
+        db.session.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+
+    db.session.execute(table.insert(), [{"gram": "", "field": READY_FIELD, "order_id": 0}])
+    db.session.commit()
+    _index_ready = True
+    return total
+
+
+def _ensure_trgm_indexes():
+    """PostgreSQL：创建 pg_trgm 扩展和 GIN 索引（CONCURRENTLY，不阻塞订单写入）"""
+    from sqlalchemy import text
+
+    from app.models import db
+
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for index_name, field in TRGM_INDEXES.items():
+            connection.execute(
+                text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+                    f"ON orders USING gin ({field} gin_trgm_ops)"
+                )
+            )
+
+
+def ensure_order_search_index():
+    """建立搜索索引：PostgreSQL 建 pg_trgm 索引，其他数据库在n-gram表未回填时全量回填"""
+    if _dialect_name() == "postgresql":
+        _ensure_trgm_indexes()
+        logger.info("✅ [订单搜索] pg_trgm 索引已就绪")
+        return
+    if _is_index_ready():
+        return
+    logger.info("🔎 [订单搜索] 开始回填n-gram索引")
+    count = rebuild_order_search_index()
+    logger.info(f"✅ [订单搜索] n-gram索引回填完成，共 {count} 个订单")
+
+
+def _app_context():
+    import contextlib
+    import sys
+
+    if "test_server" in sys.modules and hasattr(sys.modules["test_server"], "app"):
+        return sys.modules["test_server"].app.app_context()
+    return contextlib.nullcontext()
+
+
+def _worker():
+    try:
+        with _app_context():
+            ensure_order_search_index()
+    except Exception as e:
+        logger.warning(f"⚠️  [订单搜索] 建立搜索索引失败，继续使用LIKE查询: {e}")
+
+
+def start_order_search_index_worker():
+    """后台建立搜索索引（仅在后台服务Leader进程中运行）"""
+    global _worker_thread
+
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+    _worker_thread = threading.Thread(target=_worker, daemon=True, name="OrderSearchIndexer")
+    _worker_thread.start()
@@ -1166,7 +1166,7 @@ def check_order_for_verification(order_id, machine_serial_number=None):
         return False, None, f"检查订单失败: {str(e)}"
 
 
-def upload_order_photos(order_id, photos_data, machine_serial_number=None):
+def upload_order_photos(order_id, photos_data, machine_serial_number=None, start_processing=False):
     """
     上传订单照片（用于安卓APP拍摄后回传）
 
@@ -1174,6 +1174,7 @@ def upload_order_photos(order_id, photos_data, machine_serial_number=None):
         order_id: 订单号
         photos_data: 照片数据列表（包含文件对象）
         machine_serial_number: 自拍机序列号（可选）
+        start_processing: 是否提交后台图片处理（美图API + AI工作流），"立即制作"订单不处理
 
     Returns:
         tuple: (success: bool, result: dict, error_message: str)
@@ -1242,6 +1243,15 @@ def upload_order_photos(order_id, photos_data, machine_serial_number=None):
 
         db.session.commit()
 
+        if start_processing and uploaded_files and order.order_mode != "making":
+            try:
+                from app.services.image_processing_executor import submit_order_image_processing
+
+                if not submit_order_image_processing(order):
+                    logger.warning(f"订单 {order.order_number} 图片处理队列已满，未能排队")
+            except Exception as e:
+                logger.warning(f"启动图片处理流程失败: {str(e)}")
+
         return (
             True,
             {
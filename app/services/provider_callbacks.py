@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+"""
+服务商完成回调（webhook）
+
+原先 RunningHub / nano-banana 提交时固定传 webHook=-1，美图不传 repost_url，任务完成与否全靠轮询。
+配置了回调地址（provider_callback_base_url）后：
+
+- 提交任务时带上签名回调URL：{base}/api/provider-callbacks/{provider}?ref={本地任务ref}&sig={签名}
+  签名为 HMAC-SHA256(provider:ref)，密钥为 provider_callback_secret（未配置时使用应用 SECRET_KEY）
+- 回调到达后按服务商任务ID找到任务：
+  - 回调声明失败：通过 safe_update_task_status 加锁转换为 failed（已结束的任务不会被改写，重复回调无副作用）
+  - 其他情况：立即调度一次状态查询（向服务商核实结果，复用轮询的结果解析与下载逻辑）
+  - 美图：回调中带结果URL时直接加锁转换为 success 并记录结果
+- 注册了回调的任务，轮询只作为兜底：超过 provider_callback_grace_seconds 仍未回调时才开始轮询，
+  且轮询间隔不小于 provider_callback_fallback_interval
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# api_type -> (回调路径中的服务商名, 请求体中的回调字段)
+CALLBACK_PROVIDERS = {
+    "runninghub-rhart-edit": ("runninghub", "webHook"),
+    "runninghub-comfyui-workflow": ("runninghub", "webhookUrl"),
+    "nano-banana": ("nano-banana", "webHook"),
+}
+MEITU_PROVIDER = "meitu"
+
+# 回调地址配置缓存时间（秒）
+SETTINGS_TTL = 30
+DEFAULT_GRACE_SECONDS = 60
+DEFAULT_FALLBACK_INTERVAL = 30
+
+_settings_cache = {"settings": None, "loaded_at": 0.0}
+_settings_lock = threading.Lock()
+
+# 回调触发的状态查询在后台线程执行（轮询引擎未运行时），线程池首次使用时创建
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"received": 0, "rejected": 0, "ignored": 0, "failed": 0, "completed": 0, "polled": 0}
+
+
+def _incr_stat(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=4, thread_name_prefix="provider-callback"
+                )
+    return _executor
+
+
+def _reset_after_fork():
+    """fork 出的子进程中线程池的工作线程不存在，重新创建锁并在首次使用时重建线程池"""
+    global _executor, _executor_lock, _in_flight_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _in_flight.clear()
+    _in_flight_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_callback_settings():
+    """回调配置（按 SETTINGS_TTL 缓存）"""
+    with _settings_lock:
+        cached = _settings_cache["settings"]
+        if cached is not None and time.time() - _settings_cache["loaded_at"] < SETTINGS_TTL:
+            return cached
+
+    from app.utils.config_loader import get_config_value, get_int_config
+
+    base_url = (get_config_value("provider_callback_base_url", "") or "").strip().rstrip("/")
+    settings = {
+        "base_url": base_url or os.environ.get("PROVIDER_CALLBACK_BASE_URL", "").rstrip("/"),
+        "secret": get_config_value("provider_callback_secret", "") or "",
+        "grace_seconds": get_int_config("provider_callback_grace_seconds", DEFAULT_GRACE_SECONDS),
+        "fallback_interval": get_int_config(
+            "provider_callback_fallback_interval", DEFAULT_FALLBACK_INTERVAL
+        ),
+    }
+    with _settings_lock:
+        _settings_cache["settings"] = settings
+        _settings_cache["loaded_at"] = time.time()
+    return settings
+
+
+def invalidate_callback_settings():
+    """清除回调配置缓存（修改配置后调用）"""
+    with _settings_lock:
+        _settings_cache["settings"] = None
+
+
+def _secret():
+    secret = get_callback_settings()["secret"]
+    if secret:
+        return secret
+    try:
+        from flask import current_app
+
+        return current_app.config.get("SECRET_KEY") or ""
+    except RuntimeError:
+        return os.environ.get("SECRET_KEY", "")
+
+
+def sign_callback(provider, ref):
+    """回调签名：HMAC-SHA256(provider:ref)"""
+    return hmac.new(
+        _secret().encode("utf-8"), f"{provider}:{ref}".encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def verify_callback(provider, ref, signature):
+    """校验回调签名"""
+    if not ref or not signature or not _secret():
+        return False
+    return hmac.compare_digest(sign_callback(provider, ref), signature)
+
+
+def build_callback_url(provider, ref):
+    """
+    签名回调URL；未配置回调地址时返回None（保持原有纯轮询方式）
+
+    :param provider: 服务商名（runninghub / nano-banana / meitu）
+    :param ref: 本地任务ref（AI任务为 processing_log 中的 task_id，美图为订单号）
+    """
+    base_url = get_callback_settings()["base_url"]
+    if not base_url or not ref or not _secret():
+        return None
+    query = urlencode({"ref": ref, "sig": sign_callback(provider, ref)})
+    return f"{base_url}/api/provider-callbacks/{provider}?{query}"
+
+
+def attach_ai_task_callback(api_type, request_data, ref):
+    """
+    为支持回调的服务商在请求体中填写回调URL
+
+    Returns:
+        str|None: 回调URL（未启用回调时为None）
+    """
+    provider_field = CALLBACK_PROVIDERS.get(api_type)
+    if not provider_field or not isinstance(request_data, dict):
+        return None
+    callback_url = build_callback_url(provider_field[0], ref)
+    if callback_url:
+        request_data[provider_field[1]] = callback_url
+    return callback_url
+
+
+def has_registered_callback(processing_log):
+    """任务提交时是否注册了完成回调（见 ai_provider_service._new_api_task）"""
+    return bool(processing_log) and '"callback_registered": true' in processing_log
+
+
+def callback_due_at(created_ts, wait_seconds, has_callback):
+    """注册了回调的任务推迟到回调超时后才开始兜底轮询"""
+    if not has_callback:
+        return created_ts + wait_seconds
+    return created_ts + max(wait_seconds, get_callback_settings()["grace_seconds"])
+
+
+def fallback_poll_interval(interval, has_callback):
+    """注册了回调的任务兜底轮询间隔"""
+    if not has_callback:
+        return interval
+    return max(interval, get_callback_settings()["fallback_interval"])
+
+
+def meitu_poll_cutoff_seconds(default_seconds):
+    """美图任务开始轮询前的等待秒数（启用回调时延长到回调超时）"""
+    if not get_callback_settings()["base_url"]:
+        return default_seconds
+    return max(default_seconds, get_callback_settings()["grace_seconds"])
+
+
+def _parse_json(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (ValueError, TypeError):
+            return None
+    return value
+
+
+def _provider_task_id(payload):
+    """回调中的服务商任务ID"""
+    for key in ("taskId", "task_id", "id"):
+        if payload.get(key):
+            return str(payload[key])
+    data = payload.get("data")
+    if isinstance(data, dict):
+        for key in ("taskId", "task_id", "id"):
+            if data.get(key):
+                return str(data[key])
+    return None
+
+
+def _callback_failure(payload):
+    """回调声明任务失败时返回错误信息，否则返回None"""
+    status = str(payload.get("status") or "").lower()
+    if status in ("failed", "failure", "error"):
+        return payload.get("failure_reason") or payload.get("error") or "服务商回调：任务失败"
+
+    # RunningHub：eventData 为 JSON 字符串，code 非0表示失败
+    event_data = _parse_json(payload.get("eventData"))
+    if isinstance(event_data, dict) and event_data.get("code") not in (None, 0, "0"):
+        return event_data.get("msg") or f"服务商回调：任务失败（code={event_data.get('code')}）"
+    return None
+
+
+def _find_ai_task(ref, payload, AITask):
+    """按服务商任务ID或本地ref找到回调对应的任务，并核对ref"""
+    candidates = []
+    provider_task_id = _provider_task_id(payload)
+    if provider_task_id:
+        candidates = AITask.query.filter(AITask.comfyui_prompt_id == provider_task_id).all()
+    if not candidates:
+        # 服务商任务ID尚未保存（回调早于任务提交完成）或回调中没有任务ID
+        candidates = AITask.query.filter(AITask.processing_log.contains(ref)).limit(5).all()
+
+    for task in candidates:
+        api_info = _parse_json(task.processing_log)
+        if isinstance(api_info, dict) and api_info.get("task_id") == ref:
+            return task
+    return None
+
+
+def _schedule_verified_poll(task, api_config):
+    """立即向服务商查询一次任务状态（结果解析、下载与轮询共用）"""
+    from app.services import ai_task_polling_service
+    from app.services.ai_task_poller_pool import resolve_provider_key
+
+    engine = ai_task_polling_service._poller_engine
+    if engine is not None and engine.is_running:
+        provider_key = resolve_provider_key(api_config.api_type if api_config else None, False)
+        engine.schedule(task.id, provider_key)
+        return
+
+    with _in_flight_lock:
+        if task.id in _in_flight:
+            return
+        _in_flight.add(task.id)
+
+    def run(task_id):
+        try:
+            ai_task_polling_service.poll_ai_task_once(task_id)
+        except Exception as e:
+            logger.warning(f"[服务商回调] 查询任务 {task_id} 状态失败: {str(e)}")
+        finally:
+            with _in_flight_lock:
+                _in_flight.discard(task_id)
+
+    _get_executor().submit(run, task.id)
+
+
+def handle_ai_task_callback(provider, ref, payload):
+    """
+    处理 RunningHub / nano-banana 的任务完成回调（需在应用上下文中调用，签名已校验）
+
+    Returns:
+        tuple: (处理结果, 说明)，处理结果为 failed / polled / ignored
+    """
+    from app.utils.task_lock_utils import safe_update_task_status
+
+    test_server_module = sys.modules["test_server"]
+    db = test_server_module.db
+    AITask = test_server_module.AITask
+    APIProviderConfig = test_server_module.APIProviderConfig
+
+    task = _find_ai_task(ref, payload, AITask)
+    if task is None:
+        _incr_stat("ignored")
+        return "ignored", "未找到对应任务（将由兜底轮询处理）"
+    if task.status not in ["pending", "processing"]:
+        _incr_stat("ignored")
+        return "ignored", f"任务已结束（{task.status}）"
+
+    error_message = _callback_failure(payload)
+    if error_message:
+        updated = safe_update_task_status(
+            task.id,
+            "failed",
+            db,
+            AITask,
+            check_status=["pending", "processing"],
+            fields={
+                "error_message": f"[{provider}] {str(error_message)[:500]}",
+                "completed_at": datetime.now(),
+            },
+        )
+        _incr_stat("failed" if updated else "ignored")
+        logger.info(f"📨 [服务商回调] 任务 {task.id} 回调失败: {error_message}")
+        return ("failed", "任务已标记为失败") if updated else ("ignored", "任务状态已变化")
+
+    api_info = _parse_json(task.processing_log) or {}
+    api_config = (
+        APIProviderConfig.query.get(api_info.get("api_config_id"))
+        if isinstance(api_info, dict) and api_info.get("api_config_id")
+        else None
+    )
+    _schedule_verified_poll(task, api_config)
+    _incr_stat("polled")
+    logger.info(f"📨 [服务商回调] 任务 {task.id} 收到完成回调，立即查询结果")
+    return "polled", "已调度结果查询"
+
+
+def _meitu_result(payload):
+    """解析美图回调：返回 (结果URL, 错误信息)"""
+    data = payload.get("data") if isinstance(payload.get("data"), dict) else payload
+    result_url = (
+        data.get("media_data")
+        or data.get("result_url")
+        or data.get("result_image")
+        or data.get("url")
+    )
+    if result_url:
+        return result_url, None
+    status = str(data.get("status") or "").lower()
+    code = payload.get("code")
+    if status in ("failed", "error") or code not in (None, 0, "0"):
+        return None, data.get("message") or payload.get("message") or "美图回调：任务失败"
+    return None, None
+
+
+def handle_meitu_callback(ref, payload):
+    """
+    处理美图 repost_url 回调（需在应用上下文中调用，签名已校验）
+
+    Returns:
+        tuple: (处理结果, 说明)，处理结果为 completed / failed / ignored
+    """
+    from app.utils.task_lock_utils import safe_update_task_status
+
+    test_server_module = sys.modules["test_server"]
+    db = test_server_module.db
+    MeituAPICallLog = test_server_module.MeituAPICallLog
+
+    msg_id = payload.get("msg_id") or (payload.get("data") or {}).get("msg_id")
+    log = MeituAPICallLog.query.filter_by(msg_id=msg_id).first() if msg_id else None
+    if log is None or log.order_number != ref:
+        _incr_stat("ignored")
+        return "ignored", "未找到对应的美图任务（将由兜底轮询处理）"
+    if log.status != "pending":
+        _incr_stat("ignored")
+        return "ignored", f"任务已结束（{log.status}）"
+
+    result_url, error_message = _meitu_result(payload)
+    if not result_url and not error_message:
+        _incr_stat("ignored")
+        return "ignored", "回调未包含结果（将由兜底轮询处理）"
+
+    fields = {"response_data": json.dumps(payload, ensure_ascii=False)}
+    if log.created_at:
+        fields["duration_ms"] = int((datetime.now() - log.created_at).total_seconds() * 1000)
+    if result_url:
+        fields["result_image_url"] = result_url
+    else:
+        fields["error_message"] = str(error_message)[:500]
+
+    new_status = "success" if result_url else "failed"
+    updated = safe_update_task_status(
+        log.id, new_status, db, MeituAPICallLog, check_status=["pending"], fields=fields
+    )
+    if not updated:
+        _incr_stat("ignored")
+        return "ignored", "任务状态已变化"
+
+    logger.info(f"📨 [服务商回调] 美图任务 {log.id} 回调完成: {new_status}")
+    if result_url:
+        _incr_stat("completed")
+        from app.services.result_pipeline import submit_meitu_result
+
+        submit_meitu_result(log.id, result_url, name=log.id)
+        return "completed", "任务已完成"
+    _incr_stat("failed")
+    return "failed", "任务已标记为失败"
+
+
+def handle_provider_callback(provider, ref, signature, payload):
+    """
+    回调入口（需在应用上下文中调用）
+
+    Returns:
+        tuple: (HTTP状态码, 处理结果, 说明)
+    """
+    _incr_stat("received")
+    if not verify_callback(provider, ref, signature):
+        _incr_stat("rejected")
+        logger.warning(f"[服务商回调] 签名校验失败: provider={provider}, ref={ref}")
+        return 403, "rejected", "签名无效"
+    if not isinstance(payload, dict):
+        _incr_stat("ignored")
+        return 400, "ignored", "回调数据格式错误"
+
+    if provider == MEITU_PROVIDER:
+        result, message = handle_meitu_callback(ref, payload)
+    elif provider in {item[0] for item in CALLBACK_PROVIDERS.values()}:
+        result, message = handle_ai_task_callback(provider, ref, payload)
+    else:
+        _incr_stat("rejected")
+        return 404, "rejected", f"不支持的服务商: {provider}"
+    return 200, result, message
+
+
+def get_callback_stats():
+    """回调统计（当前进程）"""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+"""
+服务商网关（asyncio）
+
+同步出图API（如 gemini-native / T8Star）一次请求可能持续数分钟（read_timeout=480），
+在 gunicorn sync worker 或后台线程中同步等待会长期占用工作进程 / 线程。开启网关后
+（配置 provider_gateway_enabled=true 或环境变量 PROVIDER_GATEWAY_ENABLED=1）：
+
+1. Web进程照常构建请求（下载图片、编码payload），但不发送：共享HTTP客户端的请求被接管，
+   最终的HTTP请求（URL、请求头、请求体、超时、代理）与AI任务在同一事务中写入 provider_gateway_jobs，
+   任务保持 processing 状态后立即返回；
+2. 独立的网关进程用 asyncio + aiohttp 领取并发送请求，数千个长请求只占用同等数量的协程：
+
+       python -m app.services.provider_gateway
+
+3. 收到响应后网关回写请求结果，并复用 create_api_task 的同步结果解析逻辑更新AI任务。
+4. 请求结束后清空请求体 / 响应体（可能含 base64 图片，单行可达数MB），
+   后台服务Leader进程定期删除超过保留期的已结束请求（purge_gateway_jobs）。
+
+网关进程依赖 aiohttp（可选依赖，Web进程不需要）。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import requests
+
+from app.services.http_client import intercept_requests
+
+logger = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+except ImportError:  # 只有网关进程需要
+    aiohttp = None
+
+# 同时在途的请求数
+GATEWAY_CONCURRENCY = int(os.environ.get("PROVIDER_GATEWAY_CONCURRENCY", "2000"))
+# 单个主机的最大连接数（0 表示不限制）
+GATEWAY_LIMIT_PER_HOST = int(os.environ.get("PROVIDER_GATEWAY_LIMIT_PER_HOST", "0"))
+# 没有待发送请求时的轮询间隔（秒）
+POLL_INTERVAL = float(os.environ.get("PROVIDER_GATEWAY_POLL_INTERVAL", "0.5"))
+# 每次领取的最大请求数
+CLAIM_BATCH = 100
+# 发送中但超过 (连接超时 + 读取超时 + 该值) 仍未完成的请求视为网关中断
+INTERRUPTED_GRACE_SECONDS = 120
+# 中断检查间隔（秒）
+RECOVER_INTERVAL = 60
+# 停止时等待在途请求完成的最长时间（秒）
+SHUTDOWN_GRACE_SECONDS = 30
+# 已结束请求的保留时间与清理间隔
+RETENTION = timedelta(days=int(os.environ.get("PROVIDER_GATEWAY_RETENTION_DAYS", "7")))
+PURGE_INTERVAL = 3600
+PURGE_BATCH = 1000
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 请求已发出后连接断开或等待超时：服务商可能仍在处理，不能重试
+REQUEST_MAY_BE_SENT_ERRORS = ("timeout", "disconnected", "interrupted")
+# 由aiohttp重新计算的请求头
+_SKIP_HEADERS = {"content-length", "connection", "host"}
+
+
+def is_gateway_enabled():
+    """是否把同步API请求交给网关进程发送"""
+    env_value = os.environ.get("PROVIDER_GATEWAY_ENABLED")
+    if env_value is not None:
+        return env_value.strip().lower() in ("1", "true", "yes", "on")
+    try:
+        from app.utils.config_loader import get_config_value
+
+        value = get_config_value("provider_gateway_enabled", "false")
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+    except Exception:
+        return False
+
+
+class DeferredResponse:
+    """
+    已交给网关发送的请求（代替 requests.Response 返回给调用方）
+
+    gateway_job 为已写入会话（尚未提交）的 ProviderGatewayJob。
+    """
+
+    status_code = 202
+    text = ""
+    content = b""
+    ok = True
+
+    def __init__(self, gateway_job):
+        self.gateway_job = gateway_job
+        self.headers = {}
+
+    def json(self):
+        return {}
+
+
+def _split_timeout(timeout):
+    if isinstance(timeout, (tuple, list)) and len(timeout) == 2:
+        return float(timeout[0] or 10), float(timeout[1] or 300)
+    if timeout:
+        return float(timeout), float(timeout)
+    return 10.0, 300.0
+
+
+@contextmanager
+def defer_to_gateway(db=None, ProviderGatewayJob=None, client_names=("ai_provider",)):
+    """
+    在当前线程内把共享HTTP客户端的请求写入网关任务表而不是直接发送
+
+    请求在写入前按 requests 的规则编码（json / data / files / params 均支持），
+    任务行与调用方的其他修改在同一事务中提交。
+    """
+    if not all([db, ProviderGatewayJob]):
+        test_server_module = sys.modules.get("test_server")
+        if test_server_module is not None:
+            db = test_server_module.db
+            ProviderGatewayJob = test_server_module.ProviderGatewayJob
+
+    def handler(client, method, url, retry, kwargs):
+        prepared = client.session(retry).prepare_request(
+            requests.Request(
+                method=method,
+                url=url,
+                headers=kwargs.get("headers"),
+                files=kwargs.get("files"),
+                data=kwargs.get("data"),
+                json=kwargs.get("json"),
+                params=kwargs.get("params"),
+            )
+        )
+        body = prepared.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        connect_timeout, read_timeout = _split_timeout(kwargs.get("timeout"))
+        proxies = kwargs.get("proxies")
+        job = ProviderGatewayJob(
+            client_name=client.name,
+            method=prepared.method,
+            url=prepared.url,
+            headers=json.dumps(dict(prepared.headers), ensure_ascii=False),
+            body=body,
+            proxies=json.dumps(proxies) if proxies is not None else None,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retry_policy=retry,
+            status="pending",
+        )
+        db.session.add(job)
+        db.session.flush()
+        logger.info(f"📨 请求已交给服务商网关: job={job.id}, {prepared.method} {prepared.url}")
+        return DeferredResponse(job)
+
+    with intercept_requests(handler, client_names=client_names):
+        yield
+
+
+def complete_gateway_job(job, db, AITask):
+    """网关请求完成后更新关联的AI任务（需在应用上下文中调用，不提交事务）"""
+    if not job.ai_task_id:
+        return
+    task = db.session.get(AITask, job.ai_task_id)
+    if task is None or task.status != "processing":
+        return
+
+    from app.services.ai_provider_service import apply_gateway_response
+
+    apply_gateway_response(task, job)
+
+
+def purge_gateway_jobs(retention=RETENTION, ProviderGatewayJob=None, db=None):
+    """删除结束超过保留期的网关请求（需在应用上下文中调用），返回删除的行数"""
+    if not all([db, ProviderGatewayJob]):
+        test_server_module = sys.modules["test_server"]
+        db = test_server_module.db
+        ProviderGatewayJob = test_server_module.ProviderGatewayJob
+
+    Job = ProviderGatewayJob
+    cutoff = datetime.now() - retention
+    deleted = 0
+    while True:
+        ids = [
+            row.id
+            for row in db.session.query(Job.id)
+            .filter(Job.status.in_(["done", "failed"]), Job.finished_at < cutoff)
+            .order_by(Job.id)
+            .limit(PURGE_BATCH)
+            .all()
+        ]
+        if not ids:
+            break
+        deleted += Job.query.filter(Job.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if len(ids) < PURGE_BATCH:
+            break
+    return deleted
+
+
+_purger_thread = None
+_purger_stop = threading.Event()
+
+
+def _purger_loop():
+    while not _purger_stop.wait(PURGE_INTERVAL):
+        try:
+            if "test_server" not in sys.modules:
+                continue
+            with sys.modules["test_server"].app.app_context():
+                purged = purge_gateway_jobs()
+            if purged:
+                logger.info(f"🧹 服务商网关: 已清理 {purged} 个已结束请求")
+        except Exception as e:
+            logger.warning(f"⚠️ 服务商网关请求清理失败: {e}")
+
+
+def start_gateway_job_purger():
+    """启动网关请求清理线程（仅在后台服务Leader进程中运行）"""
+    global _purger_thread
+
+    if _purger_thread is not None and _purger_thread.is_alive():
+        return
+    _purger_stop.clear()
+    _purger_thread = threading.Thread(
+        target=_purger_loop, daemon=True, name="ProviderGatewayPurger"
+    )
+    _purger_thread.start()
+    logger.info("🧹 服务商网关请求清理线程已启动")
+
+
+def stop_gateway_job_purger():
+    global _purger_thread
+
+    _purger_stop.set()
+    _purger_thread = None
+
+
+def _reset_after_fork():
+    global _purger_thread
+    _purger_thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class ProviderGateway:
+    """
+    网关主循环：领取 provider_gateway_jobs 中待发送的请求，用 aiohttp 并发发送并回写结果
+
+    数据库读写在少量线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, app, db, ProviderGatewayJob, AITask, concurrency=GATEWAY_CONCURRENCY):
+        if aiohttp is None:
+            raise RuntimeError("服务商网关需要安装 aiohttp（pip install aiohttp）")
+        self.app = app
+        self.db = db
+        self.Job = ProviderGatewayJob
+        self.AITask = AITask
+        self.concurrency = max(int(concurrency), 1)
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._db_executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="ProviderGatewayDB"
+        )
+        self._inflight = set()
+        self._sessions = {}
+        self._stopping = None
+        self._last_recover_at = 0.0
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counters = {"sent": 0, "done": 0, "failed": 0, "retries": 0}
+
+    # ---------------------------------------------------------------- 数据库
+
+    async def _db(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db_executor, self._in_app_context, fn, args)
+
+    def _in_app_context(self, fn, args):
+        with self.app.app_context():
+            try:
+                return fn(*args)
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+    def _claim_jobs(self, limit):
+        Job = self.Job
+        session = self.db.session
+        query = session.query(Job.id).filter(Job.status == "pending").order_by(Job.id).limit(limit)
+        if session.get_bind().dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        ids = [row.id for row in query.all()]
+        if not ids:
+            session.rollback()
+            return []
+
+        # 条件更新抢占：多个网关实例同时领取不会重复发送
+        session.query(Job).filter(Job.id.in_(ids), Job.status == "pending").update(
+            {Job.status: "running", Job.claimed_by: self.name, Job.started_at: datetime.now()},
+            synchronize_session=False,
+        )
+        session.commit()
+        rows = Job.query.filter(
+            Job.id.in_(ids), Job.status == "running", Job.claimed_by == self.name
+        ).all()
+        jobs = [
+            {
+                "id": row.id,
+                "method": row.method or "POST",
+                "url": row.url,
+                "headers": json.loads(row.headers) if row.headers else {},
+                "body": row.body,
+                "proxies": json.loads(row.proxies) if row.proxies else None,
+                "connect_timeout": row.connect_timeout or 10,
+                "read_timeout": row.read_timeout or 300,
+                "retry_policy": row.retry_policy or "default",
+            }
+            for row in rows
+        ]
+        session.rollback()
+        return jobs
+
+    def _finish_job(self, job_id, result):
+        job = self.db.session.get(self.Job, job_id)
+        if job is None:
+            return
+        job.status = result["status"]
+        job.attempts = result["attempts"]
+        job.response_status = result.get("response_status")
+        job.response_body = result.get("response_body")
+        job.error_kind = result.get("error_kind")
+        job.error_message = result.get("error_message")
+        job.finished_at = datetime.now()
+        # 请求已结束，不再需要请求体
+        job.body = None
+        self.db.session.commit()
+
+        try:
+            complete_gateway_job(job, self.db, self.AITask)
+            # 响应已写回AI任务；写回失败时保留响应体便于排查，随保留期清理
+            job.response_body = None
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            logger.error(f"❌ 网关请求 {job_id} 结果写回AI任务失败: {e}", exc_info=True)
+
+    def _recover_interrupted(self):
+        """发送中但早已超过超时时间的请求（网关进程退出或崩溃）标记为中断"""
+        Job = self.Job
+        now = datetime.now()
+        candidates = Job.query.filter(Job.status == "running").all()
+        recovered = 0
+        for job in candidates:
+            deadline = (
+                (job.connect_timeout or 10) + (job.read_timeout or 300) + INTERRUPTED_GRACE_SECONDS
+            )
+            if job.started_at and job.started_at + timedelta(seconds=deadline) < now:
+                job.status = "failed"
+                job.error_kind = "interrupted"
+                job.error_message = f"网关实例 {job.claimed_by} 在请求完成前中断"
+                job.finished_at = now
+                job.body = None
+                complete_gateway_job(job, self.db, self.AITask)
+                recovered += 1
+        self.db.session.commit()
+        if recovered:
+            logger.warning(f"⚠️ 服务商网关: {recovered} 个请求因网关中断标记为失败")
+
+    # ---------------------------------------------------------------- 发送
+
+    def _session_for(self, proxies):
+        """proxies 为空时按环境变量使用代理；{'http': None, 'https': None} 表示直连"""
+        key = "env" if proxies is None else "direct"
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=GATEWAY_LIMIT_PER_HOST,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            session = aiohttp.ClientSession(connector=connector, trust_env=(key == "env"))
+            self._sessions[key] = session
+        return session
+
+    async def _send_once(self, job):
+        proxies = job["proxies"]
+        proxy = None
+        if proxies:
+            scheme = job["url"].split(":", 1)[0].lower()
+            proxy = proxies.get(scheme)
+        headers = {k: v for k, v in job["headers"].items() if k.lower() not in _SKIP_HEADERS}
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=job["connect_timeout"], sock_read=job["read_timeout"]
+        )
+        async with self._session_for(proxies).request(
+            job["method"],
+            job["url"],
+            headers=headers,
+            data=job["body"],
+            proxy=proxy,
+            timeout=timeout,
+        ) as response:
+            return response.status, await response.read()
+
+    @staticmethod
+    def _classify_error(error, elapsed, connect_timeout):
+        connection_timeout_error = getattr(aiohttp, "ConnectionTimeoutError", None)
+        if connection_timeout_error is not None and isinstance(error, connection_timeout_error):
+            return "connect"
+        if isinstance(error, aiohttp.ClientConnectorError):
+            return "connect"
+        socket_timeout_error = getattr(aiohttp, "SocketTimeoutError", None)
+        if socket_timeout_error is not None and isinstance(error, socket_timeout_error):
+            return "timeout"
+        if isinstance(error, asyncio.TimeoutError):
+            return "connect" if elapsed < connect_timeout else "timeout"
+        if isinstance(error, (aiohttp.ServerDisconnectedError, aiohttp.ClientPayloadError)):
+            return "disconnected"
+        return "disconnected" if elapsed >= connect_timeout else "connect"
+
+    async def _execute(self, job):
+        policy = job["retry_policy"]
+        max_retries = {"none": 0, "connect": 2}.get(policy, 3)
+        attempts = 0
+        while True:
+            attempts += 1
+            start = time.monotonic()
+            try:
+                status, body = await self._send_once(job)
+                error_kind = None
+            except Exception as e:
+                status, body = None, None
+                error_kind = self._classify_error(
+                    e, time.monotonic() - start, job["connect_timeout"]
+                )
+                error_message = f"{type(e).__name__}: {e}"
+            elapsed = time.monotonic() - start
+
+            retryable = (error_kind == "connect") or (
+                policy == "default" and status in RETRY_STATUS
+            )
+            if retryable and attempts <= max_retries and not self._stopping.is_set():
+                with self._stats_lock:
+                    self._counters["retries"] += 1
+                await asyncio.sleep(min(2 ** (attempts - 1), 30))
+                continue
+
+            with self._stats_lock:
+                self._counters["sent"] += 1
+                self._latencies.append(elapsed)
+            if error_kind:
+                return {
+                    "status": "failed",
+                    "attempts": attempts,
+                    "error_kind": error_kind,
+                    "error_message": error_message[:2000],
+                }
+            return {
+                "status": "done",
+                "attempts": attempts,
+                "response_status": status,
+                "response_body": body,
+            }
+
+    async def _handle(self, job):
+        try:
+            result = await self._execute(job)
+        except Exception as e:
+            logger.error(f"❌ 网关请求 {job['id']} 发送异常: {e}", exc_info=True)
+            result = {
+                "status": "failed",
+                "attempts": 1,
+                "error_kind": "connect",
+                "error_message": str(e)[:2000],
+            }
+        with self._stats_lock:
+            self._counters["done" if result["status"] == "done" else "failed"] += 1
+        try:
+            await self._db(self._finish_job, job["id"], result)
+        except Exception as e:
+            logger.error(f"❌ 网关请求 {job['id']} 结果写入失败: {e}", exc_info=True)
+
+    # ---------------------------------------------------------------- 主循环
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self._counters)
+            samples = sorted(self._latencies)
+
+        def percentile(p):
+            if not samples:
+                return None
+            return round(
+                samples[min(int(round(p / 100 * (len(samples) - 1))), len(samples) - 1)], 2
+            )
+
+        return {
+            "name": self.name,
+            "inflight": len(self._inflight),
+            "concurrency": self.concurrency,
+            **counters,
+            "latency_seconds": {
+                "p50": percentile(50),
+                "p90": percentile(90),
+                "p99": percentile(99),
+            },
+        }
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        logger.info(f"🚀 服务商网关已启动: {self.name}，最大并发 {self.concurrency}")
+        last_stats_at = time.monotonic()
+        try:
+            while not self._stopping.is_set():
+                now = time.monotonic()
+                if now - self._last_recover_at >= RECOVER_INTERVAL:
+                    self._last_recover_at = now
+                    try:
+                        await self._db(self._recover_interrupted)
+                    except Exception as e:
+                        logger.warning(f"⚠️ 服务商网关中断检查失败: {e}")
+                if now - last_stats_at >= 300:
+                    last_stats_at = now
+                    logger.info(f"📊 服务商网关统计: {self.stats()}")
+
+                free = self.concurrency - len(self._inflight)
+                jobs = []
+                if free > 0:
+                    try:
+                        jobs = await self._db(self._claim_jobs, min(free, CLAIM_BATCH))
+                    except Exception as e:
+                        logger.warning(f"⚠️ 服务商网关领取请求失败: {e}")
+                for job in jobs:
+                    task = asyncio.create_task(self._handle(job))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+
+                if not jobs:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if self._inflight:
+                logger.info(f"⏳ 服务商网关停止中，等待 {len(self._inflight)} 个在途请求...")
+                await asyncio.wait(set(self._inflight), timeout=SHUTDOWN_GRACE_SECONDS)
+            for session in self._sessions.values():
+                await session.close()
+            self._db_executor.shutdown(wait=True)
+            logger.info("✅ 服务商网关已停止")
+
+
+def main():
+    if aiohttp is None:
+        logger.error("❌ 服务商网关需要安装 aiohttp（pip install aiohttp）")
+        return 1
+
+    import test_server
+
+    gateway = ProviderGateway(
+        test_server.app, test_server.db, test_server.ProviderGatewayJob, test_server.AITask
+    )
+
+    async def _run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, gateway.stop)
+            except (NotImplementedError, RuntimeError):  # Windows
+                pass
+        await gateway.run()
+
+    asyncio.run(_run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
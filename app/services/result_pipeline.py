@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+结果图后处理流水线
+
+任务完成后，轮询线程原先在线下载结果图、保存、生成缩略图，一次慢下载会拖住所有其他任务的状态更新。
+这里把后处理拆成三个阶段，每个阶段有独立的有界队列和工作线程：
+
+- fetch：通过共享下载连接池下载结果图（I/O）
+- process：解码一次 → 水印（可选）→ 缩略图等衍生图，各步骤共用同一个解码后的图片（CPU）
+- persist：写入文件并更新数据库记录（结果图改为本地路径）
+
+阶段之间以阻塞方式投递，下游积压时上游工作线程自然等待（背压）；入口队列已满时，
+任务在提交线程中同步处理，相当于让轮询线程放慢速度，而不是无限堆积。
+
+下载失败（网络错误、429/5xx）按退避重试；流水线在进程内，重试用尽或进程重启时
+任务结果图仍是远程URL，由Leader进程的补偿线程定期把这些任务重新提交到流水线。
+"""
+
+import io
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 各阶段工作线程数与队列长度
+STAGE_SETTINGS = {
+    "fetch": {
+        "workers": int(os.environ.get("RESULT_PIPELINE_FETCH_WORKERS", "4")),
+        "queue_size": int(os.environ.get("RESULT_PIPELINE_FETCH_QUEUE", "64")),
+    },
+    "process": {
+        "workers": int(os.environ.get("RESULT_PIPELINE_PROCESS_WORKERS", "2")),
+        "queue_size": int(os.environ.get("RESULT_PIPELINE_PROCESS_QUEUE", "8")),
+    },
+    "persist": {
+        "workers": int(os.environ.get("RESULT_PIPELINE_PERSIST_WORKERS", "2")),
+        "queue_size": int(os.environ.get("RESULT_PIPELINE_PERSIST_QUEUE", "32")),
+    },
+}
+STAGES = ["fetch", "process", "persist"]
+FETCH_TIMEOUT = 60
+# 下载重试次数与退避（秒）：1, 2, 4 ...
+FETCH_RETRIES = int(os.environ.get("RESULT_PIPELINE_FETCH_RETRIES", "3"))
+FETCH_RETRY_BACKOFF = 1.0
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# 补偿：完成超过 SWEEP_GRACE 秒仍是远程URL的任务重新提交（只处理最近 SWEEP_MAX_AGE 内完成的任务）
+SWEEP_INTERVAL = int(os.environ.get("RESULT_PIPELINE_SWEEP_INTERVAL", "300"))
+SWEEP_GRACE = 120
+SWEEP_MAX_AGE = 7 * 24 * 3600
+SWEEP_BATCH = 100
+
+
+def guess_result_suffix(content_type, url):
+    """根据Content-Type（其次URL）确定结果图扩展名，默认 .jpg"""
+    content_type = (content_type or "").lower()
+    if "jpeg" in content_type or "jpg" in content_type:
+        return ".jpg"
+    if "png" in content_type:
+        return ".png"
+    if "webp" in content_type:
+        return ".webp"
+    path = (url or "").lower().split("?", 1)[0]
+    for suffix in (".png", ".webp", ".jpg"):
+        if path.endswith(suffix):
+            return suffix
+    return ".jpg"
+
+
+class ResultJob:
+    """一张结果图的后处理任务"""
+
+    def __init__(
+        self,
+        kind,
+        record_id,
+        url,
+        folder,
+        filename,
+        thumbnail=True,
+        watermark=None,
+        fixed_suffix=None,
+    ):
+        self.kind = kind  # 记录类型（见 PERSIST_HANDLERS）
+        self.record_id = record_id
+        self.url = url
+        self.folder = folder
+        self.filename = filename  # 不含扩展名
+        self.thumbnail = thumbnail
+        # 水印：{"path": 水印文件, "opacity": 透明度, "position": 位置}
+        self.watermark = watermark
+        self.fixed_suffix = fixed_suffix
+        self.content = None
+        self.suffix = None
+        self.thumbnail_content = None
+        self.local_path = None
+
+    @property
+    def key(self):
+        return (self.kind, self.record_id)
+
+
+def _fetch(job):
+    import requests
+
+    from app.services.http_client import get_http_client
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = get_http_client("download").get(
+                job.url, timeout=FETCH_TIMEOUT, proxies={"http": None, "https": None}
+            )
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+            retryable = response.status_code in RETRYABLE_STATUS
+        except requests.RequestException as e:
+            error, retryable = str(e), True
+        if error is None:
+            break
+        if not retryable or attempt > FETCH_RETRIES:
+            raise Exception(f"下载结果图失败（第{attempt}次）: {error}")
+        delay = FETCH_RETRY_BACKOFF * (2 ** (attempt - 1))
+        logger.info(f"[结果流水线] 下载结果图失败，{delay:.0f}秒后重试: {job.url}: {error}")
+        time.sleep(delay)
+    job.content = response.content
+    job.suffix = job.fixed_suffix or guess_result_suffix(
+        response.headers.get("Content-Type"), job.url
+    )
+
+
+def _encode(image, suffix):
+    buffer = io.BytesIO()
+    if suffix in (".jpg", ".jpeg"):
+        image.convert("RGB").save(buffer, format="JPEG", quality=95)
+    elif suffix == ".png":
+        image.save(buffer, format="PNG")
+    else:
+        image.save(buffer, format="WEBP", quality=95)
+    return buffer.getvalue()
+
+
+def _process(job):
+    """解码一次，依次生成水印图与缩略图"""
+    if not job.thumbnail and not job.watermark:
+        return
+
+    from PIL import Image
+
+    from app.utils.image_thumbnail import resolve_thumbnail_settings, thumbnail_image
+
+    max_size, quality = resolve_thumbnail_settings()
+    try:
+        image = Image.open(io.BytesIO(job.content))
+        # 只生成缩略图时，JPEG按比例解码即可（结果不小于缩略图尺寸）
+        if not job.watermark and image.format == "JPEG":
+            image.draft("RGB", (max_size, max_size))
+        image.load()
+    except Exception as e:
+        logger.warning(f"[结果流水线] 结果图无法解码，只保存原文件: {job.url}: {str(e)}")
+        return
+
+    if job.watermark:
+        from app.utils.image_utils import apply_watermark
+
+        image = apply_watermark(
+            image,
+            job.watermark["path"],
+            job.watermark.get("opacity", 1.0),
+            job.watermark.get("position", "tiled"),
+        )
+        job.content = _encode(image, job.suffix)
+
+    if job.thumbnail:
+        buffer = io.BytesIO()
+        thumbnail_image(image, max_size).save(buffer, "JPEG", quality=quality, optimize=True)
+        job.thumbnail_content = buffer.getvalue()
+
+
+def _write_files(job):
+    from app.utils.image_thumbnail import get_thumbnail_path
+
+    os.makedirs(job.folder, exist_ok=True)
+    local_path = os.path.join(job.folder, f"{job.filename}{job.suffix}").replace("\\", "/")
+    # 先写临时文件再重命名，读取方不会看到写了一半的图片
+    temp_path = local_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(job.content)
+    os.replace(temp_path, local_path)
+    if job.thumbnail_content:
+        with open(get_thumbnail_path(local_path), "wb") as f:
+            f.write(job.thumbnail_content)
+    job.local_path = local_path
+
+
+def _persist_ai_task(job, test_server_module):
+    """结果图改为本地路径（期间结果已被其他流程修改时不覆盖）"""
+    db = test_server_module.db
+    task = db.session.get(test_server_module.AITask, job.record_id)
+    if task is None or task.output_image_path != job.url:
+        return False
+    task.output_image_path = job.local_path
+    db.session.commit()
+    return True
+
+
+def _persist_meitu(job, test_server_module):
+    db = test_server_module.db
+    log = db.session.get(test_server_module.MeituAPICallLog, job.record_id)
+    if log is None or log.result_image_path:
+        return False
+    log.result_image_path = job.local_path
+    db.session.commit()
+    return True
+
+
+# 记录类型 -> 保存函数
+PERSIST_HANDLERS = {
+    "ai_task": _persist_ai_task,
+    "meitu": _persist_meitu,
+}
+
+
+def _persist(job):
+    _write_files(job)
+    if "test_server" not in sys.modules:
+        return
+    test_server_module = sys.modules["test_server"]
+    with test_server_module.app.app_context():
+        try:
+            updated = PERSIST_HANDLERS[job.kind](job, test_server_module)
+        except Exception:
+            test_server_module.db.session.rollback()
+            raise
+    if updated:
+        logger.info(
+            f"✅ [结果流水线] {job.kind} {job.record_id} 结果图已保存到本地: {job.local_path}"
+        )
+
+
+STAGE_FUNCS = {"fetch": _fetch, "process": _process, "persist": _persist}
+
+
+class ResultPipeline:
+    """分阶段的结果图后处理流水线（每个阶段独立的有界队列 + 工作线程）"""
+
+    def __init__(self, stage_settings=None):
+        self.stage_settings = stage_settings or STAGE_SETTINGS
+        self._queues = {
+            stage: queue.Queue(maxsize=max(self.stage_settings[stage]["queue_size"], 1))
+            for stage in STAGES
+        }
+        self._threads = []
+        self._started = False
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            stage: {"processed": 0, "errors": 0, "busy_seconds": 0.0} for stage in STAGES
+        }
+        self._counters = {"submitted": 0, "inline": 0, "duplicates": 0, "completed": 0}
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            for stage in STAGES:
+                for index in range(max(self.stage_settings[stage]["workers"], 1)):
+                    thread = threading.Thread(
+                        target=self._worker,
+                        args=(stage,),
+                        daemon=True,
+                        name=f"result-{stage}-{index}",
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+            self._started = True
+
+    def submit(self, job):
+        """
+        提交后处理任务（同一记录处理中时忽略重复提交）
+
+        入口队列已满时在当前线程同步处理（背压）。
+
+        Returns:
+            bool: 是否已受理（重复提交返回False）
+        """
+        with self._lock:
+            if job.key in self._pending:
+                self._counters["duplicates"] += 1
+                return False
+            self._pending.add(job.key)
+            self._counters["submitted"] += 1
+        self._start()
+        try:
+            self._queues["fetch"].put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._counters["inline"] += 1
+            logger.warning(f"[结果流水线] 队列已满，在当前线程处理: {job.kind} {job.record_id}")
+            self.run_inline(job)
+        return True
+
+    def run_inline(self, job):
+        """在当前线程依次执行所有阶段"""
+        for stage in STAGES:
+            if not self._run_stage(stage, job):
+                return
+
+    def _run_stage(self, stage, job):
+        start = time.monotonic()
+        try:
+            STAGE_FUNCS[stage](job)
+            ok = True
+        except Exception as e:
+            ok = False
+            logger.warning(
+                f"[结果流水线] {job.kind} {job.record_id} {stage} 阶段失败: {job.url}: {str(e)}"
+            )
+        with self._stats_lock:
+            stats = self._stats[stage]
+            stats["processed" if ok else "errors"] += 1
+            stats["busy_seconds"] += time.monotonic() - start
+        if not ok or stage == STAGES[-1]:
+            self._finish(job, ok)
+        return ok
+
+    def _finish(self, job, ok):
+        # 处理完成后释放大对象
+        job.content = None
+        job.thumbnail_content = None
+        with self._lock:
+            self._pending.discard(job.key)
+            if ok:
+                self._counters["completed"] += 1
+
+    def _worker(self, stage):
+        next_stage = STAGES[STAGES.index(stage) + 1] if stage != STAGES[-1] else None
+        stage_queue = self._queues[stage]
+        while True:
+            job = stage_queue.get()
+            try:
+                if self._run_stage(stage, job) and next_stage:
+                    # 下游队列满时阻塞，形成背压
+                    self._queues[next_stage].put(job)
+            finally:
+                stage_queue.task_done()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stages = {
+                stage: {
+                    **{key: value for key, value in stats.items() if key != "busy_seconds"},
+                    "busy_seconds": round(stats["busy_seconds"], 3),
+                    "workers": self.stage_settings[stage]["workers"],
+                    "queue_depth": self._queues[stage].qsize(),
+                    "queue_size": self._queues[stage].maxsize,
+                }
+                for stage, stats in self._stats.items()
+            }
+        with self._lock:
+            counters = dict(self._counters)
+            counters["in_progress"] = len(self._pending)
+        return {**counters, "stages": stages}
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_result_pipeline():
+    """获取（必要时创建）进程内的结果图流水线"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = ResultPipeline()
+    return _pipeline
+
+
+def submit_ai_task_result(task_id, image_url, file_key=None, watermark=None):
+    """
+    AI任务结果图：下载到 final_works、生成缩略图，并把任务的结果图改为本地路径
+
+    :param task_id: AITask ID
+    :param image_url: 结果图URL（需与任务当前的 output_image_path 一致）
+    :param file_key: 文件名中的任务标识（默认任务ID）
+    """
+    if not image_url or not image_url.startswith("http"):
+        return False
+    key = str(file_key or task_id)[:8]
+    job = ResultJob(
+        "ai_task",
+        task_id,
+        image_url,
+        folder="final_works",
+        filename=f"final_{key}_{int(time.time())}",
+        watermark=watermark,
+    )
+    return get_result_pipeline().submit(job)
+
+
+def submit_meitu_result(log_id, image_url, name=None):
+    """美图结果图：下载到 uploads/meitu_results 并记录到调用日志"""
+    job = ResultJob(
+        "meitu",
+        log_id,
+        image_url,
+        folder=os.path.join("uploads", "meitu_results"),
+        filename=f"{name or 'meitu'}_{int(time.time())}",
+        thumbnail=False,
+        fixed_suffix=".jpg",
+    )
+    return get_result_pipeline().submit(job)
+
+
+def get_result_pipeline_stats():
+    """结果图流水线统计（当前进程）"""
+    if _pipeline is None:
+        return {"started": False}
+    return get_result_pipeline().get_stats()
+
+
+def sweep_remote_ai_task_results(limit=SWEEP_BATCH):
+    """
+    把已完成但结果图仍是远程URL的任务重新提交到流水线（需在应用上下文中调用）
+
+    Returns:
+        int: 重新提交的任务数
+    """
+    from datetime import datetime, timedelta
+
+    from app.models import AITask
+
+    now = datetime.now()
+    tasks = (
+        AITask.query.filter(
+            AITask.status == "completed",
+            AITask.output_image_path.like("http%"),
+            AITask.completed_at >= now - timedelta(seconds=SWEEP_MAX_AGE),
+            AITask.completed_at <= now - timedelta(seconds=SWEEP_GRACE),
+        )
+        .order_by(AITask.completed_at.desc())
+        .limit(limit)
+        .all()
+    )
+    submitted = 0
+    for task in tasks:
+        if submit_ai_task_result(
+            task.id, task.output_image_path, file_key=task.comfyui_prompt_id or str(task.id)
+        ):
+            submitted += 1
+    if submitted:
+        logger.info(f"🔁 [结果流水线] {submitted} 个任务结果图仍是远程URL，已重新提交")
+    return submitted
+
+
+_sweeper_thread = None
+_sweeper_stop = threading.Event()
+
+
+def _sweeper_loop():
+    while not _sweeper_stop.wait(SWEEP_INTERVAL):
+        try:
+            if "test_server" not in sys.modules:
+                continue
+            with sys.modules["test_server"].app.app_context():
+                sweep_remote_ai_task_results()
+        except Exception as e:
+            logger.error(f"[结果流水线] 补偿远程结果图失败: {e}")
+
+
+def start_result_sweeper():
+    """启动远程结果图补偿线程（仅在后台服务Leader进程中运行）"""
+    global _sweeper_thread
+
+    if _sweeper_thread is not None and _sweeper_thread.is_alive():
+        return
+    _sweeper_stop.clear()
+    _sweeper_thread = threading.Thread(target=_sweeper_loop, daemon=True, name="ResultSweeper")
+    _sweeper_thread.start()
+    logger.info("🔁 [结果流水线] 远程结果图补偿线程已启动")
+
+
+def stop_result_sweeper():
+    global _sweeper_thread
+
+    _sweeper_stop.set()
+    _sweeper_thread = None
+
+
+def _reset_after_fork():
+    global _pipeline, _pipeline_lock, _sweeper_thread
+    _pipeline = None
+    _pipeline_lock = threading.Lock()
+    _sweeper_thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,694 @@
+# -*- coding: utf-8 -*-
+"""
+任务队列存储后端
+为 task_queue_service 提供持久化的优先级队列：
+- RedisQueueBackend: Redis有序集合（跨进程共享，worker重启不丢任务）
+- DatabaseQueueBackend: 数据库 task_queue_jobs 表（无Redis时使用）
+- MemoryQueueBackend: 进程内实现（单进程开发/测试使用）
+
+所有后端语义一致：
+- push: 入队，priority 越大越先被领取，同优先级先进先出
+- reserve: 领取一个任务，在 visibility_timeout 秒内对其他消费者不可见；
+  消费者崩溃未确认时，超时后任务自动重新可领取；超时同样计入尝试次数，
+  达到最大尝试次数的超时任务直接进入死信
+- extend: 处理中续期（消费者心跳），长任务不会因可见性超时被重复领取
+- ack: 确认完成；nack: 失败，未超过最大尝试次数且 retry=True 时延迟重试，否则进入死信
+  （可见性超时后已被其他消费者重新领取的任务，原消费者的 ack/nack/extend 不生效）
+- purge: 清理结束（已确认 / 死信）超过保留期的任务，由后台服务Leader进程定期执行
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 任务优先级
+PRIORITY_LOW = -1  # 后台测试 / Playground 任务
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1  # 门店订单
+
+DEFAULT_VISIBILITY_TIMEOUT = 300  # 秒（处理中由心跳续期）
+DEFAULT_MAX_ATTEMPTS = 3
+
+EXPIRED_ERROR = "处理超时（可见性超时未确认）"
+
+# 数据库后端每批清理的任务数
+PURGE_BATCH = 1000
+
+
+class QueueJob:
+    """从队列领取到的任务"""
+
+    def __init__(
+        self,
+        job_id: str,
+        task_type: str,
+        data: Dict[str, Any],
+        priority: int = PRIORITY_NORMAL,
+        attempts: int = 0,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        submitted_at: Optional[float] = None,
+    ):
+        self.job_id = job_id
+        self.task_type = task_type
+        self.data = data
+        self.priority = priority
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.submitted_at = submitted_at or time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "task_type": self.task_type,
+            "data": self.data,
+            "priority": self.priority,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "submitted_at": self.submitted_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QueueJob":
+        return cls(**data)
+
+
+def new_job_id(task_type: str) -> str:
+    return f"{task_type}_{uuid.uuid4().hex[:16]}"
+
+
+def retry_delay(attempts: int) -> int:
+    """失败重试的退避时间（秒）：10, 20, 40 ... 最多5分钟"""
+    return min(10 * (2 ** max(attempts - 1, 0)), 300)
+
+
+class QueueBackend:
+    """队列后端接口"""
+
+    name = "base"
+    durable = False  # 是否跨进程共享/持久化
+
+    def push(self, job: QueueJob) -> str:
+        raise NotImplementedError
+
+    def reserve(self, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> Optional[QueueJob]:
+        raise NotImplementedError
+
+    def extend(self, job: QueueJob, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> bool:
+        """处理中任务续期；返回False表示任务已不在处理中（已超时被重新领取或已确认）"""
+        raise NotImplementedError
+
+    def ack(self, job: QueueJob):
+        raise NotImplementedError
+
+    def nack(self, job: QueueJob, error: str = "", retry: bool = True) -> bool:
+        """标记失败；返回True表示已安排重试，False表示已进入死信（retry=False 时直接进入死信）"""
+        raise NotImplementedError
+
+    def size(self) -> int:
+        """待处理（含延迟重试）任务数"""
+        raise NotImplementedError
+
+    def purge(self, retention: timedelta) -> int:
+        """清理结束超过保留期的任务，返回清理的任务数"""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "size": self.size()}
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryQueueBackend(QueueBackend):
+    """进程内优先级队列（不持久化，仅用于单进程开发和测试）"""
+
+    name = "memory"
+    durable = False
+
+    def __init__(self):
+        self._ready = []  # [(-priority, available_at, seq, job_id)]
+        self._jobs = {}
+        self._reserved = {}  # job_id -> reserved_until
+        self._dead = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def push(self, job: QueueJob, available_at: Optional[float] = None) -> str:
+        with self._lock:
+            self._jobs[job.job_id] = job
+            heapq.heappush(
+                self._ready,
+                (-job.priority, available_at or 0.0, next(self._counter), job.job_id),
+            )
+        return job.job_id
+
+    def _requeue_expired(self, now: float):
+        for job_id, reserved_until in list(self._reserved.items()):
+            if reserved_until <= now:
+                del self._reserved[job_id]
+                job = self._jobs[job_id]
+                if job.attempts >= job.max_attempts:
+                    del self._jobs[job_id]
+                    self._dead[job_id] = {
+                        "job": job.to_dict(),
+                        "error": EXPIRED_ERROR,
+                        "dead_at": now,
+                    }
+                    continue
+                heapq.heappush(self._ready, (-job.priority, 0.0, next(self._counter), job_id))
+
+    def reserve(self, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> Optional[QueueJob]:
+        now = time.time()
+        with self._lock:
+            self._requeue_expired(now)
+            delayed = []
+            job = None
+            while self._ready:
+                entry = heapq.heappop(self._ready)
+                if entry[1] > now:
+                    delayed.append(entry)
+                    continue
+                job = self._jobs.get(entry[3])
+                if job is not None:
+                    break
+            for entry in delayed:
+                heapq.heappush(self._ready, entry)
+            if job is None:
+                return None
+            job.attempts += 1
+            self._reserved[job.job_id] = now + visibility_timeout
+            return job
+
+    def extend(self, job: QueueJob, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> bool:
+        with self._lock:
+            if job.job_id not in self._reserved:
+                return False
+            self._reserved[job.job_id] = time.time() + visibility_timeout
+            return True
+
+    def ack(self, job: QueueJob):
+        with self._lock:
+            self._reserved.pop(job.job_id, None)
+            self._jobs.pop(job.job_id, None)
+
+    def nack(self, job: QueueJob, error: str = "", retry: bool = True) -> bool:
+        with self._lock:
+            self._reserved.pop(job.job_id, None)
+            if not retry or job.attempts >= job.max_attempts:
+                self._jobs.pop(job.job_id, None)
+                self._dead[job.job_id] = {
+                    "job": job.to_dict(),
+                    "error": error,
+                    "dead_at": time.time(),
+                }
+                return False
+        self.push(job, available_at=time.time() + retry_delay(job.attempts))
+        return True
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._jobs) - len(self._reserved)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "size": len(self._jobs) - len(self._reserved),
+                "reserved": len(self._reserved),
+                "dead": len(self._dead),
+            }
+
+    def purge(self, retention: timedelta) -> int:
+        cutoff = time.time() - retention.total_seconds()
+        with self._lock:
+            expired = [job_id for job_id, dead in self._dead.items() if dead["dead_at"] < cutoff]
+            for job_id in expired:
+                del self._dead[job_id]
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._ready.clear()
+            self._jobs.clear()
+            self._reserved.clear()
+
+
+# 领取任务的Lua脚本（原子操作）：
+# 1. 可见性超时的处理中任务放回待处理集合（已达到最大尝试次数的放入死信）
+# 2. 到期的延迟重试任务放回待处理集合
+# 3. 弹出优先级最高的任务，放入处理中集合
+_REDIS_RESERVE_SCRIPT = """
+local ready, inflight, delayed, jobs, attempts_key = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+local dead, dead_at = KEYS[6], KEYS[7]
+local now, deadline, expired_error = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3]
+
+local expired = redis.call('zrangebyscore', inflight, '-inf', now)
+for _, job_id in ipairs(expired) do
+    redis.call('zrem', inflight, job_id)
+    local raw = redis.call('hget', jobs, job_id)
+    if raw then
+        local job = cjson.decode(raw)
+        local attempts = tonumber(redis.call('hget', attempts_key, job_id) or '0')
+        if attempts >= tonumber(job['max_attempts'] or 1) then
+            job['attempts'] = attempts
+            job['score'] = nil
+            job['error'] = expired_error
+            redis.call('hset', dead, job_id, cjson.encode(job))
+            redis.call('zadd', dead_at, now, job_id)
+            redis.call('hdel', jobs, job_id)
+            redis.call('hdel', attempts_key, job_id)
+        else
+            redis.call('zadd', ready, job['score'], job_id)
+        end
+    end
+end
+
+local due = redis.call('zrangebyscore', delayed, '-inf', now)
+for _, job_id in ipairs(due) do
+    redis.call('zrem', delayed, job_id)
+    local raw = redis.call('hget', jobs, job_id)
+    if raw then
+        redis.call('zadd', ready, cjson.decode(raw)['score'], job_id)
+    end
+end
+
+local popped = redis.call('zpopmin', ready)
+if #popped == 0 then
+    return nil
+end
+local job_id = popped[1]
+local raw = redis.call('hget', jobs, job_id)
+if not raw then
+    return nil
+end
+local attempts = redis.call('hincrby', attempts_key, job_id, 1)
+redis.call('zadd', inflight, deadline, job_id)
+return {raw, attempts}
+"""
+
+# 确认 / 失败 / 续期的Lua脚本：只有任务仍在处理中集合、且领取次数与调用方领取时一致
+# （没有超时后被其他消费者重新领取）时才生效，返回1；否则不做修改，返回0
+_REDIS_HOLDS_RESERVATION = """
+local inflight, attempts_key = KEYS[1], KEYS[2]
+local job_id, attempts = ARGV[1], ARGV[2]
+if not redis.call('zscore', inflight, job_id)
+    or redis.call('hget', attempts_key, job_id) ~= attempts then
+    return 0
+end
+"""
+
+_REDIS_ACK_SCRIPT = (
+    _REDIS_HOLDS_RESERVATION
+    + """
+redis.call('zrem', inflight, job_id)
+redis.call('hdel', KEYS[3], job_id)
+redis.call('hdel', attempts_key, job_id)
+return 1
+"""
+)
+
+# ARGV[3] 非空时进入死信（值为死信JSON），否则在 ARGV[4] 时间后重试；ARGV[5] 为当前时间
+_REDIS_NACK_SCRIPT = (
+    _REDIS_HOLDS_RESERVATION
+    + """
+local delayed, jobs, dead, dead_at = KEYS[3], KEYS[4], KEYS[5], KEYS[6]
+redis.call('zrem', inflight, job_id)
+if ARGV[3] ~= '' then
+    redis.call('hdel', jobs, job_id)
+    redis.call('hdel', attempts_key, job_id)
+    redis.call('hset', dead, job_id, ARGV[3])
+    redis.call('zadd', dead_at, tonumber(ARGV[5]), job_id)
+else
+    redis.call('zadd', delayed, tonumber(ARGV[4]), job_id)
+end
+return 1
+"""
+)
+
+_REDIS_EXTEND_SCRIPT = (
+    _REDIS_HOLDS_RESERVATION
+    + """
+redis.call('zadd', inflight, tonumber(ARGV[3]), job_id)
+return 1
+"""
+)
+
+
+class RedisQueueBackend(QueueBackend):
+    """
+    Redis优先级队列
+    - {prefix}:ready    有序集合，score = -priority * 1e13 + 入队毫秒时间戳（越小越先处理）
+    - {prefix}:inflight 有序集合，score = 可见性超时时间戳
+    - {prefix}:delayed  有序集合，score = 重试可领取时间戳
+    - {prefix}:jobs     哈希，job_id -> 任务JSON（入队后不再修改）
+    - {prefix}:attempts 哈希，job_id -> 已领取次数
+    - {prefix}:dead     哈希，超过重试次数的任务
+    - {prefix}:dead_at  有序集合，score = 进入死信的时间戳（按保留期清理死信）
+    """
+
+    name = "redis"
+    durable = True
+
+    def __init__(self, client, prefix: str = "task_queue"):
+        self.client = client
+        self.prefix = prefix
+        self.ready_key = f"{prefix}:ready"
+        self.inflight_key = f"{prefix}:inflight"
+        self.delayed_key = f"{prefix}:delayed"
+        self.jobs_key = f"{prefix}:jobs"
+        self.attempts_key = f"{prefix}:attempts"
+        self.dead_key = f"{prefix}:dead"
+        self.dead_at_key = f"{prefix}:dead_at"
+        self._reserve = client.register_script(_REDIS_RESERVE_SCRIPT)
+        self._ack = client.register_script(_REDIS_ACK_SCRIPT)
+        self._nack = client.register_script(_REDIS_NACK_SCRIPT)
+        self._extend = client.register_script(_REDIS_EXTEND_SCRIPT)
+
+    @staticmethod
+    def _score(job: QueueJob) -> float:
+        return -job.priority * 1e13 + int(job.submitted_at * 1000)
+
+    def _serialize(self, job: QueueJob) -> str:
+        data = job.to_dict()
+        data["score"] = self._score(job)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+    def push(self, job: QueueJob) -> str:
+        pipe = self.client.pipeline()
+        pipe.hset(self.jobs_key, job.job_id, self._serialize(job))
+        pipe.zadd(self.ready_key, {job.job_id: self._score(job)})
+        pipe.execute()
+        return job.job_id
+
+    def reserve(self, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> Optional[QueueJob]:
+        now = time.time()
+        result = self._reserve(
+            keys=[
+                self.ready_key,
+                self.inflight_key,
+                self.delayed_key,
+                self.jobs_key,
+                self.attempts_key,
+                self.dead_key,
+                self.dead_at_key,
+            ],
+            args=[now, now + visibility_timeout, EXPIRED_ERROR],
+        )
+        if not result:
+            return None
+        raw, attempts = result
+        data = json.loads(raw)
+        data.pop("score", None)
+        data["attempts"] = int(attempts)
+        return QueueJob.from_dict(data)
+
+    def extend(self, job: QueueJob, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> bool:
+        # 只更新仍由本消费者持有的任务，不会把已超时/已确认的任务重新放回
+        return bool(
+            self._extend(
+                keys=[self.inflight_key, self.attempts_key],
+                args=[job.job_id, job.attempts, time.time() + visibility_timeout],
+            )
+        )
+
+    def ack(self, job: QueueJob):
+        if not self._ack(
+            keys=[self.inflight_key, self.attempts_key, self.jobs_key],
+            args=[job.job_id, job.attempts],
+        ):
+            logger.warning(
+                f"⚠️  任务已不在本消费者处理中（已超时被重新领取），忽略确认: {job.job_id}"
+            )
+
+    def nack(self, job: QueueJob, error: str = "", retry: bool = True) -> bool:
+        now = time.time()
+        dead = ""
+        if not retry or job.attempts >= job.max_attempts:
+            dead = json.dumps({**job.to_dict(), "error": error}, ensure_ascii=False, default=str)
+        held = self._nack(
+            keys=[
+                self.inflight_key,
+                self.attempts_key,
+                self.delayed_key,
+                self.jobs_key,
+                self.dead_key,
+                self.dead_at_key,
+            ],
+            args=[job.job_id, job.attempts, dead, now + retry_delay(job.attempts), now],
+        )
+        if not held:
+            # 任务已由其他消费者处理，仍会被执行
+            logger.warning(
+                f"⚠️  任务已不在本消费者处理中（已超时被重新领取），忽略失败标记: {job.job_id}"
+            )
+            return True
+        return not dead
+
+    def size(self) -> int:
+        pipe = self.client.pipeline()
+        pipe.zcard(self.ready_key)
+        pipe.zcard(self.delayed_key)
+        ready, delayed = pipe.execute()
+        return ready + delayed
+
+    def stats(self) -> Dict[str, Any]:
+        pipe = self.client.pipeline()
+        pipe.zcard(self.ready_key)
+        pipe.zcard(self.delayed_key)
+        pipe.zcard(self.inflight_key)
+        pipe.hlen(self.dead_key)
+        ready, delayed, reserved, dead = pipe.execute()
+        return {
+            "backend": self.name,
+            "size": ready + delayed,
+            "delayed": delayed,
+            "reserved": reserved,
+            "dead": dead,
+        }
+
+    def purge(self, retention: timedelta) -> int:
+        cutoff = time.time() - retention.total_seconds()
+        job_ids = self.client.zrangebyscore(self.dead_at_key, "-inf", cutoff)
+        if not job_ids:
+            return 0
+        pipe = self.client.pipeline()
+        pipe.hdel(self.dead_key, *job_ids)
+        pipe.zrem(self.dead_at_key, *job_ids)
+        pipe.execute()
+        return len(job_ids)
+
+    def clear(self):
+        # 只清空待处理任务，处理中的任务由消费者确认
+        job_ids = self.client.zrange(self.ready_key, 0, -1) + self.client.zrange(
+            self.delayed_key, 0, -1
+        )
+        pipe = self.client.pipeline()
+        pipe.delete(self.ready_key, self.delayed_key)
+        if job_ids:
+            pipe.hdel(self.jobs_key, *job_ids)
+            pipe.hdel(self.attempts_key, *job_ids)
+        pipe.execute()
+
+
+class DatabaseQueueBackend(QueueBackend):
+    """
+    数据库优先级队列（task_queue_jobs 表）
+    领取时使用条件UPDATE抢占（PostgreSQL额外使用 FOR UPDATE SKIP LOCKED），多进程并发领取不会重复
+    所有方法需在应用上下文中调用
+    """
+
+    name = "database"
+    durable = True
+
+    def __init__(self, db, TaskQueueJob):
+        self.db = db
+        self.Job = TaskQueueJob
+
+    def push(self, job: QueueJob) -> str:
+        row = self.Job(
+            job_id=job.job_id,
+            task_type=job.task_type,
+            payload=json.dumps(job.data, ensure_ascii=False, default=str),
+            priority=job.priority,
+            status="ready",
+            attempts=job.attempts,
+            max_attempts=job.max_attempts,
+            available_at=datetime.fromtimestamp(job.submitted_at),
+        )
+        self.db.session.add(row)
+        self.db.session.commit()
+        return job.job_id
+
+    def _claimable(self, now: datetime):
+        Job = self.Job
+        return self.db.or_(
+            self.db.and_(Job.status == "ready", Job.available_at <= now),
+            self.db.and_(
+                Job.status == "reserved",
+                Job.reserved_until <= now,
+                Job.attempts < Job.max_attempts,
+            ),
+        )
+
+    def _bury_expired(self, now: datetime):
+        """可见性超时且已达到最大尝试次数的任务放入死信"""
+        Job = self.Job
+        self.db.session.query(Job).filter(
+            Job.status == "reserved",
+            Job.reserved_until <= now,
+            Job.attempts >= Job.max_attempts,
+        ).update(
+            {
+                Job.status: "dead",
+                Job.reserved_until: None,
+                Job.last_error: EXPIRED_ERROR,
+                Job.updated_at: now,
+            },
+            synchronize_session=False,
+        )
+        self.db.session.commit()
+
+    def reserve(self, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> Optional[QueueJob]:
+        Job = self.Job
+        session = self.db.session
+        now = datetime.now()
+        is_postgresql = session.get_bind().dialect.name == "postgresql"
+        self._bury_expired(now)
+
+        for _ in range(5):
+            query = (
+                session.query(Job.id)
+                .filter(self._claimable(now))
+                .order_by(Job.priority.desc(), Job.id.asc())
+                .limit(1)
+            )
+            if is_postgresql:
+                query = query.with_for_update(skip_locked=True)
+            row = query.first()
+            if not row:
+                session.rollback()
+                return None
+
+            # 条件更新抢占：只有仍处于可领取状态时才更新成功
+            claimed = (
+                session.query(Job)
+                .filter(Job.id == row.id, self._claimable(now))
+                .update(
+                    {
+                        Job.status: "reserved",
+                        Job.attempts: Job.attempts + 1,
+                        Job.reserved_until: now + timedelta(seconds=visibility_timeout),
+                        Job.updated_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            session.commit()
+            if claimed:
+                job_row = session.get(Job, row.id)
+                return QueueJob(
+                    job_id=job_row.job_id,
+                    task_type=job_row.task_type,
+                    data=json.loads(job_row.payload or "{}"),
+                    priority=job_row.priority or PRIORITY_NORMAL,
+                    attempts=job_row.attempts or 1,
+                    max_attempts=job_row.max_attempts or DEFAULT_MAX_ATTEMPTS,
+                    submitted_at=job_row.created_at.timestamp() if job_row.created_at else None,
+                )
+        return None
+
+    def extend(self, job: QueueJob, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT) -> bool:
+        now = datetime.now()
+        updated = self.Job.query.filter_by(
+            job_id=job.job_id, status="reserved", attempts=job.attempts
+        ).update(
+            {"reserved_until": now + timedelta(seconds=visibility_timeout), "updated_at": now},
+            synchronize_session=False,
+        )
+        self.db.session.commit()
+        return bool(updated)
+
+    def _held(self, job: QueueJob):
+        """仍由该消费者持有的任务（未超时被重新领取）"""
+        return self.Job.query.filter_by(job_id=job.job_id, status="reserved", attempts=job.attempts)
+
+    def ack(self, job: QueueJob):
+        updated = self._held(job).update(
+            {"status": "done", "reserved_until": None, "updated_at": datetime.now()},
+            synchronize_session=False,
+        )
+        self.db.session.commit()
+        if not updated:
+            logger.warning(
+                f"⚠️  任务已不在本消费者处理中（已超时被重新领取），忽略确认: {job.job_id}"
+            )
+
+    def nack(self, job: QueueJob, error: str = "", retry: bool = True) -> bool:
+        retry = retry and job.attempts < job.max_attempts
+        values = {
+            "status": "ready" if retry else "dead",
+            "reserved_until": None,
+            "last_error": (error or "")[:2000],
+            "updated_at": datetime.now(),
+        }
+        if retry:
+            values["available_at"] = datetime.now() + timedelta(seconds=retry_delay(job.attempts))
+        updated = self._held(job).update(values, synchronize_session=False)
+        self.db.session.commit()
+        if not updated:
+            # 任务已由其他消费者处理，仍会被执行
+            logger.warning(
+                f"⚠️  任务已不在本消费者处理中（已超时被重新领取），忽略失败标记: {job.job_id}"
+            )
+            return True
+        return retry
+
+    def size(self) -> int:
+        return self.Job.query.filter_by(status="ready").count()
+
+    def purge(self, retention: timedelta) -> int:
+        Job = self.Job
+        cutoff = datetime.now() - retention
+        deleted = 0
+        while True:
+            ids = [
+                row.id
+                for row in self.db.session.query(Job.id)
+                .filter(Job.status.in_(["done", "dead"]), Job.updated_at < cutoff)
+                .order_by(Job.id)
+                .limit(PURGE_BATCH)
+                .all()
+            ]
+            if not ids:
+                break
+            deleted += Job.query.filter(Job.id.in_(ids)).delete(synchronize_session=False)
+            self.db.session.commit()
+            if len(ids) < PURGE_BATCH:
+                break
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(
+            self.db.session.query(self.Job.status, self.db.func.count(self.Job.id))
+            .filter(self.Job.status.in_(["ready", "reserved", "dead"]))
+            .group_by(self.Job.status)
+            .all()
+        )
+        return {
+            "backend": self.name,
+            "size": counts.get("ready", 0),
+            "reserved": counts.get("reserved", 0),
+            "dead": counts.get("dead", 0),
+        }
+
+    def clear(self):
+        self.Job.query.filter_by(status="ready").delete(synchronize_session=False)
+        self.db.session.commit()
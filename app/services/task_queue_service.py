@@ -7,92 +7,241 @@
 import logging
 
 logger = logging.getLogger(__name__)
-import queue
+import json
+import os
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Any, Dict, Optional
 
 # 任务队列配置（从数据库读取）
-from app.utils.config_loader import get_int_config
+from app.utils.config_loader import get_config_value, get_int_config
+
+from app.services.task_queue_backends import (
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_VISIBILITY_TIMEOUT,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    DatabaseQueueBackend,
+    MemoryQueueBackend,
+    QueueBackend,
+    QueueJob,
+    RedisQueueBackend,
+    new_job_id,
+)
 
 # 全局变量
-TASK_QUEUE = None  # 队列实例（会在启动时初始化）
+TASK_QUEUE: Optional[QueueBackend] = None  # 队列后端实例（会在首次使用时初始化）
 WORKER_THREADS = []  # 工作线程列表
 MAX_WORKERS = None  # 工作线程数（从数据库读取）
+MAX_QUEUE_SIZE = None  # 最大排队任务数（从数据库读取）
+VISIBILITY_TIMEOUT = DEFAULT_VISIBILITY_TIMEOUT  # 任务领取后未确认的重新可见时间（秒）
 QUEUE_RUNNING = False  # 队列是否运行中
+_queue_lock = threading.Lock()
 
+# 队列空闲时工作线程的轮询间隔（秒）
+IDLE_POLL_INTERVAL = 1
 
-def _init_queue():
+# 已结束任务（已确认 / 死信）的保留时间与清理间隔
+RETENTION = timedelta(days=int(os.environ.get("TASK_QUEUE_RETENTION_DAYS", "7")))
+PURGE_INTERVAL = 3600
+_purger_thread: Optional[threading.Thread] = None
+_purger_stop = threading.Event()
+
+# 处理失败后允许重试的任务类型（处理函数须幂等）
+# comfyui / api 任务会向服务商提交生成任务（按次计费、不幂等），失败已记录在任务/订单上，
+# 不自动重试；工作线程崩溃导致的可见性超时仍会重新领取（计入最大尝试次数）
+RETRY_ON_FAILURE_TASK_TYPES = frozenset()
+
+
+def _create_backend() -> QueueBackend:
+    """
+    根据配置 task_queue_backend 创建队列后端（redis / database / memory）
+    未配置时优先使用Redis，Redis不可用时使用数据库，均不可用时退化为进程内队列
+    """
+    backend_name = (get_config_value("task_queue_backend", "") or "").strip().lower()
+
+    if backend_name in ("", "redis"):
+        try:
+            from app.services.cache_service import get_redis_client
+
+            client = get_redis_client()
+            if client:
+                return RedisQueueBackend(client)
+        except Exception as e:
+            logger.warning(f"⚠️  Redis任务队列后端不可用: {e}")
+        if backend_name == "redis":
+            logger.warning("⚠️  配置的Redis任务队列后端不可用，改用数据库后端")
+
+    if backend_name in ("", "redis", "database"):
+        import sys
+
+        test_server_module = sys.modules.get("test_server")
+        if test_server_module is not None and hasattr(test_server_module, "TaskQueueJob"):
+            return DatabaseQueueBackend(test_server_module.db, test_server_module.TaskQueueJob)
+        logger.warning("⚠️  数据库任务队列后端不可用，改用进程内队列（任务不持久化）")
+
+    return MemoryQueueBackend()
+
+
+def _init_queue() -> QueueBackend:
     """初始化队列（从数据库读取配置）"""
-    global TASK_QUEUE, MAX_WORKERS
+    global TASK_QUEUE, MAX_WORKERS, MAX_QUEUE_SIZE, VISIBILITY_TIMEOUT
     if TASK_QUEUE is None:
-        max_size = get_int_config("task_queue_max_size", 100)
-        TASK_QUEUE = queue.Queue(maxsize=max_size)
-        MAX_WORKERS = get_int_config("task_queue_workers", 3)
-        logger.info(f"✅ 任务队列已初始化: 最大大小={max_size}, 工作线程数={MAX_WORKERS}")
+        with _queue_lock:
+            if TASK_QUEUE is None:
+                MAX_QUEUE_SIZE = get_int_config("task_queue_max_size", 100)
+                MAX_WORKERS = get_int_config("task_queue_workers", 3)
+                VISIBILITY_TIMEOUT = get_int_config(
+                    "task_queue_visibility_timeout", DEFAULT_VISIBILITY_TIMEOUT
+                )
+                TASK_QUEUE = _create_backend()
+                logger.info(
+                    f"✅ 任务队列已初始化: 后端={TASK_QUEUE.name}, 最大大小={MAX_QUEUE_SIZE}, 工作线程数={MAX_WORKERS}"
+                )
     return TASK_QUEUE
 
 
-# 任务处理统计
+# 任务处理统计（当前进程）
 QUEUE_STATS = {
     "total_submitted": 0,
     "total_processed": 0,
     "total_failed": 0,
+    "total_retried": 0,
+    "total_dead": 0,
     "current_queue_size": 0,
     "last_processed_time": None,
 }
 
 
-def submit_task(task_type: str, task_data: Dict[str, Any], priority: int = 0) -> bool:
+def get_order_priority(source_type: Optional[str]) -> int:
     """
-    提交任务到队列
+    根据订单来源确定任务优先级：门店订单优先，后台测试 / Playground 任务最后
 
     Args:
-        task_type: 任务类型 ('comfyui' 或 'api')
-        task_data: 任务数据
-        priority: 优先级（0=普通，1=高优先级）
+        source_type: 订单 source_type
 
     Returns:
-        bool: 是否提交成功
+        int: PRIORITY_LOW / PRIORITY_HIGH
     """
-    # 检查队列是否运行，如果未运行则返回False，让调用方回退到直接调用模式
-    if not QUEUE_RUNNING:
-        logger.warning(
-            "任务队列未启动（QUEUE_RUNNING=False），无法提交任务到队列，将回退到直接调用模式"
-        )
-        return False
+    if source_type in ("admin_test", "playground_test"):
+        return PRIORITY_LOW
+    return PRIORITY_HIGH
+
+
+def submit_task(task_type: str, task_data: Dict[str, Any], priority: int = PRIORITY_NORMAL) -> bool:
+    """
+    提交任务到队列
+
+    持久化后端（Redis/数据库）下任意进程都可提交，由Leader进程的工作线程消费；
+    进程内队列只能在工作线程运行的进程中提交。
+
+    Args:
+        task_type: 任务类型 ('comfyui'、'api' 或 'image_processing')
+        task_data: 任务数据（需可JSON序列化）
+        priority: 优先级（PRIORITY_LOW=-1 测试任务，PRIORITY_NORMAL=0 普通，PRIORITY_HIGH=1 门店订单）
 
+    Returns:
+        bool: 是否提交成功（False时调用方回退到直接调用模式）
+    """
     try:
         queue_instance = _init_queue()
-        if queue_instance.full():
-            logger.warning("任务队列已满（{queue_instance.qsize()}个任务），无法提交新任务")
+        if not queue_instance.durable and not QUEUE_RUNNING:
+            logger.warning(
+                "任务队列未启动（QUEUE_RUNNING=False），无法提交任务到队列，将回退到直接调用模式"
+            )
+            return False
+
+        queue_size = queue_instance.size()
+        if MAX_QUEUE_SIZE and queue_size >= MAX_QUEUE_SIZE:
+            logger.warning(f"任务队列已满（{queue_size}个任务），无法提交新任务")
             return False
 
-        task_item = {
-            "type": task_type,
-            "data": task_data,
-            "priority": priority,
-            "submitted_at": datetime.now(),
-            "task_id": task_data.get("task_id") or f"{task_type}_{int(time.time())}",
-        }
+        # 校验任务数据可序列化，避免持久化后端中出现无法恢复的任务
+        json.dumps(task_data)
 
-        # 如果是高优先级任务，使用特殊标记（实际实现中可以使用PriorityQueue）
-        queue_instance.put(task_item, block=False)
+        job = QueueJob(
+            job_id=new_job_id(task_type),
+            task_type=task_type,
+            data=task_data,
+            priority=priority,
+            max_attempts=get_int_config("task_queue_max_attempts", DEFAULT_MAX_ATTEMPTS),
+        )
+        queue_instance.push(job)
         QUEUE_STATS["total_submitted"] += 1
-        QUEUE_STATS["current_queue_size"] = queue_instance.qsize()
+        QUEUE_STATS["current_queue_size"] = queue_size + 1
 
-        logger.info(f"✅ 任务已提交到队列: {task_item['task_id']} (队列大小: {TASK_QUEUE.qsize()})")
+        logger.info(
+            f"✅ 任务已提交到队列: {job.job_id} (优先级: {priority}, 队列大小: {queue_size + 1})"
+        )
         return True
 
-    except queue.Full:
-        logger.error("任务队列已满，无法提交任务")
+    except (TypeError, ValueError) as e:
+        logger.error(f"任务数据无法序列化，无法提交到队列: {str(e)}")
         return False
     except Exception as e:
-        logger.error("提交任务到队列失败: {str(e)}")
+        logger.error(f"提交任务到队列失败: {str(e)}")
         return False
 
 
+def _reserve_job(queue_instance: QueueBackend, visibility_timeout: int) -> Optional[QueueJob]:
+    """领取任务；数据库后端需要应用上下文"""
+    return _in_queue_context(queue_instance, queue_instance.reserve, visibility_timeout)
+
+
+def _in_queue_context(queue_instance: QueueBackend, func, *args):
+    """执行后端操作；数据库后端需要应用上下文"""
+    if isinstance(queue_instance, DatabaseQueueBackend):
+        import sys
+
+        with sys.modules["test_server"].app.app_context():
+            return func(*args)
+    return func(*args)
+
+
+def _heartbeat_loop(queue_instance: QueueBackend, job: QueueJob, stop: threading.Event):
+    """处理期间定期为任务续期，长任务不会因可见性超时被其他消费者重复领取"""
+    interval = max(VISIBILITY_TIMEOUT / 3, 1)
+    while not stop.wait(interval):
+        try:
+            if not _in_queue_context(
+                queue_instance, queue_instance.extend, job, VISIBILITY_TIMEOUT
+            ):
+                logger.warning(f"⚠️  任务续期失败，任务已不在处理中: {job.job_id}")
+                return
+        except Exception as e:
+            logger.warning(f"⚠️  任务续期异常: {job.job_id}, {str(e)}")
+
+
+def _start_heartbeat(queue_instance: QueueBackend, job: QueueJob) -> threading.Event:
+    stop = threading.Event()
+    threading.Thread(
+        target=_heartbeat_loop,
+        args=(queue_instance, job, stop),
+        daemon=True,
+        name=f"TaskHeartbeat-{job.job_id}",
+    ).start()
+    return stop
+
+
+def _finish_job(queue_instance: QueueBackend, job: QueueJob, success: bool, error: str = ""):
+    """确认任务完成，或标记失败（仅 RETRY_ON_FAILURE_TASK_TYPES 安排重试）"""
+
+    def _finish():
+        if success:
+            queue_instance.ack(job)
+            return
+        if queue_instance.nack(job, error, retry=job.task_type in RETRY_ON_FAILURE_TASK_TYPES):
+            QUEUE_STATS["total_retried"] += 1
+            logger.warning(f"⚠️  任务处理失败，将重试: {job.job_id} (第{job.attempts}次)")
+        else:
+            QUEUE_STATS["total_dead"] += 1
+            logger.error(f"任务处理失败（不重试或超过最大重试次数），已放入死信: {job.job_id}")
+
+    _in_queue_context(queue_instance, _finish)
+
+
 def process_task_worker(worker_id: int):
     """
     任务处理工作线程
@@ -104,51 +253,62 @@ def process_task_worker(worker_id: int):
 
     while QUEUE_RUNNING:
         try:
-            # 从队列获取任务（超时1秒，避免阻塞）
             queue_instance = _init_queue()
-            try:
-                task_item = queue_instance.get(timeout=1)
-            except queue.Empty:
+            job = _reserve_job(queue_instance, VISIBILITY_TIMEOUT)
+            if job is None:
+                time.sleep(IDLE_POLL_INTERVAL)
                 continue
 
-            task_type = task_item["type"]
-            task_data = task_item["data"]
-            task_id = task_item["task_id"]
+            task_type = job.task_type
+            task_data = job.data
+            task_id = job.job_id
 
-            logger.info(f"📦 工作线程 {worker_id} 开始处理任务: {task_id} (类型: {task_type})")
+            logger.info(
+                f"📦 工作线程 {worker_id} 开始处理任务: {task_id} (类型: {task_type}, 第{job.attempts}次)"
+            )
 
+            success = False
+            error = ""
+            heartbeat_stop = _start_heartbeat(queue_instance, job)
             try:
                 # 根据任务类型调用不同的处理函数
                 if task_type == "comfyui":
                     success = process_comfyui_task(task_data)
                 elif task_type == "api":
                     success = process_api_task(task_data)
+                elif task_type == "image_processing":
+                    # 图片处理执行器队列已满时转入的订单图片处理
+                    from app.services.image_processing_executor import (
+                        run_deferred_image_processing,
+                    )
+
+                    success = run_deferred_image_processing(task_data)
                 else:
-                    logger.warning("未知任务类型: {task_type}")
-                    success = False
+                    logger.warning(f"未知任务类型: {task_type}")
+                    error = f"未知任务类型: {task_type}"
 
                 if success:
                     QUEUE_STATS["total_processed"] += 1
                     logger.info(f"✅ 任务处理成功: {task_id}")
                 else:
                     QUEUE_STATS["total_failed"] += 1
-                    logger.error("任务处理失败: {task_id}")
+                    logger.error(f"任务处理失败: {task_id}")
 
             except Exception as e:
                 QUEUE_STATS["total_failed"] += 1
-                logger.error("处理任务异常: {task_id}, 错误: {str(e)}")
+                error = str(e)
+                logger.error(f"处理任务异常: {task_id}, 错误: {str(e)}")
                 import traceback
 
                 traceback.print_exc()
 
             finally:
-                # 标记任务完成
-                queue_instance.task_done()
-                QUEUE_STATS["current_queue_size"] = queue_instance.qsize()
+                heartbeat_stop.set()
+                _finish_job(queue_instance, job, success, error or "处理失败")
                 QUEUE_STATS["last_processed_time"] = datetime.now()
 
         except Exception as e:
-            logger.error("工作线程 {worker_id} 异常: {str(e)}")
+            logger.error(f"工作线程 {worker_id} 异常: {str(e)}")
             time.sleep(1)  # 出错后等待1秒再继续
 
     logger.info(f"🛑 任务处理工作线程 {worker_id} 已停止")
@@ -260,9 +420,25 @@ def process_api_task(task_data: Dict[str, Any]) -> bool:
         return False
 
 
+def purge_finished_jobs(retention: timedelta = RETENTION) -> int:
+    """清理结束超过保留期的任务，返回清理的任务数"""
+    queue_instance = _init_queue()
+    return _in_queue_context(queue_instance, queue_instance.purge, retention)
+
+
+def _purger_loop():
+    while not _purger_stop.wait(PURGE_INTERVAL):
+        try:
+            purged = purge_finished_jobs()
+            if purged:
+                logger.info(f"🧹 任务队列: 已清理 {purged} 个已结束任务")
+        except Exception as e:
+            logger.warning(f"⚠️ 任务队列已结束任务清理失败: {e}")
+
+
 def start_task_queue():
-    """启动任务队列服务"""
-    global QUEUE_RUNNING, MAX_WORKERS
+    """启动任务队列服务（后台服务Leader进程中运行，同时定期清理已结束任务）"""
+    global QUEUE_RUNNING, MAX_WORKERS, _purger_thread
 
     if QUEUE_RUNNING:
         logger.warning("任务队列服务已在运行")
@@ -285,18 +461,33 @@ def start_task_queue():
         WORKER_THREADS.append(worker)
         logger.info(f"✅ 任务处理工作线程 {i + 1} 已启动")
 
+    _purger_stop.clear()
+    _purger_thread = threading.Thread(target=_purger_loop, daemon=True, name="TaskQueuePurger")
+    _purger_thread.start()
+
     logger.info(f"🚀 任务队列服务已启动，工作线程数: {MAX_WORKERS}")
 
 
-def stop_task_queue():
-    """停止任务队列服务"""
-    global QUEUE_RUNNING
+def stop_task_queue(wait: bool = True):
+    """
+    停止任务队列服务
+
+    持久化后端中未处理的任务保留在队列里，由下一个当选的Leader进程继续处理；
+    正在处理的任务未确认时（停止心跳后），超过可见性超时后会被重新领取。
+
+    Args:
+        wait: 是否等待工作线程处理完当前任务后退出
+    """
+    global QUEUE_RUNNING, _purger_thread
 
     QUEUE_RUNNING = False
+    _purger_stop.set()
+    _purger_thread = None
 
-    # 等待所有任务完成
-    queue_instance = _init_queue()
-    queue_instance.join()
+    # 工作线程每次领取前检查QUEUE_RUNNING，等待其退出后再允许重新启动
+    for worker in WORKER_THREADS:
+        worker.join(timeout=None if wait else 2)
+    WORKER_THREADS.clear()
 
     logger.info("🛑 任务队列服务已停止")
 
@@ -309,23 +500,28 @@ def get_queue_stats() -> Dict[str, Any]:
         dict: 队列统计信息
     """
     queue_instance = _init_queue()
+    try:
+        backend_stats = queue_instance.stats()
+    except Exception as e:
+        logger.warning(f"获取任务队列后端统计失败: {str(e)}")
+        backend_stats = {"backend": queue_instance.name, "size": None}
+
     return {
         **QUEUE_STATS,
-        "queue_size": queue_instance.qsize(),
-        "queue_maxsize": queue_instance.maxsize,
+        "backend": backend_stats.get("backend"),
+        "queue_size": backend_stats.get("size"),
+        "reserved": backend_stats.get("reserved", 0),
+        "dead": backend_stats.get("dead", 0),
+        "queue_maxsize": MAX_QUEUE_SIZE,
         "is_running": QUEUE_RUNNING,
         "worker_count": len(WORKER_THREADS),
     }
 
 
 def clear_queue():
-    """清空任务队列（谨慎使用）"""
+    """清空任务队列中待处理的任务（谨慎使用）"""
     queue_instance = _init_queue()
-    while not queue_instance.empty():
-        try:
-            queue_instance.get_nowait()
-            queue_instance.task_done()
-        except queue.Empty:
-            break
+    queue_instance.clear()
+    QUEUE_STATS["current_queue_size"] = 0
 
     logger.info("🗑️ 任务队列已清空")
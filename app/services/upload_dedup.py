@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+图片上传去重（按内容寻址）
+
+同一张图片会在重试（retry_ai_task / get_next_retry_api_config）、批量任务的每个提示词、
+赠送工作流中反复上传到 OSS、文件服务器、ComfyUI，或反复编码为 base64 内联到 Gemini 请求。
+这里按文件内容的 SHA-256 建立索引：
+
+- 上传：(目标, 内容哈希) -> 远端URL/文件名，带过期时间；进程内保存，Redis 可用时跨进程共享
+- 同一进程内同一内容并发上传时只有一个线程真正上传，其他线程等待并复用结果
+- base64 内联：按内容哈希缓存编码结果（按总字节数限制的LRU）；云端URL按URL缓存内容哈希
+- 文件哈希按 (路径, 修改时间, 大小) 缓存，文件不变时不重复读取
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 各上传目标的索引有效期（秒），未列出的目标使用 DEFAULT_TTL
+DEFAULT_TTL = int(os.environ.get("UPLOAD_DEDUP_TTL", str(6 * 3600)))
+DESTINATION_TTLS = {
+    # OSS 公网URL长期有效
+    "oss": int(os.environ.get("UPLOAD_DEDUP_OSS_TTL", str(7 * 24 * 3600))),
+    # ComfyUI 输入目录可能被清理，有效期较短
+    "comfyui": int(os.environ.get("UPLOAD_DEDUP_COMFYUI_TTL", str(6 * 3600))),
+    "file_server": int(os.environ.get("UPLOAD_DEDUP_FILE_SERVER_TTL", str(12 * 3600))),
+}
+# 进程内上传索引最大条目数
+INDEX_MAX_ENTRIES = 4096
+# 文件哈希缓存最大条目数
+DIGEST_MAX_ENTRIES = 4096
+# base64 编码缓存总大小上限（字节）
+INLINE_CACHE_MAX_BYTES = int(os.environ.get("UPLOAD_DEDUP_INLINE_MAX_MB", "128")) * 1024 * 1024
+# 云端图片URL -> 内容哈希 的有效期（秒）
+URL_DIGEST_TTL = 600
+# Redis 键前缀
+REDIS_KEY_PREFIX = "upload_ref:"
+
+CHUNK_SIZE = 1024 * 1024
+_LOCK_STRIPES = 64
+
+_digests = OrderedDict()  # 绝对路径 -> (mtime_ns, size, digest)
+_digests_lock = threading.Lock()
+_index = OrderedDict()  # (目标, digest) -> (ref, expires_at)
+_index_lock = threading.Lock()
+_inline = OrderedDict()  # digest -> (mime_type, base64)
+_inline_bytes = 0
+_url_digests = OrderedDict()  # url -> (digest, expires_at)
+_inline_lock = threading.Lock()
+_upload_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+_stats_lock = threading.Lock()
+_stats = {
+    "upload_hits": 0,
+    "uploads": 0,
+    "upload_bytes_saved": 0,
+    "inline_hits": 0,
+    "inline_encodes": 0,
+    "downloads_saved": 0,
+}
+
+
+def _incr_stat(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def file_digest(path):
+    """文件内容的 SHA-256（按路径、修改时间、大小缓存）"""
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    with _digests_lock:
+        cached = _digests.get(abs_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            _digests.move_to_end(abs_path)
+            return cached[2]
+
+    sha = hashlib.sha256()
+    with open(abs_path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digests_lock:
+        _digests[abs_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        _digests.move_to_end(abs_path)
+        while len(_digests) > DIGEST_MAX_ENTRIES:
+            _digests.popitem(last=False)
+    return digest
+
+
+def _destination_ttl(destination):
+    return DESTINATION_TTLS.get(destination.split(":", 1)[0], DEFAULT_TTL)
+
+
+def _redis():
+    try:
+        from app.services.cache_service import get_redis_client
+
+        return get_redis_client()
+    except Exception:
+        return None
+
+
+def get_uploaded_ref(destination, digest):
+    """查询该内容在目标上已上传的URL/文件名（未上传或已过期返回None）"""
+    key = (destination, digest)
+    now = time.time()
+    with _index_lock:
+        entry = _index.get(key)
+        if entry:
+            if entry[1] > now:
+                _index.move_to_end(key)
+                return entry[0]
+            _index.pop(key, None)
+
+    client = _redis()
+    if client is None:
+        return None
+    try:
+        redis_key = f"{REDIS_KEY_PREFIX}{destination}:{digest}"
+        value = client.get(redis_key)
+        if not value:
+            return None
+        ref = value.decode("utf-8") if isinstance(value, bytes) else value
+        ttl = client.ttl(redis_key)
+        expires_at = now + (ttl if ttl and ttl > 0 else _destination_ttl(destination))
+        _remember_local(key, ref, expires_at)
+        return ref
+    except Exception as e:
+        logger.debug(f"读取上传索引失败 {destination}:{digest}: {e}")
+        return None
+
+
+def _remember_local(key, ref, expires_at):
+    with _index_lock:
+        _index[key] = (ref, expires_at)
+        _index.move_to_end(key)
+        while len(_index) > INDEX_MAX_ENTRIES:
+            _index.popitem(last=False)
+
+
+def remember_uploaded_ref(destination, digest, ref, ttl=None):
+    """记录该内容在目标上的URL/文件名"""
+    ttl = ttl or _destination_ttl(destination)
+    _remember_local((destination, digest), ref, time.time() + ttl)
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.setex(f"{REDIS_KEY_PREFIX}{destination}:{digest}", ttl, ref)
+    except Exception as e:
+        logger.debug(f"写入上传索引失败 {destination}:{digest}: {e}")
+
+
+def forget_uploaded_ref(destination, digest):
+    """删除索引（远端文件失效时调用，下次重新上传）"""
+    with _index_lock:
+        _index.pop((destination, digest), None)
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.delete(f"{REDIS_KEY_PREFIX}{destination}:{digest}")
+    except Exception as e:
+        logger.debug(f"删除上传索引失败 {destination}:{digest}: {e}")
+
+
+def upload_once(destination, path, upload, ttl=None):
+    """
+    按内容去重上传：该内容已上传到目标时直接返回已有URL/文件名，否则调用 upload 上传
+
+    :param destination: 上传目标（如 oss、comfyui:<地址>、file_server:<上传接口>）
+    :param path: 本地文件路径
+    :param upload: upload(digest) -> URL/文件名；返回 None 表示上传失败（不记录），异常原样抛出
+    :param ttl: 索引有效期（秒），默认按目标类型
+    :return: URL/文件名，上传失败时为 None
+    """
+    try:
+        digest = file_digest(path)
+    except OSError as e:
+        logger.warning(f"计算文件哈希失败，直接上传: {path}: {e}")
+        return upload(None)
+
+    ref = get_uploaded_ref(destination, digest)
+    if ref:
+        _record_upload_hit(path, destination, ref)
+        return ref
+
+    with _upload_locks[int(digest[:8], 16) % _LOCK_STRIPES]:
+        # 等锁期间其他线程可能已上传完成
+        ref = get_uploaded_ref(destination, digest)
+        if ref:
+            _record_upload_hit(path, destination, ref)
+            return ref
+        ref = upload(digest)
+        if ref:
+            _incr_stat("uploads")
+            remember_uploaded_ref(destination, digest, ref, ttl)
+        return ref
+
+
+def _record_upload_hit(path, destination, ref):
+    _incr_stat("upload_hits")
+    try:
+        _incr_stat("upload_bytes_saved", os.path.getsize(path))
+    except OSError:
+        pass
+    logger.info(f"♻️ 图片已上传过，复用 [{destination}]: {ref}")
+
+
+def detect_image_mime(data):
+    """根据文件头判断图片MIME类型（无法识别时按JPEG处理）"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"GIF"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def _download_image(url):
+    from app.services.http_client import get_http_client
+
+    response = get_http_client("download").get(
+        url, proxies={"http": None, "https": None}, timeout=30  # 禁用代理
+    )
+    if response.status_code != 200:
+        raise Exception(f"下载图片失败: HTTP {response.status_code}")
+    return response.content
+
+
+def _inline_get(digest):
+    with _inline_lock:
+        entry = _inline.get(digest)
+        if entry:
+            _inline.move_to_end(digest)
+        return entry
+
+
+def _inline_put(digest, entry):
+    global _inline_bytes
+    size = len(entry[1])
+    if size > INLINE_CACHE_MAX_BYTES:
+        return
+    with _inline_lock:
+        if digest in _inline:
+            return
+        _inline[digest] = entry
+        _inline_bytes += size
+        while _inline_bytes > INLINE_CACHE_MAX_BYTES and _inline:
+            _, (_, old) = _inline.popitem(last=False)
+            _inline_bytes -= len(old)
+
+
+def _encode(digest, data):
+    entry = (detect_image_mime(data), base64.b64encode(data).decode("utf-8"))
+    _incr_stat("inline_encodes")
+    _inline_put(digest, entry)
+    return entry
+
+
+def encode_inline_image(path=None, url=None, fetch=None):
+    """
+    图片的 (MIME类型, base64)，用于内联到请求体（同一内容只编码一次）
+
+    :param path: 本地文件路径（优先）
+    :param url: 云端图片URL（无本地文件时下载）
+    :param fetch: fetch(url) -> bytes，默认通过共享下载连接池下载
+    """
+    if path:
+        digest = file_digest(path)
+        entry = _inline_get(digest)
+        if entry:
+            _incr_stat("inline_hits")
+            return entry
+        with open(path, "rb") as f:
+            return _encode(digest, f.read())
+
+    now = time.time()
+    with _inline_lock:
+        cached = _url_digests.get(url)
+    if cached and cached[1] > now:
+        entry = _inline_get(cached[0])
+        if entry:
+            _incr_stat("inline_hits")
+            _incr_stat("downloads_saved")
+            return entry
+
+    data = (fetch or _download_image)(url)
+    digest = hashlib.sha256(data).hexdigest()
+    with _inline_lock:
+        _url_digests[url] = (digest, now + URL_DIGEST_TTL)
+        _url_digests.move_to_end(url)
+        while len(_url_digests) > INDEX_MAX_ENTRIES:
+            _url_digests.popitem(last=False)
+    entry = _inline_get(digest)
+    if entry:
+        _incr_stat("inline_hits")
+        return entry
+    return _encode(digest, data)
+
+
+def get_upload_dedup_stats():
+    """上传去重统计（当前进程）"""
+    with _stats_lock:
+        stats = dict(_stats)
+    with _index_lock:
+        stats["indexed_uploads"] = len(_index)
+    with _inline_lock:
+        stats["inline_cached"] = len(_inline)
+        stats["inline_cached_bytes"] = _inline_bytes
+    return stats
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+"""
+用户访问记录缓冲写入服务
+
+小程序每次启动/页面访问都会调用 /api/user/visit，原实现每个请求起一个线程单条插入并提交。
+这里改为进程内有界缓冲 + 后台刷写线程：
+
+- 请求线程只把访问记录放入缓冲区，立即返回
+- 刷写线程攒够 USER_VISIT_FLUSH_ROWS 条或距上次刷写超过 USER_VISIT_FLUSH_MS 毫秒时批量插入
+  （executemany，重复 session_id 由 ON CONFLICT DO NOTHING / 批内去重忽略）
+- 缓冲区满时丢弃最旧的记录并计数，内存占用有上限
+- 同一事务内按 (日期, 用户) 累加预聚合分桶，访问统计直接读取分桶；
+  后台对账任务定期按访问表重算最近的分桶，全量回填尚未完成时先做一次全量回填
+- 全量回填全部提交后写入完成标记行（user_id = READY_USER_ID），没有完成标记时
+  统计直接查询访问表（刷写线程增量写入的分桶不代表历史数据已回填）
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 缓冲区最多保存的记录数（超出时丢弃最旧的记录）
+BUFFER_SIZE = int(os.environ.get("USER_VISIT_BUFFER_SIZE", "10000"))
+# 攒够多少条立即刷写
+FLUSH_ROWS = int(os.environ.get("USER_VISIT_FLUSH_ROWS", "200"))
+# 最长刷写间隔（毫秒）
+FLUSH_INTERVAL = int(os.environ.get("USER_VISIT_FLUSH_MS", "1000")) / 1000.0
+# 单次刷写最多处理的记录数
+MAX_BATCH = max(FLUSH_ROWS, 1000)
+
+# 对账任务：间隔和重算窗口
+RECONCILE_INTERVAL = 600
+RECONCILE_WINDOW = timedelta(days=2)
+# 全量回填时每批处理的时间跨度
+BACKFILL_CHUNK = timedelta(days=30)
+# 全量回填完成标记行（不参与统计查询）
+READY_USER_ID = "__rollup_ready__"
+READY_DATE = date(1970, 1, 1)
+
+_buffer = deque()
+_cond = threading.Condition()
+_flusher_thread: Optional[threading.Thread] = None
+_flusher_stop = False
+
+_stats_lock = threading.Lock()
+_stats = {
+    "enqueued": 0,
+    "inserted": 0,
+    "duplicates": 0,
+    "dropped": 0,
+    "failed": 0,
+    "flushes": 0,
+}
+
+_rollup_ready = False
+_worker_thread: Optional[threading.Thread] = None
+_worker_stop = threading.Event()
+
+
+def _incr_stat(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def _get_models():
+    from app.models import UserVisit, UserVisitRollup
+
+    return UserVisit, UserVisitRollup
+
+
+def _app_context():
+    import contextlib
+    import sys
+
+    if "test_server" in sys.modules and hasattr(sys.modules["test_server"], "app"):
+        return sys.modules["test_server"].app.app_context()
+    return contextlib.nullcontext()
+
+
+# ============================================================================
+# 缓冲与刷写
+# ============================================================================
+
+
+def enqueue_visit(row: Dict):
+    """
+    放入一条访问记录（user_visits 的列名 -> 值），由后台线程批量写入
+
+    visit_time 为空时使用当前时间；缓冲区满时丢弃最旧的一条
+    """
+    row.setdefault("visit_time", datetime.now())
+    with _cond:
+        if len(_buffer) >= BUFFER_SIZE:
+            _buffer.popleft()
+            _incr_stat("dropped")
+        _buffer.append(row)
+        if len(_buffer) >= FLUSH_ROWS:
+            _cond.notify()
+    _incr_stat("enqueued")
+    _ensure_flusher()
+
+
+def _ensure_flusher():
+    global _flusher_thread
+
+    if _flusher_thread is not None and _flusher_thread.is_alive():
+        return
+    with _cond:
+        if _flusher_thread is not None and _flusher_thread.is_alive():
+            return
+        _flusher_thread = threading.Thread(
+            target=_flusher_loop, daemon=True, name="UserVisitFlusher"
+        )
+        _flusher_thread.start()
+
+
+def _take_batch():
+    with _cond:
+        count = min(len(_buffer), MAX_BATCH)
+        return [_buffer.popleft() for _ in range(count)]
+
+
+def _flusher_loop():
+    while True:
+        with _cond:
+            _cond.wait_for(lambda: _flusher_stop or len(_buffer) >= FLUSH_ROWS, FLUSH_INTERVAL)
+            stopping = _flusher_stop
+        while True:
+            rows = _take_batch()
+            if not rows:
+                break
+            _flush(rows)
+            if len(rows) < MAX_BATCH:
+                break
+        if stopping:
+            return
+
+
+def _insert_statement(table, dialect: str):
+    """批量插入语句：重复 session_id 直接忽略"""
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        return insert(table).on_conflict_do_nothing(index_elements=["session_id"])
+    if dialect == "mysql":
+        return table.insert().prefix_with("IGNORE")
+    return table.insert()
+
+
+def _upsert_rollup(connection, rollup_table, visit_date: date, user_id: str, count: int):
+    """对单个分桶累加访问次数（PostgreSQL/SQLite 使用 ON CONFLICT，其他数据库先UPDATE后INSERT）"""
+    now = datetime.now()
+    dialect = connection.dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(rollup_table).values(
+            visit_date=visit_date, user_id=user_id, visit_count=count, updated_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["visit_date", "user_id"],
+            set_={"visit_count": rollup_table.c.visit_count + count, "updated_at": now},
+        )
+        connection.execute(stmt)
+        return
+
+    result = connection.execute(
+        rollup_table.update()
+        .where(rollup_table.c.visit_date == visit_date, rollup_table.c.user_id == user_id)
+        .values(visit_count=rollup_table.c.visit_count + count, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(
+            rollup_table.insert().values(
+                visit_date=visit_date, user_id=user_id, visit_count=count, updated_at=now
+            )
+        )
+
+
+def _write_rows(db, rows):
+    """插入一批访问记录并累加分桶（不提交），返回实际新增的记录"""
+    UserVisit, UserVisitRollup = _get_models()
+
+    # 批内和库内已存在的 session_id 都不再插入（session_id 唯一）
+    unique = {}
+    for row in rows:
+        unique.setdefault(row["session_id"], row)
+    existing = {
+        session_id
+        for (session_id,) in db.session.query(UserVisit.session_id).filter(
+            UserVisit.session_id.in_(list(unique))
+        )
+    }
+    new_rows = [row for session_id, row in unique.items() if session_id not in existing]
+    if not new_rows:
+        return new_rows
+
+    connection = db.session.connection()
+    db.session.execute(_insert_statement(UserVisit.__table__, connection.dialect.name), new_rows)
+
+    buckets = Counter((row["visit_time"].date(), row.get("user_id") or "") for row in new_rows)
+    rollup_table = UserVisitRollup.__table__
+    for (visit_date, user_id), count in buckets.items():
+        _upsert_rollup(connection, rollup_table, visit_date, user_id, count)
+    return new_rows
+
+
+def _flush(rows):
+    """批量写入；整批失败时逐条重试，只丢弃确实无法写入的记录"""
+    started = time.time()
+    try:
+        with _app_context():
+            from app.models import db
+
+            failed = 0
+            try:
+                inserted = len(_write_rows(db, rows))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"[用户访问记录] 批量写入 {len(rows)} 条失败，逐条重试: {e}")
+                inserted = 0
+                for row in rows:
+                    try:
+                        inserted += len(_write_rows(db, [row]))
+                        db.session.commit()
+                    except Exception as row_error:
+                        db.session.rollback()
+                        failed += 1
+                        logger.warning(
+                            f"[用户访问记录] 写入失败 sessionId={row.get('session_id')}: {row_error}"
+                        )
+            finally:
+                db.session.remove()
+    except Exception as e:
+        _incr_stat("failed", len(rows))
+        logger.error(f"[用户访问记录] 刷写失败，丢弃 {len(rows)} 条: {e}")
+        return
+
+    _incr_stat("flushes")
+    _incr_stat("inserted", inserted)
+    _incr_stat("failed", failed)
+    _incr_stat("duplicates", len(rows) - inserted - failed)
+    logger.debug(
+        f"[用户访问记录] 刷写 {len(rows)} 条，新增 {inserted} 条，"
+        f"耗时 {(time.time() - started) * 1000:.0f}ms"
+    )
+
+
+def flush_user_visits(timeout: float = 5.0):
+    """停止刷写线程并写入缓冲区中剩余的记录（进程退出时调用）"""
+    global _flusher_stop, _flusher_thread
+
+    thread = _flusher_thread
+    if thread is None or not thread.is_alive():
+        return
+    with _cond:
+        _flusher_stop = True
+        _cond.notify()
+    thread.join(timeout)
+    _flusher_thread = None
+    _flusher_stop = False
+
+
+def get_user_visit_buffer_stats():
+    """缓冲写入统计（当前进程）"""
+    with _stats_lock:
+        stats = dict(_stats)
+    with _cond:
+        stats["buffered"] = len(_buffer)
+    stats["buffer_size"] = BUFFER_SIZE
+    return stats
+
+
+def _reset_after_fork():
+    """子进程继承的线程不存在，重置缓冲区和锁，首次写入时重新启动刷写线程"""
+    global _cond, _buffer, _flusher_thread, _flusher_stop, _stats_lock
+
+    _cond = threading.Condition()
+    _buffer = deque()
+    _flusher_thread = None
+    _flusher_stop = False
+    _stats_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush_user_visits)
+
+
+# ============================================================================
+# 重算（对账 / 全量回填）
+# ============================================================================
+
+
+def rebuild_user_visit_rollups(start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    按访问表重算 [start, end) 日期范围内的分桶（需在应用上下文中调用）
+
+    都为空时全量重建。返回参与统计的访问记录数。
+    """
+    from sqlalchemy import func
+
+    from app.models import db
+
+    UserVisit, UserVisitRollup = _get_models()
+
+    if start is None:
+        first = db.session.query(func.min(UserVisit.visit_time)).scalar()
+        start = first.date() if first else date.today()
+    if end is None:
+        end = date.today() + timedelta(days=1)
+
+    total = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + BACKFILL_CHUNK, end)
+        total += _rebuild_range(db, UserVisit, UserVisitRollup, chunk_start, chunk_end)
+        chunk_start = chunk_end
+    return total
+
+
+def _rebuild_range(db, UserVisit, UserVisitRollup, start: date, end: date) -> int:
+    start_time = datetime.combine(start, datetime.min.time())
+    end_time = datetime.combine(end, datetime.min.time())
+    buckets = Counter()
+    rows = (
+        db.session.query(UserVisit.visit_time, UserVisit.user_id)
+        .filter(UserVisit.visit_time >= start_time, UserVisit.visit_time < end_time)
+        .yield_per(5000)
+    )
+    for visit_time, user_id in rows:
+        buckets[(visit_time.date(), user_id or "")] += 1
+
+    try:
+        UserVisitRollup.query.filter(
+            UserVisitRollup.visit_date >= start,
+            UserVisitRollup.visit_date < end,
+            UserVisitRollup.user_id != READY_USER_ID,
+        ).delete(synchronize_session=False)
+        now = datetime.now()
+        db.session.bulk_insert_mappings(
+            UserVisitRollup,
+            [
+                {
+                    "visit_date": visit_date,
+                    "user_id": user_id,
+                    "visit_count": count,
+                    "updated_at": now,
+                }
+                for (visit_date, user_id), count in buckets.items()
+            ],
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return sum(buckets.values())
+
+
+def _has_ready_marker() -> bool:
+    _, UserVisitRollup = _get_models()
+    return (
+        UserVisitRollup.query.filter_by(visit_date=READY_DATE, user_id=READY_USER_ID).first()
+        is not None
+    )
+
+
+def _mark_rollup_ready():
+    """全量回填提交后写入完成标记"""
+    from app.models import db
+
+    _, UserVisitRollup = _get_models()
+    if _has_ready_marker():
+        return
+    db.session.add(UserVisitRollup(visit_date=READY_DATE, user_id=READY_USER_ID, visit_count=0))
+    db.session.commit()
+
+
+def reconcile_recent_user_visit_rollups(window: timedelta = RECONCILE_WINDOW) -> int:
+    """重算最近时间窗口的分桶；全量回填未完成（含中断）时先做全量回填"""
+    global _rollup_ready
+
+    if not _has_ready_marker():
+        logger.info("📊 [访问预聚合] 尚未完成全量回填，开始全量回填")
+        count = rebuild_user_visit_rollups()
+        _mark_rollup_ready()
+        logger.info(f"✅ [访问预聚合] 全量回填完成，共 {count} 条访问记录")
+    else:
+        count = rebuild_user_visit_rollups(date.today() - window, None)
+    _rollup_ready = True
+    return count
+
+
+def _worker_loop():
+    while not _worker_stop.is_set():
+        try:
+            with _app_context():
+                reconcile_recent_user_visit_rollups()
+        except Exception as e:
+            logger.error(f"[访问预聚合] 对账失败: {e}")
+        _worker_stop.wait(RECONCILE_INTERVAL)
+
+
+def start_user_visit_rollup_worker():
+    """启动后台对账线程（仅在后台服务Leader进程中运行）"""
+    global _worker_thread
+
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+    _worker_stop.clear()
+    _worker_thread = threading.Thread(
+        target=_worker_loop, daemon=True, name="UserVisitRollupWorker"
+    )
+    _worker_thread.start()
+    logger.info("📊 [访问预聚合] 对账线程已启动")
+
+
+def stop_user_visit_rollup_worker():
+    global _worker_thread
+
+    _worker_stop.set()
+    _worker_thread = None
+
+
+# ============================================================================
+# 查询
+# ============================================================================
+
+
+def _is_rollup_ready() -> bool:
+    """分桶是否可用：全量回填已完成（存在完成标记）"""
+    global _rollup_ready
+
+    if not _rollup_ready and _has_ready_marker():
+        _rollup_ready = True
+    return _rollup_ready
+
+
+def _parse_day(value) -> Optional[date]:
+    """整天的日期参数（YYYY-MM-DD 或零点的 datetime）返回 date，其他返回 None"""
+    if isinstance(value, datetime):
+        return value.date() if value.time() == datetime.min.time() else None
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def get_user_visit_stats(start=None, end=None) -> Dict:
+    """
+    统计访问次数、独立用户数、独立会话数
+
+    与原口径一致：visit_time >= start 且 visit_time <= end（end 为日期时即当天零点之前）；
+    start/end 都是整天时读取分桶，否则（带时分秒）直接查询访问表
+
+    Returns:
+        {"totalVisits": int, "uniqueUsers": int, "uniqueSessions": int}
+    """
+    from sqlalchemy import func
+
+    from app.models import db
+
+    UserVisit, UserVisitRollup = _get_models()
+    start_day = _parse_day(start) if start else None
+    end_day = _parse_day(end) if end else None
+
+    if (start and start_day is None) or (end and end_day is None) or not _is_rollup_ready():
+        query = UserVisit.query
+        if start:
+            query = query.filter(UserVisit.visit_time >= start)
+        if end:
+            query = query.filter(UserVisit.visit_time <= end)
+        return {
+            "totalVisits": query.count(),
+            "uniqueUsers": query.with_entities(
+                func.count(func.distinct(UserVisit.user_id))
+            ).scalar()
+            or 0,
+            "uniqueSessions": query.with_entities(
+                func.count(func.distinct(UserVisit.session_id))
+            ).scalar()
+            or 0,
+        }
+
+    query = db.session.query(
+        func.sum(UserVisitRollup.visit_count),
+        func.count(func.distinct(func.nullif(UserVisitRollup.user_id, ""))),
+    ).filter(UserVisitRollup.user_id != READY_USER_ID)
+    if start_day is not None:
+        query = query.filter(UserVisitRollup.visit_date >= start_day)
+    if end_day is not None:
+        query = query.filter(UserVisitRollup.visit_date < end_day)
+    total_visits, unique_users = query.one()
+    total_visits = int(total_visits or 0)
+    # session_id 在访问表中唯一，独立会话数即访问次数
+    return {
+        "totalVisits": total_visits,
+        "uniqueUsers": int(unique_users or 0),
+        "uniqueSessions": total_visits,
+    }
@@ -11,33 +11,12 @@ import json
 import os
 import time
 from datetime import datetime, timedelta
-from threading import Semaphore
 
 import requests
 from flask import current_app
 
-from app.utils.config_loader import get_int_config
-
-
-# 限流机制：限制ComfyUI并发调用数（从数据库读取配置）
-def get_comfyui_semaphore():
-    """获取ComfyUI信号量（动态从数据库读取配置）"""
-    max_concurrency = get_int_config("comfyui_max_concurrency", 10)
-    return Semaphore(max_concurrency)
-
-
-# 全局信号量（会在首次使用时初始化）
-COMFYUI_SEMAPHORE = None
-
-
-def _get_comfyui_semaphore():
-    """获取或创建ComfyUI信号量"""
-    global COMFYUI_SEMAPHORE
-    if COMFYUI_SEMAPHORE is None:
-        max_concurrency = get_int_config("comfyui_max_concurrency", 10)
-        COMFYUI_SEMAPHORE = Semaphore(max_concurrency)
-        logger.info(f"✅ ComfyUI并发信号量已初始化: {max_concurrency}")
-    return COMFYUI_SEMAPHORE
+from app.services.http_client import get_http_client
+from app.services.upload_dedup import file_digest, forget_uploaded_ref, upload_once
 
 
 def get_workflow_config(
@@ -288,7 +267,19 @@ def get_comfyui_config(db=None, AIConfig=None):
         "timeout": "300",
     }
 
-    if db and AIConfig:
+    from app.services.config_registry import get_config_snapshot
+
+    snapshot = get_config_snapshot()
+    if snapshot is not None:
+        # 从进程内配置快照读取（不访问数据库）
+        for key, config_key in (
+            ("base_url", "comfyui_base_url"),
+            ("api_endpoint", "comfyui_api_endpoint"),
+            ("timeout", "comfyui_timeout"),
+        ):
+            if config_key in snapshot.ai_configs:
+                result[key] = snapshot.ai_configs[config_key]
+    elif db and AIConfig:
         # 优化：直接查询需要的配置项，避免查询所有配置
         base_url_config = AIConfig.query.filter_by(config_key="comfyui_base_url").first()
         if base_url_config:
@@ -332,6 +323,12 @@ def get_ai_config(config_key, default_value=None, db=None, AIConfig=None):
             if hasattr(test_server_module, "AIConfig"):
                 AIConfig = test_server_module.AIConfig
 
+    from app.services.config_registry import get_config_snapshot
+
+    snapshot = get_config_snapshot()
+    if snapshot is not None:
+        return snapshot.get(config_key, default_value)
+
     if db and AIConfig:
         config = AIConfig.query.filter_by(config_key=config_key).first()
         if config:
@@ -722,6 +719,7 @@ def create_ai_task(
             # ComfyUI需要图片在输入目录中，需要通过API上传
             comfyui_base_url = comfyui_config.get("base_url", "http://127.0.0.1:8188")
             comfyui_upload_url = f"{comfyui_base_url.rstrip('/')}/upload/image"
+            comfyui_destination = f"comfyui:{comfyui_base_url.rstrip('/')}"
 
             # 上传图片到ComfyUI
             comfyui_image_filename = None
@@ -749,58 +747,61 @@ def create_ai_task(
                         30, int(10 + file_size_mb * 2)
                     )  # 大文件：动态计算，最多30秒
 
-                # 优化：使用Session复用连接，提高性能
-                upload_session = requests.Session()
-                upload_session.headers.update(
-                    {"Connection": "keep-alive", "Keep-Alive": "timeout=5, max=100"}
-                )
-
-                # 读取图片文件
-                file_read_start = time_module.time()
-                with open(input_image_path, "rb") as f:
-                    # 生成唯一的文件名（避免冲突）
-                    original_filename = os.path.basename(input_image_path)
-                    name, ext = os.path.splitext(original_filename)
-                    upload_filename = f"{name}_{ai_task.id}_{int(time.time())}{ext}"
-
-                    # 上传文件（ComfyUI的/upload/image API）
-                    files = {
-                        "image": (
-                            upload_filename,
-                            f,
-                            "image/jpeg" if ext.lower() in [".jpg", ".jpeg"] else "image/png",
-                        )
-                    }
+                # 按内容去重：同一图片已上传到该ComfyUI时直接复用文件名（重试、赠送工作流不重复上传）
+                original_filename = os.path.basename(input_image_path)
+                name, ext = os.path.splitext(original_filename)
 
-                    file_read_duration = time_module.time() - file_read_start
-                    logger.info(f"   读取文件耗时: {file_read_duration:.3f} 秒")
+                def _upload_to_comfyui(digest):
+                    # 按内容命名（同一内容同名），无法计算哈希时使用任务ID+时间戳避免冲突
+                    if digest:
+                        upload_filename = f"{name}_{digest[:16]}{ext}"
+                    else:
+                        upload_filename = f"{name}_{ai_task.id}_{int(time.time())}{ext}"
+
+                    # 读取图片文件
+                    file_read_start = time_module.time()
+                    with open(input_image_path, "rb") as f:
+                        # 上传文件（ComfyUI的/upload/image API）
+                        files = {
+                            "image": (
+                                upload_filename,
+                                f,
+                                "image/jpeg" if ext.lower() in [".jpg", ".jpeg"] else "image/png",
+                            )
+                        }
 
-                    upload_start_time = time_module.time()
-                    upload_response = upload_session.post(
-                        comfyui_upload_url,
-                        files=files,
-                        timeout=upload_timeout,  # 动态超时时间
-                        proxies={"http": None, "https": None},  # 禁用代理
-                    )
-                    upload_duration = time_module.time() - upload_start_time
-                    logger.info(
-                        f"   上传耗时: {upload_duration:.2f} 秒 (超时设置: {upload_timeout}秒)"
-                    )
+                        file_read_duration = time_module.time() - file_read_start
+                        logger.info(f"   读取文件耗时: {file_read_duration:.3f} 秒")
 
-                    # 关闭session
-                    upload_session.close()
+                        upload_start_time = time_module.time()
+                        upload_response = get_http_client("comfyui").post(
+                            comfyui_upload_url,
+                            files=files,
+                            timeout=upload_timeout,  # 动态超时时间
+                            proxies={"http": None, "https": None},  # 禁用代理
+                        )
+                        upload_duration = time_module.time() - upload_start_time
+                        logger.info(
+                            f"   上传耗时: {upload_duration:.2f} 秒 (超时设置: {upload_timeout}秒)"
+                        )
 
-                    if upload_response.status_code == 200:
-                        upload_result = upload_response.json()
-                        # ComfyUI返回格式通常是: {"name": "filename.jpg", "subfolder": "", "type": "input"}
-                        comfyui_image_filename = upload_result.get("name", upload_filename)
-                        logger.info(f"✅ 图片已上传到ComfyUI: {comfyui_image_filename}")
-                    else:
+                        if upload_response.status_code == 200:
+                            upload_result = upload_response.json()
+                            # ComfyUI返回格式通常是: {"name": "filename.jpg", "subfolder": "", "type": "input"}
+                            return upload_result.get("name", upload_filename)
                         error_msg = f"上传图片到ComfyUI失败: HTTP {upload_response.status_code}, {upload_response.text}"
-                        logger.error("{error_msg}")
-                        # 如果上传失败，尝试使用原始文件名（可能文件已存在）
-                        comfyui_image_filename = upload_filename
-                        logger.warning("使用文件名作为后备方案: {comfyui_image_filename}")
+                        logger.error(error_msg)
+                        return None
+
+                comfyui_image_filename = upload_once(
+                    comfyui_destination, input_image_path, _upload_to_comfyui
+                )
+                if comfyui_image_filename:
+                    logger.info(f"✅ 图片已上传到ComfyUI: {comfyui_image_filename}")
+                else:
+                    # 如果上传失败，尝试使用原始文件名（可能文件已存在）
+                    comfyui_image_filename = original_filename
+                    logger.warning(f"使用文件名作为后备方案: {comfyui_image_filename}")
 
             except requests.exceptions.Timeout:
                 # 超时：直接使用文件名，ComfyUI可能已经有这个文件
@@ -850,37 +851,18 @@ def create_ai_task(
         }
 
         try:
-            # 使用信号量限制并发数（防止ComfyUI过载）
-            # 优化：减少超时时间，加快响应速度（本地ComfyUI应该很快响应）
-            semaphore = _get_comfyui_semaphore()
-            semaphore.acquire()
-            try:
-                # 优化：使用Session复用连接，提高性能
-                submit_session = requests.Session()
-                submit_session.headers.update(
-                    {
-                        "Connection": "keep-alive",
-                        "Keep-Alive": "timeout=5, max=100",
-                        "Content-Type": "application/json",
-                    }
-                )
-
-                # 禁用代理，直接连接ComfyUI
-                # 优化：本地ComfyUI应该很快响应，减少超时时间到15秒（提交应该很快）
-                submit_start_time = time_module.time()
-                response = submit_session.post(
-                    comfyui_url,
-                    json=request_body,
-                    timeout=15,  # 减少超时时间到15秒（本地ComfyUI提交应该很快）
-                    proxies={"http": None, "https": None},
-                )
-                submit_duration = time_module.time() - submit_start_time
-                logger.info(f"   提交到ComfyUI耗时: {submit_duration:.2f} 秒")
-
-                # 关闭session
-                submit_session.close()
-            finally:
-                semaphore.release()
+            # 共享连接池（keep-alive复用），并发上限为 comfyui_max_concurrency（防止ComfyUI过载）
+            # 禁用代理，直接连接ComfyUI
+            # 优化：本地ComfyUI应该很快响应，减少超时时间到15秒（提交应该很快）
+            submit_start_time = time_module.time()
+            response = get_http_client("comfyui").post(
+                comfyui_url,
+                json=request_body,
+                timeout=15,  # 减少超时时间到15秒（本地ComfyUI提交应该很快）
+                proxies={"http": None, "https": None},
+            )
+            submit_duration = time_module.time() - submit_start_time
+            logger.info(f"   提交到ComfyUI耗时: {submit_duration:.2f} 秒")
 
             if response.status_code == 200:
                 result = response.json()
@@ -920,7 +902,7 @@ def create_ai_task(
                 try:
                     history_url = f"{comfyui_config['base_url']}/history/{prompt_id}"
                     logger.info(f"   🔍 立即检查任务是否已完成: {history_url}")
-                    check_response = requests.get(
+                    check_response = get_http_client("comfyui").get(
                         history_url, timeout=5, proxies={"http": None, "https": None}
                     )
                     if check_response.status_code == 200:
@@ -1110,6 +1092,12 @@ def create_ai_task(
 
                 return True, ai_task, None
             else:
+                if input_ids:
+                    # 提交被拒绝（如输入图片已被ComfyUI清理），丢弃上传索引，重试时重新上传
+                    try:
+                        forget_uploaded_ref(comfyui_destination, file_digest(input_image_path))
+                    except OSError:
+                        pass
                 ai_task.status = "failed"
                 ai_task.error_message = f"ComfyUI提交失败: {response.text}"
                 ai_task.error_code = f"HTTP_{response.status_code}"
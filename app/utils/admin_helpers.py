@@ -70,6 +70,7 @@ def get_models(model_names=None):
             "Commission": getattr(test_server_module, "Commission", None),
             "Withdrawal": getattr(test_server_module, "Withdrawal", None),
             "UserVisit": getattr(test_server_module, "UserVisit", None),
+            "UserVisitRollup": getattr(test_server_module, "UserVisitRollup", None),
             "Coupon": getattr(test_server_module, "Coupon", None),
             "UserCoupon": getattr(test_server_module, "UserCoupon", None),
             "ShareRecord": getattr(test_server_module, "ShareRecord", None),
@@ -79,6 +80,13 @@ def get_models(model_names=None):
             "MeituAPIPreset": getattr(test_server_module, "MeituAPIPreset", None),
             "MeituTask": getattr(test_server_module, "MeituTask", None),
             "PollingConfig": getattr(test_server_module, "PollingConfig", None),
+            "TaskQueueJob": getattr(test_server_module, "TaskQueueJob", None),
+            "ProviderGatewayJob": getattr(test_server_module, "ProviderGatewayJob", None),
+            "OrderRevenueRollup": getattr(test_server_module, "OrderRevenueRollup", None),
+            "OrderStatusRollup": getattr(test_server_module, "OrderStatusRollup", None),
+            "OrderSearchGram": getattr(test_server_module, "OrderSearchGram", None),
+            "OrderEvent": getattr(test_server_module, "OrderEvent", None),
+            "OrderEventCursor": getattr(test_server_module, "OrderEventCursor", None),
             "MockupTemplate": getattr(test_server_module, "MockupTemplate", None),
             "MockupTemplateProduct": getattr(test_server_module, "MockupTemplateProduct", None),
             "OperationLog": getattr(test_server_module, "OperationLog", None),
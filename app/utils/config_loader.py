@@ -22,6 +22,17 @@ def get_config_value(config_key, default_value=None, db=None, AIConfig=None):
     Returns:
         配置值（字符串），如果不存在则返回默认值
     """
+    try:
+        # 优先读取进程内配置快照（不访问数据库）
+        from app.services.config_registry import get_config_snapshot
+
+        snapshot = get_config_snapshot()
+        if snapshot is not None:
+            value = snapshot.get(config_key)
+            return value if value else default_value
+    except Exception as e:
+        logger.debug(f"读取配置快照失败，直接查询数据库: {e}")
+
     try:
         # 如果没有传入，尝试从test_server获取
         if not db or not AIConfig:
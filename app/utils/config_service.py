@@ -25,6 +25,8 @@ class ConfigService:
         self.db = db
         self.AIConfig = AIConfig
         self._cache = {}
+        # 缓存对应的配置快照：快照重新加载（配置被修改）后缓存失效
+        self._cache_snapshot = None
 
     def get_config(self, key, default_value=None, use_cache=True):
         """
@@ -44,14 +46,23 @@ class ConfigService:
         Returns:
             配置值
         """
+        from app.services.config_registry import get_config_snapshot
+
+        snapshot = get_config_snapshot()
+        if snapshot is not self._cache_snapshot:
+            self._cache.clear()
+            self._cache_snapshot = snapshot
+
         # 检查缓存
         if use_cache and key in self._cache:
             return self._cache[key]
 
         value = None
 
-        # 1. 优先从数据库读取
-        if self.db and self.AIConfig:
+        # 1. 优先从数据库读取（配置快照可用时不访问数据库）
+        if snapshot is not None:
+            value = snapshot.get(key) or None
+        elif self.db and self.AIConfig:
             try:
                 config = self.AIConfig.query.filter_by(config_key=key).first()
                 if config and config.config_value:
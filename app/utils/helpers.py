@@ -501,8 +501,12 @@ def allowed_file(filename):
 # ============================================================================
 
 
-def generate_production_info(order):
-    """生成制作信息文本"""
+def generate_production_info(order, include_generated_time=True):
+    """
+    生成制作信息文本
+
+    include_generated_time=False 时不含生成时间，内容只随订单变化（用作压缩包缓存指纹）
+    """
     from datetime import datetime
 
     # 获取服务器配置
@@ -606,9 +610,10 @@ def generate_production_info(order):
     info_lines.append(f"系统: {get_base_url()}")
     info_lines.append("客服: 请通过系统联系")
     info_lines.append("")
-    info_lines.append("=" * 50)
-    info_lines.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    info_lines.append("=" * 50)
+    if include_generated_time:
+        info_lines.append("=" * 50)
+        info_lines.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        info_lines.append("=" * 50)
 
     return "\n".join(info_lines)
 
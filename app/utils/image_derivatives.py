@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+图片派生图（按需缩放 / 转码）工具
+在 /public/hd、/media/* 等图片路由上通过查询参数请求不同尺寸、质量、格式的派生图：
+
+    /public/hd/xxx.jpg?w=480&q=75&fmt=webp
+
+- w: 目标宽度，向上取整到固定档位（避免缓存碎片），不会放大原图
+- q: 质量，同样向上取整到固定档位（50 / 65 / 80 / 90 / 95），默认 80
+- fmt: jpeg / webp / auto（按 Accept 头协商，支持 WebP 时返回 WebP）
+- v: 可选，原图版本号（响应头 X-Image-Version），与当前原图一致时返回 immutable 缓存头
+
+派生图按 (原图路径, 修改时间, 大小, 参数) 的哈希寻址缓存在磁盘上，总大小超过上限时按最近使用时间淘汰；
+JPEG 原图使用 draft 模式按比例解码，避免全分辨率解码后再缩小。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 派生图算法变更时递增，使旧缓存失效
+DERIVATIVE_VERSION = 1
+
+# 宽度档位（小程序常用展示宽度）
+WIDTH_STEPS = (160, 320, 480, 640, 750, 960, 1280, 1920)
+# 质量档位
+QUALITY_STEPS = (50, 65, 80, 90, 95)
+DEFAULT_QUALITY = 80
+
+FORMAT_MIMETYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+# 命中时刷新文件修改时间（用于LRU淘汰）的最小间隔，避免每次访问都写磁盘
+_TOUCH_INTERVAL = 3600
+# 两次淘汰扫描的最小间隔
+_EVICT_INTERVAL = 60
+
+_generate_locks = {}
+_generate_locks_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_last_evict_at = 0.0
+
+
+class DerivativeParams:
+    """派生图参数（已规范化）"""
+
+    def __init__(self, width, quality, fmt, negotiated=False, version=None):
+        self.width = width
+        self.quality = quality
+        self.fmt = fmt
+        self.negotiated = negotiated
+        self.version = version
+
+    def cache_token(self):
+        return f"w{self.width or 0}-q{self.quality}-{self.fmt}"
+
+
+def _snap(value, steps):
+    for step in steps:
+        if value <= step:
+            return step
+    return steps[-1]
+
+
+def _snap_width(width):
+    return _snap(width, WIDTH_STEPS)
+
+
+def _snap_quality(quality):
+    return _snap(quality, QUALITY_STEPS)
+
+
+def parse_derivative_params(args, accept_header=""):
+    """
+    从请求参数解析派生图参数
+
+    :return: DerivativeParams；没有派生图相关参数时返回 None（按原图处理）
+    """
+    if not any(key in args for key in ("w", "q", "fmt")):
+        return None
+
+    width = None
+    raw_width = args.get("w", type=int)
+    if raw_width and raw_width > 0:
+        width = _snap_width(raw_width)
+
+    quality = _snap_quality(args.get("q", DEFAULT_QUALITY, type=int))
+
+    fmt = (args.get("fmt") or "jpeg").lower()
+    negotiated = False
+    if fmt == "jpg":
+        fmt = "jpeg"
+    elif fmt == "auto":
+        negotiated = True
+        fmt = "webp" if "image/webp" in (accept_header or "") else "jpeg"
+    if fmt not in FORMAT_MIMETYPES:
+        fmt = "jpeg"
+
+    return DerivativeParams(width, quality, fmt, negotiated=negotiated, version=args.get("v"))
+
+
+def source_version(source_path):
+    """原图版本号：路径 + 修改时间 + 大小 的摘要，原图被替换后随之变化"""
+    stat = os.stat(source_path)
+    identity = f"{os.path.abspath(source_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+
+
+def get_cache_dir(app):
+    cache_dir = app.config.get("IMAGE_DERIVATIVE_CACHE_FOLDER")
+    if not cache_dir:
+        cache_dir = os.path.join(app.root_path, "data", "derivative_cache")
+    if not os.path.isabs(cache_dir):
+        cache_dir = os.path.join(app.root_path, cache_dir)
+    return cache_dir
+
+
+def _cache_max_bytes(app):
+    return int(app.config.get("IMAGE_DERIVATIVE_CACHE_MAX_MB", 2048)) * 1024 * 1024
+
+
+def _render(source_path, params, output_path):
+    with Image.open(source_path) as img:
+        if params.width and img.format == "JPEG":
+            # draft 模式：JPEG 解码阶段直接按 1/2、1/4、1/8 缩小（结果不小于目标尺寸）
+            orientation = img.getexif().get(0x0112, 1)
+            raw_w, raw_h = img.size
+            display_w = raw_h if orientation in (5, 6, 7, 8) else raw_w
+            if params.width < display_w:
+                scale = params.width / display_w
+                img.draft("RGB", (max(int(raw_w * scale), 1), max(int(raw_h * scale), 1)))
+
+        img = ImageOps.exif_transpose(img)
+
+        if params.width and img.width > params.width:
+            new_height = max(int(img.height * params.width / img.width), 1)
+            img = img.resize((params.width, new_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        if params.fmt == "webp":
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+            img.save(output_path, "WEBP", quality=params.quality, method=4)
+        else:
+            # JPG不支持透明度，铺白色背景
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(output_path, "JPEG", quality=params.quality, optimize=True, progressive=True)
+
+
+def _key_lock(key):
+    with _generate_locks_lock:
+        lock = _generate_locks.get(key)
+        if lock is None:
+            lock = _generate_locks[key] = threading.Lock()
+        return lock
+
+
+def get_derivative(app, source_path, params):
+    """
+    获取（必要时生成）派生图
+
+    :return: (派生图路径, 强ETag, 原图版本号)
+    """
+    version = source_version(source_path)
+    key = hashlib.sha256(
+        f"{DERIVATIVE_VERSION}:{version}:{params.cache_token()}".encode("utf-8")
+    ).hexdigest()
+    ext = "webp" if params.fmt == "webp" else "jpg"
+    cache_dir = os.path.join(get_cache_dir(app), key[:2])
+    path = os.path.join(cache_dir, f"{key}.{ext}")
+
+    if os.path.exists(path):
+        _touch(path)
+        return path, key, version
+
+    lock = _key_lock(key)
+    try:
+        with lock:
+            if not os.path.exists(path):
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    _render(source_path, params, tmp_path)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        try:
+                            os.remove(tmp_path)
+                        except OSError:
+                            pass
+                _schedule_evict(app)
+    finally:
+        # 生成失败时同样移除，避免失败的键一直留在锁表中
+        with _generate_locks_lock:
+            _generate_locks.pop(key, None)
+    return path, key, version
+
+
+def _touch(path):
+    try:
+        if time.time() - os.path.getmtime(path) > _TOUCH_INTERVAL:
+            os.utime(path, None)
+    except OSError:
+        pass
+
+
+def _schedule_evict(app):
+    """缓存写入后触发淘汰扫描（后台线程执行，同一进程内最多每分钟一次）"""
+    global _last_evict_at
+
+    now = time.time()
+    if now - _last_evict_at < _EVICT_INTERVAL or not _evict_lock.acquire(blocking=False):
+        return
+    _last_evict_at = now
+    thread = threading.Thread(
+        target=_evict,
+        args=(get_cache_dir(app), _cache_max_bytes(app)),
+        daemon=True,
+        name="DerivativeCacheEvict",
+    )
+    try:
+        thread.start()
+    except Exception:
+        _evict_lock.release()
+        raise
+
+
+def _evict(cache_dir, max_bytes):
+    """缓存总大小超过上限时，按修改时间（最近使用时间）从旧到新删除到上限的90%"""
+    try:
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+                total += stat.st_size
+        if total <= max_bytes:
+            return
+
+        target = int(max_bytes * 0.9)
+        removed = 0
+        for _mtime, size, file_path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(file_path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        logger.info(f"🧹 派生图缓存淘汰 {removed} 个文件，当前约 {total / 1024 / 1024:.1f} MB")
+    except Exception as e:
+        logger.warning(f"派生图缓存淘汰失败: {e}")
+    finally:
+        _evict_lock.release()
+
+
+def send_derivative(source_path, params):
+    """
+    返回派生图响应（强ETag + 条件请求 + 缓存头）
+
+    请求携带的 v 与原图版本一致时使用 immutable 长期缓存，否则缓存7天并依赖ETag再验证。
+    """
+    from flask import current_app, request, send_file
+
+    path, etag, version = get_derivative(current_app, source_path, params)
+    immutable = bool(params.version) and params.version == version
+    response = send_file(
+        path,
+        mimetype=FORMAT_MIMETYPES[params.fmt],
+        etag=False,
+        conditional=False,
+        max_age=IMMUTABLE_MAX_AGE if immutable else DEFAULT_MAX_AGE,
+    )
+    response.set_etag(etag)
+    response.headers["X-Image-Version"] = version
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    if params.negotiated:
+        response.vary.add("Accept")
+    return response.make_conditional(request)
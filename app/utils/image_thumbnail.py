@@ -13,20 +13,8 @@ import sys
 from PIL import Image
 
 
-def generate_thumbnail(original_path, thumbnail_path=None, max_size=None, quality=None):
-    """
-    生成缩略图（长边最大1920px的JPG）
-
-    Args:
-        original_path: 原图路径
-        thumbnail_path: 缩略图保存路径（如果为None，则在原图同目录下生成，文件名加_thumb后缀）
-        max_size: 最大边长（如果为None，从配置读取，默认1920px）
-        quality: JPEG质量（如果为None，从配置读取，默认85）
-
-    Returns:
-        str: 缩略图路径，如果失败返回None
-    """
-    # 从配置读取默认值
+def resolve_thumbnail_settings(max_size=None, quality=None):
+    """缩略图长边与JPEG质量（未指定时从配置读取，默认1920px、85）"""
     if max_size is None or quality is None:
         try:
             from app.utils.image_path_config import get_image_path_config
@@ -43,6 +31,60 @@ def generate_thumbnail(original_path, thumbnail_path=None, max_size=None, qualit
                 max_size = 1920
             if quality is None:
                 quality = 85
+    return max_size, quality
+
+
+def thumbnail_image(img, max_size):
+    """
+    由已解码的图片生成缩略图（RGB，长边不超过max_size；不修改传入的图片）
+
+    Args:
+        img: PIL Image
+        max_size: 最大边长
+
+    Returns:
+        PIL Image
+    """
+    # 转换为RGB（JPG不支持透明度）
+    if img.mode in ("RGBA", "LA", "P"):
+        # 创建白色背景
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        background.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # 计算新尺寸（保持宽高比，长边不超过max_size）
+    width, height = img.size
+    if width > max_size or height > max_size:
+        if width > height:
+            new_width = max_size
+            new_height = int(height * max_size / width)
+        else:
+            new_height = max_size
+            new_width = int(width * max_size / height)
+
+        # 使用高质量重采样
+        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    return img
+
+
+def generate_thumbnail(original_path, thumbnail_path=None, max_size=None, quality=None):
+    """
+    生成缩略图（长边最大1920px的JPG）
+
+    Args:
+        original_path: 原图路径
+        thumbnail_path: 缩略图保存路径（如果为None，则在原图同目录下生成，文件名加_thumb后缀）
+        max_size: 最大边长（如果为None，从配置读取，默认1920px）
+        quality: JPEG质量（如果为None，从配置读取，默认85）
+
+    Returns:
+        str: 缩略图路径，如果失败返回None
+    """
+    max_size, quality = resolve_thumbnail_settings(max_size, quality)
     try:
         if not os.path.exists(original_path):
             logger.error("原图文件不存在: {original_path}")
@@ -50,35 +92,16 @@ def generate_thumbnail(original_path, thumbnail_path=None, max_size=None, qualit
 
         # 如果没有指定缩略图路径，自动生成
         if thumbnail_path is None:
-            base, ext = os.path.splitext(original_path)
             # 将扩展名改为.jpg（统一使用JPG格式）
-            thumbnail_path = f"{base}_thumb.jpg"
+            thumbnail_path = get_thumbnail_path(original_path)
 
         # 打开原图
         with Image.open(original_path) as img:
-            # 转换为RGB（JPG不支持透明度）
-            if img.mode in ("RGBA", "LA", "P"):
-                # 创建白色背景
-                background = Image.new("RGB", img.size, (255, 255, 255))
-                if img.mode == "P":
-                    img = img.convert("RGBA")
-                background.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
-                img = background
-            elif img.mode != "RGB":
-                img = img.convert("RGB")
-
-            # 计算新尺寸（保持宽高比，长边不超过max_size）
-            width, height = img.size
-            if width > max_size or height > max_size:
-                if width > height:
-                    new_width = max_size
-                    new_height = int(height * max_size / width)
-                else:
-                    new_height = max_size
-                    new_width = int(width * max_size / height)
-
-                # 使用高质量重采样
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # JPEG使用draft模式按比例解码（结果不小于目标尺寸），避免全分辨率解码后再缩小
+            if img.format == "JPEG":
+                img.draft("RGB", (max_size, max_size))
+
+            img = thumbnail_image(img, max_size)
 
             # 确保缩略图目录存在
             thumbnail_dir = os.path.dirname(thumbnail_path)
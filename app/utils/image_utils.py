@@ -2,15 +2,202 @@
 """
 图片处理工具函数
 从 test_server.py 迁移图片处理相关函数
+
+水印合成：
+- 按 (水印文件, 透明度, 目标尺寸, 位置) 缓存与原图同尺寸的预合成水印层（RGBA），
+  同一批次的照片尺寸通常相同，只需生成一次水印层，之后每张图只做一次 alpha_composite
+- 水印文件按 (路径, 修改时间, 大小) 缓存解码与透明度调整结果，替换水印文件后自动失效
 """
 
 import logging
 
 logger = logging.getLogger(__name__)
 import os
+import threading
+from collections import OrderedDict
 
 from PIL import Image
 
+# 水印层缓存总大小上限（字节）
+WATERMARK_LAYER_CACHE_BYTES = int(os.environ.get("WATERMARK_LAYER_CACHE_MB", "256")) * 1024 * 1024
+WATERMARK_CACHE_SIZE = 16
+
+_watermarks = OrderedDict()  # (路径, mtime_ns, 大小, 透明度) -> 调整透明度后的RGBA水印
+_layers = OrderedDict()  # (路径, mtime_ns, 大小, 透明度, 目标尺寸, 位置) -> RGBA水印层
+_layers_bytes = 0
+_watermark_lock = threading.Lock()
+
+
+def _reset_watermark_lock():
+    global _watermark_lock
+    _watermark_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    # fork 出的子进程继承已缓存的水印层，但不能继承其他线程持有的锁
+    os.register_at_fork(after_in_child=_reset_watermark_lock)
+
+
+def _apply_opacity(watermark, opacity):
+    """按透明度缩放水印的alpha通道"""
+    if watermark.mode != "RGBA":
+        watermark = watermark.convert("RGBA")
+    if opacity < 1.0:
+        alpha = watermark.getchannel("A").point(lambda a: int(a * opacity))
+        watermark = watermark.copy()
+        watermark.putalpha(alpha)
+    return watermark
+
+
+def build_watermark_layer(watermark, size, position="tiled"):
+    """
+    生成与原图同尺寸的水印层（水印以外区域全透明）
+
+    Args:
+        watermark: 已调整透明度的RGBA水印图
+        size: 原图尺寸 (宽, 高)
+        position: 水印位置（同 add_watermark_to_image）
+
+    Returns:
+        PIL Image: RGBA水印层
+    """
+    base_width, base_height = size
+    wm_width, wm_height = watermark.size
+
+    if position == "tiled":
+        # 单层水印自适应放大覆盖整个画面
+        # 使用较大的缩放比例，确保完全覆盖
+        scale = max(base_width / wm_width, base_height / wm_height) * 1.1
+        new_size = (int(wm_width * scale), int(wm_height * scale))
+        watermark = watermark.resize(new_size, Image.Resampling.LANCZOS)
+
+        logger.info(f"水印缩放: {wm_width}x{wm_height} -> {new_size[0]}x{new_size[1]}")
+
+        # 居中（超出画面的部分在粘贴时自动裁剪）
+        x = (base_width - new_size[0]) // 2
+        y = (base_height - new_size[1]) // 2
+
+    elif position == "center":
+        # 单个水印居中，占图片的30%，保持宽高比
+        target_width = int(base_width * 0.3)
+        target_height = int(base_height * 0.3)
+        scale = min(target_width / wm_width, target_height / wm_height)
+        new_size = (int(wm_width * scale), int(wm_height * scale))
+        watermark = watermark.resize(new_size, Image.Resampling.LANCZOS)
+
+        x = (base_width - new_size[0]) // 2
+        y = (base_height - new_size[1]) // 2
+
+    else:
+        # 其他位置：水印太大时按比例缩小
+        if wm_width > base_width * 0.3 or wm_height > base_height * 0.3:
+            scale = min(base_width * 0.3 / wm_width, base_height * 0.3 / wm_height)
+            new_size = (int(wm_width * scale), int(wm_height * scale))
+            watermark = watermark.resize(new_size, Image.Resampling.LANCZOS)
+            wm_width, wm_height = new_size
+
+        # 根据位置计算坐标
+        if position == "bottom_left":
+            x = 20
+            y = base_height - wm_height - 20
+        elif position == "top_right":
+            x = base_width - wm_width - 20
+            y = 20
+        elif position == "top_left":
+            x = 20
+            y = 20
+        else:
+            # bottom_right 及未知位置
+            x = base_width - wm_width - 20
+            y = base_height - wm_height - 20
+
+        # 确保坐标不为负数
+        x = max(0, x)
+        y = max(0, y)
+
+    layer = Image.new("RGBA", (base_width, base_height), (0, 0, 0, 0))
+    layer.paste(watermark, (x, y))
+    return layer
+
+
+def _watermark_file_key(watermark_path, opacity):
+    stat = os.stat(watermark_path)
+    return (os.path.abspath(watermark_path), stat.st_mtime_ns, stat.st_size, float(opacity))
+
+
+def _load_watermark(file_key):
+    with _watermark_lock:
+        watermark = _watermarks.get(file_key)
+        if watermark is not None:
+            _watermarks.move_to_end(file_key)
+            return watermark
+
+    with Image.open(file_key[0]) as source:
+        watermark = _apply_opacity(source, file_key[3])
+        watermark.load()
+
+    with _watermark_lock:
+        _watermarks[file_key] = watermark
+        while len(_watermarks) > WATERMARK_CACHE_SIZE:
+            _watermarks.popitem(last=False)
+    return watermark
+
+
+def get_watermark_layer(watermark_path, size, opacity=1.0, position="tiled"):
+    """
+    获取（必要时生成并缓存）指定尺寸的水印层
+
+    Args:
+        watermark_path: 水印图片路径
+        size: 原图尺寸 (宽, 高)
+        opacity: 水印透明度 (0-1)
+        position: 水印位置
+
+    Returns:
+        PIL Image: RGBA水印层（缓存对象，调用方不能修改）
+    """
+    global _layers_bytes
+
+    file_key = _watermark_file_key(watermark_path, opacity)
+    key = file_key + (tuple(size), position)
+    with _watermark_lock:
+        layer = _layers.get(key)
+        if layer is not None:
+            _layers.move_to_end(key)
+            return layer
+
+    layer = build_watermark_layer(_load_watermark(file_key), size, position)
+
+    layer_bytes = size[0] * size[1] * 4
+    if layer_bytes <= WATERMARK_LAYER_CACHE_BYTES:
+        with _watermark_lock:
+            if key not in _layers:
+                _layers[key] = layer
+                _layers_bytes += layer_bytes
+            while _layers_bytes > WATERMARK_LAYER_CACHE_BYTES and _layers:
+                (_, _, _, _, (width, height), _), _ = _layers.popitem(last=False)
+                _layers_bytes -= width * height * 4
+    return layer
+
+
+def apply_watermark(base_image, watermark_path, opacity=1.0, position="tiled"):
+    """
+    将水印合成到已解码的图片上（不修改传入的图片）
+
+    Args:
+        base_image: 原图（PIL Image）
+        watermark_path: 水印图片路径
+        opacity: 水印透明度 (0-1)
+        position: 水印位置（同 add_watermark_to_image）
+
+    Returns:
+        PIL Image: 合成后的RGBA图片
+    """
+    if base_image.mode != "RGBA":
+        base_image = base_image.convert("RGBA")
+    layer = get_watermark_layer(watermark_path, base_image.size, opacity, position)
+    return Image.alpha_composite(base_image, layer)
+
 
 def add_watermark_to_image(
     image_path, watermark_path, output_path=None, opacity=1.0, position="tiled"
@@ -47,162 +234,50 @@ def add_watermark_to_image(
             logger.error("水印文件为空: {watermark_path}")
             return False
 
-        # 打开原图和水印图
+        # 打开原图，与缓存的水印层合成
         with Image.open(image_path) as base_image:
-            with Image.open(watermark_path) as watermark:
-                # 确保水印图片有alpha通道
-                if watermark.mode != "RGBA":
-                    watermark = watermark.convert("RGBA")
-
-                # 调整水印透明度
-                if opacity < 1.0:
-                    # 创建透明水印
-                    transparent_watermark = Image.new("RGBA", watermark.size, (0, 0, 0, 0))
-                    for x in range(watermark.width):
-                        for y in range(watermark.height):
-                            r, g, b, a = watermark.getpixel((x, y))
-                            transparent_watermark.putpixel((x, y), (r, g, b, int(a * opacity)))
-                    watermark = transparent_watermark
-
-                base_width, base_height = base_image.size
-                wm_width, wm_height = watermark.size
-
-                # 确保原图有alpha通道
-                if base_image.mode != "RGBA":
-                    base_image = base_image.convert("RGBA")
-
-                # 创建副本
-                watermarked_image = base_image.copy()
-
-                if position == "tiled":
-                    # 单层水印自适应放大覆盖整个画面
-                    # 计算缩放比例，使水印覆盖整个画面
-                    scale_x = base_width / wm_width
-                    scale_y = base_height / wm_height
-
-                    # 使用较大的缩放比例，确保完全覆盖
-                    scale = max(scale_x, scale_y) * 1.1  # 稍微放大一点确保完全覆盖
-
-                    # 缩放水印
-                    new_size = (int(wm_width * scale), int(wm_height * scale))
-                    scaled_watermark = watermark.resize(new_size, Image.Resampling.LANCZOS)
-
-                    logger.info(f"水印缩放: {wm_width}x{wm_height} -> {new_size[0]}x{new_size[1]}")
-
-                    # 计算居中位置
-                    x = (base_width - new_size[0]) // 2
-                    y = (base_height - new_size[1]) // 2
-
-                    # 如果水印超出边界，裁剪到图片大小
-                    if new_size[0] > base_width or new_size[1] > base_height:
-                        # 计算裁剪区域
-                        left = max(0, -x)
-                        top = max(0, -y)
-                        right = min(new_size[0], base_width - x)
-                        bottom = min(new_size[1], base_height - y)
-
-                        # 裁剪水印
-                        scaled_watermark = scaled_watermark.crop((left, top, right, bottom))
-
-                        # 调整粘贴位置
-                        x = max(0, x)
-                        y = max(0, y)
-
-                    # 粘贴水印
-                    watermarked_image.paste(scaled_watermark, (x, y), scaled_watermark)
-
-                elif position == "center":
-                    # 单个水印居中
-                    # 计算水印应该占图片的比例
-                    target_ratio = 0.3
-                    target_width = int(base_width * target_ratio)
-                    target_height = int(base_height * target_ratio)
-
-                    # 按比例缩放水印，保持宽高比
-                    scale = min(target_width / wm_width, target_height / wm_height)
-                    new_size = (int(wm_width * scale), int(wm_height * scale))
-                    scaled_watermark = watermark.resize(new_size, Image.Resampling.LANCZOS)
-
-                    # 计算居中位置
-                    x = (base_width - new_size[0]) // 2
-                    y = (base_height - new_size[1]) // 2
-
-                    # 粘贴水印
-                    watermarked_image.paste(scaled_watermark, (x, y), scaled_watermark)
-
-                else:
-                    # 其他位置（保持原有逻辑）
-                    # 如果水印太大，按比例缩小
-                    if wm_width > base_width * 0.3 or wm_height > base_height * 0.3:
-                        scale = min(base_width * 0.3 / wm_width, base_height * 0.3 / wm_height)
-                        new_size = (int(wm_width * scale), int(wm_height * scale))
-                        watermark = watermark.resize(new_size, Image.Resampling.LANCZOS)
-                        wm_width, wm_height = new_size
-
-                    # 根据位置计算坐标
-                    if position == "bottom_right":
-                        x = base_width - wm_width - 20
-                        y = base_height - wm_height - 20
-                    elif position == "bottom_left":
-                        x = 20
-                        y = base_height - wm_height - 20
-                    elif position == "top_right":
-                        x = base_width - wm_width - 20
-                        y = 20
-                    elif position == "top_left":
-                        x = 20
-                        y = 20
-                    else:
-                        x = base_width - wm_width - 20
-                        y = base_height - wm_height - 20
-
-                    # 确保坐标不为负数
-                    x = max(0, x)
-                    y = max(0, y)
-
-                    # 粘贴水印
-                    watermarked_image.paste(watermark, (x, y), watermark)
-
-                # 保存图片
-                if output_path is None:
-                    output_path = image_path
-
-                # 如果原图是JPEG，需要转换回RGB
-                if output_path.lower().endswith((".jpg", ".jpeg")):
-                    watermarked_image = watermarked_image.convert("RGB")
-
-                # 保存到临时文件，然后重命名，确保原子性
-                temp_path = output_path + ".tmp"
-                # 根据原图格式保存临时文件
-                if output_path.lower().endswith((".jpg", ".jpeg")):
-                    watermarked_image.save(temp_path, format="JPEG", quality=95)
-                elif output_path.lower().endswith(".png"):
-                    watermarked_image.save(temp_path, format="PNG")
-                else:
-                    watermarked_image.save(temp_path, quality=95)
-
-                # 验证临时文件
-                if os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
-                    # 验证图片格式
-                    try:
-                        with Image.open(temp_path) as test_img:
-                            test_img.verify()
-                        # 验证通过，重命名
-                        if os.path.exists(output_path):
-                            os.remove(output_path)
-                        os.rename(temp_path, output_path)
-                        logger.info(f"✅ 水印添加成功: {output_path}")
-                        return True
-                    except Exception as verify_error:
-                        logger.error("水印图片验证失败: {str(verify_error)}")
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
-                        return False
-                else:
-                    logger.error("临时文件保存失败: {temp_path}")
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                    return False
+            watermarked_image = apply_watermark(base_image, watermark_path, opacity, position)
+
+        # 保存图片
+        if output_path is None:
+            output_path = image_path
+
+        # 如果原图是JPEG，需要转换回RGB
+        if output_path.lower().endswith((".jpg", ".jpeg")):
+            watermarked_image = watermarked_image.convert("RGB")
+
+        # 保存到临时文件，然后重命名，确保原子性
+        temp_path = output_path + ".tmp"
+        # 根据原图格式保存临时文件
+        if output_path.lower().endswith((".jpg", ".jpeg")):
+            watermarked_image.save(temp_path, format="JPEG", quality=95)
+        elif output_path.lower().endswith(".png"):
+            watermarked_image.save(temp_path, format="PNG")
+        else:
+            watermarked_image.save(temp_path, quality=95)
+
+        # 验证临时文件
+        if os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
+            # 验证图片格式
+            try:
+                with Image.open(temp_path) as test_img:
+                    test_img.verify()
+                # 验证通过，重命名
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                os.rename(temp_path, output_path)
+                logger.info(f"✅ 水印添加成功: {output_path}")
+                return True
+            except Exception as verify_error:
+                logger.error("水印图片验证失败: {str(verify_error)}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return False
+        else:
+            logger.error("临时文件保存失败: {temp_path}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
 
     except Exception as e:
         logger.error("添加水印失败: {str(e)}")
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+订单图片打包下载（流式ZIP + 磁盘缓存）
+
+- 流式：边读文件边输出ZIP数据块，不在内存中拼整个压缩包
+- JPEG/PNG等已压缩格式使用 STORED（不再重复压缩），文本等使用 DEFLATED
+- 缓存：首次下载时把输出同时写入缓存文件，完成后按 (制作信息, 文件列表, 文件修改时间/大小) 的指纹保存；
+  再次下载直接从磁盘发送（支持 Range 断点续传），订单图片变化后指纹随之变化。
+  内存数据含每次都不同的内容（如生成时间）时，用 cache_token 代替数据本身参与指纹
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import unicodedata
+import zipfile
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# 已压缩的格式，打包时不再压缩
+STORED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".heic", ".zip", ".mp4", ".mov"}
+
+CHUNK_SIZE = 1024 * 1024
+
+_prune_lock = threading.Lock()
+
+
+class _StreamWriter(io.RawIOBase):
+    """ZipFile 的输出目标：只追加、不可seek，写入的数据由生成器取走"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ArchiveEntry:
+    """
+    压缩包中的一个条目：磁盘文件（path）或内存数据（data）
+
+    cache_token: 内存数据的稳定标识，为空时按数据内容计算指纹
+    """
+
+    def __init__(self, arcname, path=None, data=None, cache_token=None):
+        self.arcname = arcname
+        self.path = path
+        self.data = data
+        self.cache_token = cache_token
+
+    def fingerprint(self):
+        if self.path is not None:
+            stat = os.stat(self.path)
+            return f"{self.arcname}|{os.path.abspath(self.path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        if self.cache_token is not None:
+            return f"{self.arcname}|token:{self.cache_token}"
+        return f"{self.arcname}|{hashlib.sha256(self.data).hexdigest()}"
+
+
+def _compress_type(arcname):
+    ext = os.path.splitext(arcname)[1].lower()
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def iter_zip_stream(entries):
+    """
+    流式生成ZIP数据块
+
+    :param entries: ArchiveEntry 列表（磁盘文件不存在的条目会被跳过）
+    """
+    writer = _StreamWriter()
+    with zipfile.ZipFile(writer, mode="w", allowZip64=True) as zf:
+        for entry in entries:
+            if entry.path is not None:
+                if not os.path.exists(entry.path):
+                    continue
+                zinfo = zipfile.ZipInfo.from_file(
+                    entry.path, arcname=entry.arcname, strict_timestamps=False
+                )
+                zinfo.compress_type = _compress_type(entry.arcname)
+                with open(entry.path, "rb") as src, zf.open(zinfo, "w", force_zip64=True) as dest:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = writer.take()
+                        if data:
+                            yield data
+            else:
+                zinfo = zipfile.ZipInfo(entry.arcname, date_time=time.localtime()[:6])
+                zinfo.compress_type = _compress_type(entry.arcname)
+                zf.writestr(zinfo, entry.data)
+            data = writer.take()
+            if data:
+                yield data
+    # 写入中央目录
+    data = writer.take()
+    if data:
+        yield data
+
+
+def archive_fingerprint(entries):
+    sha = hashlib.sha256()
+    for entry in entries:
+        if entry.path is not None and not os.path.exists(entry.path):
+            continue
+        sha.update(entry.fingerprint().encode("utf-8"))
+        sha.update(b"\n")
+    return sha.hexdigest()[:24]
+
+
+def get_archive_cache_dir(app):
+    cache_dir = app.config.get("ORDER_ARCHIVE_CACHE_FOLDER")
+    if not cache_dir:
+        cache_dir = os.path.join(app.root_path, "data", "order_archives")
+    if not os.path.isabs(cache_dir):
+        cache_dir = os.path.join(app.root_path, cache_dir)
+    return cache_dir
+
+
+def cached_archive_path(app, cache_key, entries):
+    """订单压缩包缓存路径（cache_key 区分订单，指纹区分内容）"""
+    return os.path.join(
+        get_archive_cache_dir(app), f"{cache_key}_{archive_fingerprint(entries)}.zip"
+    )
+
+
+def iter_zip_stream_cached(entries, cache_path, max_cache_bytes):
+    """
+    流式生成ZIP数据块，同时写入缓存文件；完整输出后才保存缓存（客户端中途断开则丢弃）
+    """
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    completed = False
+    try:
+        with open(tmp_path, "wb") as cache_file:
+            for chunk in iter_zip_stream(entries):
+                cache_file.write(chunk)
+                yield chunk
+        os.replace(tmp_path, cache_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    if completed:
+        _remove_stale_versions(cache_path)
+        _prune_cache(cache_dir, max_cache_bytes)
+
+
+def _remove_stale_versions(cache_path):
+    """删除同一订单旧指纹的压缩包"""
+    cache_dir = os.path.dirname(cache_path)
+    name = os.path.basename(cache_path)
+    prefix = name.rsplit("_", 1)[0] + "_"
+    for other in os.listdir(cache_dir):
+        if other != name and other.startswith(prefix) and other.endswith(".zip"):
+            # 前缀之后只有指纹，避免 order_1_ 误删 order_12_ 的缓存
+            if "_" in other[len(prefix) :]:
+                continue
+            try:
+                os.remove(os.path.join(cache_dir, other))
+            except OSError:
+                pass
+
+
+def _prune_cache(cache_dir, max_cache_bytes):
+    """缓存总大小超过上限时按修改时间从旧到新删除"""
+    if not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        entries = []
+        total = 0
+        for name in os.listdir(cache_dir):
+            if not name.endswith(".zip"):
+                continue
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _mtime, size, path in sorted(entries):
+            if total <= max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+    finally:
+        _prune_lock.release()
+
+
+def _set_attachment_filename(headers, download_name):
+    """与 send_file 相同的 Content-Disposition（非ASCII文件名使用 RFC 5987 filename*）"""
+    try:
+        download_name.encode("ascii")
+        headers.set("Content-Disposition", "attachment", filename=download_name)
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode()
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        headers.set(
+            "Content-Disposition",
+            "attachment",
+            filename=simple or "download.zip",
+            **{"filename*": f"UTF-8''{quoted}"},
+        )
+
+
+def send_order_archive(entries, cache_key, download_name):
+    """
+    发送订单压缩包：已有缓存时直接发送文件（支持 Range 断点续传），否则流式生成并写入缓存
+    """
+    from flask import Response, current_app, send_file
+
+    cache_path = cached_archive_path(current_app, cache_key, entries)
+    if os.path.exists(cache_path):
+        try:
+            os.utime(cache_path, None)
+        except OSError:
+            pass
+        return send_file(
+            cache_path,
+            mimetype="application/zip",
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+        )
+
+    max_cache_bytes = int(current_app.config.get("ORDER_ARCHIVE_CACHE_MAX_MB", 10240)) * 1024 * 1024
+    response = Response(
+        iter_zip_stream_cached(entries, cache_path, max_cache_bytes),
+        mimetype="application/zip",
+        direct_passthrough=True,
+    )
+    _set_attachment_filename(response.headers, download_name)
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -2,11 +2,28 @@
 """
 分页工具模块
 提供统一的分页功能
+
+- OFFSET 分页（paginate_query）：支持跳页，但页码越深越慢，且每页都要 count() 一次
+- 游标分页（keyset_paginate）：按 (created_at, id) 等排序键定位下一页，
+  任意深度的翻页耗时与第一页相同，不统计总数；游标对客户端不透明
+- 总数估算（estimate_count / count_rows）：PostgreSQL 下读取查询计划的估算行数，
+  大表展示近似总数，避免每页全表 count()
 """
 
+import base64
+import json
+import logging
+import os
+from datetime import datetime
 from math import ceil
 
 from flask import request
+from sqlalchemy import and_, or_
+
+logger = logging.getLogger(__name__)
+
+# 估算总数低于该值时仍执行精确 count()
+ESTIMATE_COUNT_THRESHOLD = int(os.environ.get("PAGINATION_ESTIMATE_THRESHOLD", "10000"))
 
 
 def get_pagination_params(max_per_page=100):
@@ -57,7 +74,7 @@ def format_pagination_response(pagination, data_key="data"):
     格式化分页响应
 
     Args:
-        pagination: SQLAlchemy分页对象
+        pagination: SQLAlchemy分页对象或 KeysetPage
         data_key: 数据字段名
 
     Returns:
@@ -65,14 +82,219 @@ def format_pagination_response(pagination, data_key="data"):
     """
     return {
         data_key: [item for item in pagination.items],
-        "pagination": {
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "total": pagination.total,
-            "pages": pagination.pages,
-            "has_prev": pagination.has_prev,
-            "has_next": pagination.has_next,
-            "prev_page": pagination.prev_num if pagination.has_prev else None,
-            "next_page": pagination.next_num if pagination.has_next else None,
-        },
+        "pagination": pagination_info(pagination),
+    }
+
+
+def encode_cursor(values, direction="next"):
+    """
+    把排序键的值编码为不透明游标
+
+    Args:
+        values: 排序键的值（与 keyset_paginate 的 columns 一一对应）
+        direction: next 表示取这些值之后的记录，prev 表示取之前的记录
+
+    Returns:
+        str: URL安全的游标字符串
+    """
+    encoded = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {"dt": value.isoformat()}
+        encoded.append(value)
+    raw = json.dumps({"d": direction, "v": encoded}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+
+    Returns:
+        tuple: (direction, values)，游标无效时返回 None
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw.decode("utf-8"))
+        direction = data["d"]
+        if direction not in ("next", "prev") or not isinstance(data["v"], list):
+            return None
+        values = [
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in data["v"]
+        ]
+        return direction, values
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _column_key(column):
+    return getattr(column, "key", None) or getattr(column, "name")
+
+
+def keyset_order_by(columns, reverse=False):
+    """游标分页的排序子句（各排序键均为降序，reverse 时为升序）"""
+    return [column.asc() if reverse else column.desc() for column in columns]
+
+
+def _after(columns, values, reverse=False):
+    """(c1, c2, ...) < (v1, v2, ...) 的逐列展开（reverse 时为 >），各数据库通用"""
+    column, value = columns[0], values[0]
+    beyond = column > value if reverse else column < value
+    if len(columns) == 1:
+        return beyond
+    return or_(beyond, and_(column == value, _after(columns[1:], values[1:], reverse)))
+
+
+class KeysetPage:
+    """游标分页结果（属性与 Flask-SQLAlchemy 的分页对象兼容）"""
+
+    def __init__(self, items, per_page, has_next, has_prev, next_cursor, prev_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # 游标分页不统计总数；页码由调用方按需设置
+        self.page = None
+        self.total = None
+        self.pages = None
+        self.prev_num = None
+        self.next_num = None
+
+
+def keyset_paginate(query, columns, per_page, cursor=None, having=False, key=None):
+    """
+    游标分页（按 columns 降序，最后一列须唯一，如 (created_at, id)）
+
+    Args:
+        query: SQLAlchemy查询对象（不要带 order_by）
+        columns: 排序键，如 (Order.created_at, Order.id)；分组查询可使用聚合列的 label
+        per_page: 每页记录数
+        cursor: 上一次返回的 next_cursor / prev_cursor，为空表示第一页
+        having: 排序键为聚合列时，游标条件放在 HAVING 中
+        key: 从记录取排序键值的函数，默认按列名取属性
+
+    Returns:
+        KeysetPage
+    """
+    if key is None:
+        names = [_column_key(column) for column in columns]
+
+        def key(item):
+            return [getattr(item, name) for name in names]
+
+    decoded = decode_cursor(cursor)
+    if cursor and (decoded is None or len(decoded[1]) != len(columns)):
+        logger.warning(f"分页游标无效，返回第一页: {cursor}")
+        decoded = None
+    direction, values = decoded if decoded else ("next", None)
+    backward = direction == "prev"
+
+    if values is not None:
+        condition = _after(list(columns), values, reverse=backward)
+        query = query.having(condition) if having else query.filter(condition)
+    rows = query.order_by(*keyset_order_by(columns, reverse=backward)).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, values is not None
+
+    return KeysetPage(
+        rows,
+        per_page,
+        has_next,
+        has_prev,
+        encode_cursor(key(rows[-1]), "next") if rows and has_next else None,
+        encode_cursor(key(rows[0]), "prev") if rows and has_prev else None,
+    )
+
+
+def estimate_count(query):
+    """
+    按查询计划估算记录数（仅 PostgreSQL，读取 EXPLAIN 的 Plan Rows）
+
+    Returns:
+        int: 估算行数；不支持或失败时返回 None
+    """
+    try:
+        connection = query.session.connection()
+        dialect = connection.dialect
+        if dialect.name != "postgresql":
+            return None
+        compiled = query.statement.compile(dialect=dialect)
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception as e:
+        logger.warning(f"估算记录数失败: {str(e)}")
+        return None
+
+
+def count_rows(query, threshold=None):
+    """
+    统计记录数：估算值不低于阈值时直接返回估算值，否则执行精确 count()
+
+    Returns:
+        tuple: (total, is_estimate)
+    """
+    threshold = ESTIMATE_COUNT_THRESHOLD if threshold is None else threshold
+    estimate = estimate_count(query) if threshold > 0 else None
+    if estimate is not None and estimate >= threshold:
+        return estimate, True
+    return query.count(), False
+
+
+def paginate_request(query, columns, page=None, per_page=None, max_per_page=100):
+    """
+    按请求参数分页：带 cursor 参数时使用游标分页（不统计总数），否则使用 OFFSET 分页
+
+    OFFSET 分页也按 columns 降序排序，并返回 next_cursor，客户端可从任一页切换到游标翻页。
+
+    Returns:
+        Flask-SQLAlchemy 分页对象或 KeysetPage（均带 next_cursor / prev_cursor 属性）
+    """
+    if page is None or per_page is None:
+        page, per_page = get_pagination_params(max_per_page)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        return keyset_paginate(query, columns, per_page, cursor)
+
+    pagination = query.order_by(*keyset_order_by(columns)).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    names = [_column_key(column) for column in columns]
+    items = pagination.items
+    pagination.next_cursor = (
+        encode_cursor([getattr(items[-1], name) for name in names], "next")
+        if items and pagination.has_next
+        else None
+    )
+    pagination.prev_cursor = None
+    return pagination
+
+
+def pagination_info(pagination):
+    """分页信息（兼容 OFFSET 分页对象和 KeysetPage）"""
+    return {
+        "page": pagination.page,
+        "per_page": pagination.per_page,
+        "total": pagination.total,
+        "pages": pagination.pages,
+        "has_prev": pagination.has_prev,
+        "has_next": pagination.has_next,
+        "prev_page": pagination.prev_num if pagination.has_prev else None,
+        "next_page": pagination.next_num if pagination.has_next else None,
+        "next_cursor": getattr(pagination, "next_cursor", None),
+        "prev_cursor": getattr(pagination, "prev_cursor", None),
     }
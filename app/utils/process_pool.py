@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+CPU密集任务的进程池
+
+Web进程（gunicorn worker）中运行着多个后台线程（轮询、任务队列、HTTP连接池、日志），
+直接 fork 会把其他线程当时持有的锁原样复制到子进程，子进程可能永久阻塞在这些锁上。
+这里使用 forkserver：工作进程由一个单线程的服务进程 fork 出来。
+
+在工作进程中执行的函数必须定义在可导入的模块中（如 app.services.mockup_render_engine），
+不能定义在启动脚本里。工作进程启动时 multiprocessing 会以 __mp_main__ 导入一次启动脚本：
+gunicorn 下是 gunicorn 自身的启动脚本；直接运行 test_server.py 时其 __main__ 部分不会执行。
+不支持 forkserver 的平台（Windows）使用线程池。
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# forkserver 服务进程启动时预先导入的模块（PIL、psd_tools 等），工作进程 fork 后无需再导入
+PRELOAD_MODULES = ["app.services.mockup_render_engine"]
+
+
+def create_process_pool(max_workers, thread_name_prefix):
+    """
+    创建进程池（forkserver），不支持时返回线程池
+
+    Args:
+        max_workers: 工作进程数
+        thread_name_prefix: 退化为线程池时的线程名前缀
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+    context = multiprocessing.get_context("forkserver")
+    # 只在服务进程启动前生效，重复设置无副作用
+    context.set_forkserver_preload(PRELOAD_MODULES)
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
@@ -12,7 +12,7 @@ from functools import wraps
 from sqlalchemy import select, update
 
 
-def safe_update_task_status(task_id, new_status, db, AITask, check_status=None):
+def safe_update_task_status(task_id, new_status, db, AITask, check_status=None, fields=None):
     """
     安全更新任务状态（使用数据库锁）
 
@@ -22,6 +22,7 @@ def safe_update_task_status(task_id, new_status, db, AITask, check_status=None):
         db: 数据库实例
         AITask: AITask模型类
         check_status: 检查当前状态是否在允许列表中（防止状态回退）
+        fields: 与状态一起更新的字段（如结果、错误信息），同一事务提交
 
     Returns:
         bool: 是否更新成功
@@ -30,7 +31,10 @@ def safe_update_task_status(task_id, new_status, db, AITask, check_status=None):
         # 使用悲观锁查询任务
         try:
             task = db.session.execute(
-                select(AITask).where(AITask.id == task_id).with_for_update()
+                select(AITask)
+                .where(AITask.id == task_id)
+                .with_for_update()
+                .execution_options(populate_existing=True)
             ).scalar_one_or_none()
         except Exception:
             # 如果with_for_update不支持，使用普通查询
@@ -50,6 +54,8 @@ def safe_update_task_status(task_id, new_status, db, AITask, check_status=None):
 
         # 更新状态
         task.status = new_status
+        for name, value in (fields or {}).items():
+            setattr(task, name, value)
         db.session.commit()
         return True
 
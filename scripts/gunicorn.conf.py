@@ -60,4 +60,18 @@ def pre_fork(server, worker):
 
 def post_fork(server, worker):
     """Fork worker进程后的回调"""
-    server.log.info(f"Worker进程 {worker.pid} 启动完成")
\ No newline at end of file
+    server.log.info(f"Worker进程 {worker.pid} 启动完成")
+    # 参与后台服务Leader竞选：只有当选的worker运行任务队列和AI任务轮询服务
+    try:
+        from app.services.leader_election import start_background_services_election
+        start_background_services_election()
+    except Exception as e:
+        server.log.warning(f"⚠️ Worker进程 {worker.pid} 加入后台服务竞选失败: {e}")
+
+def worker_exit(server, worker):
+    """Worker进程退出时的回调（包括max_requests回收），释放Leader身份以便其他worker立即接管"""
+    try:
+        from app.services.leader_election import release_background_services_leadership
+        release_background_services_leadership()
+    except Exception as e:
+        server.log.warning(f"⚠️ Worker进程 {worker.pid} 释放后台服务Leader失败: {e}")
\ No newline at end of file
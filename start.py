@@ -113,25 +113,16 @@ def main():
                 logger.warning(f"并发配置初始化失败: {str(e)}")
                 print(f"⚠️  并发配置初始化失败: {str(e)}")
             
-            # 启动任务队列服务
+            # 启动任务队列服务和AI任务状态自动轮询服务
+            # 通过Leader选举启动，避免reloader父子进程重复运行
             try:
-                from app.services.task_queue_service import start_task_queue
-                start_task_queue()
-                logger.info("任务队列服务已启动")
-                print("✅ 任务队列服务已启动")
+                from app.services.leader_election import start_background_services_election
+                start_background_services_election()
+                logger.info("已加入后台服务Leader竞选（任务队列、AI任务状态轮询）")
+                print("✅ 已加入后台服务Leader竞选（任务队列、AI任务状态轮询）")
             except Exception as e:
-                logger.warning(f"启动任务队列服务失败: {str(e)}")
-                print(f"⚠️  启动任务队列服务失败: {str(e)}")
-            
-            # 启动AI任务状态自动轮询服务
-            try:
-                from app.services.ai_task_polling_service import init_ai_task_polling_service
-                init_ai_task_polling_service()
-                logger.info("AI任务状态自动轮询服务已启动")
-                print("✅ AI任务状态自动轮询服务已启动")
-            except Exception as e:
-                logger.warning(f"启动AI任务状态轮询服务失败: {str(e)}")
-                print(f"⚠️  启动AI任务状态轮询服务失败: {str(e)}")
+                logger.warning(f"加入后台服务Leader竞选失败: {str(e)}")
+                print(f"⚠️  加入后台服务Leader竞选失败: {str(e)}")
                 import traceback
                 traceback.print_exc()
                 
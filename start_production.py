@@ -133,28 +133,6 @@ def main():
         print(f"❌ 数据库初始化失败: {str(e)}")
         return
     
-    # 启动任务队列服务（在后台线程中）
-    try:
-        from app.services.task_queue_service import start_task_queue
-        import threading
-        queue_thread = threading.Thread(target=start_task_queue, daemon=True)
-        queue_thread.start()
-        logger.info("任务队列服务已启动")
-        print("✅ 任务队列服务已启动")
-    except Exception as e:
-        logger.warning(f"启动任务队列服务失败: {str(e)}")
-        print(f"⚠️  启动任务队列服务失败: {str(e)}")
-    
-    # 启动AI任务状态自动轮询服务
-    try:
-        from app.services.ai_task_polling_service import init_ai_task_polling_service
-        init_ai_task_polling_service()
-        logger.info("AI任务状态自动轮询服务已启动")
-        print("✅ AI任务状态自动轮询服务已启动")
-    except Exception as e:
-        logger.warning(f"启动AI任务状态轮询服务失败: {str(e)}")
-        print(f"⚠️  启动AI任务状态轮询服务失败: {str(e)}")
-    
     # 检查Gunicorn配置文件
     gunicorn_config = 'gunicorn.conf.py'
     if not os.path.exists(gunicorn_config):
@@ -165,6 +143,20 @@ def main():
             print(f"⚠️  未找到Gunicorn配置文件，使用默认配置")
             gunicorn_config = None
     
+    # 任务队列和AI任务状态轮询等后台服务由各gunicorn worker竞选Leader后运行
+    # （配置文件的post_fork加入竞选，worker_exit释放Leader以便max_requests回收时其他worker立即接管）；
+    # 本进程不参与竞选，否则本进程先启动且不会被回收，几乎总是当选。
+    # 没有配置文件时worker没有这些钩子，只能由本进程运行后台服务。
+    if gunicorn_config is None:
+        try:
+            from app.services.leader_election import start_background_services_election
+            start_background_services_election()
+            logger.info("已加入后台服务Leader竞选（任务队列、AI任务状态轮询）")
+            print("✅ 已加入后台服务Leader竞选（任务队列、AI任务状态轮询）")
+        except Exception as e:
+            logger.warning(f"加入后台服务Leader竞选失败: {str(e)}")
+            print(f"⚠️  加入后台服务Leader竞选失败: {str(e)}")
+    
     print("🌐 使用Gunicorn启动Web服务器...")
     print("=" * 50)
     
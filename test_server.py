@@ -417,8 +417,8 @@ try:
         Product, ProductSize, ProductSizePetOption, ProductImage, ProductStyleCategory, ProductCustomField, ProductBonusWorkflow,
         StyleCategory, StyleSubcategory, StyleImage,
         HomepageBanner, WorksGallery, HomepageConfig, HomepageCategoryNav, HomepageProductSection, HomepageActivityBanner,
-        User, UserVisit, OperationLog,
-        Order, OrderImage,
+        User, UserVisit, UserVisitRollup, OperationLog,
+        Order, OrderImage, OrderRevenueRollup, OrderStatusRollup, OrderSearchGram, OrderEvent, OrderEventCursor,
         PromotionUser, Commission, Withdrawal, PromotionTrack,
         Coupon, UserCoupon, ShareRecord, GrouponPackage,
         FranchiseeAccount, FranchiseeRecharge, SelfieMachine, StaffUser,
@@ -426,6 +426,8 @@ try:
         MeituAPIConfig, MeituAPIPreset, MeituAPICallLog,  # 美图API相关模型
         APIProviderConfig, APITemplate,  # 新增云端API服务商相关模型
         PollingConfig,  # 新增轮询配置模型
+        TaskQueueJob,  # 持久化任务队列
+        ProviderGatewayJob,  # 服务商网关请求任务
         ShopProduct, ShopProductImage, ShopProductSize, ShopOrder,  # 新增商城相关模型
         SelectionOrder,  # 选片订单（关联产品馆）
         PrintSizeConfig,  # 新增打印配置模型
@@ -897,6 +899,14 @@ try:
     except Exception as e:
         print(f"⚠️  物流回调API蓝图注册失败: {e}")
     
+    # 注册服务商完成回调蓝图
+    try:
+        from app.routes.provider_callbacks import provider_callbacks_bp
+        app.register_blueprint(provider_callbacks_bp)
+        print("✅ 服务商完成回调蓝图已注册")
+    except Exception as e:
+        print(f"⚠️  服务商完成回调蓝图注册失败: {e}")
+    
     # 注册管理后台工具API蓝图
     try:
         from app.routes.admin_tools_api import admin_tools_api_bp
@@ -1063,6 +1073,22 @@ def after_request(response):
         response.headers['Access-Control-Allow-Methods'] = 'GET,PUT,POST,DELETE,OPTIONS'
     return response
 
+# 缓存服务请求钩子（释放请求中未回填的缓存回填租约）
+from app.services.cache_service import init_cache_service
+init_cache_service(app)
+
+# 订单业绩预聚合（订单写入时增量维护分桶）
+from app.services.order_rollup_service import register_order_rollup_listeners
+register_order_rollup_listeners()
+
+# 订单搜索n-gram索引（非PostgreSQL数据库在订单写入时维护）
+from app.services.order_search_service import register_order_search_listeners
+register_order_search_listeners()
+
+# 配置注册表（配置表修改提交后递增版本号，各进程重新加载快照）
+from app.services.config_registry import register_config_registry_listeners
+register_config_registry_listeners()
+
 def migrate_database():
     """数据库迁移 - 添加新字段（仅在需要时执行）"""
     try:
@@ -1846,22 +1872,15 @@ if __name__ == '__main__':
         except Exception as e:
             print(f"⚠️ 初始化并发配置失败: {str(e)}")
         
-        # 启动任务队列服务（用于管理10台设备、40-50个排队任务）
+        # 启动后台服务（任务队列、AI任务状态轮询、订单事件消费、预聚合对账、搜索索引等）
+        # 与 start.py 一致通过Leader选举启动，避免reloader父子进程重复运行
         try:
-            from app.services.task_queue_service import start_task_queue
-            start_task_queue()
-            print("✅ 任务队列服务已启动")
+            from app.services.leader_election import start_background_services_election
+            start_background_services_election()
+            print("✅ 已加入后台服务Leader竞选（任务队列、AI任务状态轮询、订单事件消费等）")
         except Exception as e:
-            print(f"⚠️ 启动任务队列服务失败: {str(e)}")
+            print(f"⚠️ 加入后台服务Leader竞选失败: {str(e)}")
             print("⚠️ 系统将使用直接调用模式（兼容模式）")
-        
-        # 启动AI任务状态自动轮询服务（定期检查处理中的任务并更新状态）
-        try:
-            from app.services.ai_task_polling_service import init_ai_task_polling_service
-            init_ai_task_polling_service()
-            print("✅ AI任务状态自动轮询服务已启动")
-        except Exception as e:
-            print(f"⚠️ 启动AI任务状态轮询服务失败: {str(e)}")
     
 # ⭐ 管理后台工具API已迁移到 app.routes.admin_tools_api
 
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+缓存回填租约测试
+"""
+
+import pytest
+
+from app.services.cache_service import _FillLeases, _REMOTE_FILL
+
+pytestmark = pytest.mark.unit
+
+
+class FakeRedis:
+    """只实现回填租约用到的 SET NX 和释放脚本"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, token):
+        if self.data.get(key) == token:
+            del self.data[key]
+            return 1
+        return 0
+
+
+def test_release_deletes_own_lease():
+    client = FakeRedis()
+    leases = _FillLeases()
+
+    assert leases.acquire("styles", client) is None
+    leases.release("styles", client)
+
+    assert "lock:styles" not in client.data
+
+
+def test_other_process_lease_is_waited_on():
+    client = FakeRedis()
+    client.data["lock:styles"] = "other-process"
+
+    assert _FillLeases().acquire("styles", client) is _REMOTE_FILL
+    assert client.data["lock:styles"] == "other-process"
+
+
+def test_release_keeps_lease_taken_over_after_expiry():
+    """本进程的租约过期后被其他进程获取，释放时不能删除其他进程的锁"""
+    client = FakeRedis()
+    leases = _FillLeases()
+
+    assert leases.acquire("styles", client) is None
+    client.data["lock:styles"] = "other-process"
+    leases.release("styles", client)
+
+    assert client.data["lock:styles"] == "other-process"
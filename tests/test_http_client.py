@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+共享HTTP客户端测试
+重试策略（提交任务不重复发送）、并发名额、请求接管
+"""
+
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.services.http_client import (
+    CLIENT_PROFILES,
+    PooledHttpClient,
+    _build_retry,
+    intercept_requests,
+)
+
+pytestmark = pytest.mark.unit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.server.hits += 1
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == "/drop":
+            # 读取请求后不返回响应就断开（服务商可能已创建任务）
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        status = int(self.path.strip("/") or 200)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.hits = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+@pytest.fixture
+def provider_client():
+    client = PooledHttpClient("ai_provider", retry=CLIENT_PROFILES["ai_provider"]["retry"])
+    yield client
+    client.close()
+
+
+def test_retry_policies():
+    connect = _build_retry("connect")
+    assert connect.connect == 2
+    assert connect.read == 0
+    assert not connect.is_retry("POST", 503)
+    assert not connect.is_retry("POST", 429)
+
+    default = _build_retry("default")
+    assert default.is_retry("POST", 503)
+    assert default.is_retry("GET", 429)
+
+    assert _build_retry("none").total == 0
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_provider_submission_is_not_resent_on_status(server, provider_client, status):
+    response = provider_client.post(_url(server, f"/{status}"), json={"prompt": "猫"})
+
+    assert response.status_code == status
+    assert server.hits == 1
+    assert provider_client.stats()["status_counts"] == {status: 1}
+
+
+def test_provider_submission_is_not_resent_on_dropped_response(server, provider_client):
+    with pytest.raises(requests.ConnectionError):
+        provider_client.post(_url(server, "/drop"), json={"prompt": "猫"})
+
+    assert server.hits == 1
+    assert provider_client.stats()["errors"] == 1
+
+
+def test_connections_are_reused(server, provider_client):
+    for _ in range(3):
+        assert provider_client.post(_url(server, "/200")).status_code == 200
+
+    stats = provider_client.stats()
+    assert stats["new_connections"] == 1
+    assert stats["pool_requests"] == 3
+
+
+def test_nested_slot_takes_one_permit():
+    client = PooledHttpClient("test", max_concurrency=1)
+
+    with client.slot():
+        with client.slot():
+            # 外层已占用唯一名额，其他线程拿不到
+            assert not client._semaphore.acquire(blocking=False)
+
+    assert client._semaphore.acquire(blocking=False)
+    client._semaphore.release()
+
+
+def test_intercept_only_named_clients(server):
+    calls = []
+
+    def handler(client, method, url, retry, kwargs):
+        calls.append((client.name, method, retry))
+        return "intercepted"
+
+    comfyui = PooledHttpClient("comfyui", retry="connect")
+    download = PooledHttpClient("download")
+    with intercept_requests(handler, client_names=["comfyui"]):
+        assert comfyui.post(_url(server, "/200")) == "intercepted"
+        assert download.post(_url(server, "/200")).status_code == 200
+
+    assert calls == [("comfyui", "POST", "connect")]
+    assert server.hits == 1
+    comfyui.close()
+    download.close()
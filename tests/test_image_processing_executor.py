@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+订单图片处理执行器测试
+加盟商之间轮转取任务、排队上限、重复订单、队列已满时转入任务队列
+"""
+
+import threading
+import time
+import types
+
+import pytest
+
+from app.services import image_processing_executor
+from app.services.image_processing_executor import FairImageExecutor, ImageProcessingJob
+
+pytestmark = pytest.mark.unit
+
+
+class GatedRunner:
+    """记录处理顺序；gate 打开前第一个任务一直处于执行中"""
+
+    def __init__(self, results=None):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.results = results or {}
+        self.order = []
+
+    def __call__(self, job):
+        self.started.set()
+        self.gate.wait(5)
+        self.order.append(job.order_number)
+        result = self.results.get(job.order_number, (True, "ok"))
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def _job(order_id, order_number=None):
+    return ImageProcessingJob(order_id, order_number or f"O{order_id}")
+
+
+def _wait_finished(executor, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = executor.get_stats()
+        if stats["completed"] + stats["failed"] >= count:
+            return stats
+        time.sleep(0.01)
+    raise AssertionError("图片处理任务未在超时时间内完成")
+
+
+def test_franchisees_take_turns():
+    runner = GatedRunner()
+    executor = FairImageExecutor(max_workers=1, runner=runner)
+
+    executor.submit(_job(1, "A1"), franchisee_id=1)
+    assert runner.started.wait(5)
+    # A1 执行期间：加盟商1批量上传，加盟商2随后上传
+    for order_id, number, franchisee_id in [(2, "A2", 1), (3, "A3", 1), (4, "A4", 1)]:
+        executor.submit(_job(order_id, number), franchisee_id=franchisee_id)
+    executor.submit(_job(5, "B1"), franchisee_id=2)
+    executor.submit(_job(6, "B2"), franchisee_id=2)
+    assert executor.get_stats()["queue_depth_by_franchisee"] == {1: 3, 2: 2}
+
+    runner.gate.set()
+    stats = _wait_finished(executor, 6)
+
+    assert runner.order == ["A1", "A2", "B1", "A3", "B2", "A4"]
+    assert stats["completed"] == 6
+    assert stats["queue_depth"] == 0
+    assert stats["running"] == 0
+
+
+def test_queue_limits_and_duplicates():
+    runner = GatedRunner()
+    executor = FairImageExecutor(
+        max_workers=1, max_queue_size=3, max_per_franchisee=2, runner=runner
+    )
+    executor.submit(_job(1), franchisee_id=1)
+    assert runner.started.wait(5)
+
+    assert executor.submit(_job(2), franchisee_id=1)
+    assert executor.submit(_job(3), franchisee_id=1)
+    # 单个加盟商排队已满，其他加盟商不受影响
+    assert not executor.submit(_job(4), franchisee_id=1)
+    assert executor.submit(_job(5), franchisee_id=2)
+    # 排队总数已满
+    assert not executor.submit(_job(6), franchisee_id=3)
+    # 已在排队的订单不重复排队
+    assert executor.submit(_job(2), franchisee_id=1)
+
+    stats = executor.get_stats()
+    assert stats["queue_depth"] == 3
+    assert stats["rejected"] == 2
+    assert stats["duplicates"] == 1
+    runner.gate.set()
+    _wait_finished(executor, 4)
+
+
+def test_running_order_can_be_queued_again():
+    """执行中的订单再次上传图片时重新排队（处理新上传的图片）"""
+    runner = GatedRunner()
+    executor = FairImageExecutor(max_workers=1, runner=runner)
+    executor.submit(_job(1))
+    assert runner.started.wait(5)
+
+    assert executor.submit(_job(1))
+    assert executor.get_stats()["duplicates"] == 0
+
+    runner.gate.set()
+    _wait_finished(executor, 2)
+    assert runner.order == ["O1", "O1"]
+
+
+def test_failed_jobs_do_not_stop_workers():
+    runner = GatedRunner(results={"O1": (False, "美图API失败"), "O2": RuntimeError("工作流异常")})
+    runner.gate.set()
+    executor = FairImageExecutor(max_workers=1, runner=runner)
+
+    for order_id in (1, 2, 3):
+        executor.submit(_job(order_id))
+    stats = _wait_finished(executor, 3)
+
+    assert stats["failed"] == 2
+    assert stats["completed"] == 1
+    assert runner.order == ["O1", "O2", "O3"]
+
+
+@pytest.fixture
+def full_executor(monkeypatch):
+    """队列已满的进程内执行器"""
+    runner = GatedRunner()
+    executor = FairImageExecutor(max_workers=1, max_queue_size=1, runner=runner)
+    executor.submit(_job(100), franchisee_id=1)
+    assert runner.started.wait(5)
+    executor.submit(_job(101), franchisee_id=1)
+    monkeypatch.setattr(image_processing_executor, "_executor", executor)
+    yield executor
+    runner.gate.set()
+
+
+def _order(order_id):
+    return types.SimpleNamespace(
+        id=order_id,
+        order_number=f"O{order_id}",
+        style_category_id=3,
+        style_image_id=None,
+        franchisee_id=2,
+    )
+
+
+def test_rejected_order_is_deferred_to_task_queue(full_executor, monkeypatch):
+    deferred = []
+    monkeypatch.setattr(
+        image_processing_executor, "_defer_job", lambda job: deferred.append(job) or "job-1"
+    )
+
+    assert image_processing_executor.submit_order_image_processing(_order(1))
+
+    assert [(job.order_id, job.style_category_id) for job in deferred] == [(1, 3)]
+    stats = image_processing_executor.get_image_processing_stats()
+    assert stats["rejected"] == 1
+    assert stats["deferred"] == 1
+
+
+def test_submit_fails_when_task_queue_unavailable(full_executor, monkeypatch):
+    def defer(job):
+        raise RuntimeError("任务队列不可用")
+
+    monkeypatch.setattr(image_processing_executor, "_defer_job", defer)
+
+    assert not image_processing_executor.submit_order_image_processing(_order(1))
+    assert full_executor.get_stats()["deferred"] == 0
+
+
+def test_deferred_task_runs_job(monkeypatch):
+    jobs = []
+
+    def run_job(job):
+        jobs.append(job)
+        return (False, "订单不存在") if job.order_id == 2 else (True, "处理完成")
+
+    monkeypatch.setattr(image_processing_executor, "_run_job", run_job)
+
+    assert image_processing_executor.run_deferred_image_processing({"order_id": 1})
+    assert not image_processing_executor.run_deferred_image_processing(
+        {"order_id": 2, "order_number": "O2", "style_image_id": 7}
+    )
+    assert (jobs[1].order_number, jobs[1].style_image_id) == ("O2", 7)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+订单原图打包下载测试
+同一订单再次下载命中磁盘缓存；订单图片变化后重新生成
+"""
+
+import datetime
+import os
+import zipfile
+
+import pytest
+
+from app.routes.media import original_archive_entries
+from app.utils.order_archive import send_order_archive
+
+pytestmark = pytest.mark.integration
+
+
+class LaterDatetime(datetime.datetime):
+    """制作信息的生成时间晚一小时（模拟之后的另一次下载）"""
+
+    @classmethod
+    def now(cls, tz=None):
+        return super().now(tz) + datetime.timedelta(hours=1)
+
+
+@pytest.fixture
+def order_files(app, db, tmp_path, monkeypatch):
+    from app.models import Order
+
+    upload_folder = tmp_path / "uploads"
+    upload_folder.mkdir()
+    (upload_folder / "a.jpg").write_bytes(b"\xff\xd8original-a")
+    (upload_folder / "b.png").write_bytes(b"\x89PNGoriginal-b")
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(upload_folder))
+    monkeypatch.setitem(app.config, "ORDER_ARCHIVE_CACHE_FOLDER", str(tmp_path / "archives"))
+
+    order = Order(order_number="Z001", customer_name="张三", customer_phone="13800000000")
+    db.session.add(order)
+    db.session.commit()
+    return order, str(upload_folder), ["a.jpg", "b.png"]
+
+
+def _download(app, order, upload_folder, filenames, headers=None):
+    entries = original_archive_entries(order, filenames, upload_folder)
+    with app.test_request_context(headers=headers):
+        response = send_order_archive(entries, f"order_{order.id}", "Z001.zip")
+        response.direct_passthrough = False
+        return response, response.get_data()
+
+
+def _cached_files(app):
+    return sorted(os.listdir(app.config["ORDER_ARCHIVE_CACHE_FOLDER"]))
+
+
+def test_second_download_hits_cache(app, order_files, monkeypatch):
+    order, upload_folder, filenames = order_files
+
+    first, first_body = _download(app, order, upload_folder, filenames)
+    assert "Content-Length" not in first.headers
+    cached = _cached_files(app)
+    assert len(cached) == 1
+
+    # 制作信息的生成时间已变化，仍命中同一个缓存文件
+    with monkeypatch.context() as m:
+        m.setattr(datetime, "datetime", LaterDatetime)
+        second, second_body = _download(app, order, upload_folder, filenames)
+        ranged, ranged_body = _download(
+            app, order, upload_folder, filenames, headers={"Range": "bytes=0-9"}
+        )
+
+    # 缓存命中：直接发送磁盘文件（带长度，支持 Range 断点续传）
+    assert second.headers["Content-Length"] == str(len(first_body))
+    assert second_body == first_body
+    assert ranged.status_code == 206
+    assert ranged_body == first_body[:10]
+    assert _cached_files(app) == cached
+
+    with zipfile.ZipFile(os.path.join(app.config["ORDER_ARCHIVE_CACHE_FOLDER"], cached[0])) as zf:
+        assert zf.namelist() == ["制作信息.txt", "Z001_图片1.jpg", "Z001_图片2.png"]
+        assert zf.read("Z001_图片1.jpg") == b"\xff\xd8original-a"
+
+
+def test_changed_image_rebuilds_archive(app, order_files):
+    order, upload_folder, filenames = order_files
+
+    _download(app, order, upload_folder, filenames)
+    cached = _cached_files(app)
+
+    with open(os.path.join(upload_folder, "a.jpg"), "wb") as f:
+        f.write(b"\xff\xd8replaced-a")
+    response, _body = _download(app, order, upload_folder, filenames)
+
+    assert "Content-Length" not in response.headers
+    rebuilt = _cached_files(app)
+    assert len(rebuilt) == 1
+    assert rebuilt != cached
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+订单事件发件箱测试
+消费进度、失败重试与跳过、事件ID空洞
+"""
+
+import time
+
+import pytest
+
+from app.services import order_event_service
+from app.services.order_event_service import (
+    EVENT_ORDER_CREATED,
+    EVENT_STATUS_CHANGED,
+    GAP_TIMEOUT,
+    OrderEventConsumer,
+)
+
+pytestmark = pytest.mark.integration
+
+
+@pytest.fixture(autouse=True)
+def isolated_consumers(monkeypatch):
+    """每个测试使用独立的消费者注册表"""
+    monkeypatch.setattr(order_event_service, "_consumers", {})
+
+
+def _add_events(db, *ids, event_type=EVENT_STATUS_CHANGED):
+    from app.models import OrderEvent
+
+    db.session.add_all(
+        [
+            OrderEvent(
+                id=event_id,
+                order_id=event_id,
+                order_number=f"E{event_id:03d}",
+                event_type=event_type,
+            )
+            for event_id in ids
+        ]
+    )
+    db.session.commit()
+
+
+def _cursor(name):
+    from app.models import OrderEventCursor
+
+    return OrderEventCursor.query.filter_by(consumer=name).one()
+
+
+def test_recorded_event_is_dispatched(db):
+    from app.models import Order
+
+    order = Order(order_number="E001", customer_name="张三", customer_phone="13800000000")
+    db.session.add(order)
+    order_event_service.record_order_event(order, EVENT_ORDER_CREATED, source="test")
+    db.session.commit()
+
+    handled = []
+    order_event_service.register_order_event_consumer("test", handled.append)
+    assert order_event_service.run_order_event_consumers_once() == 1
+    assert handled[0]["order_id"] == order.id
+    assert handled[0]["payload"] == {"source": "test"}
+
+
+def test_consumer_processes_in_order_and_saves_cursor(db):
+    _add_events(db, 1, 2, 3)
+    handled = []
+    consumer = OrderEventConsumer("test", lambda event: handled.append(event["id"]))
+
+    assert order_event_service._run_consumer(consumer) == 3
+    assert handled == [1, 2, 3]
+    assert _cursor("test").last_event_id == 3
+
+    assert order_event_service._run_consumer(consumer) == 0
+    assert handled == [1, 2, 3]
+
+
+def test_new_consumer_starts_from_slowest_cursor(db):
+    """首个消费者从头开始；之后新增的消费者不重放更早的事件"""
+    _add_events(db, 1, 2)
+    first = OrderEventConsumer("first", lambda event: None)
+    assert order_event_service._run_consumer(first) == 2
+
+    _add_events(db, 3)
+    handled = []
+    second = OrderEventConsumer("second", lambda event: handled.append(event["id"]))
+    order_event_service._run_consumer(second)
+
+    assert handled == [3]
+
+
+def test_failed_event_is_retried_before_later_events(db):
+    _add_events(db, 1, 2)
+    handled = []
+    failures = [RuntimeError("微信接口超时")]
+
+    def handler(event):
+        if event["id"] == 1 and failures:
+            raise failures.pop()
+        handled.append(event["id"])
+
+    consumer = OrderEventConsumer("test", handler)
+    assert order_event_service._run_consumer(consumer) == 0
+    cursor = _cursor("test")
+    assert cursor.last_event_id == 0
+    assert cursor.attempts == 1
+    assert "微信接口超时" in cursor.last_error
+
+    # 退避期间不重试
+    assert consumer.retry_at > time.monotonic()
+    assert order_event_service._run_consumer(consumer) == 0
+
+    consumer.retry_at = 0.0
+    assert order_event_service._run_consumer(consumer) == 2
+    assert handled == [1, 2]
+    assert _cursor("test").attempts == 0
+
+
+def test_event_skipped_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(order_event_service, "MAX_ATTEMPTS", 2)
+    _add_events(db, 1, 2)
+    handled = []
+
+    def handler(event):
+        if event["id"] == 1:
+            raise RuntimeError("无法处理")
+        handled.append(event["id"])
+
+    consumer = OrderEventConsumer("test", handler)
+    order_event_service._run_consumer(consumer)
+    consumer.retry_at = 0.0
+    order_event_service._run_consumer(consumer)
+
+    assert handled == [2]
+    assert _cursor("test").last_event_id == 2
+    assert consumer.counters == {"processed": 1, "failed": 2, "skipped": 1}
+
+
+def test_gap_waits_then_is_crossed(db):
+    """ID空洞可能是尚未提交的事务：等待 GAP_TIMEOUT 后才越过"""
+    _add_events(db, 1, 2, 4)
+    handled = []
+    consumer = OrderEventConsumer("test", lambda event: handled.append(event["id"]))
+
+    assert order_event_service._run_consumer(consumer) == 2
+    assert handled == [1, 2]
+    assert consumer.gap_seen_at is not None
+
+    # 空洞期间提交的事件按顺序处理
+    _add_events(db, 3)
+    assert order_event_service._run_consumer(consumer) == 2
+    assert handled == [1, 2, 3, 4]
+    assert consumer.gap_seen_at is None
+
+    _add_events(db, 6)
+    assert order_event_service._run_consumer(consumer) == 0
+    consumer.gap_seen_at = time.monotonic() - GAP_TIMEOUT - 1
+    assert order_event_service._run_consumer(consumer) == 1
+    assert handled == [1, 2, 3, 4, 6]
+    assert _cursor("test").last_event_id == 6
+
+
+def test_event_type_filter_advances_cursor(db):
+    _add_events(db, 1, event_type=EVENT_ORDER_CREATED)
+    _add_events(db, 2)
+    handled = []
+    consumer = OrderEventConsumer(
+        "test", lambda event: handled.append(event["id"]), event_types=[EVENT_STATUS_CHANGED]
+    )
+
+    assert order_event_service._run_consumer(consumer) == 1
+    assert handled == [2]
+    assert _cursor("test").last_event_id == 2
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+订单业绩预聚合测试
+全量回填与完成标记、增量维护、状态计数
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.services import order_rollup_service
+
+pytestmark = pytest.mark.integration
+
+
+@pytest.fixture(autouse=True)
+def reset_ready_flags(monkeypatch):
+    """完成标记的进程内缓存在测试之间不共享"""
+    monkeypatch.setattr(order_rollup_service, "_rollup_ready", False)
+    monkeypatch.setattr(order_rollup_service, "_status_rollup_ready", False)
+
+
+def _create_order(db, number, status="completed", completed_at=None, price=10.0, **fields):
+    from app.models import Order
+
+    order = Order(
+        order_number=number,
+        customer_name="张三",
+        customer_phone="13800000000",
+        status=status,
+        completed_at=completed_at,
+        price=price,
+        **fields,
+    )
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def _live_status_counts(db, franchisee_id=None):
+    from app.models import Order
+
+    counts = {}
+    query = Order.query
+    if franchisee_id is not None:
+        query = query.filter(Order.franchisee_id == franchisee_id)
+    for order in query.all():
+        key = (order.status or "", order.printer_error_message is not None)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def test_not_ready_reads_orders_table(db):
+    """没有完成标记时统计直接查询订单表，状态计数返回None"""
+    yesterday = datetime.now() - timedelta(days=1)
+    _create_order(db, "R001", completed_at=yesterday, price=20.0)
+    _create_order(db, "R002", status="pending")
+
+    assert not order_rollup_service._is_rollup_ready()
+    summary = order_rollup_service.get_revenue_summary(yesterday.date(), date.today())
+    assert summary == {"order_count": 1, "revenue": 20.0}
+    assert order_rollup_service.get_order_status_counts() is None
+
+
+def test_interrupted_backfill_is_not_ready(db):
+    """只有增量写入或中断的回填留下的分桶时不视为可用"""
+    from app.models import OrderRevenueRollup
+
+    _create_order(db, "R001", completed_at=datetime.now() - timedelta(days=3), price=5.0)
+    # 中断的回填：分桶已写入但没有完成标记
+    order_rollup_service.rebuild_order_rollups()
+
+    assert OrderRevenueRollup.query.count() > 0
+    assert not order_rollup_service._has_ready_marker()
+    assert not order_rollup_service._is_rollup_ready()
+
+
+def test_reconcile_backfills_and_marks_ready(db):
+    now = datetime.now()
+    _create_order(db, "R001", completed_at=now - timedelta(days=30), price=10.0, franchisee_id=1)
+    _create_order(db, "R002", completed_at=now - timedelta(days=1), price=15.5, franchisee_id=2)
+    _create_order(db, "R003", status="pending", franchisee_id=1)
+
+    start, end = date.today() - timedelta(days=60), date.today() + timedelta(days=1)
+    expected = order_rollup_service.get_revenue_summary(start, end)
+
+    count = order_rollup_service.reconcile_recent_rollups()
+
+    assert count == 2
+    assert order_rollup_service._has_ready_marker()
+    assert order_rollup_service._is_rollup_ready()
+    assert order_rollup_service.get_revenue_summary(start, end) == expected
+    assert order_rollup_service.get_revenue_summary(start, end, franchisee_id=2) == {
+        "order_count": 1,
+        "revenue": 15.5,
+    }
+    # 完成标记行不计入统计
+    assert order_rollup_service.get_revenue_summary() == expected
+
+
+def test_incremental_updates_after_ready(db):
+    order_rollup_service.reconcile_recent_rollups()
+    start, end = date.today() - timedelta(days=1), date.today() + timedelta(days=1)
+
+    order = _create_order(db, "R001", status="pending", price=30.0)
+    assert order_rollup_service.get_revenue_summary(start, end)["order_count"] == 0
+
+    order.status = "completed"
+    order.completed_at = datetime.now()
+    db.session.commit()
+    assert order_rollup_service.get_revenue_summary(start, end) == {
+        "order_count": 1,
+        "revenue": 30.0,
+    }
+
+    order.price = 45.0
+    db.session.commit()
+    assert order_rollup_service.get_revenue_summary(start, end)["revenue"] == 45.0
+
+    db.session.delete(order)
+    db.session.commit()
+    assert order_rollup_service.get_revenue_summary(start, end) == {
+        "order_count": 0,
+        "revenue": 0.0,
+    }
+
+
+def test_reconcile_corrects_bulk_updates(db):
+    """query.update 绕过ORM事件，由对账任务修正"""
+    from app.models import Order
+
+    order_rollup_service.reconcile_recent_rollups()
+    order = _create_order(db, "R001", completed_at=datetime.now(), price=10.0)
+    Order.query.filter_by(id=order.id).update({"price": 99.0}, synchronize_session=False)
+    db.session.commit()
+
+    start, end = date.today(), date.today() + timedelta(days=1)
+    assert order_rollup_service.get_revenue_summary(start, end)["revenue"] == 10.0
+    order_rollup_service.reconcile_recent_rollups()
+    assert order_rollup_service.get_revenue_summary(start, end)["revenue"] == 99.0
+
+
+def test_status_counts_match_orders_table(db):
+    _create_order(db, "R001", franchisee_id=1)
+    _create_order(db, "R002", status="pending", franchisee_id=1)
+    order = _create_order(db, "R003", status="pending", franchisee_id=2)
+
+    order_rollup_service.reconcile_recent_rollups()
+    assert order_rollup_service.get_order_status_counts() == _live_status_counts(db)
+
+    # 重算后的增量维护
+    order.status = "processing"
+    order.printer_error_message = "打印机离线"
+    db.session.commit()
+    _create_order(db, "R004", status="pending", franchisee_id=1)
+
+    assert order_rollup_service.get_order_status_counts() == {
+        key: count for key, count in _live_status_counts(db).items() if count
+    }
+    counts = order_rollup_service.get_order_status_counts(franchisee_id=1)
+    assert counts == _live_status_counts(db, franchisee_id=1)
+    assert counts[("pending", False)] == 2
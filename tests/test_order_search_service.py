@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+订单搜索测试
+n-gram 索引的结果与原 LIKE '%关键词%' 查询一致
+"""
+
+import pytest
+
+from app.services import order_search_service
+
+pytestmark = pytest.mark.integration
+
+ORDERS = [
+    ("PET20240101001", "张小明", "13800001111"),
+    ("PET20240101002", "Zhang Wei", "13900002222"),
+    ("PET20240215003", "王_芳", "13800003333"),
+    ("XHS100%OFF", "李四", "15000004444"),
+    ("PET20240301004", "zhang wei", None),
+]
+
+TERMS = [
+    "PET2024",
+    "pet2024",
+    "0101",
+    "张小明",
+    "小明",
+    "zhang",
+    "ZHANG WEI",
+    "王_芳",
+    "_芳",
+    "100%",
+    "%OFF",
+    "13800",
+    "1111",
+    "0001111",
+    "PET20240101001",
+    "不存在的订单",
+    "P",
+]
+
+
+@pytest.fixture(autouse=True)
+def search_index(db, monkeypatch):
+    monkeypatch.setattr(order_search_service, "_index_ready", False)
+    order_search_service.register_order_search_listeners()
+
+
+def _create_orders(db, rows=ORDERS):
+    from app.models import Order
+
+    orders = [
+        Order(order_number=number, customer_name=name, customer_phone=phone or "")
+        for number, name, phone in rows
+    ]
+    db.session.add_all(orders)
+    db.session.commit()
+    return orders
+
+
+def _like_ids(term):
+    """原实现：各字段 LIKE '%关键词%'"""
+    from sqlalchemy import or_
+
+    from app.models import Order
+
+    pattern = f"%{order_search_service._escape_like(term)}%"
+    return {
+        order.id
+        for order in Order.query.filter(
+            or_(
+                *[
+                    getattr(Order, field).like(pattern, escape="\\")
+                    for field in order_search_service.SEARCH_FIELDS
+                ]
+            )
+        )
+    }
+
+
+def _search_ids(term):
+    return {order.id for order in order_search_service.search_orders(term)}
+
+
+def test_make_grams():
+    assert order_search_service.make_grams("AbCd") == {"abc", "bcd"}
+    assert order_search_service.make_grams("ab") == set()
+    assert order_search_service.make_grams(None) == set()
+
+
+def test_search_matches_like_before_backfill(db):
+    _create_orders(db)
+
+    assert not order_search_service._is_index_ready()
+    for term in TERMS:
+        assert _search_ids(term) == _like_ids(term), term
+
+
+def test_search_matches_like_with_gram_index(db):
+    _create_orders(db)
+    assert order_search_service.rebuild_order_search_index() == len(ORDERS)
+    assert order_search_service._is_index_ready()
+
+    for term in TERMS:
+        assert _search_ids(term) == _like_ids(term), term
+
+
+def test_index_follows_order_writes(db):
+    order_search_service.rebuild_order_search_index()
+    orders = _create_orders(db)
+
+    orders[0].customer_name = "赵六六"
+    db.session.delete(orders[1])
+    db.session.commit()
+
+    for term in TERMS + ["赵六六", "张小明"]:
+        assert _search_ids(term) == _like_ids(term), term
+    assert _search_ids("赵六六") == {orders[0].id}
+
+
+def test_exact_and_prefix_matches_rank_first(db):
+    _create_orders(
+        db,
+        [
+            ("A-PET001", "客户甲", "1"),
+            ("PET001-B", "客户乙", "2"),
+            ("PET001", "客户丙", "3"),
+        ],
+    )
+    order_search_service.rebuild_order_search_index()
+
+    from app.models import Order
+
+    results = order_search_service.search_orders("PET001", query=Order.query).all()
+    assert [order.order_number for order in results[:2]] == ["PET001", "PET001-B"]
+    assert results[2].order_number == "A-PET001"
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+游标分页测试
+逐页向后/向前翻页的结果与 OFFSET 分页一致
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.utils.pagination import decode_cursor, encode_cursor, keyset_order_by, keyset_paginate
+
+pytestmark = pytest.mark.utils
+
+
+@pytest.fixture
+def orders(db):
+    from app.models import Order
+
+    base = datetime(2024, 5, 1, 12, 0, 0)
+    rows = []
+    for i in range(23):
+        # 每3个订单同一创建时间，由 id 区分先后
+        rows.append(
+            Order(
+                order_number=f"K{i:03d}",
+                customer_name="客户",
+                customer_phone="13800000000",
+                created_at=base + timedelta(minutes=i // 3),
+            )
+        )
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+def _walk(query, columns, per_page, key=None, having=False):
+    """从第一页一直向后翻页，返回每页的记录和最后一页"""
+    pages = []
+    page = keyset_paginate(query, columns, per_page, key=key, having=having)
+    pages.append(page)
+    while page.has_next:
+        page = keyset_paginate(query, columns, per_page, page.next_cursor, key=key, having=having)
+        pages.append(page)
+    return pages
+
+
+def test_cursor_roundtrip():
+    value = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = encode_cursor([value, 42], "prev")
+
+    assert decode_cursor(cursor) == ("prev", [value, 42])
+    assert decode_cursor("not-a-cursor") is None
+    assert decode_cursor("") is None
+
+
+def test_forward_pages_match_offset(orders):
+    from app.models import Order
+
+    columns = (Order.created_at, Order.id)
+    expected = [order.id for order in Order.query.order_by(*keyset_order_by(columns)).all()]
+
+    pages = _walk(Order.query, columns, 5)
+
+    assert [len(page.items) for page in pages] == [5, 5, 5, 5, 3]
+    assert [order.id for page in pages for order in page.items] == expected
+    assert not pages[0].has_prev and pages[0].prev_cursor is None
+    assert all(page.has_prev for page in pages[1:])
+    assert pages[-1].next_cursor is None
+
+
+def test_backward_pages(orders):
+    from app.models import Order
+
+    columns = (Order.created_at, Order.id)
+    forward = _walk(Order.query, columns, 5)
+
+    page = forward[-1]
+    backward = [page]
+    while page.has_prev:
+        page = keyset_paginate(Order.query, columns, 5, page.prev_cursor)
+        backward.append(page)
+
+    assert [[o.id for o in p.items] for p in reversed(backward)] == [
+        [o.id for o in p.items] for p in forward
+    ]
+    assert backward[-1].has_next
+    assert not backward[-1].has_prev
+
+
+def test_invalid_cursor_returns_first_page(orders):
+    from app.models import Order
+
+    columns = (Order.created_at, Order.id)
+    first = keyset_paginate(Order.query, columns, 5)
+    page = keyset_paginate(Order.query, columns, 5, "bad-cursor")
+
+    assert [o.id for o in page.items] == [o.id for o in first.items]
+    assert not page.has_prev
+
+
+def test_grouped_query_with_having(db, orders):
+    """按订单号分组、按聚合列排序（订单列表页的用法）"""
+    from sqlalchemy import func
+
+    from app.models import Order
+
+    min_created_at = func.min(Order.created_at).label("min_created_at")
+    query = db.session.query(Order.order_number, min_created_at).group_by(Order.order_number)
+    columns = (min_created_at, Order.order_number)
+
+    pages = _walk(
+        query,
+        columns,
+        4,
+        key=lambda row: [row.min_created_at, row.order_number],
+        having=True,
+    )
+
+    expected = [row.order_number for row in query.order_by(*keyset_order_by(columns)).all()]
+    assert [row.order_number for page in pages for row in page.items] == expected
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+服务商完成回调测试
+签名校验、失败回调与美图结果回调只生效一次（重复回调无副作用）
+"""
+
+import json
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from app.services import provider_callbacks
+
+pytestmark = pytest.mark.integration
+
+BASE_URL = "https://shop.example.com"
+
+
+@pytest.fixture(autouse=True)
+def callback_env(app, db, monkeypatch):
+    """回调配置 + 路由中使用的 test_server 模块（模型与数据库）"""
+    from app import models
+
+    settings = {
+        "base_url": BASE_URL,
+        "secret": "callback-secret",
+        "grace_seconds": 60,
+        "fallback_interval": 30,
+    }
+    monkeypatch.setattr(
+        provider_callbacks, "_settings_cache", {"settings": settings, "loaded_at": time.time()}
+    )
+    monkeypatch.setattr(provider_callbacks, "_stats", dict.fromkeys(provider_callbacks._stats, 0))
+    monkeypatch.setitem(
+        sys.modules,
+        "test_server",
+        types.SimpleNamespace(
+            db=db,
+            AITask=models.AITask,
+            APIProviderConfig=models.APIProviderConfig,
+            MeituAPICallLog=models.MeituAPICallLog,
+        ),
+    )
+
+
+@pytest.fixture
+def order(db):
+    from app.models import Order
+
+    order = Order(order_number="CB001", customer_name="张三", customer_phone="13800000000")
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def _ai_task(db, order, ref="task-ref-1", provider_task_id="rh-1001", status="processing"):
+    from app.models import AITask
+
+    task = AITask(
+        order_id=order.id,
+        order_number=order.order_number,
+        status=status,
+        comfyui_prompt_id=provider_task_id,
+        processing_log=json.dumps({"task_id": ref, "callback_registered": True}),
+    )
+    db.session.add(task)
+    db.session.commit()
+    return task
+
+
+def _callback(provider, ref, payload, signature=None):
+    if signature is None:
+        signature = provider_callbacks.sign_callback(provider, ref)
+    return provider_callbacks.handle_provider_callback(provider, ref, signature, payload)
+
+
+def test_callback_url_is_signed():
+    url = provider_callbacks.build_callback_url("runninghub", "task-ref-1")
+    signature = provider_callbacks.sign_callback("runninghub", "task-ref-1")
+
+    assert url == f"{BASE_URL}/api/provider-callbacks/runninghub?ref=task-ref-1&sig={signature}"
+    assert provider_callbacks.verify_callback("runninghub", "task-ref-1", signature)
+    # 签名绑定服务商和任务ref
+    assert not provider_callbacks.verify_callback("nano-banana", "task-ref-1", signature)
+    assert not provider_callbacks.verify_callback("runninghub", "task-ref-2", signature)
+
+
+def test_attach_callback_only_for_supported_providers():
+    request_data = {}
+    url = provider_callbacks.attach_ai_task_callback("nano-banana", request_data, "task-ref-1")
+
+    assert request_data == {"webHook": url}
+    assert provider_callbacks.attach_ai_task_callback("gemini", {}, "task-ref-1") is None
+
+
+def test_invalid_signature_is_rejected(db, order):
+    task = _ai_task(db, order)
+
+    result = _callback("runninghub", "task-ref-1", {"status": "failed"}, signature="forged")
+
+    assert result == (403, "rejected", "签名无效")
+    db.session.refresh(task)
+    assert task.status == "processing"
+    assert provider_callbacks.get_callback_stats()["rejected"] == 1
+
+
+def test_failure_callback_applies_once(db, order):
+    task = _ai_task(db, order)
+    payload = {"taskId": "rh-1001", "eventData": json.dumps({"code": 805, "msg": "节点执行失败"})}
+
+    assert _callback("runninghub", "task-ref-1", payload) == (200, "failed", "任务已标记为失败")
+    db.session.refresh(task)
+    assert task.status == "failed"
+    assert task.error_message == "[runninghub] 节点执行失败"
+    completed_at = task.completed_at
+
+    # 服务商重复回调：任务已结束，不再改写
+    status_code, result, _message = _callback("runninghub", "task-ref-1", payload)
+    assert (status_code, result) == (200, "ignored")
+    db.session.refresh(task)
+    assert task.completed_at == completed_at
+
+
+def test_callback_ref_must_match_task(db, order):
+    """服务商任务ID对应的任务与回调URL中的ref不一致时忽略"""
+    task = _ai_task(db, order)
+    ref = "task-ref-other"
+
+    status_code, result, _message = _callback("runninghub", ref, {"taskId": "rh-1001"})
+
+    assert (status_code, result) == (200, "ignored")
+    db.session.refresh(task)
+    assert task.status == "processing"
+
+
+def test_repeated_success_callback_schedules_one_poll(db, order, monkeypatch):
+    """查询进行中再次收到回调，不重复调度"""
+    from app.services import ai_task_polling_service
+
+    polled = []
+    release = threading.Event()
+
+    def poll_once(task_id):
+        release.wait(5)
+        polled.append(task_id)
+
+    monkeypatch.setattr(ai_task_polling_service, "_poller_engine", None)
+    monkeypatch.setattr(ai_task_polling_service, "poll_ai_task_once", poll_once)
+    task = _ai_task(db, order)
+    payload = {"id": "rh-1001", "status": "succeeded"}
+
+    assert _callback("nano-banana", "task-ref-1", payload) == (200, "polled", "已调度结果查询")
+    assert _callback("nano-banana", "task-ref-1", payload)[1] == "polled"
+    release.set()
+    deadline = time.monotonic() + 5
+    while provider_callbacks._in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert polled == [task.id]
+
+
+def _meitu_log(db, msg_id="msg-1", order_number="CB001"):
+    from app.models import MeituAPICallLog
+
+    log = MeituAPICallLog(order_number=order_number, msg_id=msg_id, status="pending")
+    db.session.add(log)
+    db.session.commit()
+    return log
+
+
+def test_meitu_result_callback_completes_once(db, monkeypatch):
+    from app.services import result_pipeline
+
+    submitted = []
+    monkeypatch.setattr(
+        result_pipeline,
+        "submit_meitu_result",
+        lambda log_id, url, name=None: submitted.append((log_id, url)),
+    )
+    log = _meitu_log(db)
+    payload = {
+        "code": 0,
+        "data": {"msg_id": "msg-1", "media_data": "https://meitu.example.com/r.jpg"},
+    }
+
+    assert _callback("meitu", "CB001", payload) == (200, "completed", "任务已完成")
+    status_code, result, _message = _callback("meitu", "CB001", payload)
+
+    assert (status_code, result) == (200, "ignored")
+    assert submitted == [(log.id, "https://meitu.example.com/r.jpg")]
+    db.session.refresh(log)
+    assert log.status == "success"
+    assert log.result_image_url == "https://meitu.example.com/r.jpg"
+    stats = provider_callbacks.get_callback_stats()
+    assert stats["completed"] == 1
+    assert stats["ignored"] == 1
+
+
+def test_meitu_callback_for_other_order_is_ignored(db):
+    log = _meitu_log(db)
+    payload = {"msg_id": "msg-1", "media_data": "https://meitu.example.com/r.jpg"}
+
+    # 签名对 CB002 有效，但 msg_id 属于 CB001 的任务
+    status_code, result, _message = _callback("meitu", "CB002", payload)
+
+    assert (status_code, result) == (200, "ignored")
+    db.session.refresh(log)
+    assert log.status == "pending"
+
+
+def test_meitu_failure_callback(db):
+    log = _meitu_log(db)
+    payload = {"code": 1001, "msg_id": "msg-1", "message": "图片不合规"}
+
+    assert _callback("meitu", "CB001", payload) == (200, "failed", "任务已标记为失败")
+    db.session.refresh(log)
+    assert log.status == "failed"
+    assert log.error_message == "图片不合规"
+
+
+def test_unknown_provider_is_rejected():
+    status_code, result, _message = _callback("unknown", "task-ref-1", {})
+
+    assert (status_code, result) == (404, "rejected")
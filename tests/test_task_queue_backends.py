@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+任务队列存储后端测试（进程内 / 数据库后端语义一致）
+"""
+
+from datetime import timedelta
+
+import pytest
+
+from app.services.task_queue_backends import (
+    EXPIRED_ERROR,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    DatabaseQueueBackend,
+    MemoryQueueBackend,
+    QueueJob,
+    new_job_id,
+)
+
+pytestmark = pytest.mark.integration
+
+
+@pytest.fixture(params=["memory", "database"])
+def backend(request):
+    if request.param == "memory":
+        return MemoryQueueBackend()
+    db = request.getfixturevalue("db")
+    from app.models import TaskQueueJob
+
+    return DatabaseQueueBackend(db, TaskQueueJob)
+
+
+def _push(backend, priority=PRIORITY_NORMAL, max_attempts=3, **data):
+    job = QueueJob(new_job_id("api"), "api", data, priority=priority, max_attempts=max_attempts)
+    backend.push(job)
+    return job.job_id
+
+
+def test_reserve_by_priority_then_fifo(backend):
+    low = _push(backend, PRIORITY_LOW)
+    first = _push(backend)
+    high = _push(backend, PRIORITY_HIGH)
+    second = _push(backend)
+
+    reserved = [backend.reserve().job_id for _ in range(4)]
+
+    assert reserved == [high, first, second, low]
+    assert backend.reserve() is None
+
+
+def test_reserved_job_is_invisible_until_ack(backend):
+    job_id = _push(backend, order_id=1)
+
+    job = backend.reserve()
+    assert job.job_id == job_id
+    assert job.data == {"order_id": 1}
+    assert job.attempts == 1
+    assert backend.reserve() is None
+    assert backend.stats()["reserved"] == 1
+
+    backend.ack(job)
+    assert backend.reserve() is None
+    assert backend.stats()["reserved"] == 0
+    assert backend.size() == 0
+
+
+def test_expired_reservation_is_reclaimed(backend):
+    job_id = _push(backend)
+
+    first = backend.reserve(visibility_timeout=-1)
+    second = backend.reserve()
+
+    assert first.job_id == second.job_id == job_id
+    assert second.attempts == 2
+
+
+def test_extend_keeps_job_reserved(backend):
+    _push(backend)
+
+    job = backend.reserve(visibility_timeout=-1)
+    assert backend.extend(job, visibility_timeout=300)
+    assert backend.reserve() is None
+
+
+def test_expired_at_max_attempts_goes_to_dead_letter(backend):
+    _push(backend, max_attempts=2)
+
+    backend.reserve(visibility_timeout=-1)
+    backend.reserve(visibility_timeout=-1)
+
+    assert backend.reserve() is None
+    stats = backend.stats()
+    assert stats["dead"] == 1
+    assert stats["reserved"] == 0
+    assert backend.size() == 0
+
+
+def test_nack_retries_later(backend):
+    _push(backend)
+
+    job = backend.reserve()
+    assert backend.nack(job, "接口超时") is True
+
+    # 按退避时间延迟重试，不会立即被重新领取
+    assert backend.reserve() is None
+    assert backend.size() == 1
+    assert backend.stats()["dead"] == 0
+
+
+def test_nack_dead_letters(backend):
+    _push(backend, max_attempts=1)
+    job = backend.reserve()
+    assert backend.nack(job, "接口超时") is False
+
+    _push(backend)
+    job = backend.reserve()
+    assert backend.nack(job, "参数错误", retry=False) is False
+
+    assert backend.stats()["dead"] == 2
+    assert backend.size() == 0
+
+
+def test_database_stale_extend_after_reclaim(db):
+    """超时后被重新领取的任务，原消费者续期失败"""
+    from app.models import TaskQueueJob
+
+    backend = DatabaseQueueBackend(db, TaskQueueJob)
+    _push(backend)
+
+    stale = backend.reserve(visibility_timeout=-1)
+    current = backend.reserve()
+
+    assert current.attempts == 2
+    assert backend.extend(stale) is False
+    assert backend.extend(current) is True
+
+
+def test_database_dead_letter_records_expiry(db):
+    from app.models import TaskQueueJob
+
+    backend = DatabaseQueueBackend(db, TaskQueueJob)
+    job_id = _push(backend, max_attempts=1)
+    backend.reserve(visibility_timeout=-1)
+    backend.reserve()
+
+    row = TaskQueueJob.query.filter_by(job_id=job_id).one()
+    assert row.status == "dead"
+    assert row.last_error == EXPIRED_ERROR
+
+
+def test_database_stale_ack_and_nack_are_ignored(db):
+    """超时后被重新领取的任务，原消费者的确认和失败标记不生效"""
+    from app.models import TaskQueueJob
+
+    backend = DatabaseQueueBackend(db, TaskQueueJob)
+    job_id = _push(backend)
+
+    stale = backend.reserve(visibility_timeout=-1)
+    current = backend.reserve()
+
+    backend.ack(stale)
+    assert backend.nack(stale, "超时", retry=False) is True
+    row = TaskQueueJob.query.filter_by(job_id=job_id).one()
+    assert row.status == "reserved"
+    assert row.attempts == 2
+
+    backend.ack(current)
+    assert TaskQueueJob.query.filter_by(job_id=job_id).one().status == "done"
+
+
+def test_purge_removes_finished_jobs_after_retention(backend):
+    done_id = _push(backend)
+    backend.ack(backend.reserve())
+    _push(backend, max_attempts=1)
+    backend.nack(backend.reserve(), "参数错误")
+    pending_id = _push(backend)
+
+    assert backend.purge(timedelta(days=7)) == 0
+    purged = backend.purge(timedelta(seconds=-1))
+
+    assert backend.stats()["dead"] == 0
+    assert backend.size() == 1
+    if isinstance(backend, DatabaseQueueBackend):
+        from app.models import TaskQueueJob
+
+        assert purged == 2
+        remaining = [row.job_id for row in TaskQueueJob.query.all()]
+        assert remaining == [pending_id]
+        assert done_id not in remaining
+    else:
+        # 进程内后端确认后立即移除，只保留死信
+        assert purged == 1
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+图片上传去重测试
+同一内容只上传/编码一次，失败不记录，过期、删除索引或文件变化后重新上传
+"""
+
+import base64
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from app.services import upload_dedup
+
+pytestmark = pytest.mark.unit
+
+JPEG = b"\xff\xd8\xff\xe0fake-jpeg"
+PNG = b"\x89PNGfake-png"
+
+
+class FakeRedis:
+    """只实现上传索引用到的 get / ttl / setex / delete"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key, (None,))[0]
+
+    def ttl(self, key):
+        return self.data[key][1] if key in self.data else -2
+
+    def setex(self, key, ttl, value):
+        self.data[key] = (value.encode("utf-8"), ttl)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture(autouse=True)
+def isolated_index(monkeypatch):
+    """每个测试使用独立的进程内索引，默认不连接 Redis"""
+    monkeypatch.setattr(upload_dedup, "_digests", OrderedDict())
+    monkeypatch.setattr(upload_dedup, "_index", OrderedDict())
+    monkeypatch.setattr(upload_dedup, "_inline", OrderedDict())
+    monkeypatch.setattr(upload_dedup, "_inline_bytes", 0)
+    monkeypatch.setattr(upload_dedup, "_url_digests", OrderedDict())
+    monkeypatch.setattr(upload_dedup, "_stats", dict.fromkeys(upload_dedup._stats, 0))
+    monkeypatch.setattr(upload_dedup, "_redis", lambda: None)
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "cat.jpg"
+    path.write_bytes(JPEG)
+    return path
+
+
+class Uploader:
+    def __init__(self, result="https://oss.example.com/{n}.jpg", delay=0):
+        self.result = result
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, digest):
+        self.calls.append(digest)
+        time.sleep(self.delay)
+        return self.result and self.result.format(n=len(self.calls))
+
+
+def test_same_content_is_uploaded_once(tmp_path, image):
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes(JPEG)
+    upload = Uploader()
+
+    first = upload_dedup.upload_once("oss", str(image), upload)
+    second = upload_dedup.upload_once("oss", str(copy), upload)
+
+    assert first == second == "https://oss.example.com/1.jpg"
+    assert upload.calls == [upload_dedup.file_digest(str(image))]
+    stats = upload_dedup.get_upload_dedup_stats()
+    assert stats["uploads"] == 1
+    assert stats["upload_hits"] == 1
+    assert stats["upload_bytes_saved"] == len(JPEG)
+
+
+def test_destinations_are_indexed_separately(image):
+    upload = Uploader()
+
+    upload_dedup.upload_once("comfyui:http://127.0.0.1:8188", str(image), upload)
+    upload_dedup.upload_once("comfyui:http://127.0.0.1:8189", str(image), upload)
+
+    assert len(upload.calls) == 2
+
+
+def test_failed_upload_is_not_remembered(image):
+    failed = Uploader(result=None)
+    assert upload_dedup.upload_once("oss", str(image), failed) is None
+
+    upload = Uploader()
+    assert upload_dedup.upload_once("oss", str(image), upload) == "https://oss.example.com/1.jpg"
+    assert len(upload.calls) == 1
+
+
+def test_expired_or_forgotten_ref_is_uploaded_again(image):
+    upload = Uploader()
+    upload_dedup.upload_once("oss", str(image), upload, ttl=-1)
+    upload_dedup.upload_once("oss", str(image), upload)
+    assert len(upload.calls) == 2
+
+    upload_dedup.forget_uploaded_ref("oss", upload_dedup.file_digest(str(image)))
+    assert upload_dedup.upload_once("oss", str(image), upload) == "https://oss.example.com/3.jpg"
+
+
+def test_changed_file_is_uploaded_again(image):
+    upload = Uploader()
+    upload_dedup.upload_once("oss", str(image), upload)
+
+    image.write_bytes(PNG)
+    upload_dedup.upload_once("oss", str(image), upload)
+
+    assert len(upload.calls) == 2
+    assert upload.calls[0] != upload.calls[1]
+
+
+def test_missing_file_uploads_without_index(tmp_path):
+    upload = Uploader()
+
+    assert upload_dedup.upload_once("oss", str(tmp_path / "missing.jpg"), upload)
+    assert upload.calls == [None]
+    assert upload_dedup.get_upload_dedup_stats()["indexed_uploads"] == 0
+
+
+def test_concurrent_uploads_of_same_content_share_one_upload(image):
+    upload = Uploader(delay=0.2)
+    results = []
+
+    def worker():
+        results.append(upload_dedup.upload_once("oss", str(image), upload))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(upload.calls) == 1
+    assert results == ["https://oss.example.com/1.jpg"] * 5
+
+
+def test_index_is_shared_through_redis(monkeypatch, image):
+    client = FakeRedis()
+    monkeypatch.setattr(upload_dedup, "_redis", lambda: client)
+    upload_dedup.upload_once("oss", str(image), Uploader())
+
+    # 模拟另一个进程：进程内索引为空，从 Redis 读取
+    monkeypatch.setattr(upload_dedup, "_index", OrderedDict())
+    upload = Uploader()
+    assert upload_dedup.upload_once("oss", str(image), upload) == "https://oss.example.com/1.jpg"
+    assert upload.calls == []
+
+    upload_dedup.forget_uploaded_ref("oss", upload_dedup.file_digest(str(image)))
+    assert client.data == {}
+
+
+def test_inline_image_is_encoded_once(tmp_path, image):
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes(JPEG)
+
+    first = upload_dedup.encode_inline_image(path=str(image))
+    second = upload_dedup.encode_inline_image(path=str(copy))
+
+    assert first == second == ("image/jpeg", base64.b64encode(JPEG).decode("utf-8"))
+    stats = upload_dedup.get_upload_dedup_stats()
+    assert stats["inline_encodes"] == 1
+    assert stats["inline_hits"] == 1
+
+
+def test_inline_url_is_downloaded_once():
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        return PNG
+
+    first = upload_dedup.encode_inline_image(url="https://cdn.example.com/a.png", fetch=fetch)
+    second = upload_dedup.encode_inline_image(url="https://cdn.example.com/a.png", fetch=fetch)
+    # 不同URL、相同内容：需要下载，但不重复编码
+    third = upload_dedup.encode_inline_image(url="https://cdn.example.com/b.png", fetch=fetch)
+
+    assert first == second == third
+    assert first[0] == "image/png"
+    assert fetched == ["https://cdn.example.com/a.png", "https://cdn.example.com/b.png"]
+    stats = upload_dedup.get_upload_dedup_stats()
+    assert stats["inline_encodes"] == 1
+    assert stats["downloads_saved"] == 1
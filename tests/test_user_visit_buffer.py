@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+用户访问记录缓冲写入与访问预聚合测试
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.services import user_visit_buffer
+
+pytestmark = pytest.mark.integration
+
+
+@pytest.fixture(autouse=True)
+def reset_ready_flag(monkeypatch):
+    """完成标记的进程内缓存在测试之间不共享"""
+    monkeypatch.setattr(user_visit_buffer, "_rollup_ready", False)
+
+
+def _visit(session_id, user_id="u1", visit_time=None):
+    return {
+        "session_id": session_id,
+        "user_id": user_id,
+        "visit_time": visit_time or datetime.now(),
+    }
+
+
+def _add_raw_visits(db, rows):
+    """直接写入访问表（启用预聚合之前的历史数据）"""
+    from app.models import UserVisit
+
+    db.session.add_all([UserVisit(**row) for row in rows])
+    db.session.commit()
+
+
+def _whole_range():
+    return (date.today() - timedelta(days=30)).isoformat(), (
+        date.today() + timedelta(days=1)
+    ).isoformat()
+
+
+def test_flush_skips_duplicate_sessions(db):
+    from app.models import UserVisit
+
+    user_visit_buffer._flush([_visit("s1"), _visit("s2"), _visit("s1")])
+    user_visit_buffer._flush([_visit("s2"), _visit("s3")])
+
+    assert UserVisit.query.count() == 3
+
+
+def test_history_visible_before_backfill(db):
+    """历史访问只在访问表中，回填完成前统计直接查询访问表"""
+    old = datetime.now() - timedelta(days=10)
+    _add_raw_visits(db, [_visit(f"h{i}", f"u{i % 3}", old) for i in range(6)])
+    user_visit_buffer._flush([_visit("n1", "u9")])
+
+    # 缓冲写入的分桶只包含新访问，但没有完成标记
+    assert not user_visit_buffer._has_ready_marker()
+    stats = user_visit_buffer.get_user_visit_stats(*_whole_range())
+    assert stats == {"totalVisits": 7, "uniqueUsers": 4, "uniqueSessions": 7}
+
+
+def test_reconcile_backfills_and_marks_ready(db):
+    old = datetime.now() - timedelta(days=10)
+    _add_raw_visits(db, [_visit(f"h{i}", f"u{i % 3}", old) for i in range(6)])
+    user_visit_buffer._flush([_visit("n1", "u9"), _visit("n2", None)])
+    expected = user_visit_buffer.get_user_visit_stats(*_whole_range())
+
+    count = user_visit_buffer.reconcile_recent_user_visit_rollups()
+
+    assert count == 8
+    assert user_visit_buffer._has_ready_marker()
+    assert user_visit_buffer._is_rollup_ready()
+    assert user_visit_buffer.get_user_visit_stats(*_whole_range()) == expected
+
+    # 回填后缓冲写入继续累加分桶
+    user_visit_buffer._flush([_visit("n3", "u9")])
+    stats = user_visit_buffer.get_user_visit_stats(*_whole_range())
+    assert stats["totalVisits"] == expected["totalVisits"] + 1
+    assert stats["uniqueUsers"] == expected["uniqueUsers"]
+
+
+def test_reconcile_without_marker_repeats_full_backfill(db):
+    """回填中断（没有完成标记）时下次对账重新全量回填"""
+    old = datetime.now() - timedelta(days=10)
+    _add_raw_visits(db, [_visit(f"h{i}", "u1", old) for i in range(3)])
+    user_visit_buffer.rebuild_user_visit_rollups(date.today(), None)
+
+    assert not user_visit_buffer._is_rollup_ready()
+    assert user_visit_buffer.reconcile_recent_user_visit_rollups() == 3
+    assert user_visit_buffer.get_user_visit_stats(*_whole_range())["totalVisits"] == 3
+
+
+def test_time_of_day_range_reads_visit_table(db):
+    """带时分秒的范围不能用按天分桶，直接查询访问表"""
+    now = datetime.now().replace(microsecond=0)
+    user_visit_buffer._flush(
+        [_visit("a", "u1", now - timedelta(hours=3)), _visit("b", "u2", now - timedelta(minutes=5))]
+    )
+    user_visit_buffer.reconcile_recent_user_visit_rollups()
+
+    stats = user_visit_buffer.get_user_visit_stats(now - timedelta(hours=1), now)
+    assert stats == {"totalVisits": 1, "uniqueUsers": 1, "uniqueSessions": 1}